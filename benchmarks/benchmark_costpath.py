@@ -0,0 +1,28 @@
+""" Benchmark accumulated cost distance and least cost path on a random cost
+surface. The grid size (default 10000) and connectivity (default 8) may be
+given as arguments. """
+
+import sys
+import time
+import numpy as np
+import karta
+from karta.raster import costpath
+
+n = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+connectivity = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+
+rng = np.random.RandomState(46)
+cost = rng.uniform(1, 10, (n, n))
+grid = karta.RegularGrid((0, 0, 30, 30, 0, 0), values=cost)
+del cost
+sources = karta.Multipoint([(15, 15), (30*n/2, 30*n/2)], crs=grid.crs)
+
+t0 = time.time()
+dist, back = costpath.cost_distance(grid, sources, connectivity=connectivity)
+t1 = time.time()
+line = costpath.least_cost_path(back, karta.Point((30*n-15, 15), crs=grid.crs))
+t2 = time.time()
+
+print("grid size:         {0}x{0}".format(n))
+print("cost distance:     {0:.2f} s".format(t1-t0))
+print("least cost path:   {0:.2f} s ({1} vertices)".format(t2-t1, len(line)))
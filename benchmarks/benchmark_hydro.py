@@ -0,0 +1,39 @@
+""" Benchmark depression filling, flow direction, and flow accumulation on a
+synthetic DEM. The DEM size (default 20000) and tile size (default 2048) may
+be given as arguments. """
+
+import sys
+import time
+import numpy as np
+import karta
+from karta.raster import hydro, CompressedBand
+
+n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+tile = int(sys.argv[2]) if len(sys.argv) > 2 else 2048
+
+def synthetic_block(i0, i1, j0, j1):
+    # ridges and valleys with noise that creates many small depressions
+    y, x = np.mgrid[i0:i1,j0:j1] / float(n)
+    rng = np.random.RandomState(i0*n + j0)
+    return (100*(x + y) + 20*np.sin(12*x)*np.cos(9*y) +
+            rng.normal(0, 0.5, x.shape)).astype(np.float32)
+
+band = CompressedBand((n, n), np.float32)
+for i0 in range(0, n, tile):
+    for j0 in range(0, n, tile):
+        i1, j1 = min(i0+tile, n), min(j0+tile, n)
+        band.setblock(i0, j0, synthetic_block(i0, i1, j0, j1))
+dem = karta.RegularGrid((0, 0, 30, 30, 0, 0), bands=[band])
+
+t0 = time.time()
+filled = hydro.fill_depressions(dem, epsilon=True, tilesize=(tile, tile))
+t1 = time.time()
+fdir = hydro.flow_direction(filled, chunksize=(tile, tile))
+t2 = time.time()
+acc = hydro.flow_accumulation(fdir, tilesize=(tile, tile))
+t3 = time.time()
+
+print("{0}x{0} DEM in {1}x{1} tiles".format(n, tile))
+print("fill_depressions   {0:8.1f} s".format(t1-t0))
+print("flow_direction     {0:8.1f} s".format(t2-t1))
+print("flow_accumulation  {0:8.1f} s".format(t3-t2))
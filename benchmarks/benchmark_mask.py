@@ -0,0 +1,24 @@
+import karta
+import numpy as np
+import cProfile, pstats, io
+
+# star-shaped polygon with a rough boundary of 100k vertices
+t = -np.linspace(0, 2*np.pi, 100000)
+r = 2 + np.cos(7*t) + 0.05*np.sin(997*t)
+poly = karta.Polygon(zip((r*np.cos(t)+4)*12, (r*np.sin(t)+4)*12))
+
+grid = karta.RegularGrid([0.0, 0.0, 0.025, 0.025, 0.0, 0.0],
+                         values=np.zeros((4000, 4000), dtype=np.float32))
+
+prof = cProfile.Profile()
+prof.enable()
+
+for i in range(10):
+    masked_grid = grid.mask_by_poly(poly)
+
+prof.disable()
+string = io.StringIO()
+sortby = "tottime"
+ps = pstats.Stats(prof, stream=string).sort_stats(sortby)
+ps.print_stats(15)
+print(string.getvalue())
@@ -10,15 +10,29 @@ numbers.Integral.register(numpy.integer)
 
 from . import grid
 from . import misc
+from . import focal
+from . import classify
+from . import hydro
+from . import costpath
+from . import inpaint
+from . import interpolate
 
-from .grid import RegularGrid, merge, gridpoints, mask_poly
-from .band import SimpleBand, CompressedBand
+from .grid import (RegularGrid, merge, gridpoints, mask_poly, polygon_mask,
+                   polygon_coverage, rasterize, PointAggregator)
+from .band import SimpleBand, CompressedBand, InterleavedBand
+from .sketch import QuantileSketch
+from .stack import RasterStack
 from .read import read_aai, read_geotiff, read_gtiff, from_geotiffs
 from .misc import (normed_potential_vectors,
                    slope, aspect, gradient, divergence, hillshade)
+from .interpolate import interpolate_points
+from .focal import focal_sum, focal_mean, focal_std, focal_min, focal_max
 
-__all__ = ["grid", "misc", "RegularGrid",
+__all__ = ["grid", "misc", "focal", "classify", "hydro", "costpath", "inpaint", "interpolate", "RegularGrid", "PointAggregator", "rasterize",
+           "interpolate_points",
+           "QuantileSketch", "RasterStack",
            "read_aai", "read_geotiff", "read_gtiff", "from_geotiffs",
            "slope", "aspect", "gradient", "divergence", "hillshade",
-           "normed_potential_vectors"]
+           "normed_potential_vectors", "focal_sum", "focal_mean",
+           "focal_std", "focal_min", "focal_max"]
 
@@ -1,59 +1,84 @@
 """ Low-level functions for reading ESRI ASCII grids """
 
 import numpy as np
+from . import aaifuncs
+
+HEADER_FIELDS = ('nrows', 'ncols', 'yllcenter', 'xllcenter', 'yllcorner',
+                 'xllcorner', 'cellsize', 'nodata_value')
+
+def read_header(f):
+    """ Read the header of an ASCII grid from a file opened in binary mode.
+    Returns a dictionary of header information, and the bytes read beyond
+    the header. """
+    hdr = {}
+    while True:
+        line = f.readline()
+        rec = line.split(None, 1)
+        if len(rec) == 2 and rec[0].decode("ascii", "replace").lower() in HEADER_FIELDS:
+            hdr[rec[0].decode("ascii").lower()] = float(rec[1])
+        else:
+            break
 
-def aairead(fnm):
-    """ Read an existing ASCII grid file and return a Numpy array and a
-    dictionary of header information. """
-    h = []
-    with open(fnm, 'r') as f:
-        # Count the number of header entries
-        cnt = 0
-        while True:
-            l = f.readline()
-            if l.split(None, 1)[0].lower() in ['nrows', 'ncols',
-                    'yllcenter', 'xllcenter', 'yllcorner', 'xllcorner',
-                    'cellsize', 'nodata_value']:
-                cnt += 1
-            else:
-                break
-
-        # Read the header, then the array data
-        f.seek(0)
-        for _ in range(cnt):
-            h.append(f.readline())
-        data = f.readlines()
-
-    # Store data internally
-    hs = [rec.split(None, 1) for rec in h]
-    hdr = dict([(rec[0].lower(), float(rec[1])) for rec in hs])
+    for field in ('yllcenter', 'xllcenter', 'yllcorner', 'xllcorner'):
+        if field not in hdr:
+            hdr[field] = None
+    if 'nodata_value' not in hdr:
+        hdr['nodata_value'] = -9999
+    check_header(hdr)
     hdr['ncols'] = int(hdr['ncols'])
     hdr['nrows'] = int(hdr['nrows'])
-    if 'yllcenter' not in hdr.keys():
-        hdr['yllcenter'] = None
-
-    if 'xllcenter' not in hdr.keys():
-        hdr['xllcenter'] = None
+    return hdr, line
+
+def iter_rowblocks(f, text, ncols, rowcounts, readsize=1<<22):
+    """ Generate arrays of grid values parsed from an ASCII grid file.
+
+    Parameters
+    ----------
+    f : file
+        file opened in binary mode, positioned after *text*
+    text : bytes
+        data already read from *f*
+    ncols : int
+        number of columns
+    rowcounts : iterable of ints
+        number of rows in each block to generate
+    readsize : int, optional
+        number of bytes to read from *f* at a time
+
+    Yields
+    ------
+    ndarray
+        (nrows x ncols) arrays of doubles in file order
+    """
+    text = memoryview(text)
+    eof = False
+    for nrows in rowcounts:
+        block = np.empty(nrows*ncols, dtype=np.float64)
+        n = 0
+        while n != len(block):
+            count, consumed = aaifuncs.parse_values(text, block[n:], final=eof)
+            n += count
+            text = text[consumed:]
+            if n != len(block):
+                if eof:
+                    raise ValueError("ASCII grid contains fewer values than "
+                                     "given by NROWS and NCOLS")
+                data = f.read(readsize)
+                eof = len(data) == 0
+                text = memoryview(text.tobytes() + data)
+        yield block.reshape(nrows, ncols)
 
-    if 'yllcorner' not in hdr.keys():
-        hdr['yllcorner'] = None
-
-    if 'xllcorner' not in hdr.keys():
-        hdr['xllcorner'] = None
-
-    if 'nodata_value' not in hdr.keys():
-        hdr['nodata_value'] = -9999
-
-    check_header(hdr)
+def aairead(fnm):
+    """ Read an existing ASCII grid file and return a Numpy array and a
+    dictionary of header information. """
+    with open(fnm, 'rb') as f:
+        hdr, text = read_header(f)
+        nrows, ncols = hdr['nrows'], hdr['ncols']
+        data_a, = iter_rowblocks(f, text, ncols, [nrows])
 
-    f = lambda l: [float(i) for i in l.split()]
-    data_f = list(map(f, data))
-    data_a = np.array(data_f)
     data_a[data_a==hdr['nodata_value']] = np.nan
-
     return data_a, hdr
 
-
 def check_header(hdr):
     """ Make sure that all required header records are present, as well as both
     centered and corner spatial references. """
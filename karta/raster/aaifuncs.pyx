@@ -0,0 +1,360 @@
+""" Parsing and formatting kernels for ESRI ASCII grids
+
+Values are parsed directly from byte buffers without creating Python objects.
+Decimal values with at most 15 significant digits and small exponents are
+converted exactly by scaling an integer mantissa by a power of ten. Values
+with up to 19 significant digits are converted by the Eisel-Lemire algorithm,
+which multiplies the mantissa by a 128-bit approximation of a power of five.
+The remaining values, and the rare cases in which the approximation cannot
+decide the rounding, are passed to strtod, so that every value is correctly
+rounded.
+"""
+
+import numpy as np
+cimport numpy as np
+cimport cython
+from libc.stdlib cimport strtod, malloc, realloc, free
+from libc.string cimport memcpy, strlen
+from libc.math cimport isnan
+from cpython.bytes cimport PyBytes_FromStringAndSize
+
+cdef extern from "Python.h":
+    char *PyOS_double_to_string(double val, char format_code, int precision,
+                                int flags, int *ptype) except NULL
+    void PyMem_Free(void *p)
+    int Py_DTSF_ADD_DOT_0
+
+ctypedef unsigned long long uint64
+
+cdef double POW10[23]
+for _k in range(23):
+    POW10[_k] = 10.0**_k
+
+# truncated 128-bit normalized powers of five, 5**q for q in [-342, 308]
+DEF POW5_MIN = -342
+DEF POW5_MAX = 308
+cdef uint64 POW5_HI[POW5_MAX-POW5_MIN+1]
+cdef uint64 POW5_LO[POW5_MAX-POW5_MIN+1]
+
+for _q in range(POW5_MIN, POW5_MAX+1):
+    if _q < 0:
+        _p = 5**(-_q)
+        _z = (_p - 1).bit_length()
+        if _q >= -27:
+            _c = 2**(_z + 127) // _p + 1
+        else:
+            _c = 2**(2*_z + 128) // _p + 1
+            _c >>= max(_c.bit_length() - 128, 0)
+    else:
+        _c = 5**_q
+        _c = _c << (128 - _c.bit_length()) if _c.bit_length() < 128 \
+                else _c >> (_c.bit_length() - 128)
+    POW5_HI[_q-POW5_MIN] = _c >> 64
+    POW5_LO[_q-POW5_MIN] = _c & 0xFFFFFFFFFFFFFFFF
+
+DEF MAX_TOKEN = 511
+
+cdef inline void _mul128(uint64 a, uint64 b, uint64 *hi, uint64 *lo) nogil:
+    cdef uint64 a0 = a & 0xFFFFFFFFULL, a1 = a >> 32
+    cdef uint64 b0 = b & 0xFFFFFFFFULL, b1 = b >> 32
+    cdef uint64 p00 = a0*b0, p01 = a0*b1, p10 = a1*b0, p11 = a1*b1
+    cdef uint64 mid = (p00 >> 32) + (p01 & 0xFFFFFFFFULL) + (p10 & 0xFFFFFFFFULL)
+    lo[0] = (mid << 32) | (p00 & 0xFFFFFFFFULL)
+    hi[0] = p11 + (p01 >> 32) + (p10 >> 32) + (mid >> 32)
+
+cdef int _eisel_lemire(uint64 w, int q, double *out) nogil:
+    """ Compute w * 10**q for a nonzero w, returning -1 when the result is
+    subnormal, infinite, or cannot be rounded with certainty. """
+    cdef int lz = 0
+    cdef int upperbit, power2, index
+    cdef uint64 hi, lo, hi2, lo2, mantissa, bits
+    if q < POW5_MIN or q > POW5_MAX:
+        return -1
+    while (w >> 63) == 0:
+        w <<= 1
+        lz += 1
+    index = q - POW5_MIN
+    _mul128(w, POW5_HI[index], &hi, &lo)
+    if (hi & 0x1FF) == 0x1FF:
+        _mul128(w, POW5_LO[index], &hi2, &lo2)
+        lo += hi2
+        if hi2 > lo:
+            hi += 1
+        if lo == ~(<uint64> 0) and not (-27 <= q <= 55):
+            return -1
+    upperbit = <int> (hi >> 63)
+    mantissa = hi >> (upperbit + 9)
+    power2 = (((152170 + 65536) * q) >> 16) + 63 + upperbit - lz + 1023
+    if power2 <= 0:
+        return -1
+    # round half to even when the product is exactly halfway
+    if lo <= 1 and -4 <= q <= 23 and (mantissa & 3) == 1 and \
+            (mantissa << (upperbit + 9)) == hi:
+        mantissa &= ~(<uint64> 1)
+    mantissa += mantissa & 1
+    mantissa >>= 1
+    if mantissa >= (<uint64> 2) << 52:
+        mantissa = (<uint64> 1) << 52
+        power2 += 1
+    mantissa &= ~((<uint64> 1) << 52)
+    if power2 >= 0x7FF:
+        return -1
+    bits = mantissa | ((<uint64> power2) << 52)
+    memcpy(out, &bits, 8)
+    return 0
+
+cdef inline bint _isspace(unsigned char c) nogil:
+    return c == 32 or (9 <= c <= 13)
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+cdef int _parse_token(const unsigned char *s, Py_ssize_t n, double *out) nogil:
+    """ Parse a token of length *n*, returning 0 on success. """
+    cdef Py_ssize_t i = 0
+    cdef bint negative = 0
+    cdef unsigned long long mantissa = 0
+    cdef int ndigits = 0
+    cdef int exp10 = 0
+    cdef int e = 0
+    cdef bint eneg = 0
+    cdef bint seen = 0
+    cdef char buf[MAX_TOKEN+1]
+    cdef char *end
+
+    if s[0] == c'-' or s[0] == c'+':
+        negative = s[0] == c'-'
+        i += 1
+    while i < n and c'0' <= s[i] <= c'9':
+        seen = 1
+        if mantissa != 0 or s[i] != c'0':
+            ndigits += 1
+            if ndigits <= 19:
+                mantissa = 10*mantissa + (s[i] - c'0')
+            else:
+                exp10 += 1
+        i += 1
+    if i < n and s[i] == c'.':
+        i += 1
+        while i < n and c'0' <= s[i] <= c'9':
+            seen = 1
+            if mantissa != 0 or s[i] != c'0':
+                ndigits += 1
+                if ndigits <= 19:
+                    mantissa = 10*mantissa + (s[i] - c'0')
+                    exp10 -= 1
+            else:
+                exp10 -= 1
+            i += 1
+    if seen and i < n and (s[i] == c'e' or s[i] == c'E'):
+        i += 1
+        if i < n and (s[i] == c'-' or s[i] == c'+'):
+            eneg = s[i] == c'-'
+            i += 1
+        if i == n:
+            seen = 0
+        while i < n and c'0' <= s[i] <= c'9':
+            if e < 100000:
+                e = 10*e + (s[i] - c'0')
+            i += 1
+        exp10 += -e if eneg else e
+
+    if seen and i == n and ndigits <= 19:
+        if mantissa == 0:
+            out[0] = -0.0 if negative else 0.0
+            return 0
+        if ndigits <= 15 and -22 <= exp10 <= 22:
+            # both the mantissa and the power of ten are exact doubles, so a
+            # single multiplication or division is correctly rounded
+            if exp10 >= 0:
+                out[0] = <double> mantissa * POW10[exp10]
+            else:
+                out[0] = <double> mantissa / POW10[-exp10]
+            if negative:
+                out[0] = -out[0]
+            return 0
+        if _eisel_lemire(mantissa, exp10, out) == 0:
+            if negative:
+                out[0] = -out[0]
+            return 0
+
+    # fall back on the C library for long mantissas, large exponents, and
+    # special values
+    if n > MAX_TOKEN:
+        return -1
+    memcpy(buf, s, n)
+    buf[n] = 0
+    out[0] = strtod(buf, &end)
+    if end != buf + n:
+        return -1
+    return 0
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def parse_values(const unsigned char[:] buf not None, double[:] out not None,
+                 bint final=True):
+    """ Parse whitespace-separated numbers from a buffer.
+
+    Parameters
+    ----------
+    buf : bytes-like
+        text to parse
+    out : 1-d array of doubles
+        array to fill with parsed values
+    final : bool, optional
+        whether *buf* ends at the end of the input. If False, a token touching
+        the end of *buf* may be incomplete and is not parsed.
+
+    Returns
+    -------
+    (nvalues, nconsumed)
+        number of values written to *out*, and number of bytes of *buf*
+        consumed. Parsing stops when *out* is full.
+
+    Raises
+    ------
+    ValueError
+        a token could not be parsed as a number
+    """
+    cdef Py_ssize_t n = buf.shape[0]
+    cdef Py_ssize_t nout = out.shape[0]
+    cdef Py_ssize_t pos = 0, start, count = 0
+    cdef int err = 0
+    cdef const unsigned char *s
+
+    if n == 0:
+        return 0, 0
+    s = &buf[0]
+    with nogil:
+        while count < nout:
+            while pos < n and _isspace(s[pos]):
+                pos += 1
+            if pos == n:
+                break
+            start = pos
+            while pos < n and not _isspace(s[pos]):
+                pos += 1
+            if pos == n and not final:
+                pos = start
+                break
+            if _parse_token(s + start, pos - start, &out[count]) != 0:
+                err = 1
+                pos = start
+                break
+            count += 1
+    if err:
+        end = start
+        while end < n and not _isspace(buf[end]) and end - start < 40:
+            end += 1
+        raise ValueError("could not parse '{0}' as a number".format(
+                bytes(buf[start:end]).decode("ascii", "replace")))
+    return count, pos
+
+cdef class _Buffer:
+    """ Growable output buffer """
+    cdef char *data
+    cdef Py_ssize_t size
+    cdef Py_ssize_t capacity
+
+    def __cinit__(self, Py_ssize_t capacity):
+        self.capacity = max(capacity, 64)
+        self.size = 0
+        self.data = <char*> malloc(self.capacity)
+        if self.data == NULL:
+            raise MemoryError()
+
+    def __dealloc__(self):
+        free(self.data)
+
+    cdef int reserve(self, Py_ssize_t n) except -1:
+        cdef char *data
+        cdef Py_ssize_t capacity = self.capacity
+        if self.size + n <= capacity:
+            return 0
+        while self.size + n > capacity:
+            capacity *= 2
+        data = <char*> realloc(self.data, capacity)
+        if data == NULL:
+            raise MemoryError()
+        self.data = data
+        self.capacity = capacity
+        return 0
+
+    cdef int write(self, const char *s, Py_ssize_t n) except -1:
+        self.reserve(n)
+        memcpy(self.data + self.size, s, n)
+        self.size += n
+        return 0
+
+cdef inline Py_ssize_t _format_int(long long v, char *out) nogil:
+    # write the decimal representation of v, returning its length
+    cdef char tmp[24]
+    cdef Py_ssize_t n = 0, k = 0
+    cdef unsigned long long u = <unsigned long long> (-v) if v < 0 else <unsigned long long> v
+    while True:
+        tmp[n] = <char> (c'0' + u % 10)
+        u //= 10
+        n += 1
+        if u == 0:
+            break
+    if v < 0:
+        out[k] = c'-'
+        k += 1
+    while n > 0:
+        n -= 1
+        out[k] = tmp[n]
+        k += 1
+    return k
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def format_rows(double[:,:] block not None, bytes nodata not None,
+                int precision=0, bint integer=False):
+    """ Format rows of values as text, one row per line.
+
+    Parameters
+    ----------
+    block : 2-d array of doubles
+    nodata : bytes
+        text written in place of NaN
+    precision : int, optional
+        number of significant digits. If 0 (default), values are written
+        with the shortest representation that reads back exactly, as by
+        ``repr``.
+    integer : bool, optional
+        if True, values are written as integers
+
+    Returns
+    -------
+    bytes
+    """
+    cdef Py_ssize_t nrows = block.shape[0]
+    cdef Py_ssize_t ncols = block.shape[1]
+    cdef Py_ssize_t i, j, n
+    cdef double v
+    cdef char *s
+    cdef char code = b'r' if precision == 0 else b'g'
+    cdef int flags = Py_DTSF_ADD_DOT_0 if precision == 0 else 0
+    cdef const char *nd = nodata
+    cdef Py_ssize_t ndlen = len(nodata)
+    cdef _Buffer out = _Buffer(nrows*ncols*8 + nrows)
+
+    for i in range(nrows):
+        for j in range(ncols):
+            if j != 0:
+                out.write(b" ", 1)
+            v = block[i,j]
+            if isnan(v):
+                out.write(nd, ndlen)
+            elif integer:
+                out.reserve(24)
+                out.size += _format_int(<long long> v, out.data + out.size)
+            else:
+                s = PyOS_double_to_string(v, code, precision, flags, NULL)
+                n = strlen(s)
+                try:
+                    out.write(s, n)
+                finally:
+                    PyMem_Free(s)
+        out.write(b"\n", 1)
+    return PyBytes_FromStringAndSize(out.data, out.size)
@@ -10,6 +10,8 @@ Overview
 
 `CompressedBand` uses blosc compression to reduce in-memory footprint
 
+`InterleavedBand` stores the values of several bands together, pixel by pixel
+
 Implementation
 --------------
 
@@ -93,12 +95,24 @@ class BandIndexer(object):
                  1 + (xend-xstart-1) // abs(xstep),
                  len(bands)]
 
-        out = np.empty(shape, dtype = self.bands[0].dtype)
+        interleaved = self._interleaved(bands)
+        if interleaved is not None:
+            # read every band with a single block read
+            block = interleaved.getblock(ystart, xstart, yend-ystart, xend-xstart)
+            index = [self.bands[i].index for i in bands]
+            if index == list(range(block.shape[2])):
+                out = block[::ystep,::xstep]
+                if not interleaved.compressed:
+                    out = out.copy()
+            else:
+                out = block[::ystep,::xstep,index]
+        else:
+            out = np.empty(shape, dtype = self.bands[0].dtype)
 
-        for i, iband in enumerate(bands):
-            band = self.bands[iband]
-            band_values = band.getblock(ystart, xstart, yend-ystart, xend-xstart)
-            out[:,:,i] = band_values[::ystep,::xstep]
+            for i, iband in enumerate(bands):
+                band = self.bands[iband]
+                band_values = band.getblock(ystart, xstart, yend-ystart, xend-xstart)
+                out[:,:,i] = band_values[::ystep,::xstep]
 
         if collapse_bands:
             out = out[:,:,0]
@@ -165,12 +179,31 @@ class BandIndexer(object):
         else:
             val_array = np.broadcast_to(np.atleast_3d(value), shape)
 
+        interleaved = self._interleaved(bands)
+        if interleaved is not None and \
+                [self.bands[i].index for i in bands] == list(range(interleaved.nbands)):
+            interleaved.setblock(ystart, xstart, val_array)
+            return
+
         for i, iband in enumerate(bands):
             band = self.bands[iband]
             band.setblock(ystart, xstart, val_array[:,:,i])
 
         return
 
+    def _interleaved(self, bands):
+        """ Return the InterleavedBand storing every band in *bands*, or None
+        if the bands are not stored together. """
+        if len(bands) < 2:
+            return None
+        interleaved = getattr(self.bands[bands[0]], "interleaved", None)
+        if interleaved is None:
+            return None
+        for i in bands[1:]:
+            if getattr(self.bands[i], "interleaved", None) is not interleaved:
+                return None
+        return interleaved
+
     def _get_from_array_mask(self, mask):
         # The mask is assumed to be in (row, column[, band]) order
         # TODO: make this memory efficient
@@ -200,9 +233,13 @@ class BandIndexer(object):
 
     def __iter__(self):
         nx = self.bands[0].size[1]
+        interleaved = self._interleaved(list(range(len(self.bands))))
         for i in range(self.bands[0].size[0]):
             if len(self.bands) == 1:
                 yield self.bands[0].getblock(i, 0, 1, nx)
+            elif interleaved is not None:
+                index = [b.index for b in self.bands]
+                yield interleaved.getblock(i, 0, 1, nx)[0].T[index]
             else:
                 yield np.vstack([b.getblock(i, 0, 1, nx) for b in self.bands])
 
@@ -237,7 +274,7 @@ class SimpleBand(object):
         return self._array[yoff:yoff+ny, xoff:xoff+nx]
 
     def setblock(self, yoff, xoff, array):
-        (ny, nx) = array.shape
+        (ny, nx) = array.shape[:2]
         self._array[yoff:yoff+ny, xoff:xoff+nx] = array
         return
 
@@ -246,7 +283,8 @@ class CompressedBand(object):
     CHUNKSET = 1
     CHUNKUNSET = 0
 
-    def __init__(self, size, dtype, chunksize=(256, 256), initval=0):
+    def __init__(self, size, dtype, chunksize=(256, 256), initval=0,
+                 depth=None):
         """ Initialize a CompressedBand instance.
 
         Parameters
@@ -260,11 +298,18 @@ class CompressedBand(object):
         initval : value, optional
             if set, the entire grid is initialized with this value, which should
             be of *dtype*
+        depth : int, optional
+            if set, each pixel holds *depth* values, and blocks have dimensions
+            (ny, nx, *depth*)
         """
         assert len(size) == 2
         self.size = size
         self.dtype = dtype
         self._chunksize = chunksize
+        if depth is None:
+            self._chunkshape = tuple(chunksize)
+        else:
+            self._chunkshape = tuple(chunksize) + (depth,)
         self._initval = initval
 
         self.nchunkrows = int(ceil(float(size[0])/float(chunksize[0])))
@@ -287,7 +332,7 @@ class CompressedBand(object):
 
     def _retrieve(self, index):
         bytestr = blosc.decompress(self._data[index])
-        return np.fromstring(bytestr, dtype=self.dtype).reshape(self._chunksize)
+        return np.fromstring(bytestr, dtype=self.dtype).reshape(self._chunkshape)
 
     def _getchunks(self, yoff, xoff, ny, nx):
         """ Return a generator returning tuples identifying chunks covered by a
@@ -331,7 +376,7 @@ class CompressedBand(object):
             if self.chunkstatus[i] == self.CHUNKSET:
                 chunkdata = self._retrieve(i)
             else:
-                chunkdata = np.full(self._chunksize, self._initval, dtype=self.dtype)
+                chunkdata = np.full(self._chunkshape, self._initval, dtype=self.dtype)
 
             # Compute region within chunk to place data in
             cy0 = max(0, yoff-yst)
@@ -355,7 +400,7 @@ class CompressedBand(object):
         """ Retrieve values with dimensions *size*, starting at offset *yoff*,
         *xoff*.
         """
-        result = np.empty([ny, nx], self.dtype)
+        result = np.empty((ny, nx) + self._chunkshape[2:], self.dtype)
         for i, yst, yen, xst, xen in self._getchunks(yoff, xoff, ny, nx):
 
             # Compute the bounds in the output
@@ -365,9 +410,7 @@ class CompressedBand(object):
             ox1 = min(nx, xen-xoff)
 
             if self.chunkstatus[i] == self.CHUNKUNSET:
-                result[oy0:oy1, ox0:ox1] = np.full((oy1-oy0, ox1-ox0),
-                                                   self._initval,
-                                                   dtype=self.dtype)
+                result[oy0:oy1, ox0:ox1] = self._initval
 
             else:
                 # Compute the extents from the chunk to retain
@@ -380,3 +423,171 @@ class CompressedBand(object):
 
         return result
 
+
+class InterleavedBand(object):
+    """ InterleavedBand stores the values of several bands in a single
+    (ny, nx, nbands) array, so that the values of all bands at a pixel are
+    adjacent in memory. Data may be compressed in chunks spanning every band,
+    so that reading a window of all bands decompresses each chunk once.
+
+    An InterleavedBand is not itself a band. Its `bands` attribute holds one
+    `InterleavedLayer` per band, which implement the band interface and are
+    used to construct grids::
+
+        store = InterleavedBand((ny, nx), np.uint16, 4)
+        grid = RegularGrid(transform, bands=store.bands)
+
+    Grids created from three-dimensional values with
+    ``bandclass=InterleavedBand`` use a single InterleavedBand.
+    """
+
+    def __init__(self, size, dtype, nbands, initval=None, compress=True,
+                 chunksize=(256, 256)):
+        """ Initialize an InterleavedBand instance.
+
+        Parameters
+        ----------
+        size : tuple of two ints
+            size of bands in pixels
+        dtype : type
+            data type of pixel values
+        nbands : int
+            number of bands
+        initval : value, optional
+            if set, all bands are initialized with this value
+        compress : bool, optional
+            whether to store data in blosc-compressed chunks (default True)
+        chunksize : tuple of two ints, optional
+            size of compressed chunks, default (256, 256)
+        """
+        self.size = tuple(size)
+        self.dtype = dtype
+        self.nbands = nbands
+        if compress:
+            self._store = CompressedBand(self.size, dtype, chunksize=chunksize,
+                                         initval=0 if initval is None else initval,
+                                         depth=nbands)
+        else:
+            self._store = SimpleBand(self.size + (nbands,), dtype, initval=initval)
+        self.bands = [InterleavedLayer(self, i) for i in range(nbands)]
+        return
+
+    @property
+    def compressed(self):
+        return isinstance(self._store, CompressedBand)
+
+    def getblock(self, yoff, xoff, ny, nx):
+        """ Retrieve values of every band as an array with dimensions (*ny*,
+        *nx*, nbands), starting at offset *yoff*, *xoff*.
+        """
+        return self._store.getblock(yoff, xoff, ny, nx)
+
+    def setblock(self, yoff, xoff, array):
+        """ Store a block of values with dimensions (ny, nx, nbands) starting
+        at offset *yoff*, *xoff*.
+        """
+        self._store.setblock(yoff, xoff, array)
+        return
+
+class InterleavedLayer(object):
+    """ InterleavedLayer is a single band of an `InterleavedBand`. """
+
+    def __init__(self, interleaved, index):
+        self.interleaved = interleaved
+        self.index = index
+        return
+
+    @property
+    def size(self):
+        return self.interleaved.size
+
+    @property
+    def dtype(self):
+        return self.interleaved.dtype
+
+    @property
+    def bandclass(self):
+        """ Class used to allocate new single bands """
+        return CompressedBand if self.interleaved.compressed else SimpleBand
+
+    @property
+    def _chunksize(self):
+        return getattr(self.interleaved._store, "_chunksize", (256, 256))
+
+    def getblock(self, yoff, xoff, ny, nx):
+        return self.interleaved.getblock(yoff, xoff, ny, nx)[:,:,self.index]
+
+    def setblock(self, yoff, xoff, array):
+        ny, nx = array.shape
+        if self.interleaved.compressed:
+            block = self.interleaved.getblock(yoff, xoff, ny, nx)
+            block[:,:,self.index] = array
+            self.interleaved.setblock(yoff, xoff, block)
+        else:
+            # plain storage returns a view
+            self.interleaved.getblock(yoff, xoff, ny, nx)[:,:,self.index] = array
+        return
+
+class BandWindow(object):
+    """ BandWindow is a view of a rectangular region of another band. Values
+    are read from and written to the parent band, so that creating a window
+    copies no data. """
+
+    def __init__(self, band, yoff, xoff, size, writable=False):
+        """ Initialize a BandWindow instance.
+
+        Parameters
+        ----------
+        band : band instance
+            band to view
+        yoff, xoff : int
+            offset of the window in *band*
+        size : tuple of two ints
+            size of the window in pixels
+        writable : bool, optional
+            whether values may be set through the window (default False)
+        """
+        ny, nx = size
+        if yoff < 0 or xoff < 0 or ny < 0 or nx < 0 or \
+                yoff+ny > band.size[0] or xoff+nx > band.size[1]:
+            raise IndexError("window ({0}, {1}, {2}, {3}) outside of band with "
+                             "size {4}".format(yoff, xoff, ny, nx, band.size))
+        if isinstance(band, BandWindow):
+            writable = writable and band.writable
+            yoff += band.yoff
+            xoff += band.xoff
+            band = band.band
+        self.band = band
+        self.yoff = yoff
+        self.xoff = xoff
+        self.size = (ny, nx)
+        self.writable = writable
+        return
+
+    @property
+    def dtype(self):
+        return self.band.dtype
+
+    @property
+    def bandclass(self):
+        """ Class of the parent band, used to allocate new bands """
+        return getattr(self.band, "bandclass", type(self.band))
+
+    def getblock(self, yoff, xoff, ny, nx):
+        ny = min(ny, self.size[0]-yoff)
+        nx = min(nx, self.size[1]-xoff)
+        return self.band.getblock(self.yoff+yoff, self.xoff+xoff, ny, nx)
+
+    def setblock(self, yoff, xoff, array):
+        if not self.writable:
+            raise ValueError("band window is read-only")
+        array = array[:self.size[0]-yoff, :self.size[1]-xoff]
+        self.band.setblock(self.yoff+yoff, self.xoff+xoff, array)
+        return
+
+    def __deepcopy__(self, memo):
+        # copies are independent bands holding only the windowed values
+        band = self.bandclass(self.size, self.dtype)
+        if self.size[0] != 0 and self.size[1] != 0:
+            band.setblock(0, 0, np.array(self.getblock(0, 0, *self.size)))
+        return band
@@ -0,0 +1,276 @@
+"""
+Reclassification and value counts of categorical grids
+
+Grids are processed one chunk at a time by a pool of threads. Integer bands
+of at most 16 bits are reclassified by indexing a lookup table holding the
+class of every representable value, and counted with `numpy.bincount`. Other
+bands are reclassified by binary search in sorted class values or range
+bounds.
+"""
+
+import numpy as np
+from .grid import RegularGrid, get_nodata
+from .misc import _chunks, _map_chunks
+
+def _is_small_int(dtype):
+    return dtype.kind in "iu" and dtype.itemsize <= 2
+
+def _unsigned(dtype):
+    return np.dtype("u{0}".format(dtype.itemsize))
+
+def _all_values(dtype):
+    """ Return every value representable by a small integer type, ordered by
+    their unsigned bit patterns. """
+    return np.arange(2**(8*dtype.itemsize)).astype(_unsigned(dtype)).view(dtype)
+
+class _Classes(object):
+    """ Vectorized lookup of the classes of values from a mapping or a
+    sequence of (lower, upper, value) ranges. """
+
+    def __init__(self, classes):
+        if hasattr(classes, "items"):
+            items = sorted(classes.items())
+            self.ranges = False
+            self.keys = np.array([k for k, _ in items])
+            self.values = np.array([v for _, v in items])
+        else:
+            items = sorted(tuple(c) for c in classes)
+            if any(len(c) != 3 for c in items):
+                raise ValueError("ranges must be (lower, upper, value) tuples")
+            self.ranges = True
+            self.keys = np.array([c[0] for c in items])
+            self.upper = np.array([c[1] for c in items])
+            self.values = np.array([c[2] for c in items])
+            if np.any(self.upper <= self.keys) or \
+                    np.any(self.upper[:-1] > self.keys[1:]):
+                raise ValueError("ranges must be non-empty and must not overlap")
+        if len(items) == 0:
+            raise ValueError("no classes given")
+        return
+
+    def __call__(self, v, fill, dtype):
+        """ Return the classes of values in *v*, or *fill* for values without
+        a class. """
+        if self.ranges:
+            k = np.searchsorted(self.keys, v, side="right") - 1
+            kc = np.clip(k, 0, len(self.keys)-1)
+            found = (k >= 0) & (v < self.upper[kc])
+        else:
+            kc = np.clip(np.searchsorted(self.keys, v), 0, len(self.keys)-1)
+            found = self.keys[kc] == v
+        out = np.full(v.shape, fill, dtype=dtype)
+        out[found] = self.values[kc[found]]
+        return out
+
+# minimum number of pending distinct values merged at once by value_counts
+_MERGE_SIZE = 2**16
+
+# integer types tried for the output of reclassify, from smallest
+_INT_TYPES = [np.uint8, np.int8, np.uint16, np.int16, np.uint32, np.int32,
+              np.int64]
+
+def _output_dtype(values, default, nodata_value):
+    """ Return the smallest type holding the new *values*, *default*, and
+    *nodata_value*, or if *nodata_value* is None, a default NoData value
+    distinct from the new values. """
+    new = np.asarray(values)
+    if default is not None:
+        new = np.append(new, default)
+    if new.dtype.kind in "biu":
+        if nodata_value is not None and not float(nodata_value).is_integer():
+            # a NaN or fractional NoData value requires a float type
+            new = new.astype(np.float64)
+        else:
+            for t in _INT_TYPES:
+                info = np.iinfo(t)
+                if new.min() < info.min or new.max() > info.max:
+                    continue
+                if nodata_value is None:
+                    nodata = get_nodata(t)
+                    if np.any(new == nodata):
+                        continue
+                else:
+                    nodata = nodata_value
+                if info.min <= nodata <= info.max:
+                    return np.dtype(t)
+            return new.dtype
+    if new.dtype.kind == "f":
+        with np.errstate(over="ignore", invalid="ignore"):
+            exact = (new.astype(np.float32) == new) | np.isnan(new)
+        if exact.all():
+            return np.dtype(np.float32)
+    return new.dtype
+
+def _is_nodata(v, nodata):
+    if np.isnan(nodata):
+        return np.isnan(v) if v.dtype.kind in "fc" else np.zeros(v.shape, dtype=bool)
+    return v == nodata
+
+def reclassify(grid, classes, band=0, default=None, dtype=None,
+               nodata_value=None, chunksize=None, nthreads=None):
+    """ Assign new values to grid cells by class.
+
+    Parameters
+    ----------
+    grid : RegularGrid
+    classes : dict or sequence of tuples
+        either a mapping from cell values to new values, or a sequence of
+        (lower, upper, value) tuples assigning *value* to cells in the
+        half-open interval [lower, upper). Ranges must not overlap.
+    band : int, optional
+        band to reclassify (default 0)
+    default : number, optional
+        value of cells not in any class. If None (default), these cells are
+        NoData.
+    dtype : numpy dtype, optional
+        type of the output (default the smallest type holding the new values,
+        *default*, and the NoData value, such as uint8 for small class
+        numbers)
+    nodata_value : number, optional
+        NoData value of the output (default chosen by *dtype*). NoData cells
+        in *grid* are NoData in the output.
+    chunksize : tuple of two ints, optional
+        size of chunks to process at once (default the chunk size of the
+        band, or (256, 256))
+    nthreads : int, optional
+        number of threads to use (default number of CPUs)
+
+    Returns
+    -------
+    RegularGrid
+    """
+    classes = _Classes(classes)
+    if dtype is None:
+        dtype = _output_dtype(classes.values, default, nodata_value)
+    dtype = np.dtype(dtype)
+    if nodata_value is None:
+        nodata_value = get_nodata(dtype.type)
+    fill = nodata_value if default is None else default
+
+    src = grid.bands[band]
+    srctype = np.dtype(src.dtype)
+    nodata = grid.nodata
+    if chunksize is None:
+        chunksize = getattr(src, "_chunksize", (256, 256))
+
+    if _is_small_int(srctype):
+        values = _all_values(srctype)
+        lut = classes(values, fill, dtype)
+        lut[_is_nodata(values, nodata)] = nodata_value
+        utype = _unsigned(srctype)
+        compute = lambda v: np.take(lut, v.view(utype))
+    else:
+        def compute(v):
+            out = classes(v, fill, dtype)
+            out[_is_nodata(v, nodata)] = nodata_value
+            return out
+
+    read = lambda c: src.getblock(c[0], c[2], c[1]-c[0], c[3]-c[2])
+    out = grid._bndcls(grid.size, dtype.type, initval=nodata_value)
+    for chunk, result in _map_chunks(_chunks(grid.size, chunksize), read,
+                                     compute, nthreads):
+        out.setblock(chunk[0], chunk[2], result)
+    return RegularGrid(grid.transform, bands=[out], crs=grid.crs,
+                       nodata_value=nodata_value)
+
+def _merge_counts(parts):
+    """ Merge (values, counts) pairs into the counts of distinct values. """
+    values = np.concatenate([v for v, _ in parts])
+    counts = np.concatenate([n for _, n in parts]).astype(np.int64)
+    if len(values) == 0:
+        return values, counts
+    order = np.argsort(values, kind="mergesort")
+    values = values[order]
+    counts = counts[order]
+    start = np.flatnonzero(np.concatenate([[True], values[1:] != values[:-1]]))
+    return values[start], np.add.reduceat(counts, start)
+
+def value_counts(grid, band=0, bins=None, chunksize=None, nthreads=None):
+    """ Count the cells of each distinct value in a grid band, or of values in
+    each of a sequence of bins. NoData cells are not counted.
+
+    Parameters
+    ----------
+    grid : RegularGrid
+    band : int, optional
+        band to count (default 0)
+    bins : sequence of numbers, optional
+        monotonically increasing bin edges. If given, values are counted in
+        bins as by `numpy.histogram`.
+    chunksize : tuple of two ints, optional
+        size of chunks to process at once (default the chunk size of the
+        band, or (256, 256))
+    nthreads : int, optional
+        number of threads to use (default number of CPUs)
+
+    Returns
+    -------
+    (values, counts) : tuple of ndarrays
+        distinct values in increasing order and their counts, or if *bins* is
+        given, the bin edges and the count in each bin
+
+    Notes
+    -----
+    Without *bins*, memory use is proportional to the number of distinct
+    values, which for continuous floating point data may approach the number
+    of cells. Use *bins* to count such data in bounded memory.
+    """
+    src = grid.bands[band]
+    srctype = np.dtype(src.dtype)
+    nodata = grid.nodata
+    if chunksize is None:
+        chunksize = getattr(src, "_chunksize", (256, 256))
+    read = lambda c: src.getblock(c[0], c[2], c[1]-c[0], c[3]-c[2])
+
+    if bins is not None:
+        bins = np.asarray(bins, dtype=np.float64)
+        if bins.ndim != 1 or len(bins) < 2 or np.any(np.diff(bins) < 0):
+            raise ValueError("bins must be an increasing sequence of edges")
+
+        def compute(v):
+            v = v[~_is_nodata(v, nodata)]
+            if v.dtype.kind in "fc":
+                v = v[~np.isnan(v)]
+            return np.histogram(v, bins=bins)[0]
+
+        counts = np.zeros(len(bins)-1, dtype=np.int64)
+        for _, result in _map_chunks(_chunks(grid.size, chunksize), read,
+                                     compute, nthreads):
+            counts += result
+        return bins, counts
+
+    if _is_small_int(srctype):
+        utype = _unsigned(srctype)
+        nvalues = 2**(8*srctype.itemsize)
+        compute = lambda v: np.bincount(v.view(utype).ravel(), minlength=nvalues)
+        counts = np.zeros(nvalues, dtype=np.int64)
+        for _, result in _map_chunks(_chunks(grid.size, chunksize), read,
+                                     compute, nthreads):
+            counts += result
+        values = _all_values(srctype)
+        counts[_is_nodata(values, nodata)] = 0
+        order = np.argsort(values)
+        values, counts = values[order], counts[order]
+        return values[counts != 0], counts[counts != 0]
+
+    def compute(v):
+        v = v[~_is_nodata(v, nodata)]
+        if v.dtype.kind in "fc":
+            v = v[~np.isnan(v)]
+        return np.unique(v, return_counts=True)
+
+    # chunk results are merged into the running totals once they outnumber
+    # them, so that pending results take no more memory than the totals while
+    # each value is merged only a logarithmic number of times
+    totals = (np.zeros(0, dtype=srctype), np.zeros(0, dtype=np.int64))
+    parts = []
+    npending = 0
+    for _, result in _map_chunks(_chunks(grid.size, chunksize), read, compute,
+                                 nthreads):
+        parts.append(result)
+        npending += len(result[0])
+        if npending >= max(len(totals[0]), _MERGE_SIZE):
+            totals = _merge_counts([totals] + parts)
+            parts = []
+            npending = 0
+    return _merge_counts([totals] + parts)
@@ -0,0 +1,224 @@
+""" Contour extraction by marching squares
+
+Grid values are treated as samples at cell centers, and each square formed by
+four neighbouring centers is classified by which of its corners are at or
+above a contour level. Crossings are placed by linear interpolation along
+square edges. Each crossing is identified by the grid edge it lies on, so
+that segments produced from separate blocks of a grid can be joined exactly
+into polylines.
+"""
+
+import numpy as np
+cimport numpy as np
+cimport cython
+
+# Edges of a square crossed by the contour for each corner classification,
+# where corners are numbered clockwise from top-left (bit 0) and edges
+# clockwise from the top (0: top, 1: right, 2: bottom, 3: left). Saddles (5
+# and 10) list the pairs used when the center is below the level; when the
+# center is at or above the level, the alternate pairing is used.
+cdef int CASE_EDGES[64]
+cdef int SADDLE_EDGES[64]
+
+for _c, _edges in enumerate([[-1, -1], [3, 0], [0, 1], [3, 1], [1, 2],
+                             [3, 0, 1, 2], [0, 2], [2, 3], [2, 3], [0, 2],
+                             [0, 1, 2, 3], [1, 2], [3, 1], [0, 1], [3, 0],
+                             [-1, -1]]):
+    for _k in range(4):
+        CASE_EDGES[4*_c+_k] = _edges[_k] if _k < len(_edges) else -1
+        SADDLE_EDGES[4*_c+_k] = -1
+for _k, _edge in enumerate([0, 1, 2, 3]):
+    SADDLE_EDGES[4*5+_k] = _edge
+for _k, _edge in enumerate([3, 0, 1, 2]):
+    SADDLE_EDGES[4*10+_k] = _edge
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef inline int _case(double[:,:] z, np.uint8_t[:,:] valid, Py_ssize_t i,
+                      Py_ssize_t j, double level) nogil:
+    if not (valid[i,j] and valid[i,j+1] and valid[i+1,j+1] and valid[i+1,j]):
+        return 0
+    return ((z[i,j] >= level) | (z[i,j+1] >= level) << 1 |
+            (z[i+1,j+1] >= level) << 2 | (z[i+1,j] >= level) << 3)
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+cdef inline np.int64_t _crossing(double[:,:] z, Py_ssize_t i, Py_ssize_t j,
+                                 int edge, double level, np.int64_t i0,
+                                 np.int64_t j0, np.int64_t nx,
+                                 double *row, double *col) nogil:
+    # locate the crossing on one edge of square (i, j), returning its key
+    cdef double a, b
+    cdef np.int64_t gi = i + i0
+    cdef np.int64_t gj = j + j0
+    if edge == 0:
+        a = z[i,j]
+        b = z[i,j+1]
+        row[0] = gi + 0.5
+        col[0] = gj + 0.5 + (level - a) / (b - a)
+        return 2 * (gi*nx + gj)
+    elif edge == 1:
+        a = z[i,j+1]
+        b = z[i+1,j+1]
+        row[0] = gi + 0.5 + (level - a) / (b - a)
+        col[0] = gj + 1.5
+        return 2 * (gi*nx + gj + 1) + 1
+    elif edge == 2:
+        a = z[i+1,j]
+        b = z[i+1,j+1]
+        row[0] = gi + 1.5
+        col[0] = gj + 0.5 + (level - a) / (b - a)
+        return 2 * ((gi+1)*nx + gj)
+    else:
+        a = z[i,j]
+        b = z[i+1,j]
+        row[0] = gi + 0.5 + (level - a) / (b - a)
+        col[0] = gj + 0.5
+        return 2 * (gi*nx + gj) + 1
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def contour_segments(double[:,:] z not None, np.uint8_t[:,:] valid not None,
+                     double level, long i0, long j0, long nx):
+    """ Return the contour segments at *level* in a block of grid values.
+
+    Parameters
+    ----------
+    z : 2-d array of doubles
+        block of grid values, whose first row and column have grid indices
+        *i0*, *j0*
+    valid : 2-d array of uint8
+        nonzero where *z* holds data. Squares with an invalid corner are
+        skipped, so contours end at the edge of nodata regions.
+    level : float
+        contour level
+    i0, j0 : int
+        grid indices of the block origin
+    nx : int
+        number of columns in the full grid, used to compute edge keys
+
+    Returns
+    -------
+    (keys, positions)
+        *keys* is an (n x 2) int64 array identifying the grid edges at either
+        end of each segment, and *positions* is an (n x 4) array of the
+        segment endpoints (row0, col0, row1, col1) in fractional grid indices
+        of cell centers
+    """
+    cdef Py_ssize_t nrows = z.shape[0]
+    cdef Py_ssize_t ncols = z.shape[1]
+    cdef Py_ssize_t i, j, n = 0
+    cdef int c, k
+    cdef int *edges
+    cdef double center, r, q
+
+    if valid.shape[0] != nrows or valid.shape[1] != ncols:
+        raise ValueError("z and valid must have the same shape")
+
+    with nogil:
+        for i in range(nrows-1):
+            for j in range(ncols-1):
+                c = _case(z, valid, i, j, level)
+                if c == 5 or c == 10:
+                    n += 2
+                elif c != 0 and c != 15:
+                    n += 1
+
+    cdef np.ndarray[np.int64_t, ndim=2] keys = np.empty((n, 2), dtype=np.int64)
+    cdef np.ndarray[np.float64_t, ndim=2] positions = np.empty((n, 4), dtype=np.float64)
+    n = 0
+    with nogil:
+        for i in range(nrows-1):
+            for j in range(ncols-1):
+                c = _case(z, valid, i, j, level)
+                if c == 0 or c == 15:
+                    continue
+                edges = &CASE_EDGES[4*c]
+                if c == 5 or c == 10:
+                    center = 0.25 * (z[i,j] + z[i,j+1] + z[i+1,j+1] + z[i+1,j])
+                    if center >= level:
+                        edges = &SADDLE_EDGES[4*c]
+                for k in range(0, 4, 2):
+                    if edges[k] == -1:
+                        break
+                    keys[n,0] = _crossing(z, i, j, edges[k], level, i0, j0, nx,
+                                          &r, &q)
+                    positions[n,0] = r
+                    positions[n,1] = q
+                    keys[n,1] = _crossing(z, i, j, edges[k+1], level, i0, j0, nx,
+                                          &r, &q)
+                    positions[n,2] = r
+                    positions[n,3] = q
+                    n += 1
+    return keys, positions
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def link_segments(np.int64_t[:,:] keys not None):
+    """ Join segments that share endpoint keys into polylines.
+
+    Each key is expected to be shared by at most two segments.
+
+    Parameters
+    ----------
+    keys : (n x 2) int64 array
+        endpoint keys of each segment, as returned by `contour_segments`
+
+    Returns
+    -------
+    (path, offsets)
+        *path* lists endpoints in polyline order, where endpoint *e* refers
+        to ``keys[e % n, e // n]``. Polyline *k* is given by
+        ``path[offsets[k]:offsets[k+1]]``. Closed polylines repeat their first
+        endpoint at the end.
+    """
+    cdef Py_ssize_t n = keys.shape[0]
+    cdef Py_ssize_t e, f, g, k, npath, nlines
+    cdef np.ndarray[np.int64_t] flat = np.concatenate([np.asarray(keys[:,0]),
+                                                       np.asarray(keys[:,1])])
+    cdef np.ndarray[np.intp_t] order = np.argsort(flat, kind="mergesort")
+    cdef np.ndarray[np.intp_t] partner = np.full(2*n, -1, dtype=np.intp)
+    cdef np.ndarray[np.uint8_t] visited = np.zeros(n, dtype=np.uint8)
+    cdef np.ndarray[np.intp_t] path = np.empty(3*n, dtype=np.intp)
+    cdef np.ndarray[np.intp_t] offsets = np.empty(n+1, dtype=np.intp)
+    cdef int closed, sweep
+
+    with nogil:
+        for k in range(2*n-1):
+            if flat[order[k]] == flat[order[k+1]]:
+                partner[order[k]] = order[k+1]
+                partner[order[k+1]] = order[k]
+
+        # open polylines are traced from their free ends, and closed
+        # polylines from any remaining segment
+        npath = 0
+        nlines = 0
+        for sweep in range(2):
+            for e in range(2*n):
+                if visited[e % n]:
+                    continue
+                if sweep == 0 and partner[e] != -1:
+                    continue
+                offsets[nlines] = npath
+                nlines += 1
+                path[npath] = e
+                npath += 1
+                closed = 0
+                while True:
+                    visited[e % n] = 1
+                    f = e + n if e < n else e - n
+                    path[npath] = f
+                    npath += 1
+                    g = partner[f]
+                    if g == -1:
+                        break
+                    if visited[g % n]:
+                        closed = 1
+                        break
+                    e = g
+                if closed:
+                    # replace the last endpoint by the first to close exactly
+                    path[npath-1] = path[offsets[nlines-1]]
+        offsets[nlines] = npath
+    return path[:npath], offsets[:nlines+1]
@@ -10,6 +10,46 @@ def coordinate_transformer(crs1, crs2):
             return crs1.transform(crs2, x, y)
     return transformer
 
+def affine_mesh(transform, ivec, jvec, offset=0.5, broadcast=False):
+    """ Return x, y arrays with shape (len(ivec), len(jvec)) giving the
+    positions of grid indices under an affine transform.
+
+    When the transform has no skew, x depends only on column and y depends only
+    on row, so that coordinates are computed from 1-d vectors in O(nx+ny)
+    operations.
+
+    Parameters
+    ----------
+    transform : tuple
+        RegularGrid transform tuple in the form (x0, y0, dx, dy, sx, sy)
+    ivec, jvec : 1-d arrays
+        row and column indices
+    offset : float, optional
+        fractional index offset (default 0.5, for cell centers)
+    broadcast : bool, optional
+        if True and the transform has no skew, return read-only broadcast
+        views of the 1-d coordinate vectors, requiring O(nx+ny) memory rather
+        than O(nx*ny) (default False)
+
+    Returns
+    -------
+    (ndarray, ndarray)
+    """
+    T = transform
+    ivec = np.asarray(ivec) + offset
+    jvec = np.asarray(jvec) + offset
+    shape = (len(ivec), len(jvec))
+    if T[4] == 0 and T[5] == 0:
+        x = np.broadcast_to(T[0] + jvec*T[2], shape)
+        y = np.broadcast_to((T[1] + ivec*T[3])[:,np.newaxis], shape)
+        if not broadcast:
+            x = x.copy()
+            y = y.copy()
+    else:
+        x = T[0] + jvec[np.newaxis,:]*T[2] + ivec[:,np.newaxis]*T[4]
+        y = T[1] + ivec[:,np.newaxis]*T[3] + jvec[np.newaxis,:]*T[5]
+    return x, y
+
 class CoordinateGenerator(object):
     """ Class that generates coordinates from grid indices in a specified
     coordinate system. """
@@ -43,24 +83,156 @@ class CoordinateGenerator(object):
         # slicing is supported
         X, Y = cg[:, 200:32:-2]
         allX, allY = cg[:,:]
+
+        Notes
+        -----
+        When the transform is unskewed and no coordinate transformation is
+        required, coordinates are separable, and `axes()` returns them as 1-d
+        vectors.
         """
         self.transform = transform
         self.size = size
         self._coordtransformer = coordinate_transformer(transform_crs, output_crs)
+        self._separable = (transform[4] == 0 and transform[5] == 0 and
+                           transform_crs == output_crs)
+
+    @property
+    def separable(self):
+        """ True if x coordinates depend only on column and y coordinates
+        depend only on row """
+        return self._separable
 
     def __getitem__(self, key):
         if len(key) != 2:
             raise KeyError("CoordinateGenerator indices must be length 2")
         ikey, jkey = key
+
         if isinstance(ikey, slice):
             ikey = np.arange(*ikey.indices(self.size[0]))
         if isinstance(jkey, slice):
             jkey = np.arange(*jkey.indices(self.size[1]))
         if hasattr(ikey, "__len__") and hasattr(jkey, "__len__") and \
                 (len(ikey) > 1) and (len(jkey) > 1):
-            jkey, ikey = np.meshgrid(jkey, ikey)
+            x_, y_ = affine_mesh(self.transform, ikey, jkey)
+            if not self._separable:
+                x_, y_ = self._coordtransformer(x_, y_)
+            return x_, y_
+
         T = self.transform
         x_ = T[0] + jkey*T[2] + ikey*T[4] + 0.5*T[2] + 0.5*T[4]
         y_ = T[1] + ikey*T[3] + jkey*T[5] + 0.5*T[3] + 0.5*T[5]
         return self._coordtransformer(x_, y_)
 
+    def axes(self, ikey=slice(None), jkey=slice(None)):
+        """ Return 1-d x and y coordinate vectors for a separable generator.
+        The full coordinate mesh is the outer combination of the two vectors.
+
+        Parameters
+        ----------
+        ikey, jkey : slice or vector of ints, optional
+            row and column indices (default all)
+
+        Returns
+        -------
+        (ndarray, ndarray)
+
+        Raises
+        ------
+        ValueError
+            if the transform is skewed or requires a coordinate transformation
+        """
+        if not self._separable:
+            raise ValueError("coordinates are not separable")
+        if isinstance(ikey, slice):
+            ikey = np.arange(*ikey.indices(self.size[0]))
+        if isinstance(jkey, slice):
+            jkey = np.arange(*jkey.indices(self.size[1]))
+        T = self.transform
+        return (T[0] + (np.asarray(jkey)+0.5)*T[2],
+                T[1] + (np.asarray(ikey)+0.5)*T[3])
+
+class ApproximateTransformer(object):
+    """ Approximates a smooth mapping from grid indices (i, j) to positions
+    (u, v) by bilinear interpolation between exactly evaluated control points.
+
+    A rectangular block of indices is tested by comparing the interpolated
+    mapping with exact values at the block center and edge midpoints. Blocks
+    that fail the test are split into quadrants until they pass or become
+    smaller than *min_size*, in which case the mapping is evaluated exactly.
+    """
+
+    def __init__(self, func, error=0.125, min_size=4):
+        """
+        Parameters
+        ----------
+        func : callable
+            function taking float index arrays *i*, *j* and returning position
+            arrays *u*, *v*
+        error : float, optional
+            maximum tolerated interpolation error in units of *u*, *v*
+            (default 0.125). If zero, every index is evaluated exactly.
+        min_size : int, optional
+            blocks with fewer rows or columns are evaluated exactly
+            (default 4)
+        """
+        self.func = func
+        self.error = error
+        self.min_size = max(min_size, 3)
+
+    def __call__(self, i0, i1, j0, j1):
+        """ Return arrays *u*, *v* with shape (i1-i0, j1-j0) for the block of
+        indices i0 <= i < i1, j0 <= j < j1. """
+        U = np.empty((i1-i0, j1-j0), dtype=np.float64)
+        V = np.empty((i1-i0, j1-j0), dtype=np.float64)
+        self._fill(U, V, i0, i1, j0, j1, i0, j0)
+        return U, V
+
+    def _exact(self, U, V, i0, i1, j0, j1, ioff, joff):
+        J, I = np.meshgrid(np.arange(j0, j1, dtype=np.float64),
+                           np.arange(i0, i1, dtype=np.float64))
+        u, v = self.func(I.ravel(), J.ravel())
+        U[i0-ioff:i1-ioff, j0-joff:j1-joff] = np.reshape(u, I.shape)
+        V[i0-ioff:i1-ioff, j0-joff:j1-joff] = np.reshape(v, I.shape)
+
+    def _fill(self, U, V, i0, i1, j0, j1, ioff, joff):
+        ni = i1 - i0
+        nj = j1 - j0
+        if self.error <= 0 or ni < self.min_size or nj < self.min_size:
+            self._exact(U, V, i0, i1, j0, j1, ioff, joff)
+            return
+
+        # evaluate a 3x3 lattice of control and test points
+        ia = float(i0)
+        ib = float(i1-1)
+        ja = float(j0)
+        jb = float(j1-1)
+        ic = 0.5*(ia+ib)
+        jc = 0.5*(ja+jb)
+        I = np.array([ia, ia, ia, ic, ic, ic, ib, ib, ib])
+        J = np.array([ja, jc, jb, ja, jc, jb, ja, jc, jb])
+        u, v = self.func(I, J)
+        u = np.asarray(u, dtype=np.float64).reshape(3, 3)
+        v = np.asarray(v, dtype=np.float64).reshape(3, 3)
+
+        def interp(c, a, b):
+            # bilinear interpolation from corners at fractional positions
+            return ((1-a)*(1-b)*c[0,0] + (1-a)*b*c[0,2] +
+                    a*(1-b)*c[2,0] + a*b*c[2,2])
+
+        frac = np.array([0.0, 0.5, 1.0])
+        A, B = np.meshgrid(frac, frac, indexing="ij")
+        err = np.max(np.abs([interp(u, A, B) - u, interp(v, A, B) - v]))
+
+        if err <= self.error:
+            a = ((np.arange(i0, i1) - ia) / (ib - ia))[:,np.newaxis]
+            b = ((np.arange(j0, j1) - ja) / (jb - ja))[np.newaxis,:]
+            U[i0-ioff:i1-ioff, j0-joff:j1-joff] = interp(u, a, b)
+            V[i0-ioff:i1-ioff, j0-joff:j1-joff] = interp(v, a, b)
+        else:
+            im = i0 + ni//2
+            jm = j0 + nj//2
+            self._fill(U, V, i0, im, j0, jm, ioff, joff)
+            self._fill(U, V, i0, im, jm, j1, ioff, joff)
+            self._fill(U, V, im, i1, j0, jm, ioff, joff)
+            self._fill(U, V, im, i1, jm, j1, ioff, joff)
+        return
@@ -0,0 +1,215 @@
+""" Kernels for accumulated cost distance
+
+Accumulated costs are computed by Dijkstra's algorithm from every source
+cell at once, using a binary heap of open cells in which cells are pushed
+again when their cost decreases, and stale entries are skipped when popped.
+
+The cost of a move is its length times the mean cost of the cells it
+crosses. Moves to the 8 adjacent cells cross the starting and ending cells,
+and knight's moves cross, for a quarter of their length each, the starting
+and ending cells and the two cells between them. NaN costs are barriers.
+
+Each reached cell records the move that reached it, as a code from 1 to 16
+indexing MOVES, or 0 for sources. Unreached cells have code 255.
+Kernels release the GIL.
+"""
+
+import numpy as np
+cimport numpy as np
+cimport cython
+from libc.stdlib cimport realloc, free
+from libc.math cimport sqrt, isnan, INFINITY
+
+ctypedef np.int64_t int64
+ctypedef np.uint8_t uint8
+
+# row and column steps of each move; the first 8 are to adjacent cells and
+# the last 8 are knight's moves
+MOVES = [(0, 1), (1, 1), (1, 0), (1, -1), (0, -1), (-1, -1), (-1, 0), (-1, 1),
+         (1, 2), (2, 1), (2, -1), (1, -2), (-1, -2), (-2, -1), (-2, 1), (-1, 2)]
+
+cdef int DI[16]
+cdef int DJ[16]
+DI[:] = [m[0] for m in MOVES]
+DJ[:] = [m[1] for m in MOVES]
+
+ctypedef struct Entry:
+    double z
+    int64 idx
+
+ctypedef struct Heap:
+    Entry *data
+    Py_ssize_t size
+    Py_ssize_t capacity
+
+cdef int _heap_push(Heap *h, double z, int64 idx) nogil:
+    cdef Py_ssize_t k, parent
+    cdef Entry *data
+    if h.size == h.capacity:
+        h.capacity = 2*h.capacity if h.capacity != 0 else 1024
+        data = <Entry*> realloc(h.data, h.capacity*sizeof(Entry))
+        if data == NULL:
+            return -1
+        h.data = data
+    k = h.size
+    h.size += 1
+    while k > 0:
+        parent = (k-1) // 2
+        if h.data[parent].z <= z:
+            break
+        h.data[k] = h.data[parent]
+        k = parent
+    h.data[k].z = z
+    h.data[k].idx = idx
+    return 0
+
+cdef Entry _heap_pop(Heap *h) nogil:
+    cdef Entry top = h.data[0]
+    cdef Entry last
+    cdef Py_ssize_t k = 0, child
+    h.size -= 1
+    if h.size == 0:
+        return top
+    last = h.data[h.size]
+    while True:
+        child = 2*k + 1
+        if child >= h.size:
+            break
+        if child+1 < h.size and h.data[child+1].z < h.data[child].z:
+            child += 1
+        if h.data[child].z >= last.z:
+            break
+        h.data[k] = h.data[child]
+        k = child
+    h.data[k] = last
+    return top
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+def accumulate(double[:,::1] C not None, int64[::1] sources not None,
+               int connectivity, double dx, double dy,
+               double[:,::1] D not None, uint8[:,::1] back not None):
+    """ Compute in *D* the least accumulated cost of reaching each cell of
+    *C* from any of the cells with flat indices *sources*, moving to 8 or 16
+    neighbours with columns *dx* and rows *dy* apart, and in *back* the code
+    of the move that reached each cell. Sources on NaN cells are ignored.
+    """
+    cdef Py_ssize_t ny = C.shape[0], nx = C.shape[1]
+    cdef Py_ssize_t i, j, ni, nj, k
+    cdef int64 c, n
+    cdef int64 off[16]
+    cdef int64 mid1[16]
+    cdef int64 mid2[16]
+    cdef double length[16]
+    cdef double dc, dn, cc, step
+    cdef double *cost
+    cdef double *dist
+    cdef uint8 *code
+    cdef Entry e
+    cdef Heap heap
+    cdef int err = 0
+    if ny == 0 or nx == 0:
+        return
+    cost = &C[0,0]
+    dist = &D[0,0]
+    code = &back[0,0]
+    for k in range(connectivity):
+        off[k] = DI[k]*nx + DJ[k]
+        length[k] = sqrt((DI[k]*dy)**2 + (DJ[k]*dx)**2)
+        # cells crossed by knight's moves besides the ends
+        if abs(DI[k]) == 2:
+            mid1[k] = (DI[k]//2)*nx
+            mid2[k] = (DI[k]//2)*nx + DJ[k]
+        else:
+            mid1[k] = DJ[k]//2
+            mid2[k] = DI[k]*nx + DJ[k]//2
+    heap.data = NULL; heap.size = 0; heap.capacity = 0
+
+    try:
+        with nogil:
+            for c in range(ny*nx):
+                dist[c] = INFINITY
+                code[c] = 255
+            for k in range(sources.shape[0]):
+                c = sources[k]
+                if not isnan(cost[c]) and dist[c] != 0:
+                    dist[c] = 0
+                    code[c] = 0
+                    err |= _heap_push(&heap, 0.0, c)
+
+            while err == 0 and heap.size != 0:
+                e = _heap_pop(&heap)
+                c = e.idx
+                dc = dist[c]
+                if e.z > dc:
+                    continue
+                i = c // nx
+                j = c - i*nx
+                cc = cost[c]
+                for k in range(connectivity):
+                    ni = i + DI[k]
+                    nj = j + DJ[k]
+                    if ni < 0 or ni >= ny or nj < 0 or nj >= nx:
+                        continue
+                    n = c + off[k]
+                    if k < 8:
+                        step = 0.5*length[k]*(cc + cost[n])
+                    else:
+                        step = 0.25*length[k]*(cc + cost[c+mid1[k]] +
+                                               cost[c+mid2[k]] + cost[n])
+                    dn = dc + step
+                    # NaN costs fail the comparison
+                    if dn < dist[n]:
+                        dist[n] = dn
+                        code[n] = <uint8> (k+1)
+                        err |= _heap_push(&heap, dn, n)
+    finally:
+        free(heap.data)
+    if err != 0:
+        raise MemoryError()
+    return
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def backtrack(uint8[:,::1] back not None, Py_ssize_t i, Py_ssize_t j):
+    """ Return the rows and columns of the cells on the least cost path from
+    a source to cell (*i*, *j*), following the move codes in *back*.
+
+    Raises
+    ------
+    ValueError
+        if the cell was not reached from a source
+    """
+    cdef Py_ssize_t n = 0, capacity = 1024
+    cdef int64 *path = NULL
+    cdef void *p
+    cdef uint8 k
+    while True:
+        if n == 0 or n == capacity:
+            if n != 0:
+                capacity *= 2
+            p = realloc(path, 2*capacity*sizeof(int64))
+            if p == NULL:
+                free(path)
+                raise MemoryError()
+            path = <int64*> p
+        path[2*n] = i
+        path[2*n+1] = j
+        n += 1
+        k = back[i,j]
+        if k == 0:
+            break
+        elif k > 16:
+            free(path)
+            raise ValueError("cell ({0}, {1}) is not reachable".format(i, j))
+        i -= DI[k-1]
+        j -= DJ[k-1]
+
+    out = np.empty((n, 2), dtype=np.int64)
+    cdef int64[:,::1] outv = out
+    for i in range(n):
+        outv[n-1-i,0] = path[2*i]
+        outv[n-1-i,1] = path[2*i+1]
+    free(path)
+    return out
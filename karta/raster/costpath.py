@@ -0,0 +1,148 @@
+"""
+Accumulated cost distance and least cost paths
+
+`cost_distance` computes the least accumulated cost of travelling from a set
+of source cells to every cell of a cost surface, and the move that reached
+each cell. `least_cost_path` follows those moves back from a destination to
+the nearest source, returning the path as a Line.
+
+Moves are to the 8 adjacent cells, or additionally to the 8 cells a knight's
+move away. The cost of a move is its length in grid units times the mean cost
+of the cells it crosses, so that costs are per unit distance. NoData cells
+are barriers. Knight's moves cross four cells for a quarter of their length
+each, and cannot jump over barriers.
+
+Backlink grids hold, for each cell, the index plus one in `MOVES` of the
+(row, column) step that reached it, 0 for sources, and 255 for cells that
+are not reached.
+"""
+
+import numpy as np
+from .grid import RegularGrid
+from .misc import _check_orthogonal
+from . import costfuncs
+from ..vector.geometry import Line
+
+MOVES = costfuncs.MOVES
+
+def _source_indices(grid, sources):
+    """ Return the flat indices of the cells containing source points. """
+    if hasattr(sources, "_geotype"):
+        sources = [sources]
+    x, y = [], []
+    for geom in sources:
+        if getattr(geom, "_geotype", None) == "Point":
+            px, py = geom.vertex(crs=grid.crs)[:2]
+            x.append(px)
+            y.append(py)
+        elif getattr(geom, "_geotype", None) == "Multipoint":
+            px, py = geom.coords(crs=grid.crs)
+            x.extend(px)
+            y.extend(py)
+        else:
+            raise TypeError("sources must be Points or Multipoints")
+    if len(x) == 0:
+        raise ValueError("no sources given")
+    i, j = grid.indices(x, y)
+    return i.astype(np.int64)*grid.size[1] + j
+
+def cost_distance(grid, sources, band=0, connectivity=8):
+    """ Compute the least accumulated cost of reaching every cell from the
+    nearest of a set of sources.
+
+    Parameters
+    ----------
+    grid : RegularGrid
+        cost per unit distance of crossing each cell. Costs must not be
+        negative, and NoData cells cannot be crossed.
+    sources : Point, Multipoint, or list of Points and Multipoints
+        source locations. Sources on NoData cells are ignored.
+    band : int, optional
+        band of costs (default 0)
+    connectivity : int, optional
+        8 to move to adjacent cells, or 16 to also make knight's moves
+        (default 8)
+
+    Returns
+    -------
+    (RegularGrid, RegularGrid)
+        float64 grid of accumulated costs, NaN where cells are not reachable,
+        and uint8 grid of backlinks for `least_cost_path`
+
+    Raises
+    ------
+    ValueError
+        if connectivity is not 8 or 16, or costs are negative
+    IndexError
+        if sources are outside the grid
+    """
+    _check_orthogonal(grid, "cost_distance")
+    if connectivity not in (8, 16):
+        raise ValueError("connectivity must be 8 or 16")
+    ny, nx = grid.size
+    src = grid.bands[band]
+    nodata = grid.nodata
+    cny, cnx = getattr(src, "_chunksize", (256, 256))
+
+    cost = np.empty((ny, nx), dtype=np.float64)
+    for i0 in range(0, ny, cny):
+        for j0 in range(0, nx, cnx):
+            c = src.getblock(i0, j0, min(cny, ny-i0), min(cnx, nx-j0))
+            c = c.astype(np.float64)
+            if not np.isnan(nodata):
+                c[c == nodata] = np.nan
+            if np.any(c < 0):
+                raise ValueError("costs must not be negative")
+            cost[i0:i0+c.shape[0], j0:j0+c.shape[1]] = c
+
+    dist = np.empty((ny, nx), dtype=np.float64)
+    back = np.empty((ny, nx), dtype=np.uint8)
+    costfuncs.accumulate(cost, _source_indices(grid, sources), connectivity,
+                         abs(grid.transform[2]), abs(grid.transform[3]),
+                         dist, back)
+    del cost
+    dist[np.isinf(dist)] = np.nan
+
+    distband = grid._bndcls(grid.size, np.float64, initval=np.nan)
+    backband = grid._bndcls(grid.size, np.uint8, initval=255)
+    for i0 in range(0, ny, cny):
+        distband.setblock(i0, 0, dist[i0:i0+cny])
+        backband.setblock(i0, 0, back[i0:i0+cny])
+    return (RegularGrid(grid.transform, bands=[distband], crs=grid.crs,
+                        nodata_value=np.nan),
+            RegularGrid(grid.transform, bands=[backband], crs=grid.crs,
+                        nodata_value=255))
+
+def least_cost_path(backlink, destination):
+    """ Return the least cost path from the nearest source to a destination.
+
+    Parameters
+    ----------
+    backlink : RegularGrid
+        backlinks computed by `cost_distance`
+    destination : Point
+
+    Returns
+    -------
+    Line
+        path through the centers of the cells crossed, starting at a source,
+        in the coordinate system of *backlink*
+
+    Raises
+    ------
+    ValueError
+        if the destination cannot be reached from any source
+    IndexError
+        if the destination is outside the grid
+    """
+    _check_orthogonal(backlink, "least_cost_path")
+    x, y = destination.vertex(crs=backlink.crs)[:2]
+    i, j = backlink.indices(x, y)
+    back = np.ascontiguousarray(backlink[:,:,0], dtype=np.uint8)
+    path = costfuncs.backtrack(back, i, j)
+    x0, y0, dx, dy = backlink.transform[:4]
+    vertices = np.column_stack([x0 + (path[:,1]+0.5)*dx,
+                                y0 + (path[:,0]+0.5)*dy])
+    if len(vertices) == 1:
+        vertices = np.vstack([vertices, vertices])
+    return Line(vertices, crs=backlink.crs)
@@ -194,3 +194,87 @@ def fillarray_double(double[:,:] array not None,
                 array[i,j] = nodata_value
     return 0
 
+
+ctypedef fused zvalue_t:
+    np.int8_t
+    np.int16_t
+    np.int32_t
+    np.int64_t
+    np.uint8_t
+    np.uint16_t
+    np.uint32_t
+    np.uint64_t
+    np.float32_t
+    np.float64_t
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+def aggregate_points(tuple T,
+                     double[:] x not None,
+                     double[:] y not None,
+                     zvalue_t[:] z not None,
+                     np.int64_t[:,:] count not None,
+                     double[:,:] total,
+                     double[:,:] sqdev,
+                     double[:,:] minimum,
+                     double[:,:] maximum,
+                     double[:,:] last):
+    """ Accumulate values *z* at positions *x*, *y* into running per-cell
+    statistics of a grid with transform *T*. *total*, *sqdev*, *minimum*,
+    *maximum*, and *last* may be None, in which case they are not updated.
+    *sqdev* holds the sum of squared deviations from the cell mean, and
+    requires *total*.
+
+    Points outside the grid are ignored, and NaN values are not counted.
+
+    Returns the number of points inside the grid.
+    """
+    cdef Py_ssize_t k, i, j
+    cdef Py_ssize_t n = z.shape[0]
+    cdef Py_ssize_t ny = count.shape[0]
+    cdef Py_ssize_t nx = count.shape[1]
+    cdef Py_ssize_t ninside = 0
+    cdef double x0 = T[0], y0 = T[1], dx = T[2], dy = T[3], sx = T[4], sy = T[5]
+    cdef double det = dx*dy - sx*sy
+    cdef double fi, fj, v, c, mean_old
+    cdef bint do_total = total is not None
+    cdef bint do_sqdev = sqdev is not None
+    cdef bint do_min = minimum is not None
+    cdef bint do_max = maximum is not None
+    cdef bint do_last = last is not None
+
+    if (x.shape[0] != n) or (y.shape[0] != n):
+        raise ValueError("x, y, and z must have equal length")
+
+    for k in range(n):
+        fj = (dy*(x[k]-x0) - sx*(y[k]-y0)) / det
+        fi = (y[k] - y0 - fj*sy) / dy
+        if not (fi >= 0 and fj >= 0):
+            continue
+        i = <Py_ssize_t> fi
+        j = <Py_ssize_t> fj
+        if i >= ny or j >= nx:
+            continue
+        ninside += 1
+
+        v = <double> z[k]
+        if v != v:
+            continue
+
+        c = <double> count[i,j]
+        if do_total:
+            if do_sqdev:
+                mean_old = total[i,j] / c if c != 0 else v
+                total[i,j] += v
+                sqdev[i,j] += (v - mean_old) * (v - total[i,j] / (c+1))
+            else:
+                total[i,j] += v
+        if do_min and (c == 0 or v < minimum[i,j]):
+            minimum[i,j] = v
+        if do_max and (c == 0 or v > maximum[i,j]):
+            maximum[i,j] = v
+        if do_last:
+            last[i,j] = v
+        count[i,j] += 1
+    return ninside
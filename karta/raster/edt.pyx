@@ -0,0 +1,123 @@
+""" Exact Euclidean distance transform
+
+Distances are computed in two separable passes following Felzenszwalb and
+Huttenlocher (2012, Theory of Computing 8:415-428). The first pass finds the
+nearest target cell in each column, and the second computes, for each row,
+the lower envelope of the parabolas rooted at every cell of the row with the
+height of its column distance. Both passes cost O(1) per cell, and accept
+different resolutions along rows and columns.
+
+Kernels process a range of columns or rows, release the GIL, and may be
+called by several threads on disjoint ranges.
+"""
+
+import numpy as np
+cimport numpy as np
+cimport cython
+from libc.stdlib cimport malloc, free
+from libc.math cimport sqrt, INFINITY
+
+ctypedef np.int64_t int64
+ctypedef np.int32_t int32
+ctypedef np.uint8_t uint8
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def columns(uint8[:,:] target not None, double dy, double[:,::1] g not None,
+            int32[:,::1] nearest not None, Py_ssize_t j0, Py_ssize_t j1):
+    """ For columns j0 <= j < j1, store in *g* the squared distance to the
+    nearest nonzero cell of *target* in the same column, with rows *dy*
+    apart, and in *nearest* its row (or inf and -1 if there is none).
+    """
+    cdef Py_ssize_t ny = target.shape[0]
+    cdef Py_ssize_t i, j
+    cdef int32 r
+    cdef double d
+    with nogil:
+        # downward scan
+        for j in range(j0, j1):
+            nearest[0,j] = 0 if target[0,j] != 0 else -1
+        for i in range(1, ny):
+            for j in range(j0, j1):
+                nearest[i,j] = <int32> i if target[i,j] != 0 else nearest[i-1,j]
+        # upward scan, keeping the closer of the targets above and below
+        for i in range(ny-1, -1, -1):
+            for j in range(j0, j1):
+                if i != ny-1 and nearest[i+1,j] > i and \
+                        (nearest[i,j] == -1 or
+                         nearest[i+1,j] - i < i - nearest[i,j]):
+                    nearest[i,j] = nearest[i+1,j]
+                r = nearest[i,j]
+                if r == -1:
+                    g[i,j] = INFINITY
+                else:
+                    d = dy*(i - r)
+                    g[i,j] = d*d
+    return
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+def rows(double[:,::1] g not None, int32[:,::1] nearest not None, double dx,
+         Py_ssize_t i0, Py_ssize_t i1, double[:,::1] dist not None,
+         int64[:,::1] index not None):
+    """ For rows i0 <= i < i1, store in row i-i0 of *dist* the distance to
+    the nearest target cell, with columns *dx* apart, given column squared
+    distances *g* and nearest rows *nearest* from `columns`. The flat index
+    of the nearest target cell is stored in *index*, or -1 if there is none.
+    """
+    cdef Py_ssize_t nx = g.shape[1]
+    cdef Py_ssize_t i, q, k
+    cdef double w = dx*dx
+    cdef double s, fq
+    cdef double *f
+    cdef Py_ssize_t *v = <Py_ssize_t*> malloc(nx*sizeof(Py_ssize_t))
+    cdef double *z = <double*> malloc((nx+1)*sizeof(double))
+    if v == NULL or z == NULL:
+        free(v)
+        free(z)
+        raise MemoryError()
+    try:
+        with nogil:
+            for i in range(i0, i1):
+                f = &g[i,0]
+                # lower envelope of parabolas w*(x-q)**2 + f[q]
+                k = -1
+                for q in range(nx):
+                    fq = f[q]
+                    if fq == INFINITY:
+                        continue
+                    if k == -1:
+                        k = 0
+                        v[0] = q
+                        z[0] = -INFINITY
+                        z[1] = INFINITY
+                        continue
+                    # z[0] is -inf, so that k remains nonnegative
+                    while True:
+                        s = ((fq + w*q*q) - (f[v[k]] + w*v[k]*v[k])) / \
+                            (2*w*(q - v[k]))
+                        if s > z[k]:
+                            break
+                        k -= 1
+                    k += 1
+                    v[k] = q
+                    z[k] = s
+                    z[k+1] = INFINITY
+
+                if k == -1:
+                    for q in range(nx):
+                        dist[i-i0,q] = INFINITY
+                        index[i-i0,q] = -1
+                    continue
+                k = 0
+                for q in range(nx):
+                    while z[k+1] < q:
+                        k += 1
+                    s = w*(q - v[k])*(q - v[k]) + f[v[k]]
+                    dist[i-i0,q] = sqrt(s)
+                    index[i-i0,q] = nearest[i,v[k]]*nx + v[k]
+    finally:
+        free(v)
+        free(z)
+    return
@@ -0,0 +1,228 @@
+"""
+Focal (moving window) statistics
+
+Windows are reduced separably along rows and columns by the van Herk/Gil-Werman
+algorithm, which splits each line into blocks the length of the window and
+combines running reductions within blocks, so that the cost per cell does not
+depend on the size of the window. Sums, means, and standard deviations are
+computed from running sums of counts, values, and squared values, and minima
+and maxima from running extremes. Grids are processed one
+chunk at a time, reading each chunk with a halo half the width of the window.
+
+NoData cells are excluded from windows, so that windows on the edge of the
+grid or of NoData regions are computed from the valid cells they contain.
+Cells whose window contains no valid cells are NaN in the output.
+"""
+
+import numpy as np
+from .misc import (_check_orthogonal, _chunks, _read_halo, _map_chunks,
+                   _output_grid)
+
+def _window_shape(size):
+    if np.ndim(size) == 0:
+        size = (size, size)
+    ky, kx = int(size[0]), int(size[1])
+    if ky < 1 or kx < 1 or ky % 2 == 0 or kx % 2 == 0:
+        raise ValueError("window size must be a positive odd integer or a "
+                         "pair of positive odd integers")
+    return ky, kx
+
+def _running(A, k, axis, ufunc):
+    """ Reduce windows of length *k* along *axis* with ``np.add``,
+    ``np.minimum``, or ``np.maximum``, using the van Herk/Gil-Werman
+    decomposition into blocks of length *k*. Each window is the union of a
+    suffix of one block and a prefix of the next, so that the reduction costs
+    a constant number of operations per element and, for sums, round-off
+    depends only on the window length. The output is shorter than *A* by k-1
+    along *axis*.
+    """
+    A = np.moveaxis(A, axis, -1)
+    n = A.shape[-1]
+    nblocks = -(-n // k)
+    if ufunc is np.minimum:
+        fill = np.inf
+    elif ufunc is np.maximum:
+        fill = -np.inf
+    else:
+        fill = 0
+    padded = np.full(A.shape[:-1] + (nblocks*k,), fill, dtype=A.dtype)
+    padded[...,:n] = A
+    blocks = padded.reshape(A.shape[:-1] + (nblocks, k))
+
+    prefix = ufunc.accumulate(blocks, axis=-1).reshape(padded.shape)
+    suffix = ufunc.accumulate(blocks[...,::-1], axis=-1)[...,::-1].reshape(padded.shape)
+    out = ufunc(suffix[...,:n-k+1], prefix[...,k-1:n])
+    if ufunc is np.add:
+        # windows aligned with blocks would otherwise be counted twice
+        out[...,::k] = suffix[...,:n-k+1:k]
+    return np.moveaxis(out, -1, axis)
+
+def _window_reduce(A, ky, kx, ufunc):
+    return _running(_running(A, ky, 0, ufunc), kx, 1, ufunc)
+
+def _moments(D, ky, kx, std=False):
+    """ Return the count, sum, and optionally the sum of squared deviations
+    from the mean, of valid values in every window of a block. """
+    valid = ~np.isnan(D)
+    count = _window_reduce(valid.astype(np.int64), ky, kx, np.add)
+    # values are offset by their mean to limit round-off
+    shift = D[valid].mean() if valid.any() else 0.0
+    Z = np.where(valid, D - shift, 0.0)
+    total = _window_reduce(Z, ky, kx, np.add)
+    if not std:
+        return count, total + shift*count, None
+    with np.errstate(invalid="ignore", divide="ignore"):
+        sqdev = _window_reduce(Z*Z, ky, kx, np.add) - total*total/count
+    return count, total + shift*count, np.maximum(sqdev, 0.0)
+
+def _extreme(D, ky, kx, ufunc):
+    fill = np.inf if ufunc is np.minimum else -np.inf
+    out = _window_reduce(np.where(np.isnan(D), fill, D), ky, kx, ufunc)
+    out[out == fill] = np.nan
+    return out
+
+def _focal(grid, size, band, chunksize, nthreads, compute):
+    _check_orthogonal(grid, "focal")
+    ky, kx = _window_shape(size)
+    if chunksize is None:
+        chunksize = (max(256, 4*ky), max(256, 4*kx))
+    read = lambda chunk: _read_halo(grid, band, chunk, np.float64,
+                                    halo=(ky//2, kx//2))
+    out = grid._bndcls(grid.size, np.float64, initval=np.nan)
+    for chunk, result in _map_chunks(_chunks(grid.size, chunksize), read,
+                                     lambda D: compute(D, ky, kx), nthreads):
+        out.setblock(chunk[0], chunk[2], result)
+    return _output_grid(grid, [out])
+
+def _sum(D, ky, kx):
+    count, total, _ = _moments(D, ky, kx)
+    total[count == 0] = np.nan
+    return total
+
+def _mean(D, ky, kx):
+    count, total, _ = _moments(D, ky, kx)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(count == 0, np.nan, total/count)
+
+def _std(D, ky, kx):
+    count, _, sqdev = _moments(D, ky, kx, std=True)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(count == 0, np.nan, np.sqrt(sqdev/count))
+
+def focal_sum(grid, size, band=0, chunksize=None, nthreads=None):
+    """ Compute the sum of valid values in a window around each cell.
+
+    Parameters
+    ----------
+    grid : RegularGrid
+    size : int or tuple of two ints
+        window size as an odd number of cells, or as odd numbers of (rows,
+        columns)
+    band : int, optional
+        band to process (default 0)
+    chunksize : tuple of two ints, optional
+        size of chunks to process at once (default at least (256, 256) and
+        four times the window size)
+    nthreads : int, optional
+        number of threads to use (default number of CPUs)
+
+    Returns
+    -------
+    RegularGrid
+    """
+    return _focal(grid, size, band, chunksize, nthreads, _sum)
+
+def focal_mean(grid, size, band=0, chunksize=None, nthreads=None):
+    """ Compute the mean of valid values in a window around each cell.
+
+    Parameters
+    ----------
+    grid : RegularGrid
+    size : int or tuple of two ints
+        window size as an odd number of cells, or as odd numbers of (rows,
+        columns)
+    band : int, optional
+        band to process (default 0)
+    chunksize : tuple of two ints, optional
+        size of chunks to process at once (default at least (256, 256) and
+        four times the window size)
+    nthreads : int, optional
+        number of threads to use (default number of CPUs)
+
+    Returns
+    -------
+    RegularGrid
+    """
+    return _focal(grid, size, band, chunksize, nthreads, _mean)
+
+def focal_std(grid, size, band=0, chunksize=None, nthreads=None):
+    """ Compute the (population) standard deviation of valid values in a
+    window around each cell.
+
+    Parameters
+    ----------
+    grid : RegularGrid
+    size : int or tuple of two ints
+        window size as an odd number of cells, or as odd numbers of (rows,
+        columns)
+    band : int, optional
+        band to process (default 0)
+    chunksize : tuple of two ints, optional
+        size of chunks to process at once (default at least (256, 256) and
+        four times the window size)
+    nthreads : int, optional
+        number of threads to use (default number of CPUs)
+
+    Returns
+    -------
+    RegularGrid
+    """
+    return _focal(grid, size, band, chunksize, nthreads, _std)
+
+def focal_min(grid, size, band=0, chunksize=None, nthreads=None):
+    """ Compute the minimum of valid values in a window around each cell.
+
+    Parameters
+    ----------
+    grid : RegularGrid
+    size : int or tuple of two ints
+        window size as an odd number of cells, or as odd numbers of (rows,
+        columns)
+    band : int, optional
+        band to process (default 0)
+    chunksize : tuple of two ints, optional
+        size of chunks to process at once (default at least (256, 256) and
+        four times the window size)
+    nthreads : int, optional
+        number of threads to use (default number of CPUs)
+
+    Returns
+    -------
+    RegularGrid
+    """
+    return _focal(grid, size, band, chunksize, nthreads,
+                  lambda D, ky, kx: _extreme(D, ky, kx, np.minimum))
+
+def focal_max(grid, size, band=0, chunksize=None, nthreads=None):
+    """ Compute the maximum of valid values in a window around each cell.
+
+    Parameters
+    ----------
+    grid : RegularGrid
+    size : int or tuple of two ints
+        window size as an odd number of cells, or as odd numbers of (rows,
+        columns)
+    band : int, optional
+        band to process (default 0)
+    chunksize : tuple of two ints, optional
+        size of chunks to process at once (default at least (256, 256) and
+        four times the window size)
+    nthreads : int, optional
+        number of threads to use (default number of CPUs)
+
+    Returns
+    -------
+    RegularGrid
+    """
+    return _focal(grid, size, band, chunksize, nthreads,
+                  lambda D, ky, kx: _extreme(D, ky, kx, np.maximum))
@@ -2,14 +2,23 @@
 Raster grid representations
 """
 import copy
+import io
 import math
 import numbers
 import warnings
 import numpy as np
 from . import _gdal
 from . import crfuncs
-from .band import SimpleBand, CompressedBand, BandIndexer
-from .coordgen import CoordinateGenerator
+from . import scanline
+from . import contour as _contour
+from . import regions
+from . import aaifuncs
+from . import edt
+from .sketch import QuantileSketch
+from .band import (SimpleBand, CompressedBand, InterleavedBand, BandIndexer,
+                   BandWindow)
+from .coordgen import (CoordinateGenerator, ApproximateTransformer,
+                       affine_mesh, coordinate_transformer)
 from .. import errors
 from ..crs import Cartesian
 
@@ -137,7 +146,8 @@ class RegularGrid(Grid):
             neither is provided, the default is NaN.
         bandclass : class, optional
             indicates the band class used to represent grid data. default
-            BAND_CLASS_DEFAULT
+            BAND_CLASS_DEFAULT. If `InterleavedBand`, the bands of *values*
+            are stored together in a single compressed InterleavedBand.
         """
 
         if hasattr(transform, "keys"):
@@ -150,7 +160,7 @@ class RegularGrid(Grid):
                                    "transform iterable or dictionary")
 
         if bands is not None:
-            self._bndcls = type(bands[0])
+            self._bndcls = getattr(bands[0], "bandclass", type(bands[0]))
         elif bandclass is None:
             self._bndcls = BAND_CLASS_DEFAULT
         else:
@@ -164,7 +174,17 @@ class RegularGrid(Grid):
         else:
             self.bands = []
 
-        if bands is None and (values is not None):
+        if bands is None and (values is not None) and \
+                issubclass(self._bndcls, InterleavedBand):
+            if values.ndim not in (2, 3):
+                raise ValueError("`values` must have two or three dimensions")
+            values = np.atleast_3d(values)
+            interleaved = InterleavedBand(values.shape[:2], values.dtype.type,
+                                          values.shape[2])
+            interleaved.setblock(0, 0, values)
+            self.bands = interleaved.bands
+            self._bndcls = self.bands[0].bandclass
+        elif bands is None and (values is not None):
             if values.ndim == 2:
                 band = self._bndcls(values.shape, values.dtype.type)
                 band.setblock(0, 0, values)
@@ -298,26 +318,14 @@ class RegularGrid(Grid):
 
     def center_coords(self):
         """ Return the coordinates of cell centers. """
-        t = self._transform
-        xcoords = np.empty(self.size)
-        ycoords = np.empty(self.size)
-        icol = np.arange(self.size[1])
-        for i in range(self.size[0]):
-            xcoords[i,:] = t[0] + (icol+0.5)*t[2] + (i+0.5)*t[4]
-            ycoords[i,:] = (t[1] + (i+0.5)*t[3] + (icol+0.5)*t[5])
-        return xcoords, ycoords
+        ny, nx = self.size
+        return affine_mesh(self._transform, np.arange(ny), np.arange(nx))
 
     def vertex_coords(self):
         """ Return the coordinates of cell vertices. """
-        t = self._transform
         ny, nx = self.size
-        xcoords = np.empty((ny+1, nx+1))
-        ycoords = np.empty((ny+1, nx+1))
-        icol = np.arange(0, self.size[1]+1)
-        for i in range(self.size[0]):
-            xcoords[i,:] = t[0] + icol*t[2] + i*t[4]
-            ycoords[i,:] = (t[1] + i*t[3] + icol*t[5])
-        return xcoords, ycoords
+        return affine_mesh(self._transform, np.arange(ny+1), np.arange(nx+1),
+                           offset=0.0)
 
     @property
     def origin(self):
@@ -476,6 +484,37 @@ class RegularGrid(Grid):
         """ 8-bit mask of valid data cells, collapsed across bands """
         return np.all(self.data_mask_full, axis=-1)
 
+    def window(self, i0, i1, j0, j1, writable=False):
+        """ Return a grid viewing a rectangular window of this grid. The
+        window shares bands with this grid, so that no values are copied until
+        they are read.
+
+        Parameters
+        ----------
+        i0, i1 : int
+            first and last-plus-one rows of the window
+        j0, j1 : int
+            first and last-plus-one columns of the window
+        writable : bool, optional
+            whether values may be set through the window, modifying this grid
+            (default False)
+
+        Returns
+        -------
+        RegularGrid
+        """
+        ny, nx = self.size
+        if not (0 <= i0 <= i1 <= ny and 0 <= j0 <= j1 <= nx):
+            raise IndexError("window [{0}:{1}, {2}:{3}] outside of grid with "
+                             "size {4}".format(i0, i1, j0, j1, self.size))
+        t = self.transform
+        T = (t[0] + j0*t[2] + i0*t[4], t[1] + i0*t[3] + j0*t[5],
+             t[2], t[3], t[4], t[5])
+        bands = [BandWindow(band, i0, j0, (i1-i0, j1-j0), writable=writable)
+                 for band in self.bands]
+        return RegularGrid(T, bands=bands, crs=self.crs,
+                           nodata_value=self.nodata)
+
     def aschunks(self, size=(-1, -1), overlap=(0, 0), copy=True):
         """ Generator for grid chunks. This may be useful for parallel or
         memory-controlled grid processing.
@@ -488,8 +527,9 @@ class RegularGrid(Grid):
         overlap : tuple of two integers, optional
             number of pixels of overlap (default (0, 0))
         copy : bool
-            whether to force returned grids to be copies
-            warning: output may be a copy regardless, depending on the band class
+            whether returned grids are copies. If False, returned grids are
+            read-only windows sharing bands with this grid (see
+            `RegularGrid.window`)
 
         Yields
         ------
@@ -512,17 +552,19 @@ class RegularGrid(Grid):
             if i0 >= ny:
                 break
 
-            T = [self.transform[0] + j0*T0[2] + i0*T0[4],
-                 self.transform[1] + i0*T0[3] + j0*T0[5],
-                 T0[2], T0[3], T0[4], T0[5]]
             if copy:
+                T = [self.transform[0] + j0*T0[2] + i0*T0[4],
+                     self.transform[1] + i0*T0[3] + j0*T0[5],
+                     T0[2], T0[3], T0[4], T0[5]]
                 v = self[i0:i0+size[1], j0:j0+size[0]].copy()
+                yield RegularGrid(T, values=v, crs=self.crs,
+                                  nodata_value=self.nodata)
             else:
-                v = self[i0:i0+size[1], j0:j0+size[0]]
-            yield RegularGrid(T, values=v, crs=self.crs, nodata_value=self.nodata)
+                yield self.window(i0, min(i0+size[1], ny),
+                                  j0, min(j0+size[0], nx))
             j0 += size[0]-overlap[0]
 
-    def clip(self, xmin, xmax, ymin, ymax, crs=None):
+    def clip(self, xmin, xmax, ymin, ymax, crs=None, copy=True):
         """ Return a clipped version of grid with cell centers constrained to a
         bounding box.
 
@@ -533,6 +575,10 @@ class RegularGrid(Grid):
         ymin : float
         ymax : float
         crs : karta.crs.CRS subclass, optional
+        copy : bool, optional
+            whether the clipped grid is a copy (default True). If False, the
+            clipped grid is a read-only window sharing bands with this grid
+            (see `RegularGrid.window`).
         """
         if crs is not None:
             x, y = crs.transform(self.crs, [xmin, xmin, xmax, xmax],
@@ -555,6 +601,11 @@ class RegularGrid(Grid):
         j0 = int(np.ceil(min(ll[1], lr[1], ul[1], ur[1])))
         j1 = int(np.floor(max(ll[1], lr[1], ul[1], ur[1]))) + 1
 
+        if not copy:
+            ny, nx = self.size
+            i0, j0 = max(i0, 0), max(j0, 0)
+            return self.window(i0, max(min(i1, ny), i0), j0, max(min(j1, nx), j0))
+
         values = self[i0:i1,j0:j1].copy()
         x0 = t[0] + j0*t[2] + i0*t[4]
         y0 = t[1] + i0*t[3] + j0*t[5]
@@ -616,56 +667,732 @@ class RegularGrid(Grid):
                               nodata_value=self.nodata)
         return gridnew
 
-    def mask_by_poly(self, polys, inplace=False):
+    def mask_by_poly(self, polys, inplace=False, crop=False):
         """ Return a grid with all elements outside the bounds of a polygon
         masked as nodata.
 
+        Masking proceeds one chunk at a time. Chunks entirely inside the
+        polygons are left untouched, chunks entirely outside are set to nodata
+        without being read, and only chunks crossed by a boundary are masked
+        cell-by-cell.
+
         Parameters
         ----------
         polys : Polygon, Multipolygon or list of Polygon instances
-            region(s) defining masking boundary
+            region(s) defining masking boundary. Cells are retained if their
+            centers are inside any polygon and outside its holes.
         inplace : bool, optional
             if True, perform masking in-place (default False)
-        """
-        if getattr(polys, "_geotype", "") == "Polygon":
-            polys = [polys]
-
-        def unpack_multipolygons(L):
-            out = []
-            for item in L:
-                if getattr(item, "_geotype", "") == "Multipolygon":
-                    out.extend(item[i] for i in range(len(item)))
-                elif getattr(item, "_geotype", "") == "Polygon":
-                    out.append(item)
-                elif isinstance(item, (list, tuple)):
-                    out.extend(unpack_multipolygons(a for a in item))
-            return out
+        crop : bool, optional
+            if True, clip the output to the bounding window of the cells inside
+            the polygons (default False). Cannot be combined with *inplace*.
 
-        polys = unpack_multipolygons(polys)
+        Returns
+        -------
+        RegularGrid
+        """
+        if inplace and crop:
+            raise ValueError("crop is not available for in-place masking")
 
         ny, nx = self.size
-        msk = np.zeros([ny, nx], dtype=np.bool)
-        for poly in polys:
-
-            x, y = poly.coords(self.crs)[:2]
-            if not poly.isclockwise():
-                x = x[::-1]
-                y = y[::-1]
+        edges = _ring_edges(_polygon_rings(polys, self.crs), self.transform,
+                            orient=True)
+        spans = scanline.polygon_spans(edges, ny, nx, nonzero=True)
+
+        if crop:
+            rows, starts, ends = spans
+            if len(rows) == 0:
+                raise errors.GridError("polygons do not contain any grid cells")
+            wi0, wi1 = int(rows[0]), int(rows[-1])+1
+            wj0, wj1 = int(starts.min()), int(ends.max())
+        else:
+            wi0, wi1, wj0, wj1 = 0, ny, 0, nx
 
-            _msk = mask_poly(x, y, nx, ny, self.transform)
-            msk = (msk | _msk)
+        if inplace:
+            bands = self.bands
+        else:
+            bands = [self._bndcls((wi1-wi0, wj1-wj0), band.dtype,
+                                  initval=self.nodata)
+                     for band in self.bands]
+
+        # align chunks with the storage of compressed bands
+        cny, cnx = getattr(self.bands[0], "_chunksize", (256, 256))
+        for ci0 in range(wi0 - wi0 % cny, wi1, cny):
+            i0, i1 = max(ci0, wi0), min(ci0+cny, wi1)
+            for cj0 in range(wj0 - wj0 % cnx, wj1, cnx):
+                j0, j1 = max(cj0, wj0), min(cj0+cnx, wj1)
+
+                rows, starts, ends = _window_spans(spans, i0, i1, j0, j1)
+                ninside = np.sum(ends - starts)
+
+                if ninside == 0:
+                    if inplace:
+                        for band in bands:
+                            band.setblock(i0, j0, np.full((i1-i0, j1-j0),
+                                                          self.nodata,
+                                                          dtype=band.dtype))
+                    continue
+
+                if ninside == (i1-i0)*(j1-j0):
+                    if not inplace:
+                        for src, dst in zip(self.bands, bands):
+                            dst.setblock(i0-wi0, j0-wj0,
+                                         src.getblock(i0, j0, i1-i0, j1-j0))
+                    continue
+
+                mask = scanline.spans_to_mask(rows, starts, ends, i1-i0, j1-j0)
+                for src, dst in zip(self.bands, bands):
+                    block = np.array(src.getblock(i0, j0, i1-i0, j1-j0))
+                    block[~mask] = self.nodata
+                    dst.setblock(i0-wi0, j0-wj0, block)
 
         if inplace:
-            for i in range(len(self.bands)):
-                data = self[:,:,i]
-                data[~msk] = self.nodata
-                self[:,:,i] = data
             return self
-        else:
-            msk = np.broadcast_to(np.atleast_3d(msk), [ny, nx, self.nbands])
-            return RegularGrid(self.transform,
-                               values=np.where(msk, self[:,:,:], self.nodata),
-                               crs=self.crs, nodata_value=self.nodata)
+        t = self.transform
+        tnew = (t[0] + wj0*t[2] + wi0*t[4], t[1] + wi0*t[3] + wj0*t[5],
+                t[2], t[3], t[4], t[5])
+        return RegularGrid(tnew, bands=bands, crs=self.crs,
+                           nodata_value=self.nodata)
+
+    def zonal_stats(self, polys, stats=("count", "mean"), band=0, bins=None,
+                    coverage=False, chunksize=(256, 256)):
+        """ Compute statistics of grid values within each polygon of a
+        Multipolygon. Statistics are added as fields to the data table of the
+        Multipolygon.
+
+        The grid is processed one chunk at a time. The zones overlapping each
+        chunk are found using the Multipolygon spatial index and rasterized into
+        a label map, from which statistics are accumulated for all zones at
+        once. With *coverage*, each cell is instead weighted by the exact
+        fraction of its area inside each zone, which avoids the bias of
+        center sampling for zones that are small compared with the cells.
+
+        Parameters
+        ----------
+        polys : Multipolygon
+            zones. Cells are assigned to a zone when their centers are inside
+            it. Where zones overlap, cells are assigned to the zone with the
+            highest index. (See also *coverage*.)
+        stats : list of str, optional
+            statistics to compute from "count", "sum", "mean", "std", "min",
+            "max", and "histogram" (default ["count", "mean"])
+        band : int, optional
+            band to compute statistics for (default 0)
+        bins : sequence of floats, optional
+            histogram bin edges, required for "histogram". As with
+            `numpy.histogram`, the last bin includes its right edge.
+        coverage : bool, optional
+            if True, weight cells by the fraction covered by each zone, so that
+            "count" and "histogram" give covered areas in units of cells, and
+            "sum", "mean" and "std" are area-weighted. "min" and "max" are
+            taken over all cells that a zone touches. Overlapping zones share
+            cells. (default False)
+        chunksize : tuple of two ints, optional
+            number of rows and columns processed at a time (default (256, 256))
+
+        Returns
+        -------
+        Table
+            data table of *polys*, with a field for each statistic. Zones
+            without valid cells have NaN statistics and zero counts.
+        """
+        for stat in stats:
+            if stat not in ("count", "sum", "mean", "std", "min", "max",
+                            "histogram"):
+                raise ValueError("unknown statistic '{0}'".format(stat))
+        if "histogram" in stats:
+            if bins is None:
+                raise ValueError("bin edges must be provided for 'histogram'")
+            bins = np.asarray(bins, dtype=np.float64)
+            nbins = len(bins) - 1
+
+        nzones = len(polys)
+        count = np.zeros(nzones, dtype=np.float64)
+        total = np.zeros(nzones, dtype=np.float64)
+        mean = np.zeros(nzones, dtype=np.float64)
+        sqdev = np.zeros(nzones, dtype=np.float64)
+        vmin = np.full(nzones, np.inf)
+        vmax = np.full(nzones, -np.inf)
+        if "histogram" in stats:
+            hist = np.zeros((nzones, nbins), dtype=np.float64)
+
+        ny, nx = self.size
+        cny, cnx = chunksize
+        src = self.bands[band]
+        for i0 in range(0, ny, cny):
+            i1 = min(i0+cny, ny)
+            edge_cache = {}
+            for j0 in range(0, nx, cnx):
+                j1 = min(j0+cnx, nx)
+
+                zones = polys.rtree.search_overlapping(
+                        self._window_bbox(i0, i1, j0, j1, polys.crs))
+                if len(zones) == 0:
+                    continue
+
+                values = src.getblock(i0, j0, i1-i0, j1-j0)
+                if np.isnan(self.nodata):
+                    valid = ~np.isnan(values)
+                else:
+                    valid = values != self.nodata
+
+                for k in zones:
+                    if k not in edge_cache:
+                        edge_cache[k] = _ring_edges(
+                                _polygon_rings(polys[k], self.crs),
+                                self.transform, orient=coverage)
+
+                if coverage:
+                    # zones may share cells, so each is rasterized within its
+                    # own bounding window
+                    labs, vals, wts = [], [], []
+                    for k in zones:
+                        edges = edge_cache[k]
+                        if len(edges) == 0:
+                            continue
+                        wi0 = max(i0, int(np.floor(edges[:,1::2].min())))
+                        wi1 = min(i1, int(np.ceil(edges[:,1::2].max())))
+                        wj0 = max(j0, int(np.floor(edges[:,0::2].min())))
+                        wj1 = min(j1, int(np.ceil(edges[:,0::2].max())))
+                        if wi1 <= wi0 or wj1 <= wj0:
+                            continue
+                        edges = edges.copy()
+                        edges[:,0::2] -= wj0
+                        edges[:,1::2] -= wi0
+                        frac = scanline.polygon_coverage(edges, wi1-wi0, wj1-wj0)
+                        sub = (slice(wi0-i0, wi1-i0), slice(wj0-j0, wj1-j0))
+                        use = valid[sub] & (frac != 0)
+                        vals.append(values[sub][use])
+                        wts.append(frac[use])
+                        labs.append(np.full(len(wts[-1]), k, dtype=np.int32))
+                    if len(labs) == 0:
+                        continue
+                    lab = np.concatenate(labs)
+                    v = np.concatenate(vals).astype(np.float64)
+                    w = np.concatenate(wts)
+                else:
+                    labels = np.full((i1-i0, j1-j0), -1, dtype=np.int32)
+                    for k in sorted(zones):
+                        edges = edge_cache[k].copy()
+                        edges[:,0::2] -= j0
+                        edges[:,1::2] -= i0
+                        spans = scanline.polygon_spans(edges, i1-i0, j1-j0)
+                        scanline.fill_spans(*(spans + (labels, np.int32(k))))
+                    valid &= labels != -1
+                    lab = labels[valid]
+                    v = values[valid].astype(np.float64)
+                    w = None
+                if len(lab) == 0:
+                    continue
+
+                # merge chunk moments into running moments
+                n_c = np.bincount(lab, weights=w, minlength=nzones)
+                sum_c = np.bincount(lab, weights=(v if w is None else w*v),
+                                    minlength=nzones)
+                has = n_c != 0
+                mean_c = np.zeros(nzones)
+                mean_c[has] = sum_c[has] / n_c[has]
+                dev = (v - mean_c[lab])**2
+                sqdev_c = np.bincount(lab, weights=(dev if w is None else w*dev),
+                                      minlength=nzones)
+                n_new = count + n_c
+                delta = mean_c - mean
+                mean[has] += delta[has] * n_c[has] / n_new[has]
+                sqdev[has] += sqdev_c[has] + \
+                        delta[has]**2 * count[has] * n_c[has] / n_new[has]
+                count = n_new
+                total += sum_c
+
+                if "min" in stats or "max" in stats:
+                    order = np.argsort(lab, kind="mergesort")
+                    lab_sorted = lab[order]
+                    v_sorted = v[order]
+                    first = np.r_[0, np.flatnonzero(np.diff(lab_sorted)) + 1]
+                    ids = lab_sorted[first]
+                    vmin[ids] = np.minimum(vmin[ids],
+                                           np.minimum.reduceat(v_sorted, first))
+                    vmax[ids] = np.maximum(vmax[ids],
+                                           np.maximum.reduceat(v_sorted, first))
+
+                if "histogram" in stats:
+                    b = np.searchsorted(bins, v, side="right") - 1
+                    b[v == bins[-1]] = nbins - 1
+                    inbins = (b >= 0) & (b < nbins)
+                    hist += np.bincount(lab[inbins]*nbins + b[inbins],
+                                        weights=(None if w is None else w[inbins]),
+                                        minlength=nzones*nbins
+                                        ).reshape(nzones, nbins)
+
+        if not coverage:
+            count = count.astype(np.int64)
+            if "histogram" in stats:
+                hist = hist.astype(np.int64)
+        empty = count == 0
+        results = {}
+        with np.errstate(invalid="ignore", divide="ignore"):
+            results["count"] = count
+            results["sum"] = np.where(empty, np.nan, total)
+            results["mean"] = np.where(empty, np.nan, mean)
+            results["std"] = np.where(empty, np.nan, np.sqrt(sqdev/count))
+            results["min"] = np.where(empty, np.nan, vmin)
+            results["max"] = np.where(empty, np.nan, vmax)
+        for stat in stats:
+            if stat == "histogram":
+                polys.data.setfield(stat, [list(h) for h in hist.tolist()])
+            else:
+                polys.data.setfield(stat, results[stat].tolist())
+        return polys.data
+
+    def contour(self, levels, band=0, chunksize=None):
+        """ Compute contour lines of grid values by marching squares.
+
+        Grid values are taken to represent cell centers. The grid is read one
+        chunk at a time, and segments from neighbouring chunks are joined into
+        continuous lines. Contours end where they reach the edge of the grid
+        or a nodata cell.
+
+        Parameters
+        ----------
+        levels : float or sequence of floats
+            contour levels
+        band : int, optional
+            band to contour (default 0)
+        chunksize : tuple of two ints, optional
+            number of rows and columns read at a time (default band chunk size,
+            or (256, 256))
+
+        Returns
+        -------
+        Multiline
+            contour lines, with the contour level of each line in the "level"
+            data field. Closed contours begin and end at the same vertex.
+        """
+        from ..vector.geometry import Multiline
+
+        levels = np.atleast_1d(np.asarray(levels, dtype=np.float64))
+        ny, nx = self.size
+        src = self.bands[band]
+        if chunksize is None:
+            chunksize = getattr(src, "_chunksize", (256, 256))
+        cny, cnx = chunksize
+
+        segments = [[] for _ in levels]
+        for i0 in range(0, ny-1, cny):
+            i1 = min(i0+cny, ny-1)
+            for j0 in range(0, nx-1, cnx):
+                j1 = min(j0+cnx, nx-1)
+
+                # each chunk overlaps its neighbours by one row and column, so
+                # that squares straddling chunk boundaries are included
+                z = np.asarray(src.getblock(i0, j0, i1-i0+1, j1-j0+1),
+                               dtype=np.float64)
+                if np.isnan(self.nodata):
+                    valid = ~np.isnan(z)
+                else:
+                    valid = (z != self.nodata) & ~np.isnan(z)
+                if not valid.any():
+                    continue
+                zmin = z[valid].min()
+                zmax = z[valid].max()
+                valid = valid.view(np.uint8)
+                for n, level in enumerate(levels):
+                    if zmin < level <= zmax:
+                        segments[n].append(_contour.contour_segments(
+                                z, valid, level, i0, j0, nx))
+
+        T = self._transform
+        lines = []
+        line_levels = []
+        for level, segs in zip(levels, segments):
+            if len(segs) == 0:
+                continue
+            keys = np.vstack([k for k, _ in segs])
+            pos = np.vstack([p for _, p in segs])
+            path, offsets = _contour.link_segments(keys)
+            nseg = len(keys)
+            rows = np.where(path < nseg, pos[path % nseg, 0], pos[path % nseg, 2])
+            cols = np.where(path < nseg, pos[path % nseg, 1], pos[path % nseg, 3])
+            x = T[0] + cols*T[2] + rows*T[4]
+            y = T[1] + rows*T[3] + cols*T[5]
+            for a, b in zip(offsets[:-1], offsets[1:]):
+                lines.append(np.c_[x[a:b], y[a:b]])
+                line_levels.append(level)
+        return Multiline(lines, data={"level": line_levels}, crs=self.crs)
+
+    def polygonize(self, band=0, chunksize=None):
+        """ Convert regions of equal grid values into polygons.
+
+        Cells sharing a side and a value form a region. Regions are labeled
+        one chunk at a time, labels meeting across chunk seams are merged, and
+        region boundaries are traced into rings. Nodata cells are not
+        converted.
+
+        Parameters
+        ----------
+        band : int, optional
+            band to polygonize (default 0)
+        chunksize : tuple of two ints, optional
+            number of rows and columns read at a time (default band chunk size,
+            or (256, 256))
+
+        Returns
+        -------
+        Multipolygon
+            one polygon per region, with outer rings counterclockwise and holes
+            clockwise, and the region value in the "value" data field
+        """
+        from ..vector.geometry import Multipolygon
+
+        ny, nx = self.size
+        src = self.bands[band]
+        if chunksize is None:
+            chunksize = getattr(src, "_chunksize", (256, 256))
+        cny, cnx = chunksize
+
+        parent = np.empty(1024, dtype=np.int64)
+        values = np.empty(1024, dtype=np.float64)
+        nlabels = 0
+
+        # labels and values of the cells preceding the current chunk
+        above_lab = np.full(nx, -1, dtype=np.int64)
+        above_z = np.zeros(nx, dtype=np.float64)
+        above_valid = np.zeros(nx, dtype=bool)
+        edges = []
+
+        for i0 in range(0, ny, cny):
+            i1 = min(i0+cny, ny)
+            left_lab = np.full(i1-i0, -1, dtype=np.int64)
+            left_z = np.zeros(i1-i0, dtype=np.float64)
+            left_valid = np.zeros(i1-i0, dtype=bool)
+            for j0 in range(0, nx, cnx):
+                j1 = min(j0+cnx, nx)
+
+                z = np.asarray(src.getblock(i0, j0, i1-i0, j1-j0),
+                               dtype=np.float64)
+                if np.isnan(self.nodata):
+                    valid = ~np.isnan(z)
+                else:
+                    valid = (z != self.nodata) & ~np.isnan(z)
+                lab, n = regions.label_block(z, valid.view(np.uint8))
+
+                if nlabels + n > len(parent):
+                    size = max(2*len(parent), nlabels+n)
+                    parent = np.resize(parent, size)
+                    values = np.resize(values, size)
+                parent[nlabels:nlabels+n] = np.arange(nlabels, nlabels+n)
+                values[nlabels+lab[valid]] = z[valid]
+                lab[valid] += nlabels
+                nlabels += n
+
+                Z = np.empty((i1-i0+1, j1-j0+1), dtype=np.float64)
+                V = np.zeros((i1-i0+1, j1-j0+1), dtype=bool)
+                L = np.full((i1-i0+1, j1-j0+1), -1, dtype=np.int64)
+                Z[1:,1:] = z
+                V[1:,1:] = valid
+                L[1:,1:] = lab
+                Z[0,1:] = above_z[j0:j1]
+                V[0,1:] = above_valid[j0:j1]
+                L[0,1:] = above_lab[j0:j1]
+                Z[1:,0] = left_z
+                V[1:,0] = left_valid
+                L[1:,0] = left_lab
+
+                # merge regions meeting across the seams
+                for a, b in (((0, slice(1, None)), (1, slice(1, None))),
+                             ((slice(1, None), 0), (slice(1, None), 1))):
+                    m = V[a] & V[b] & (Z[a] == Z[b])
+                    if m.any():
+                        regions.union_pairs(parent[:nlabels], L[a][m], L[b][m])
+
+                edges.append(regions.boundary_edges(Z, V.view(np.uint8), L,
+                                                    i0, j0, i1 == ny, j1 == nx))
+
+                above_lab[j0:j1] = lab[-1]
+                above_z[j0:j1] = z[-1]
+                above_valid[j0:j1] = valid[-1]
+                left_lab = lab[:,-1].copy()
+                left_z = z[:,-1].copy()
+                left_valid = valid[:,-1].copy()
+
+        parent = parent[:nlabels]
+        regions.resolve_parents(parent)
+        edges = np.vstack(edges) if len(edges) != 0 else np.empty((0, 5), dtype=np.int64)
+        edges[:,4] = parent[edges[:,4]]
+        startkey = edges[:,0] * (nx+1) + edges[:,1]
+        order = np.lexsort((startkey, edges[:,4]))
+        edges = edges[order]
+        startkey = startkey[order]
+        endkey = edges[:,2] * (nx+1) + edges[:,3]
+        rows, cols, offsets, labels = regions.trace_rings(edges, startkey, endkey)
+
+        # ring orientation distinguishes outer rings from holes: in (row,
+        # column) space with regions on the left, outer rings have negative
+        # signed area when rows are treated as y and columns as x
+        T = self._transform
+        x = T[0] + cols*T[2] + rows*T[4]
+        y = T[1] + rows*T[3] + cols*T[5]
+        nxt = np.arange(len(rows)) + 1
+        nxt[offsets[1:]-1] = offsets[:-1]
+        cross = cols*rows[nxt] - cols[nxt]*rows
+        area = np.add.reduceat(cross, offsets[:-1]) if len(rows) != 0 else \
+               np.empty(0, dtype=np.int64)
+        hole = area > 0
+        flip = (T[2]*T[3] - T[4]*T[5]) > 0
+
+        xy = np.column_stack([x, y])
+        if flip:
+            xy = xy[::-1]
+            offsets = len(xy) - offsets[::-1]
+            labels = labels[::-1]
+            hole = hole[::-1]
+
+        polygons = []
+        keys = []
+        for k in np.lexsort((hole, labels)).tolist():
+            if not hole[k]:
+                polygons.append([])
+                keys.append(labels[k])
+            polygons[-1].append(xy[offsets[k]:offsets[k+1]])
+        return Multipolygon(polygons, data={"value": values[keys].tolist()},
+                            crs=self.crs)
+
+    def quantiles(self, qs, band=0, error=1e-3):
+        """ Estimate quantiles of valid grid values in a single pass, reading
+        one chunk at a time.
+
+        Parameters
+        ----------
+        qs : float or array-like
+            quantiles to estimate, between 0 and 1
+        band : int, optional
+            band to summarize (default 0)
+        error : float, optional
+            maximum error of estimates as a fraction of the range of values
+            (default 1e-3)
+
+        Returns
+        -------
+        float or ndarray
+            estimated quantiles, which are NaN if the band contains no data
+
+        See Also
+        --------
+        karta.raster.sketch.QuantileSketch
+        """
+        sketch = QuantileSketch(error=error)
+        ny, nx = self.size
+        src = self.bands[band]
+        cny, cnx = getattr(src, "_chunksize", (256, 256))
+        for i0 in range(0, ny, cny):
+            i1 = min(i0+cny, ny)
+            for j0 in range(0, nx, cnx):
+                j1 = min(j0+cnx, nx)
+                z = src.getblock(i0, j0, i1-i0, j1-j0)
+                if not np.isnan(self.nodata):
+                    z = z[z != self.nodata]
+                sketch.update(z)
+        return sketch.quantiles(qs)
+
+    def reclassify(self, classes, band=0, default=None, dtype=None,
+                   nodata_value=None, chunksize=None, nthreads=None):
+        """ Return a grid with new values assigned to cells by class, computed
+        one chunk at a time.
+
+        Parameters
+        ----------
+        classes : dict or sequence of tuples
+            either a mapping from cell values to new values, or a sequence of
+            (lower, upper, value) tuples assigning *value* to cells in the
+            half-open interval [lower, upper). Ranges must not overlap.
+        band : int, optional
+            band to reclassify (default 0)
+        default : number, optional
+            value of cells not in any class. If None (default), these cells
+            are NoData.
+        dtype : numpy dtype, optional
+            type of the output (default the type of the new values)
+        nodata_value : number, optional
+            NoData value of the output (default chosen by *dtype*)
+        chunksize : tuple of two ints, optional
+            size of chunks to process at once
+        nthreads : int, optional
+            number of threads to use (default number of CPUs)
+
+        Returns
+        -------
+        RegularGrid
+
+        See Also
+        --------
+        karta.raster.classify.reclassify
+        """
+        from .classify import reclassify
+        return reclassify(self, classes, band=band, default=default,
+                          dtype=dtype, nodata_value=nodata_value,
+                          chunksize=chunksize, nthreads=nthreads)
+
+    def value_counts(self, band=0, bins=None, chunksize=None, nthreads=None):
+        """ Count the cells of each distinct value in a band, or of values in
+        bins, one chunk at a time. NoData cells are not counted.
+
+        Parameters
+        ----------
+        band : int, optional
+            band to count (default 0)
+        bins : sequence of numbers, optional
+            increasing bin edges. If given, values are counted in bins as by
+            `numpy.histogram`.
+        chunksize : tuple of two ints, optional
+            size of chunks to process at once
+        nthreads : int, optional
+            number of threads to use (default number of CPUs)
+
+        Returns
+        -------
+        (values, counts) : tuple of ndarrays
+            distinct values in increasing order and their counts, or if *bins*
+            is given, the bin edges and the count in each bin
+
+        See Also
+        --------
+        karta.raster.classify.value_counts
+        """
+        from .classify import value_counts
+        return value_counts(self, band=band, bins=bins, chunksize=chunksize,
+                            nthreads=nthreads)
+
+    def proximity(self, target_values=None, band=0, return_index=False,
+                  nthreads=None):
+        """ Compute the distance from every cell to the nearest target cell by
+        an exact Euclidean distance transform, in time proportional to the
+        number of cells.
+
+        Parameters
+        ----------
+        target_values : sequence of numbers, optional
+            values of target cells. If None (default), every cell that is not
+            NoData is a target.
+        band : int, optional
+            band to read targets from (default 0)
+        return_index : bool, optional
+            if True, also return a grid of the index of the nearest target
+            cell (default False)
+        nthreads : int, optional
+            number of threads to use (default number of CPUs)
+
+        Returns
+        -------
+        RegularGrid
+            float64 distances in grid units, taking into account different
+            row and column resolutions. Distances are NaN if there are no
+            target cells.
+        RegularGrid, optional
+            int64 flat index ``i*nx + j`` of the nearest target cell, or -1
+            if there are no target cells. Only returned if *return_index* is
+            True.
+        """
+        from .misc import _check_orthogonal, _map_chunks
+        _check_orthogonal(self, "proximity")
+        ny, nx = self.size
+        src = self.bands[band]
+        cny, cnx = getattr(src, "_chunksize", (256, 256))
+
+        target = np.zeros((ny, nx), dtype=np.uint8)
+        for i0 in range(0, ny, cny):
+            for j0 in range(0, nx, cnx):
+                z = src.getblock(i0, j0, min(cny, ny-i0), min(cnx, nx-j0))
+                if target_values is None:
+                    if np.isnan(self.nodata):
+                        t = ~np.isnan(z)
+                    else:
+                        t = z != self.nodata
+                else:
+                    t = np.in1d(z.ravel(), target_values).reshape(z.shape)
+                target[i0:i0+z.shape[0], j0:j0+z.shape[1]] = t
+
+        # column distances are computed in strips of columns, and distances
+        # in strips of rows, which are written to the output bands
+        g = np.empty((ny, nx), dtype=np.float64)
+        nearest = np.empty((ny, nx), dtype=np.int32)
+        dx, dy = abs(self.transform[2]), abs(self.transform[3])
+        strips = [(j0, min(j0+cnx, nx)) for j0 in range(0, nx, cnx)]
+        for _ in _map_chunks(strips, lambda s: s,
+                lambda s: edt.columns(target, dy, g, nearest, s[0], s[1]),
+                nthreads):
+            pass
+        del target
+
+        def compute(strip):
+            dist = np.empty((strip[1]-strip[0], nx), dtype=np.float64)
+            index = np.empty((strip[1]-strip[0], nx), dtype=np.int64)
+            edt.rows(g, nearest, dx, strip[0], strip[1], dist, index)
+            dist[index == -1] = np.nan
+            return dist, index
+
+        distband = self._bndcls(self.size, np.float64, initval=np.nan)
+        if return_index:
+            indexband = self._bndcls(self.size, np.int64, initval=-1)
+        strips = [(i0, min(i0+cny, ny)) for i0 in range(0, ny, cny)]
+        for strip, (dist, index) in _map_chunks(strips, lambda s: s, compute,
+                                                nthreads):
+            distband.setblock(strip[0], 0, dist)
+            if return_index:
+                indexband.setblock(strip[0], 0, index)
+
+        distgrid = RegularGrid(self.transform, bands=[distband], crs=self.crs,
+                               nodata_value=np.nan)
+        if return_index:
+            return distgrid, RegularGrid(self.transform, bands=[indexband],
+                                         crs=self.crs, nodata_value=-1)
+        return distgrid
+
+    def fill_nodata(self, method="idw", max_distance=None, power=2.0,
+                    chunksize=None, nthreads=None):
+        """ Return a copy of the grid with NoData holes filled, processing
+        only the chunks that contain NoData.
+
+        Parameters
+        ----------
+        method : str, optional
+            "idw" (default) for inverse distance weighting of the nearest
+            valid cells in 8 directions, or "laplace" for a smooth surface
+            bounded by the values around holes
+        max_distance : float, optional
+            cells farther than this from valid cells, in grid units, remain
+            NoData (default 100 cells)
+        power : float, optional
+            power of inverse distance weights (default 2)
+        chunksize : tuple of two ints, optional
+            size of chunks to process at once
+        nthreads : int, optional
+            number of threads to use (default number of CPUs)
+
+        Returns
+        -------
+        RegularGrid
+
+        See Also
+        --------
+        karta.raster.inpaint.fill_nodata
+        """
+        from .inpaint import fill_nodata
+        return fill_nodata(self, method=method, max_distance=max_distance,
+                           power=power, chunksize=chunksize, nthreads=nthreads)
+
+    def _window_bbox(self, i0, i1, j0, j1, crs=None):
+        """ Return the bounding box (xmin, ymin, xmax, ymax) of the cells in a
+        window, optionally in another coordinate system. """
+        t = np.linspace(0.0, 1.0, 9)
+        i = np.concatenate([i0 + t*(i1-i0), np.full_like(t, i1),
+                            i0 + t*(i1-i0), np.full_like(t, i0)])
+        j = np.concatenate([np.full_like(t, j0), j0 + t*(j1-j0),
+                            np.full_like(t, j1), j0 + t*(j1-j0)])
+        T = self._transform
+        x = T[0] + j*T[2] + i*T[4]
+        y = T[1] + i*T[3] + j*T[5]
+        if crs is not None and crs != self.crs:
+            x, y = self.crs.transform(crs, x, y)
+        return (np.min(x), np.min(y), np.max(x), np.max(y))
 
     def _resample_transform(self, transform, method='nearest'):
         """ Resample grid to match a new transform.
@@ -680,8 +1407,9 @@ class RegularGrid(Grid):
         -------
         RegularGrid
         """
-        cg = CoordinateGenerator(transform, self.size, self.crs, self.crs)
-        X, Y = cg[:,:]
+        ny, nx = self.size
+        X, Y = affine_mesh(transform, np.arange(ny), np.arange(nx),
+                           broadcast=True)
         if method == 'nearest':
             values = self.sample_nearest(X, Y)
         elif method == 'linear':
@@ -744,8 +1472,7 @@ class RegularGrid(Grid):
 
         t = self._transform
         tnew = (xmin-0.5*dx-0.5*t[4], ymin-0.5*dy-0.5*t[5], dx, dy, t[4], t[5])
-        cg = CoordinateGenerator(tnew, (ny, nx), self.crs, self.crs)
-        X, Y = cg[:,:]
+        X, Y = affine_mesh(tnew, np.arange(ny), np.arange(nx), broadcast=True)
 
         if method == 'nearest':
             values = self.sample_nearest(X, Y)
@@ -759,6 +1486,159 @@ class RegularGrid(Grid):
         return RegularGrid(tnew, values=values, crs=self.crs,
                            nodata_value=self.nodata)
 
+    def reproject(self, crs, resolution=None, method="nearest", bbox=None,
+                  error=0.125, chunksize=(256, 256), bandclass=None):
+        """ Return a grid warped into a new coordinate system.
+
+        Output cell centers are mapped back to source grid positions one chunk
+        at a time. Within each chunk, the coordinate transformation is
+        approximated by interpolating between exactly transformed control
+        points, so that only a small fraction of cells are passed through
+        *crs.transform*. Memory use is bounded by the chunk size and the region
+        of the source grid it covers.
+
+        Parameters
+        ----------
+        crs : karta.crs.CRS subclass
+            output coordinate system
+        resolution : float or 2-tuple of floats, optional
+            output cell size (dx, dy). By default, square cells are chosen
+            so that the output has about as many cells as the input.
+        method : str, optional
+            interpolation method, currently 'nearest' (default) and 'linear'
+            supported
+        bbox : 4-tuple of floats, optional
+            output (xmin, ymin, xmax, ymax) in *crs*. By default, the
+            transformed outline of the grid is used.
+        error : float, optional
+            maximum error of the approximate coordinate transformation, in
+            source pixels (default 0.125). If zero, every cell is transformed
+            exactly.
+        chunksize : tuple of two ints, optional
+            number of output rows and columns processed at a time
+            (default (256, 256))
+        bandclass : class, optional
+            band class of the output grid (default BAND_CLASS_DEFAULT)
+
+        Returns
+        -------
+        RegularGrid
+        """
+        if method not in ("nearest", "linear"):
+            raise NotImplementedError('method "{0}" unavailable'.format(method))
+
+        ny, nx = self.size
+        T = self._transform
+        to_output = coordinate_transformer(self.crs, crs)
+        to_source = coordinate_transformer(crs, self.crs)
+
+        if bbox is None:
+            # transform a densified outline of the grid
+            t = np.linspace(0.0, 1.0, 33)
+            i = np.concatenate([t*ny, np.full_like(t, ny), t[::-1]*ny, np.zeros_like(t)])
+            j = np.concatenate([np.zeros_like(t), t*nx, np.full_like(t, nx), t[::-1]*nx])
+            xo, yo = to_output(T[0] + j*T[2] + i*T[4], T[1] + i*T[3] + j*T[5])
+            xo = np.asarray(xo)[np.isfinite(xo)]
+            yo = np.asarray(yo)[np.isfinite(yo)]
+            if len(xo) == 0 or len(yo) == 0:
+                raise errors.GridError("grid outline could not be transformed")
+            bbox = (xo.min(), yo.min(), xo.max(), yo.max())
+
+        if resolution is None:
+            r = math.sqrt((bbox[2]-bbox[0]) * (bbox[3]-bbox[1]) / float(nx*ny))
+            resolution = (r, r)
+        elif isinstance(resolution, numbers.Real):
+            resolution = (resolution, resolution)
+        dx, dy = resolution
+        if dx <= 0 or dy <= 0:
+            raise ValueError("resolution must be positive "
+                             "(got {0}, {1})".format(dx, dy))
+
+        nxo = max(1, int(math.ceil((bbox[2]-bbox[0]) / dx)))
+        nyo = max(1, int(math.ceil((bbox[3]-bbox[1]) / dy)))
+        Tout = (bbox[0], bbox[1], dx, dy, 0.0, 0.0)
+
+        def source_positions(i, j):
+            xs, ys = to_source(Tout[0] + (j+0.5)*dx, Tout[1] + (i+0.5)*dy)
+            return crfuncs.get_positions_vec(T,
+                                             np.asarray(xs, dtype=np.float64),
+                                             np.asarray(ys, dtype=np.float64))
+
+        approx = ApproximateTransformer(source_positions, error=error)
+
+        if bandclass is None:
+            bandclass = BAND_CLASS_DEFAULT
+        bands = [bandclass((nyo, nxo), band.dtype, initval=self.nodata)
+                 for band in self.bands]
+
+        for i0 in range(0, nyo, chunksize[0]):
+            i1 = min(i0+chunksize[0], nyo)
+            for j0 in range(0, nxo, chunksize[1]):
+                j1 = min(j0+chunksize[1], nxo)
+                I, J = approx(i0, i1, j0, j1)
+                if not np.any((I > -1) & (I < ny) & (J > -1) & (J < nx)):
+                    continue
+                values = self._sample_positions(I.ravel(), J.ravel(), method)
+                for band, v in zip(bands, values):
+                    band.setblock(i0, j0, v.reshape(I.shape))
+
+        return RegularGrid(Tout, bands=bands, crs=crs, nodata_value=self.nodata)
+
+    def _sample_positions(self, I, J, method="nearest"):
+        """ Return band values at fractional row and column positions as an
+        (nbands x n) array. Positions that are outside the grid or not finite
+        are assigned nodata.
+
+        Parameters
+        ----------
+        I, J : 1-d ndarrays
+            row and column positions, as returned by `positions()`
+        method : str, optional
+            'nearest' (default) or 'linear'
+        """
+        m, n = self.size
+        dtype = self.bands[0].dtype
+        out = np.full((self.nbands, len(I)), self.nodata, dtype=dtype)
+
+        if method == "nearest":
+            I = np.round(I)
+            J = np.round(J)
+        elif method != "linear":
+            raise NotImplementedError('method "{0}" unavailable'.format(method))
+
+        with np.errstate(invalid="ignore"):
+            valid = (I >= 0) & (I <= m-1) & (J >= 0) & (J <= n-1)
+
+        if not valid.any():
+            return out
+        I = I[valid]
+        J = J[valid]
+
+        # read only the region of the grid containing the positions
+        Imn = max(int(np.floor(I.min()))-1, 0)
+        Imx = min(int(np.ceil(I.max()))+2, m)
+        Jmn = max(int(np.floor(J.min()))-1, 0)
+        Jmx = min(int(np.ceil(J.max()))+2, n)
+        values = self[Imn:Imx,Jmn:Jmx,:]
+        I = I - Imn
+        J = J - Jmn
+
+        if method == "nearest":
+            out[:,valid] = values[I.astype(np.intp), J.astype(np.intp), :].T
+        else:
+            # interpolate in double precision and round for integer bands,
+            # so that values are not biased downward by truncation. NoData
+            # cells are NaN, so that positions next to them become NoData.
+            for k in range(self.nbands):
+                Z = values[:,:,k].astype(np.float64)
+                if not np.isnan(self.nodata):
+                    Z[values[:,:,k] == self.nodata] = np.nan
+                z = crfuncs.sample_bilinear_double(I, J, Z, np.nan)
+                if not np.issubdtype(dtype, np.floating):
+                    z = np.round(z)
+                out[k,valid] = np.where(np.isnan(z), self.nodata, z)
+        return out
+
     def positions(self, x, y):
         """ Return the float row and column indices for the point nearest
         geographical coordinates.
@@ -1033,12 +1913,13 @@ class RegularGrid(Grid):
         return v
 
     def profile(self, line, resolution=None, **kw):
-        """ Sample along a *Line* at a specified interval.
+        """ Sample along a *Line* at a specified interval. If a *Multiline* is
+        provided, every line is sampled in a single batch.
 
         Parameters
         ----------
-        line : karta.Line
-            defines the sampling path
+        line : karta.Line or karta.Multiline
+            defines the sampling path(s)
         resolution : float, optional
             sample spacing, taken to be the minimum grid resolution by default
 
@@ -1048,7 +1929,8 @@ class RegularGrid(Grid):
         Returns
         -------
         Multipoint
-            sample points
+            sample points. When *line* is a Multiline, the "part" data field
+            gives the index of the line each point was sampled from.
         ndarray
             grid value at sample points
         """
@@ -1081,10 +1963,14 @@ class RegularGrid(Grid):
                 FutureWarning)
         return self.to_geotiff(*args, **kwargs)
 
-    def to_aai(self, f, reference='corner', nodata_value=-9999):
+    def to_aai(self, f, reference='corner', nodata_value=-9999, band=0,
+               precision=None):
         """ Save internal data as an ASCII grid. Based on the ESRI standard,
         only isometric grids (i.e. `hdr['dx'] == hdr['dy']` can be saved.
 
+        Rows are formatted and written one block at a time, beginning from the
+        top of the grid.
+
         Parameters
         ----------
         f : str
@@ -1093,6 +1979,12 @@ class RegularGrid(Grid):
             specify a header reference ('center' | 'corner')
         nodata_value : number
             specify how NaNs should be represented
+        band : int, optional
+            band to write (default 0)
+        precision : int, optional
+            number of significant digits written for floating point grids. By
+            default, values are written with the shortest representation that
+            reads back exactly.
 
         Raises
         ------
@@ -1108,32 +2000,46 @@ class RegularGrid(Grid):
             raise errors.GridError("ESRI ASCII grids require isometric grid cells")
 
         sx, sy = self.skew
-        if sx != sy != 0.0:
+        if sx != 0.0 or sy != 0.0:
             raise errors.GridError("skewed grids cannot be written as ESRI ASCII")
 
-        ny, nx = self.bands[0].size
+        src = self.bands[band]
+        ny, nx = src.size
+        integer = np.issubdtype(src.dtype, np.integer)
+        nodata_text = str(nodata_value).encode("ascii")
 
         if not hasattr(f, 'read'):
-            f = open(f, "w")
+            f = open(f, "wb")
 
-        try:
-            data_a = self[:,:].copy()
-            data_a[np.isnan(data_a)] = nodata_value
+        if isinstance(f, io.TextIOBase):
+            write = lambda b: f.write(b.decode("ascii"))
+        else:
+            write = f.write
 
-            f.write("NCOLS {0}\n".format(nx))
-            f.write("NROWS {0}\n".format(ny))
+        try:
+            header = ["NCOLS {0}".format(nx), "NROWS {0}".format(ny)]
             if reference == 'center':
                 xll, yll = self.center_llref()
-                f.write("XLLCENTER {0}\n".format(xll))
-                f.write("YLLCENTER {0}\n".format(yll))
+                header.append("XLLCENTER {0}".format(xll))
+                header.append("YLLCENTER {0}".format(yll))
             elif reference == 'corner':
                 xll, yll = self.corner_llref()
-                f.write("XLLCORNER {0}\n".format(xll))
-                f.write("YLLCORNER {0}\n".format(yll))
-            f.write("CELLSIZE {0}\n".format(dx))
-            f.write("NODATA_VALUE {0}\n".format(nodata_value))
-            f.writelines([str(row).replace(',','')[1:-1] +
-                            '\n' for row in data_a.tolist()])
+                header.append("XLLCORNER {0}".format(xll))
+                header.append("YLLCORNER {0}".format(yll))
+            header.append("CELLSIZE {0}".format(dx))
+            header.append("NODATA_VALUE {0}".format(nodata_value))
+            write(("\n".join(header) + "\n").encode("ascii"))
+
+            cny = getattr(src, "_chunksize", (256, 256))[0]
+            for i1 in range(ny, 0, -cny):
+                i0 = max(i1-cny, 0)
+                block = np.array(src.getblock(i0, 0, i1-i0, nx)[::-1],
+                                 dtype=np.float64)
+                if not np.isnan(self.nodata):
+                    block[block == self.nodata] = np.nan
+                write(aaifuncs.format_rows(block, nodata_text,
+                                           precision=precision or 0,
+                                           integer=integer))
         finally:
             f.close()
         return self
@@ -1256,6 +2162,127 @@ def get_nodata(T):
     else:
         raise ValueError("No default NODATA value for type {0}".format(T))
 
+class PointAggregator(object):
+    """ Accumulates point data into the cells of a grid in batches, so that
+    arbitrarily large point streams can be gridded with memory proportional to
+    the grid size.
+
+    Parameters
+    ----------
+    transform : 6-tuple of floats
+        geotransform: ``[xllcorner, yllcorner, xres, yres, xskew, yskew]``
+    size : 2-tuple of ints
+        number of rows and columns
+    crs : karta.crs.CRS subclass, optional
+        coordinate reference system of the grid and points
+    stats : list of str, optional
+        statistics to be computed, from "count", "mean", "std", "min", "max",
+        and "last" (default ["mean"])
+
+    Usage
+    -----
+    agg = PointAggregator(transform, (ny, nx), stats=["mean", "max"])
+    for x, y, z in batches:
+        agg.add(x, y, z)
+    grid = agg.finalize("mean")
+    """
+
+    STATISTICS = ("count", "mean", "std", "min", "max", "last")
+
+    def __init__(self, transform, size, crs=None, stats=("mean",)):
+        if isinstance(stats, str):
+            stats = [stats]
+        for stat in stats:
+            if stat not in self.STATISTICS:
+                raise ValueError("unknown statistic '{0}'".format(stat))
+
+        self.transform = tuple(float(a) for a in transform)
+        self.size = tuple(size)
+        self.crs = CRS_DEFAULT if crs is None else crs
+        self.stats = tuple(stats)
+
+        def accumulator(needed):
+            if needed:
+                return np.zeros(self.size, dtype=np.float64)
+            return None
+
+        self._count = np.zeros(self.size, dtype=np.int64)
+        self._total = accumulator("mean" in stats or "std" in stats)
+        self._sqdev = accumulator("std" in stats)
+        self._min = accumulator("min" in stats)
+        self._max = accumulator("max" in stats)
+        self._last = accumulator("last" in stats)
+        return
+
+    def add(self, x, y, z):
+        """ Add a batch of points. Points outside the grid are ignored, and
+        NaN values are not counted.
+
+        Parameters
+        ----------
+        x, y : iterable
+            point coordinates
+        z : iterable
+            point values
+
+        Returns
+        -------
+        int
+            number of points inside the grid
+        """
+        x = np.ascontiguousarray(np.ravel(x), dtype=np.float64)
+        y = np.ascontiguousarray(np.ravel(y), dtype=np.float64)
+        z = np.ascontiguousarray(np.ravel(z))
+        if z.dtype.kind not in "iuf" or z.dtype == np.float16:
+            z = z.astype(np.float64)
+        if not (len(x) == len(y) == len(z)):
+            raise ValueError("x, y, and z must have equal length")
+        return crfuncs.aggregate_points(self.transform, x, y, z, self._count,
+                                        self._total, self._sqdev,
+                                        self._min, self._max, self._last)
+
+    def _values(self, stat):
+        if stat not in self.stats and stat != "count":
+            raise ValueError("statistic '{0}' was not accumulated".format(stat))
+        empty = self._count == 0
+        if stat == "count":
+            return self._count.astype(np.float64)
+        elif stat == "mean":
+            values = self._total / np.where(empty, 1, self._count)
+        elif stat == "std":
+            values = np.sqrt(self._sqdev / np.where(empty, 1, self._count))
+        elif stat == "min":
+            values = self._min.copy()
+        elif stat == "max":
+            values = self._max.copy()
+        else:
+            values = self._last.copy()
+        values[empty] = np.nan
+        return values
+
+    def finalize(self, stats=None):
+        """ Return a grid of accumulated statistics. Cells containing no
+        points are nodata (NaN), except for counts, which are zero.
+
+        Parameters
+        ----------
+        stats : str or list of str, optional
+            statistic or statistics to return, by default those passed to the
+            constructor. A list produces a grid with one band per statistic.
+
+        Returns
+        -------
+        RegularGrid
+        """
+        if stats is None:
+            stats = self.stats
+        if isinstance(stats, str):
+            values = self._values(stats)
+        else:
+            values = np.dstack([self._values(stat) for stat in stats])
+        return RegularGrid(self.transform, values=values, crs=self.crs,
+                           nodata_value=np.nan)
+
 def gridpoints(x, y, z, transform, crs):
     """ Return a grid computed by averaging point data over cells.
 
@@ -1271,117 +2298,382 @@ def gridpoints(x, y, z, transform, crs):
         geotransform: ``[xllcorner, yllcorner, xres, yres, xskew, yskew]``
     crs : karta.crs.CRS subclass
         coordinate reference system object
+
+    See also
+    --------
+    PointAggregator : grids points in batches and computes other statistics
     """
     ny = int((np.max(y) - transform[1]) // transform[3]) + 1
     nx = int((np.max(x) - transform[0]) // transform[2]) + 1
-    grid = RegularGrid(transform, values=np.empty([ny, nx]), crs=crs,
-                       nodata_value=np.nan)
-
-    array = np.zeros([ny, nx])
-    (I, J) = grid.indices(x, y)
-
-    try:
-        err = crfuncs.fillarray_double(array,
-                                       I.astype(np.int32),
-                                       J.astype(np.int32), z, grid.nodata)
-        if err != 0:
-            raise RuntimeError("failure in fillarray_double")
-    except ValueError:
-        # Fast version works when *z* is of type double (np.float64).
-        # Python fallback for other types
-        counts = np.zeros([ny, nx], dtype=np.int16)
-        for (i,j,z_) in zip(I, J, z):
-            array[i,j] += z_
-            counts[i,j] += 1
-
-        m = counts!=0
-        array[m] = array[m] / counts[m]
-        array[~m] = np.nan
-
-    grid[:,:,0] = array
-    return grid
+    aggregator = PointAggregator(transform, (ny, nx), crs=crs, stats=["mean"])
+    if aggregator.add(x, y, z) != np.size(z):
+        raise IndexError("coordinates outside grid region")
+    return aggregator.finalize("mean")
+
+def _polygon_rings(polys, crs):
+    """ Return a list with one list of ring vertex arrays per polygon in
+    *polys* (a Polygon, Multipolygon, or nested list of these), in
+    coordinate system *crs*. The first ring of each polygon is the outer
+    boundary. """
+    geotype = getattr(polys, "_geotype", None)
+    if geotype == "Polygon":
+        rings = [polys.vertices(crs=crs)[:,:2]]
+        for sub in polys.subs:
+            rings.append(sub.vertices(crs=crs)[:,:2])
+        return [rings]
+    elif geotype == "Multipolygon":
+        return [_polygon_rings(polys[i], crs)[0] for i in range(len(polys))]
+    elif isinstance(polys, (list, tuple)):
+        out = []
+        for item in polys:
+            out.extend(_polygon_rings(item, crs))
+        return out
+    else:
+        raise TypeError("expected a Polygon, Multipolygon, or list of these "
+                        "(got {0})".format(type(polys)))
 
-def mask_poly(xpoly, ypoly, nx, ny, transform):
-    """ Create a grid mask based on a clockwise-oriented polygon.
+def _ring_edges(rings, transform, orient=False):
+    """ Return an (n x 4) array of the edges (u0, v0, u1, v1) of polygon rings
+    in fractional grid column (u) and row (v) coordinates.
+
+    If *orient* is True, rings are reversed as necessary so that the first
+    ring of each polygon winds counterclockwise in index space and the
+    remaining rings wind clockwise.
+    """
+    a, b, c, d, e, f = transform
+    det = c*d - e*f
+    edges = []
+    for polygon in rings:
+        for k, ring in enumerate(polygon):
+            x = np.asarray(ring[:,0], dtype=np.float64)
+            y = np.asarray(ring[:,1], dtype=np.float64)
+            u = (d*(x-a) - e*(y-b)) / det
+            v = (c*(y-b) - f*(x-a)) / det
+            if orient:
+                area = np.dot(u[:-1], v[1:]) - np.dot(u[1:], v[:-1]) + \
+                       u[-1]*v[0] - u[0]*v[-1]
+                if (area < 0) == (k == 0):
+                    u = u[::-1]
+                    v = v[::-1]
+            ring_edges = np.empty((len(u), 4), dtype=np.float64)
+            ring_edges[:,0] = u
+            ring_edges[:,1] = v
+            ring_edges[:-1,2] = u[1:]
+            ring_edges[:-1,3] = v[1:]
+            ring_edges[-1,2] = u[0]
+            ring_edges[-1,3] = v[0]
+            edges.append(ring_edges)
+    if len(edges) == 0:
+        return np.empty((0, 4), dtype=np.float64)
+    return np.vstack(edges)
+
+def _window_spans(spans, i0, i1, j0, j1):
+    """ Return the parts of row-ordered *spans* within rows i0 <= i < i1 and
+    columns j0 <= j < j1, relative to the window origin. """
+    rows, starts, ends = spans
+    a, b = np.searchsorted(rows, [i0, i1])
+    starts = np.maximum(starts[a:b], j0)
+    ends = np.minimum(ends[a:b], j1)
+    keep = ends > starts
+    return ((rows[a:b][keep] - i0).astype(np.int32),
+            (starts[keep] - j0).astype(np.int32),
+            (ends[keep] - j0).astype(np.int32))
+
+def polygon_mask(polys, size, transform, crs=None, window=None,
+                 rule="evenodd", packed=False):
+    """ Return a mask of the grid cells with centers inside polygons.
 
     Parameters
     ----------
-    xpoly, ypoly : lists of floats
-        sequences of points representing polygon
-    nx : int
-    ny : int
-        size of grid
+    polys : Polygon, Multipolygon or list of Polygon instances
+        polygons, whose holes are given by sub-polygons
+    size : 2-tuple of ints
+        grid (ny, nx)
     transform : list[float]
         affine transformation describing grid layout and origin
         ``T == [x0, y0, dx, dy, sx, sy]``
+    crs : karta.crs.CRS subclass, optional
+        coordinate system of the grid. If None, polygon coordinates are used
+        without transformation.
+    window : 4-tuple of ints, optional
+        (i0, i1, j0, j1) row and column bounds of a subregion of the grid to
+        rasterize (default entire grid)
+    rule : str, optional
+        'evenodd' (default) or 'nonzero'. With the nonzero winding rule,
+        overlapping polygons are combined as a union.
+    packed : bool, optional
+        if True, return a bit-packed uint8 array as produced by
+        `numpy.packbits` along rows (default False)
 
     Returns
     -------
     ndarray
+        boolean array of shape (i1-i0, j1-j0), or packed uint8 array
     """
-    mask = np.zeros((ny, nx), dtype=np.int8)
+    if rule not in ("evenodd", "nonzero"):
+        raise ValueError("rule must be 'evenodd' or 'nonzero'")
+    if window is None:
+        window = (0, size[0], 0, size[1])
+    i0, i1, j0, j1 = window
+    nrows = max(i1-i0, 0)
+    ncols = max(j1-j0, 0)
+
+    edges = _ring_edges(_polygon_rings(polys, crs), transform,
+                        orient=(rule == "nonzero"))
+    edges[:,0::2] -= j0
+    edges[:,1::2] -= i0
+    spans = scanline.polygon_spans(edges, nrows, ncols,
+                                   nonzero=(rule == "nonzero"))
+    if packed:
+        return scanline.spans_to_packed(*(spans + (nrows, ncols)))
+    else:
+        return scanline.spans_to_mask(*(spans + (nrows, ncols)))
+
+def polygon_coverage(polys, size, transform, crs=None, window=None):
+    """ Return the exact fraction of each grid cell covered by polygons.
 
-    # find left southernmost index (will start and end on this point)
-    x0, y0 = xpoly[0], ypoly[0]
-    i_bot = 0
-    for i in range(1, len(ypoly)):
-        if ypoly[i] < y0 or (ypoly[i] == y0 and xpoly[i] < x0):
-            x0 = xpoly[i]
-            y0 = ypoly[i]
-            i_bot = i
+    Only cells crossed by polygon boundaries are visited individually, so the
+    cost grows with the length of the boundaries rather than the area of the
+    grid.
 
-    x0 = xpoly[i_bot]
-    y0 = ypoly[i_bot]
+    Parameters
+    ----------
+    polys : Polygon, Multipolygon or list of Polygon instances
+        polygons, whose holes are given by sub-polygons. Coverage by
+        overlapping polygons is limited to one, which is exact only where
+        one polygon covers the whole overlap of a cell.
+    size : 2-tuple of ints
+        grid (ny, nx)
+    transform : list[float]
+        affine transformation describing grid layout and origin
+        ``T == [x0, y0, dx, dy, sx, sy]``
+    crs : karta.crs.CRS subclass, optional
+        coordinate system of the grid. If None, polygon coordinates are used
+        without transformation.
+    window : 4-tuple of ints, optional
+        (i0, i1, j0, j1) row and column bounds of a subregion of the grid to
+        rasterize (default entire grid)
 
-    # compute the grid indices of the starting point
-    ta, tb, tc, td, te, tf = transform
+    Returns
+    -------
+    ndarray
+        float64 array of shape (i1-i0, j1-j0) with values from zero to one
+    """
+    if window is None:
+        window = (0, size[0], 0, size[1])
+    i0, i1, j0, j1 = window
+    edges = _ring_edges(_polygon_rings(polys, crs), transform, orient=True)
+    edges[:,0::2] -= j0
+    edges[:,1::2] -= i0
+    return scanline.polygon_coverage(edges, max(i1-i0, 0), max(j1-j0, 0))
+
+def _burn_items(geoms, transform, crs, values):
+    """ Convert geometries to lists of (kind, parts) items for `rasterize`,
+    with coordinates in fractional grid column (u) and row (v) indices. """
+    if getattr(geoms, "_geotype", None) is not None:
+        geoms = [geoms]
+    items = []
+    for geom in geoms:
+        geotype = getattr(geom, "_geotype", None)
+        multipart = geotype in ("Multipoint", "Multiline", "Multipolygon")
+        if geotype == "Point":
+            xy = np.atleast_2d(np.asarray(geom.vertex(crs=crs), dtype=np.float64))
+        elif geotype in ("Line", "Multipoint"):
+            xy = np.atleast_2d(np.asarray(geom.vertices(crs=crs), dtype=np.float64))
+        elif geotype == "Multiline":
+            xy = [np.asarray(v, dtype=np.float64) for v in geom.vertices(crs=crs)]
+        elif geotype in ("Polygon", "Multipolygon"):
+            xy = _polygon_rings(geom, crs)
+        else:
+            raise TypeError("cannot rasterize {0}".format(type(geom)))
 
-    # normalize grid transform so increasing i, j corresponds to north, east
-    if tc < 0:
-        ta = ta + nx*tc
-        tc = -tc
+        nparts = 1 if geotype in ("Point", "Line") else len(xy)
 
-    if td < 0:
-        tb = tb + ny*td
-        td = -td
+        if isinstance(values, str):
+            if multipart:
+                vals = geom.data.getfield(values)
+            else:
+                vals = [geom.properties[values]]
+        else:
+            vals = [values] * nparts
+        vals = np.asarray(vals, dtype=np.float64)
+
+        if geotype in ("Polygon", "Multipolygon"):
+            edges = [_ring_edges([rings], transform) for rings in xy]
+            bboxes = np.array([(e[:,0::2].min(), e[:,1::2].min(),
+                                e[:,0::2].max(), e[:,1::2].max())
+                               for e in edges]).reshape(-1, 4)
+            items.append(("polygon", (edges, vals, bboxes)))
+            continue
+
+        if geotype == "Multiline":
+            lengths = [len(v) for v in xy]
+            xy = np.vstack(xy) if len(xy) != 0 else np.empty((0, 2))
+        elif geotype == "Line":
+            lengths = [len(xy)]
+        else:
+            lengths = [1] * len(xy)
+        I, J = crfuncs.get_positions_vec(transform,
+                                         np.ascontiguousarray(xy[:,0]),
+                                         np.ascontiguousarray(xy[:,1]))
+        u = J + 0.5
+        v = I + 0.5
+        if geotype in ("Line", "Multiline"):
+            ends = np.cumsum(lengths).astype(np.int64)
+            starts = ends - np.asarray(lengths, dtype=np.int64)
+            bboxes = np.array([(u[a:b].min(), v[a:b].min(),
+                                u[a:b].max(), v[a:b].max())
+                               for a, b in zip(starts, ends) if b > a]
+                              ).reshape(-1, 4)
+            keep = ends > starts
+            items.append(("line", (u, v, starts[keep], ends[keep], vals[keep],
+                                   bboxes)))
+        else:
+            items.append(("point", (u, v, vals)))
+    return items
 
-    i0 = int(round((y0-tb - tf/tc*(x0-ta)) / (td - tf*te/tc)))
-    j0 = int(round((x0-ta - te/td*(y0-tb)) / (tc - te*tf/td)))
+def rasterize(geoms, like, values=1.0, merge="replace", dtype=np.float64,
+              nodata=None, bandclass=None, chunksize=(256, 256)):
+    """ Burn vector geometries into a new grid.
 
-    for el in range(1, len(xpoly)+1):
-        idx = (el + i_bot) % len(xpoly)
-        x1 = xpoly[idx]
-        y1 = ypoly[idx]
+    Points are burned into the cell containing them, lines into every cell
+    they cross, and polygons into the cells whose centers they contain. The
+    output is written one chunk at a time, and each chunk only visits the
+    geometries that overlap it. Polygons are scan converted once, and their
+    spans are divided among chunks.
 
-        # (Unbounded) grid indices of the segment end points
-        i1 = int(round((y1-tb - tf/tc*(x1-ta)) / (td - tf*te/tc)))
-        j1 = int(round((x1-ta - te/td*(y1-tb)) / (tc - te*tf/td)))
+    Parameters
+    ----------
+    geoms : geometry or list of geometries
+        Point, Line, Polygon, Multipoint, Multiline, or Multipolygon instances
+    like : RegularGrid
+        grid providing the transform, size, and coordinate system of the output
+    values : number or str, optional
+        constant value to burn (default 1.0), or name of a field holding the
+        value for each geometry. The field is taken from the data table of
+        multipart geometries and from the properties of single geometries.
+    merge : str, optional
+        how values burned into the same cell are combined, one of 'replace'
+        (later geometries take precedence, the default), 'add', 'max', or
+        'min'
+    dtype : numpy dtype, optional
+        output data type (default float64)
+    nodata : number, optional
+        value of cells that are not burned (default chosen by `get_nodata`)
+    bandclass : class, optional
+        band class of the output (default BAND_CLASS_DEFAULT)
+    chunksize : tuple of two ints, optional
+        number of rows and columns burned at a time (default (256, 256))
 
-        # If segment is horizontal or off-grid, ignore
-        if ((0 <= i0 < ny) and (0 <= i1 < ny)) or (y1 != y0):
+    Returns
+    -------
+    RegularGrid
+    """
+    merge_methods = {"replace": scanline.MERGE_REPLACE,
+                     "add": scanline.MERGE_ADD,
+                     "max": scanline.MERGE_MAX,
+                     "min": scanline.MERGE_MIN}
+    if merge not in merge_methods:
+        raise ValueError("merge must be one of 'replace', 'add', 'max', "
+                         "or 'min'")
+    mode = merge_methods[merge]
+    dtype = np.dtype(dtype)
+    if nodata is None:
+        nodata = get_nodata(dtype.type)
+    if bandclass is None:
+        bandclass = BAND_CLASS_DEFAULT
+
+    items = _burn_items(geoms, like.transform, like.crs, values)
+    ny, nx = like.size
+    cny, cnx = chunksize
+
+    # group points by chunk, preserving input order within chunks, and
+    # rasterize polygons once over the whole grid so that results do not
+    # depend on the chunk size
+    ncx = (nx + cnx - 1) // cnx
+    for n, (kind, parts) in enumerate(items):
+        if kind == "polygon":
+            edges, vals, bboxes = parts
+            spans = [scanline.polygon_spans(e, ny, nx) for e in edges]
+            items[n] = ("polygon", (spans, vals, bboxes))
+        elif kind == "point":
+            u, v, vals = parts
+            inside = (u >= 0) & (u < nx) & (v >= 0) & (v < ny)
+            u, v, vals = u[inside], v[inside], vals[inside]
+            key = (v // cny).astype(np.int64) * ncx + (u // cnx).astype(np.int64)
+            order = np.argsort(key, kind="mergesort")
+            items[n] = ("point", (u[order], v[order], vals[order], key[order]))
+
+    band = bandclass((ny, nx), dtype.type, initval=nodata)
+    for i0 in range(0, ny, cny):
+        i1 = min(i0+cny, ny)
+        for j0 in range(0, nx, cnx):
+            j1 = min(j0+cnx, nx)
+            out = np.zeros((i1-i0, j1-j0), dtype=np.float64)
+            touched = np.zeros((i1-i0, j1-j0), dtype=np.uint8)
+
+            for kind, parts in items:
+                if kind == "point":
+                    u, v, vals, key = parts
+                    chunk = (i0 // cny) * ncx + j0 // cnx
+                    a, b = np.searchsorted(key, [chunk, chunk+1])
+                    if b > a:
+                        scanline.burn_points(u[a:b]-j0, v[a:b]-i0, vals[a:b],
+                                             out, touched, mode)
+                    continue
+
+                bboxes = parts[-1]
+                sel = np.flatnonzero((bboxes[:,0] <= j1) & (bboxes[:,2] >= j0) &
+                                     (bboxes[:,1] <= i1) & (bboxes[:,3] >= i0))
+                if len(sel) == 0:
+                    continue
+                if kind == "line":
+                    u, v, starts, ends, vals, _ = parts
+                    scanline.burn_lines(u-j0, v-i0, starts[sel], ends[sel],
+                                        vals[sel], out, touched, mode)
+                else:
+                    spans, vals, _ = parts
+                    for k in sel:
+                        scanline.burn_spans(
+                                *(_window_spans(spans[k], i0, i1, j0, j1) +
+                                  (vals[k], out, touched, mode)))
 
-            if y1 > y0:     # upward - mark grid cells to the right
+            if touched.any():
+                block = out.astype(dtype)
+                block[touched == 0] = nodata
+                band.setblock(i0, j0, block)
 
-                for i in range(i0, i1):
-                    if (0 <= i < ny):
-                        j = int(round((i-i0) * (x1-x0)/(y1-y0) + j0))
-                        if j < nx:
-                            mask[i, max(0, j):] += 1
+    return RegularGrid(like.transform, bands=[band], crs=like.crs,
+                       nodata_value=nodata)
 
-            else:           # downward - unmark grid cells to the right
+def mask_poly(xpoly, ypoly, nx, ny, transform):
+    """ Create a grid mask based on a polygon. Cells with centers inside the
+    polygon are True.
 
-                for i in range(i1, i0):
-                    if (0 <= i < ny):
-                        j = int(round((i-i1) * (x1-x0)/(y1-y0) + j1))
-                        if j < nx:
-                            mask[i, max(0, j):] -= 1
+    Parameters
+    ----------
+    xpoly, ypoly : lists of floats
+        sequences of points representing polygon
+    nx : int
+    ny : int
+        size of grid
+    transform : list[float]
+        affine transformation describing grid layout and origin
+        ``T == [x0, y0, dx, dy, sx, sy]``
 
-        x0 = x1
-        y0 = y1
-        i0 = i1
-        j0 = j1
+    Returns
+    -------
+    ndarray
 
-    return mask.astype(np.bool)
+    See also
+    --------
+    polygon_mask : supports holes, multiple polygons, and windows
+    """
+    ring = np.column_stack([np.asarray(xpoly, dtype=np.float64),
+                            np.asarray(ypoly, dtype=np.float64)])
+    edges = _ring_edges([[ring]], transform)
+    spans = scanline.polygon_spans(edges, ny, nx)
+    return scanline.spans_to_mask(*(spans + (ny, nx)))
 
 def newgrid(bbox, resolution=(1, 1), skew=(0, 0), dtype=np.float64, **kw):
     """ Simplified constructor for RegularGrid """
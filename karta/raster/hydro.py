@@ -0,0 +1,372 @@
+"""
+Hydrological analysis of DEMs
+
+`fill_depressions` raises cells in depressions to the level at which they
+spill, `flow_direction` computes D8 flow directions, and `flow_accumulation`
+counts (or sums weights over) the cells draining through each cell.
+
+Flow directions are stored as 8-bit codes giving the direction of steepest
+descent in map coordinates:
+
+    === === ===
+    32  64  128
+    16   0   1
+     8   4   2
+    === === ===
+
+where 0 marks cells without a lower neighbour and 255 marks NoData.
+
+Depression filling and flow accumulation may be performed in tiles, so that
+only one tile per thread is held in memory at a time. Tiles are processed
+twice. Depressions are filled following Barnes et al. (2014, Computers &
+Geosciences 62:117-127): the first pass floods each tile from its edges and
+records the elevations at which the flooded regions spill into one another,
+from which the filled elevation of every tile edge cell is solved globally;
+the second pass floods each tile again from its edges at their final
+elevations. Flow is accumulated similarly, by linking flow between the edge
+cells of neighbouring tiles.
+"""
+
+import numpy as np
+from .grid import RegularGrid
+from .misc import _check_orthogonal, _chunks, _read_halo, _map_chunks
+from . import hydrofuncs
+
+# (north, east) steps for direction codes 2**k
+_DIRECTIONS = [(0, 1), (-1, 1), (-1, 0), (-1, -1),
+               (0, -1), (1, -1), (1, 0), (1, 1)]
+
+def _offsets(grid):
+    """ Return tables of the row and column offsets of the cell downstream of
+    a cell with each direction code. """
+    t = grid.transform
+    sy = 1 if t[3] > 0 else -1
+    sx = 1 if t[2] > 0 else -1
+    di = np.zeros(256, dtype=np.int8)
+    dj = np.zeros(256, dtype=np.int8)
+    for k, (north, east) in enumerate(_DIRECTIONS):
+        di[1 << k] = north*sy
+        dj[1 << k] = east*sx
+    return di, dj
+
+def _outlets(Zh):
+    """ Return a mask of valid cells within a block read with a one-cell
+    halo that are next to NoData or the edge of the grid. """
+    nan = np.isnan(Zh)
+    ny, nx = Zh.shape[0]-2, Zh.shape[1]-2
+    adjacent = np.zeros((ny, nx), dtype=bool)
+    for i in range(3):
+        for j in range(3):
+            adjacent |= nan[i:i+ny,j:j+nx]
+    return adjacent & ~nan[1:-1,1:-1]
+
+def _rim(shape):
+    """ Return a mask of the cells on the edge of a block. """
+    rim = np.zeros(shape, dtype=bool)
+    rim[0,:] = rim[-1,:] = True
+    rim[:,0] = rim[:,-1] = True
+    return rim
+
+def _check_tilesize(tilesize, size):
+    if tilesize is None:
+        return size
+    if tilesize[0] < 2 or tilesize[1] < 2:
+        raise ValueError("tiles must be at least 2x2 cells")
+    return tilesize
+
+def _min_edges(a, b, w):
+    """ Return unique undirected edges with the least weight of duplicates. """
+    lo = np.minimum(a, b)
+    hi = np.maximum(a, b)
+    order = np.lexsort((w, hi, lo))
+    lo, hi, w = lo[order], hi[order], w[order]
+    first = np.ones(len(lo), dtype=bool)
+    first[1:] = (lo[1:] != lo[:-1]) | (hi[1:] != hi[:-1])
+    return lo[first], hi[first], w[first]
+
+def _flood_tile(Zh):
+    """ First pass of tiled depression filling. Edge cells of the tile are
+    labelled 1..n and interior outlets 0, and the tile is flooded from them.
+    """
+    outlet = _outlets(Zh)
+    Z = Zh[1:-1,1:-1].copy()
+    rim = _rim(Z.shape) & ~np.isnan(Z)
+    ri, rj = np.nonzero(rim)
+    label = np.full(Z.shape, -1, dtype=np.int32)
+    label[outlet & ~rim] = 0
+    label[ri,rj] = np.arange(1, len(ri)+1)
+    z = Z[ri,rj]
+    a, b, w = hydrofuncs.flood_labels(Z, label)
+    a, b, w = _min_edges(a, b, w)
+    return ri, rj, z, outlet[ri,rj], a, b, w
+
+def _edge_levels(grid, band, tiles, nthreads, epsilon=False):
+    """ Return the filled elevations of the edge cells of every tile. If
+    *epsilon* is True, edge cells are raised so that each drains by a
+    strictly decreasing path, across a tile edge or through its tile. """
+    ny, nx = grid.size
+    read = lambda chunk: _read_halo(grid, band, chunk, np.float64)
+
+    # graph nodes are the edge cells of tiles, and node 0 is outside the grid
+    nodes = []
+    edges = []
+    base = 0
+    for chunk, (ri, rj, z, outlet, a, b, w) in \
+            _map_chunks(tiles, read, _flood_tile, nthreads):
+        a = a.astype(np.int64)
+        b = b.astype(np.int64)
+        ids = base + np.arange(1, len(ri)+1)
+        nodes.append(((chunk[0]+ri)*nx + chunk[2]+rj, ids, z,
+                      np.full(len(ri), len(nodes)), outlet))
+        edges.append((np.where(a == 0, 0, base+a), np.where(b == 0, 0, base+b), w))
+        edges.append((np.zeros(outlet.sum(), dtype=np.int64), ids[outlet], z[outlet]))
+        base += len(ri)
+
+    index = np.concatenate([n[0] for n in nodes])
+    ids = np.concatenate([n[1] for n in nodes])
+    z = np.concatenate([n[2] for n in nodes])
+    tile = np.concatenate([n[3] for n in nodes])
+    outlet = np.concatenate([n[4] for n in nodes])
+
+    # edge cells of neighbouring tiles spill into one another at the higher
+    # of their elevations
+    order = np.argsort(index)
+    sindex = index[order]
+    i, j = index // nx, index % nx
+    for di, dj in ((0, 1), (1, -1), (1, 0), (1, 1)):
+        inside = (i+di < ny) & (j+dj >= 0) & (j+dj < nx)
+        target = (i+di)*nx + j+dj
+        pos = np.clip(np.searchsorted(sindex, target), 0, len(sindex)-1)
+        other = order[pos]
+        linked = inside & (sindex[pos] == target) & (tile[other] != tile)
+        edges.append((ids[linked], ids[other[linked]],
+                      np.maximum(z[linked], z[other[linked]])))
+
+    a = np.concatenate([e[0] for e in edges]).astype(np.int64)
+    b = np.concatenate([e[1] for e in edges]).astype(np.int64)
+    w = np.concatenate([e[2] for e in edges])
+    src = np.concatenate([a, b])
+    dst = np.concatenate([b, a])
+    order = np.argsort(src, kind="mergesort")
+    indptr = np.zeros(base+2, dtype=np.int64)
+    indptr[1:] = np.cumsum(np.bincount(src, minlength=base+1))
+    parent = np.empty(base+1, dtype=np.int64)
+    found = np.empty(base+1, dtype=np.int64)
+    level = hydrofuncs.minimax(indptr, dst[order], np.concatenate([w, w])[order],
+                               0, parent, found)
+    level[ids] = np.where(np.isinf(level[ids]), z, np.maximum(level[ids], z))
+
+    if epsilon:
+        # raise edge cells above the cells they drain to. Within a tile, the
+        # increments added by filling are fewer than the number of its cells.
+        ncells = np.array([(c[1]-c[0])*(c[3]-c[2]) for c in tiles])
+        across = np.zeros(base+1, dtype=np.uint8)
+        linked = parent[ids] > 0
+        across[ids[linked]] = tile[parent[ids[linked]]-1] != tile[linked]
+        steps = np.zeros(base+1)
+        steps[ids] = ncells[tile] + 1
+        hydrofuncs.raise_levels(level, parent, found, across,
+                                np.concatenate([[0], outlet]).astype(np.uint8),
+                                steps)
+    level = level[ids]
+    result = {}
+    start = 0
+    for k, chunk in enumerate(tiles):
+        count = np.count_nonzero(tile == k)
+        result[chunk] = level[start:start+count]
+        start += count
+    return result
+
+def fill_depressions(grid, band=0, epsilon=False, tilesize=None, nthreads=None):
+    """ Fill depressions in a DEM, so that every cell drains to the edge of
+    the grid or to NoData.
+
+    Parameters
+    ----------
+    grid : RegularGrid
+    band : int, optional
+        band to process (default 0)
+    epsilon : bool, optional
+        if True, filled cells are raised by small floating point increments
+        so that they drain by strictly decreasing paths, and
+        `flow_direction` assigns every cell a direction. Untiled, increments
+        are the smallest possible; in tiled filling, cells on tile edges may
+        be raised by as many increments as there are cells in a tile.
+        (default False)
+    tilesize : tuple of two ints, optional
+        process the grid in tiles of this size, holding one tile per thread
+        in memory at a time (default process the whole grid at once)
+    nthreads : int, optional
+        number of threads used to process tiles (default number of CPUs)
+
+    Returns
+    -------
+    RegularGrid
+        float64 grid of filled elevations, with NoData as NaN
+    """
+    tiles = _chunks(grid.size, _check_tilesize(tilesize, grid.size))
+    read = lambda chunk: _read_halo(grid, band, chunk, np.float64)
+    if len(tiles) == 1:
+        levels = None
+    else:
+        levels = _edge_levels(grid, band, tiles, nthreads, epsilon)
+
+    def compute(args):
+        chunk, Zh = args
+        seed = _outlets(Zh)
+        Z = Zh[1:-1,1:-1].copy()
+        if levels is not None:
+            rim = _rim(Z.shape) & ~np.isnan(Z)
+            Z[rim] = levels[chunk]
+            seed |= rim
+        hydrofuncs.fill(Z, seed.view(np.uint8), epsilon)
+        return Z
+
+    out = grid._bndcls(grid.size, np.float64, initval=np.nan)
+    for chunk, Z in _map_chunks(tiles, lambda c: (c, read(c)), compute, nthreads):
+        out.setblock(chunk[0], chunk[2], Z)
+    return RegularGrid(grid.transform, bands=[out], crs=grid.crs,
+                       nodata_value=np.nan)
+
+def flow_direction(grid, band=0, chunksize=(256, 256), nthreads=None):
+    """ Compute D8 flow directions, pointing from each cell to its neighbour
+    in the direction of steepest descent.
+
+    Parameters
+    ----------
+    grid : RegularGrid
+        DEM, usually with depressions filled by `fill_depressions`
+    band : int, optional
+        band to process (default 0)
+    chunksize : tuple of two ints, optional
+        size of chunks to process at once (default (256, 256))
+    nthreads : int, optional
+        number of threads to use (default number of CPUs)
+
+    Returns
+    -------
+    RegularGrid
+        uint8 grid of direction codes (see `karta.raster.hydro`), with 255 as
+        NoData
+    """
+    _check_orthogonal(grid, "flow direction")
+    di, dj = _offsets(grid)
+    ndi = di[[1 << k for k in range(8)]]
+    ndj = dj[[1 << k for k in range(8)]]
+    dx, dy = abs(grid.transform[2]), abs(grid.transform[3])
+    dist = np.where(ndi == 0, dx, np.where(ndj == 0, dy, np.hypot(dx, dy)))
+
+    def compute(D):
+        out = np.empty((D.shape[0]-2, D.shape[1]-2), dtype=np.uint8)
+        hydrofuncs.d8(D, ndi, ndj, dist, out)
+        return out
+
+    read = lambda chunk: _read_halo(grid, band, chunk, np.float64)
+    out = grid._bndcls(grid.size, np.uint8, initval=255)
+    for chunk, result in _map_chunks(_chunks(grid.size, chunksize), read,
+                                     compute, nthreads):
+        out.setblock(chunk[0], chunk[2], result)
+    return RegularGrid(grid.transform, bands=[out], crs=grid.crs,
+                       nodata_value=255)
+
+def _read_flow(fdir, weights, chunk):
+    i0, i1, j0, j1 = chunk
+    F = np.ascontiguousarray(fdir.bands[0].getblock(i0, j0, i1-i0, j1-j0),
+                             dtype=np.uint8)
+    if weights is None:
+        W = np.ones(F.shape, dtype=np.float64)
+    else:
+        W = np.array(weights.bands[0].getblock(i0, j0, i1-i0, j1-j0),
+                     dtype=np.float64)
+        W[np.isnan(W) | (W == weights.nodata)] = 0.0
+    return chunk, F, W
+
+def _link_tile(args, di, dj, size):
+    """ First pass of tiled flow accumulation. Returns the flow accumulated
+    within the tile at its edge cells, and where their flow goes next. """
+    chunk, F, W = args
+    ny, nx = size
+    hydrofuncs.accumulate(F, W, di, dj)
+    nxt = hydrofuncs.perimeter_links(F, di, dj)
+    ri, rj = np.nonzero(_rim(F.shape) & (F != 255))
+    index = (chunk[0]+ri)*nx + chunk[2]+rj
+
+    # flow leaving the tile from an edge cell goes into a neighbouring tile
+    code = F[ri,rj]
+    ti = ri + di[code]
+    tj = rj + dj[code]
+    leaves = (ti < 0) | (ti >= F.shape[0]) | (tj < 0) | (tj >= F.shape[1])
+    gi = chunk[0] + ti
+    gj = chunk[2] + tj
+    leaves &= (gi >= 0) & (gi < ny) & (gj >= 0) & (gj < nx)
+    succ = np.where(leaves, gi*nx + gj, -1)
+
+    # otherwise it may reach another edge cell of the same tile
+    local = nxt[ri,rj]
+    within = local != -1
+    succ[within] = (chunk[0] + local[within] // F.shape[1])*nx + \
+                   chunk[2] + local[within] % F.shape[1]
+    return index, succ, leaves, W[ri,rj]
+
+def flow_accumulation(fdir, weights=None, tilesize=None, nthreads=None):
+    """ Compute the number of cells draining through each cell, including
+    itself, or the sum of their weights.
+
+    Parameters
+    ----------
+    fdir : RegularGrid
+        flow directions computed by `flow_direction`
+    weights : RegularGrid, optional
+        weight of each cell. NoData weights are zero. (default 1 for every
+        cell)
+    tilesize : tuple of two ints, optional
+        process the grid in tiles of this size, holding one tile per thread
+        in memory at a time (default process the whole grid at once)
+    nthreads : int, optional
+        number of threads used to process tiles (default number of CPUs)
+
+    Returns
+    -------
+    RegularGrid
+        float64 grid of accumulated flow, with NoData as NaN
+    """
+    if weights is not None and weights.size != fdir.size:
+        raise ValueError("weights must have the same size as flow directions")
+    di, dj = _offsets(fdir)
+    tiles = _chunks(fdir.size, _check_tilesize(tilesize, fdir.size))
+    read = lambda chunk: _read_flow(fdir, weights, chunk)
+
+    inflow = {}
+    if len(tiles) != 1:
+        links = [result for _, result in _map_chunks(tiles, read,
+                 lambda args: _link_tile(args, di, dj, fdir.size), nthreads)]
+        index = np.concatenate([l[0] for l in links])
+        succ = np.concatenate([l[1] for l in links])
+        cross = np.concatenate([l[2] for l in links]).astype(np.uint8)
+        local = np.concatenate([l[3] for l in links])
+
+        order = np.argsort(index)
+        pos = np.clip(np.searchsorted(index[order], succ), 0, len(index)-1)
+        succ = np.where((succ != -1) & (index[order][pos] == succ), order[pos], -1)
+        flow = np.zeros(len(index))
+        hydrofuncs.propagate(succ, cross, local, flow)
+
+        start = 0
+        for chunk, l in zip(tiles, links):
+            inflow[chunk] = flow[start:start+len(l[0])]
+            start += len(l[0])
+
+    def compute(args):
+        chunk, F, W = args
+        if chunk in inflow:
+            ri, rj = np.nonzero(_rim(F.shape) & (F != 255))
+            W[ri,rj] += inflow[chunk]
+        hydrofuncs.accumulate(F, W, di, dj)
+        W[F == 255] = np.nan
+        return W
+
+    out = fdir._bndcls(fdir.size, np.float64, initval=np.nan)
+    for chunk, result in _map_chunks(tiles, read, compute, nthreads):
+        out.setblock(chunk[0], chunk[2], result)
+    return RegularGrid(fdir.transform, bands=[out], crs=fdir.crs,
+                       nodata_value=np.nan)
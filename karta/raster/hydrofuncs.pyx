@@ -0,0 +1,588 @@
+""" Kernels for hydrological analysis of DEMs
+
+Depressions are filled by the Priority-Flood algorithm of Barnes et al.
+(2014), which grows a flooded region inward from outlet cells in order of
+elevation, using a binary heap of open cells and a FIFO queue of cells being
+raised to the level of a depression. Flow is accumulated by following D8 flow
+directions downstream from cells without inflow, so that no queue is needed.
+
+NoData is represented by NaN in elevations and by 255 in flow directions.
+Kernels release the GIL.
+"""
+
+import numpy as np
+cimport numpy as np
+cimport cython
+from libc.stdlib cimport realloc, free
+from libc.math cimport isnan, nextafter, INFINITY
+
+ctypedef np.int64_t int64
+ctypedef np.int32_t int32
+ctypedef np.uint8_t uint8
+ctypedef np.int8_t int8
+
+# neighbour offsets, in no particular order
+cdef int NI[8]
+cdef int NJ[8]
+NI[:] = [0, 1, 1, 1, 0, -1, -1, -1]
+NJ[:] = [1, 1, 0, -1, -1, -1, 0, 1]
+
+ctypedef struct Entry:
+    double z
+    int64 idx
+
+ctypedef struct Heap:
+    Entry *data
+    Py_ssize_t size
+    Py_ssize_t capacity
+
+ctypedef struct Queue:
+    int64 *data
+    Py_ssize_t head
+    Py_ssize_t tail
+    Py_ssize_t capacity
+
+cdef inline bint _before(Entry *a, Entry *b) nogil:
+    return a.z < b.z
+
+cdef int _heap_push(Heap *h, double z, int64 idx) nogil:
+    cdef Py_ssize_t k, parent
+    cdef Entry e
+    cdef Entry *data
+    if h.size == h.capacity:
+        h.capacity = 2*h.capacity if h.capacity != 0 else 1024
+        data = <Entry*> realloc(h.data, h.capacity*sizeof(Entry))
+        if data == NULL:
+            return -1
+        h.data = data
+    e.z = z
+    e.idx = idx
+    k = h.size
+    h.size += 1
+    while k > 0:
+        parent = (k-1) // 2
+        if not _before(&e, &h.data[parent]):
+            break
+        h.data[k] = h.data[parent]
+        k = parent
+    h.data[k] = e
+    return 0
+
+cdef Entry _heap_pop(Heap *h) nogil:
+    cdef Entry top = h.data[0]
+    cdef Entry last
+    cdef Py_ssize_t k = 0, child
+    h.size -= 1
+    if h.size == 0:
+        return top
+    last = h.data[h.size]
+    while True:
+        child = 2*k + 1
+        if child >= h.size:
+            break
+        if child+1 < h.size and _before(&h.data[child+1], &h.data[child]):
+            child += 1
+        if not _before(&h.data[child], &last):
+            break
+        h.data[k] = h.data[child]
+        k = child
+    h.data[k] = last
+    return top
+
+cdef int _queue_push(Queue *q, int64 idx) nogil:
+    cdef int64 *data
+    cdef Py_ssize_t k
+    if q.tail == q.capacity:
+        if q.head != 0:
+            # reclaim space used by removed items
+            for k in range(q.tail - q.head):
+                q.data[k] = q.data[q.head+k]
+            q.tail -= q.head
+            q.head = 0
+        if q.tail == q.capacity:
+            q.capacity = 2*q.capacity if q.capacity != 0 else 1024
+            data = <int64*> realloc(q.data, q.capacity*sizeof(int64))
+            if data == NULL:
+                return -1
+            q.data = data
+    q.data[q.tail] = idx
+    q.tail += 1
+    return 0
+
+cdef inline int64 _queue_pop(Queue *q) nogil:
+    cdef int64 idx = q.data[q.head]
+    q.head += 1
+    if q.head == q.tail:
+        q.head = 0
+        q.tail = 0
+    return idx
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+def fill(double[:,::1] Z not None, uint8[:,::1] seed not None, bint epsilon=False):
+    """ Fill depressions in *Z* in place, flooding from the cells where *seed*
+    is nonzero. NaN cells are NoData, and are neither flooded nor flooded
+    through. If *epsilon* is True, filled cells are raised by the smallest
+    increment of floating point values along the flooding path, so that
+    every cell drains to a seed by a strictly decreasing path.
+    """
+    cdef Py_ssize_t ny = Z.shape[0], nx = Z.shape[1]
+    cdef Py_ssize_t i, j, k
+    cdef int64 c, n
+    cdef int64 off[8]
+    cdef double zc, zfill
+    cdef double *z
+    cdef uint8 *closed
+    cdef bint interior
+    cdef np.ndarray closed_array = np.zeros((ny, nx), dtype=np.uint8)
+    cdef Heap heap
+    cdef Queue pit
+    cdef int err = 0
+    if ny == 0 or nx == 0:
+        return
+    z = &Z[0,0]
+    closed = <uint8*> closed_array.data
+    for k in range(8):
+        off[k] = NI[k]*nx + NJ[k]
+    heap.data = NULL; heap.size = 0; heap.capacity = 0
+    pit.data = NULL; pit.head = 0; pit.tail = 0; pit.capacity = 0
+
+    try:
+        with nogil:
+            for c in range(ny*nx):
+                if seed[c // nx, c % nx] != 0 and not isnan(z[c]):
+                    closed[c] = 1
+                    err |= _heap_push(&heap, z[c], c)
+
+            while err == 0 and (heap.size != 0 or pit.head != pit.tail):
+                if pit.head != pit.tail:
+                    c = pit.data[pit.head]
+                    if epsilon and heap.size != 0 and heap.data[0].z == z[c]:
+                        c = _heap_pop(&heap).idx
+                    else:
+                        c = _queue_pop(&pit)
+                else:
+                    c = _heap_pop(&heap).idx
+                i = c // nx
+                j = c - i*nx
+                interior = 0 < i < ny-1 and 0 < j < nx-1
+                zc = z[c]
+                zfill = nextafter(zc, INFINITY) if epsilon else zc
+                for k in range(8):
+                    if not interior and (i+NI[k] < 0 or i+NI[k] >= ny or
+                                         j+NJ[k] < 0 or j+NJ[k] >= nx):
+                        continue
+                    n = c + off[k]
+                    if closed[n] != 0:
+                        continue
+                    closed[n] = 1
+                    if isnan(z[n]):
+                        continue
+                    if z[n] <= zfill:
+                        z[n] = zfill
+                        err |= _queue_push(&pit, n)
+                    else:
+                        err |= _heap_push(&heap, z[n], n)
+    finally:
+        free(heap.data)
+        free(pit.data)
+    if err != 0:
+        raise MemoryError()
+    return
+
+cdef class _Edges:
+    """ Growable list of weighted edges between labels """
+    cdef int32 *a
+    cdef int32 *b
+    cdef double *w
+    cdef Py_ssize_t size
+    cdef Py_ssize_t capacity
+
+    def __cinit__(self):
+        self.a = NULL
+        self.b = NULL
+        self.w = NULL
+        self.size = 0
+        self.capacity = 0
+
+    def __dealloc__(self):
+        free(self.a)
+        free(self.b)
+        free(self.w)
+
+    cdef int append(self, int32 a, int32 b, double w) nogil:
+        cdef void *p
+        if self.size == self.capacity:
+            self.capacity = 2*self.capacity if self.capacity != 0 else 1024
+            p = realloc(self.a, self.capacity*sizeof(int32))
+            if p == NULL:
+                return -1
+            self.a = <int32*> p
+            p = realloc(self.b, self.capacity*sizeof(int32))
+            if p == NULL:
+                return -1
+            self.b = <int32*> p
+            p = realloc(self.w, self.capacity*sizeof(double))
+            if p == NULL:
+                return -1
+            self.w = <double*> p
+        self.a[self.size] = a
+        self.b[self.size] = b
+        self.w[self.size] = w
+        self.size += 1
+        return 0
+
+    def arrays(self):
+        cdef Py_ssize_t k
+        a = np.empty(self.size, dtype=np.int32)
+        b = np.empty(self.size, dtype=np.int32)
+        w = np.empty(self.size, dtype=np.float64)
+        cdef int32[:] av = a, bv = b
+        cdef double[:] wv = w
+        for k in range(self.size):
+            av[k] = self.a[k]
+            bv[k] = self.b[k]
+            wv[k] = self.w[k]
+        return a, b, w
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+def flood_labels(double[:,::1] Z not None, int32[:,::1] label not None):
+    """ Fill depressions in *Z* in place, flooding from the cells where
+    *label* is nonnegative and propagating labels to flooded cells. Where
+    regions with different labels meet, the lower of the elevations at which
+    they meet is their spill elevation.
+
+    Returns
+    -------
+    (a, b, w) : arrays of label pairs and the spill elevations between them,
+                which may contain duplicate pairs
+    """
+    cdef Py_ssize_t ny = Z.shape[0], nx = Z.shape[1]
+    cdef Py_ssize_t i, j, k
+    cdef int64 c, n
+    cdef int64 off[8]
+    cdef double zc
+    cdef double *z
+    cdef int32 *lbl
+    cdef int32 lc
+    cdef bint interior
+    cdef Heap heap
+    cdef Queue pit
+    cdef _Edges edges = _Edges()
+    cdef int err = 0
+    if ny == 0 or nx == 0:
+        return edges.arrays()
+    z = &Z[0,0]
+    lbl = &label[0,0]
+    for k in range(8):
+        off[k] = NI[k]*nx + NJ[k]
+    heap.data = NULL; heap.size = 0; heap.capacity = 0
+    pit.data = NULL; pit.head = 0; pit.tail = 0; pit.capacity = 0
+
+    try:
+        with nogil:
+            for c in range(ny*nx):
+                if lbl[c] >= 0 and not isnan(z[c]):
+                    err |= _heap_push(&heap, z[c], c)
+
+            while err == 0 and (heap.size != 0 or pit.head != pit.tail):
+                if pit.head != pit.tail:
+                    c = _queue_pop(&pit)
+                else:
+                    c = _heap_pop(&heap).idx
+                i = c // nx
+                j = c - i*nx
+                interior = 0 < i < ny-1 and 0 < j < nx-1
+                zc = z[c]
+                lc = lbl[c]
+                for k in range(8):
+                    if not interior and (i+NI[k] < 0 or i+NI[k] >= ny or
+                                         j+NJ[k] < 0 or j+NJ[k] >= nx):
+                        continue
+                    n = c + off[k]
+                    if isnan(z[n]):
+                        continue
+                    if lbl[n] >= 0:
+                        if lbl[n] != lc:
+                            err |= edges.append(lc, lbl[n], max(zc, z[n]))
+                        continue
+                    lbl[n] = lc
+                    if z[n] <= zc:
+                        z[n] = zc
+                        err |= _queue_push(&pit, n)
+                    else:
+                        err |= _heap_push(&heap, z[n], n)
+    finally:
+        free(heap.data)
+        free(pit.data)
+    if err != 0:
+        raise MemoryError()
+    return edges.arrays()
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def minimax(int64[:] indptr not None, int64[:] indices not None,
+            double[:] weights not None, Py_ssize_t source,
+            int64[:] parent=None, int64[:] order=None):
+    """ Return for every node of a graph the least, over paths from *source*,
+    of the greatest edge weight along the path. The graph is given in
+    compressed sparse row form. The source is -inf, and nodes that cannot be
+    reached are inf.
+
+    If *parent* and *order* are given, they receive the node before each
+    node on its least path (-1 for the source and unreached nodes), and the
+    reached nodes in the order their levels are found, followed by -1.
+    """
+    cdef Py_ssize_t nnodes = indptr.shape[0] - 1
+    cdef Py_ssize_t k, nfound = 0
+    cdef int64 u, v
+    cdef double d
+    cdef Entry e
+    cdef double[:] level = np.full(nnodes, INFINITY, dtype=np.float64)
+    cdef uint8[:] done = np.zeros(nnodes, dtype=np.uint8)
+    cdef bint tree = parent is not None and order is not None
+    cdef Heap heap
+    cdef int err = 0
+    heap.data = NULL; heap.size = 0; heap.capacity = 0
+    if tree:
+        parent[:] = -1
+        order[:] = -1
+
+    try:
+        with nogil:
+            level[source] = -INFINITY
+            err |= _heap_push(&heap, -INFINITY, source)
+            while err == 0 and heap.size != 0:
+                e = _heap_pop(&heap)
+                u = e.idx
+                if e.z > level[u] or done[u] != 0:
+                    continue
+                done[u] = 1
+                if tree:
+                    order[nfound] = u
+                    nfound += 1
+                for k in range(indptr[u], indptr[u+1]):
+                    v = indices[k]
+                    d = max(e.z, weights[k])
+                    if d < level[v]:
+                        level[v] = d
+                        if tree:
+                            parent[v] = u
+                        err |= _heap_push(&heap, d, v)
+    finally:
+        free(heap.data)
+    if err != 0:
+        raise MemoryError()
+    return np.asarray(level)
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def raise_levels(double[:] level not None, int64[:] parent not None,
+                 int64[:] order not None, uint8[:] across not None,
+                 uint8[:] outlet not None, double[:] steps not None):
+    """ Raise the *level* of tile edge cells in place, so that each cell
+    drains to its *parent* by a strictly decreasing path. Cells are visited
+    in *order*, so that parents are raised before their children.
+
+    A cell draining *across* a tile edge is raised just above its parent,
+    which is its neighbour. A cell draining through the interior of its tile
+    is raised *steps* increments of floating point values above its parent,
+    more than the increments added along any path within the tile, so that
+    its neighbour on the path is lower. Outlets are not raised.
+    """
+    cdef Py_ssize_t k
+    cdef int64 u, p
+    cdef double b
+    with nogil:
+        for k in range(order.shape[0]):
+            u = order[k]
+            if u == -1:
+                break
+            p = parent[u]
+            if p == -1 or outlet[u] != 0:
+                continue
+            if across[u] != 0:
+                if level[u] <= level[p]:
+                    level[u] = nextafter(level[p], INFINITY)
+            else:
+                b = max(level[u], level[p])
+                level[u] = b + steps[u]*(nextafter(b, INFINITY) - b)
+    return
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+def d8(double[:,:] D not None, int8[:] di not None, int8[:] dj not None,
+       double[:] dist not None, uint8[:,:] out not None):
+    """ Compute D8 flow directions of a block *D* with a one-cell halo,
+    storing them in *out*. The k-th neighbour is at offset (di[k], dj[k]) and
+    distance dist[k], and has direction code 2**k. Cells without a lower
+    neighbour have direction 0, and NaN cells have direction 255.
+    """
+    cdef Py_ssize_t i, j, k
+    cdef double zc, zn, s, best
+    cdef uint8 code
+    with nogil:
+        for i in range(out.shape[0]):
+            for j in range(out.shape[1]):
+                zc = D[i+1,j+1]
+                if isnan(zc):
+                    out[i,j] = 255
+                    continue
+                best = 0.0
+                code = 0
+                for k in range(8):
+                    zn = D[i+1+di[k],j+1+dj[k]]
+                    if isnan(zn):
+                        continue
+                    s = (zc - zn) / dist[k]
+                    if s > best:
+                        best = s
+                        code = <uint8> (1 << k)
+                out[i,j] = code
+    return
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef inline int64 _downstream(uint8[:,:] fdir, int8[:] di, int8[:] dj,
+                              Py_ssize_t i, Py_ssize_t j) nogil:
+    # index of the cell downstream of (i, j) within the block, or -1
+    cdef uint8 code = fdir[i,j]
+    cdef Py_ssize_t ni = i + di[code], nj = j + dj[code]
+    if (ni == i and nj == j) or ni < 0 or ni >= fdir.shape[0] or \
+            nj < 0 or nj >= fdir.shape[1] or fdir[ni,nj] == 255:
+        return -1
+    return ni*fdir.shape[1] + nj
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def accumulate(uint8[:,:] fdir not None, double[:,:] acc not None,
+               int8[:] di not None, int8[:] dj not None):
+    """ Accumulate flow in place in *acc*, which initially holds the weight
+    of each cell. The cell downstream of a cell with direction code c is at
+    offset (di[c], dj[c]). Flow leaving the block or entering a NoData cell
+    is discarded.
+    """
+    cdef Py_ssize_t ny = fdir.shape[0], nx = fdir.shape[1]
+    cdef Py_ssize_t i, j
+    cdef int64 cur, n
+    cdef uint8[:,:] indegree = np.zeros((ny, nx), dtype=np.uint8)
+    with nogil:
+        for i in range(ny):
+            for j in range(nx):
+                if fdir[i,j] != 255:
+                    n = _downstream(fdir, di, dj, i, j)
+                    if n != -1:
+                        indegree[n // nx, n % nx] += 1
+
+        # follow flow downstream from each cell without inflow, continuing
+        # into cells whose inflows are all accumulated; processed cells are
+        # marked with 255
+        for i in range(ny):
+            for j in range(nx):
+                if indegree[i,j] != 0 or fdir[i,j] == 255:
+                    continue
+                cur = i*nx + j
+                while True:
+                    indegree[cur // nx, cur % nx] = 255
+                    n = _downstream(fdir, di, dj, cur // nx, cur % nx)
+                    if n == -1:
+                        break
+                    acc[n // nx, n % nx] += acc[cur // nx, cur % nx]
+                    indegree[n // nx, n % nx] -= 1
+                    if indegree[n // nx, n % nx] != 0:
+                        break
+                    cur = n
+    return
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def perimeter_links(uint8[:,:] fdir not None, int8[:] di not None,
+                    int8[:] dj not None):
+    """ Return for each cell on the edge of the block the index of the first
+    edge cell reached by following flow downstream within the block, or -1 if
+    flow ends or leaves the block first. Other cells are -1.
+    """
+    cdef Py_ssize_t ny = fdir.shape[0], nx = fdir.shape[1]
+    cdef Py_ssize_t i, j, k, m
+    cdef int64 c, n, result
+    cdef int64[:,:] memo = np.full((ny, nx), -2, dtype=np.int64)
+    cdef int64[:,:] out = np.full((ny, nx), -1, dtype=np.int64)
+    cdef Queue path
+    cdef int err = 0
+    path.data = NULL; path.head = 0; path.tail = 0; path.capacity = 0
+
+    try:
+        with nogil:
+            # memo holds, for interior cells, the first edge cell downstream
+            for i in range(ny):
+                for j in range(nx):
+                    if (i != 0 and i != ny-1 and j != 0 and j != nx-1) or \
+                            fdir[i,j] == 255:
+                        continue
+                    n = _downstream(fdir, di, dj, i, j)
+                    path.tail = 0
+                    while n != -1:
+                        k = n // nx
+                        m = n % nx
+                        if k == 0 or k == ny-1 or m == 0 or m == nx-1:
+                            break
+                        if memo[k,m] != -2:
+                            n = memo[k,m]
+                            break
+                        err |= _queue_push(&path, n)
+                        if err != 0:
+                            break
+                        n = _downstream(fdir, di, dj, k, m)
+                    result = n
+                    for k in range(path.tail):
+                        c = path.data[k]
+                        memo[c // nx, c % nx] = result
+                    out[i,j] = result
+    finally:
+        free(path.data)
+    if err != 0:
+        raise MemoryError()
+    return np.asarray(out)
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def propagate(int64[:] succ not None, uint8[:] cross not None,
+              double[:] local not None, double[:] inflow not None):
+    """ Propagate flow through a forest of perimeter cells. Each node *u*
+    flows to node succ[u] (or nowhere if -1), within a tile if cross[u] is 0
+    and into a neighbouring tile otherwise. local[u] is the flow accumulated
+    at *u* within its tile. On return, inflow[u] is the flow entering *u*
+    directly from other tiles.
+    """
+    cdef Py_ssize_t n = succ.shape[0]
+    cdef Py_ssize_t u
+    cdef int64 cur, s
+    cdef int64[:] indegree = np.zeros(n, dtype=np.int64)
+    cdef double[:] external = np.zeros(n, dtype=np.float64)
+    with nogil:
+        for u in range(n):
+            if succ[u] != -1:
+                indegree[succ[u]] += 1
+        for u in range(n):
+            if indegree[u] != 0:
+                continue
+            cur = u
+            while True:
+                indegree[cur] = -1
+                s = succ[cur]
+                if s == -1:
+                    break
+                if cross[cur]:
+                    inflow[s] += local[cur] + external[cur]
+                    external[s] += local[cur] + external[cur]
+                else:
+                    external[s] += external[cur]
+                indegree[s] -= 1
+                if indegree[s] != 0:
+                    break
+                cur = s
+    return
@@ -0,0 +1,155 @@
+"""
+Filling NoData holes in grids
+
+`fill_nodata` fills holes by inverse distance weighting or by solving
+Laplace's equation. Only chunks containing NoData are processed, each in a
+window extending *max_distance* beyond the chunk, so that the cost grows
+with the area of holes rather than of the grid.
+
+Inverse distance weighting averages the nearest valid cells in each of the
+8 directions from a hole cell. The Laplace method finds the smoothest
+surface through the hole bounded by the surrounding values, solved on a
+pyramid of coarsened grids: each level is initialized from the solution at
+the coarser level and relaxed by successive over-relaxation, so that few
+iterations are needed per level.
+"""
+
+import math
+import numpy as np
+from .grid import RegularGrid
+from .misc import _check_orthogonal, _chunks, _read_halo, _map_chunks
+from . import edt
+from . import inpaintfuncs
+
+# relaxation parameters of the Laplace solver
+_OMEGA = 1.9
+_ITERATIONS = 100
+_COARSEST_ITERATIONS = 10000
+
+def _coarsen(Z, free):
+    """ Average known values over 2x2 blocks. Blocks without known values
+    that contain free cells are free at the coarser level. """
+    ny, nx = Z.shape
+    known = ~np.isnan(Z) & ~free
+    pad = ((0, ny % 2), (0, nx % 2))
+    K = np.pad(known, pad, mode="constant")
+    V = np.pad(np.where(known, Z, 0.0), pad, mode="constant")
+    F = np.pad(free, pad, mode="constant")
+    shape = (K.shape[0]//2, 2, K.shape[1]//2, 2)
+    count = K.reshape(shape).sum(axis=(1, 3))
+    total = V.reshape(shape).sum(axis=(1, 3))
+    Zc = np.full(count.shape, np.nan)
+    Zc[count != 0] = total[count != 0] / count[count != 0]
+    freec = F.reshape(shape).any(axis=(1, 3)) & (count == 0)
+    return Zc, freec
+
+def _laplace(Z, free, wx, wy, tol):
+    """ Solve Laplace's equation in place for the cells of *Z* where *free*
+    is True, with NaN cells as boundaries without flux. """
+    if not free.any():
+        return
+    ny, nx = Z.shape
+    if min(ny, nx) <= 4:
+        known = ~np.isnan(Z) & ~free
+        Z[free] = Z[known].mean() if known.any() else 0.0
+        iterations = _COARSEST_ITERATIONS
+    else:
+        Zc, freec = _coarsen(Z, free)
+        _laplace(Zc, freec, wx, wy, tol)
+        Z[free] = np.repeat(np.repeat(Zc, 2, axis=0), 2, axis=1)[:ny,:nx][free]
+        iterations = _ITERATIONS
+    inpaintfuncs.relax(Z, free.view(np.uint8), wx, wy, _OMEGA, iterations, tol)
+    return
+
+def fill_nodata(grid, method="idw", max_distance=None, power=2.0,
+                chunksize=None, nthreads=None):
+    """ Fill NoData holes in every band of a grid.
+
+    Parameters
+    ----------
+    grid : RegularGrid
+    method : str, optional
+        "idw" (default) for inverse distance weighting of the nearest valid
+        cells in 8 directions, or "laplace" for a smooth surface bounded by
+        the values around holes
+    max_distance : float, optional
+        cells farther than this from valid cells, in grid units, remain
+        NoData (default 100 cells)
+    power : float, optional
+        power of inverse distance weights (default 2)
+    chunksize : tuple of two ints, optional
+        size of chunks to process at once (default the chunk size of the
+        first band, or (256, 256))
+    nthreads : int, optional
+        number of threads to use (default number of CPUs)
+
+    Returns
+    -------
+    RegularGrid
+        copy of *grid* with holes filled. Fill values of integer bands are
+        rounded.
+
+    Notes
+    -----
+    Holes are solved separately in each chunk's window, so that Laplace
+    solutions for holes much wider than *max_distance* may differ slightly
+    across chunk edges.
+    """
+    _check_orthogonal(grid, "fill_nodata")
+    if method not in ("idw", "laplace"):
+        raise ValueError("method must be 'idw' or 'laplace'")
+    dx, dy = abs(grid.transform[2]), abs(grid.transform[3])
+    if max_distance is None:
+        max_distance = 100*max(dx, dy)
+    if max_distance <= 0:
+        raise ValueError("max_distance must be positive")
+    if chunksize is None:
+        chunksize = getattr(grid.bands[0], "_chunksize", (256, 256))
+    halo = (int(math.ceil(max_distance/dy)), int(math.ceil(max_distance/dx)))
+    ny, nx = grid.size
+    nodata = grid.nodata
+
+    def has_holes(v):
+        if np.isnan(nodata):
+            return v.dtype.kind in "fc" and np.isnan(v).any()
+        return (v == nodata).any()
+
+    def fill(args):
+        chunk, Z = args
+        i0, i1, j0, j1 = chunk
+        if method == "idw":
+            out = np.empty_like(Z)
+            inpaintfuncs.idw(Z, dx, dy, max_distance, power, out)
+        else:
+            # holes within max_distance of valid cells and inside the grid
+            g = np.empty(Z.shape, dtype=np.float64)
+            nearest = np.empty(Z.shape, dtype=np.int32)
+            dist = np.empty(Z.shape, dtype=np.float64)
+            index = np.empty(Z.shape, dtype=np.int64)
+            valid = ~np.isnan(Z)
+            edt.columns(valid.view(np.uint8), dy, g, nearest, 0, Z.shape[1])
+            edt.rows(g, nearest, dx, 0, Z.shape[0], dist, index)
+            inside = np.zeros(Z.shape, dtype=bool)
+            inside[max(halo[0]-i0, 0):Z.shape[0]-max(i1+halo[0]-ny, 0),
+                   max(halo[1]-j0, 0):Z.shape[1]-max(j1+halo[1]-nx, 0)] = True
+            free = ~valid & inside & (dist <= max_distance)
+            tol = 1e-6*(np.nanmax(Z) - np.nanmin(Z)) if valid.any() else 0.0
+            _laplace(Z, free, 1.0/dx**2, 1.0/dy**2, tol)
+            out = Z
+        return out[halo[0]:halo[0]+i1-i0, halo[1]:halo[1]+j1-j0]
+
+    out = grid.copy()
+    chunks = _chunks(grid.size, chunksize)
+    for k, band in enumerate(out.bands):
+        read = lambda c: band.getblock(c[0], c[2], c[1]-c[0], c[3]-c[2])
+        holes = [chunk for chunk, h in _map_chunks(chunks, read, has_holes,
+                                                   nthreads) if h]
+        read = lambda c: (c, _read_halo(grid, k, c, np.float64, halo=halo))
+        for chunk, Z in _map_chunks(holes, read, fill, nthreads):
+            filled = ~np.isnan(Z)
+            old = band.getblock(chunk[0], chunk[2], Z.shape[0], Z.shape[1])
+            if np.dtype(band.dtype).kind in "iu":
+                Z = np.round(Z)
+            new = np.where(filled, Z, old).astype(band.dtype)
+            band.setblock(chunk[0], chunk[2], new)
+    return out
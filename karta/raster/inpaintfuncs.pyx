@@ -0,0 +1,129 @@
+""" Kernels for filling NoData holes
+
+NaN represents NoData. Kernels release the GIL.
+"""
+
+import numpy as np
+cimport numpy as np
+cimport cython
+from libc.math cimport sqrt, pow, fabs, isnan, NAN
+
+ctypedef np.int32_t int32
+ctypedef np.uint8_t uint8
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def idw(double[:,::1] Z not None, double dx, double dy, double max_distance,
+        double power, double[:,::1] out not None):
+    """ Store in *out* the inverse distance weighted mean of the nearest
+    valid cells of *Z* in each of the 8 directions from every NaN cell,
+    searching up to *max_distance*, with columns *dx* and rows *dy* apart.
+    Cells with no valid cells in range are NaN. Valid cells are copied.
+
+    The nearest valid cell in each direction is found for every cell in one
+    sweep per direction, so that the cost is independent of *max_distance*.
+    """
+    cdef Py_ssize_t ny = Z.shape[0], nx = Z.shape[1]
+    cdef Py_ssize_t i, j, k, ii, jj, a0, b0
+    cdef int si, sj
+    cdef int32 s
+    cdef double length, d, w
+    cdef int SI[8]
+    cdef int SJ[8]
+    SI[:] = [0, 1, 1, 1, 0, -1, -1, -1]
+    SJ[:] = [1, 1, 0, -1, -1, -1, 0, 1]
+    steps_array = np.empty((ny, nx), dtype=np.int32)
+    num_array = np.zeros((ny, nx), dtype=np.float64)
+    den_array = np.zeros((ny, nx), dtype=np.float64)
+    cdef int32[:,::1] steps = steps_array
+    cdef double[:,::1] num = num_array
+    cdef double[:,::1] den = den_array
+
+    with nogil:
+        for k in range(8):
+            si = SI[k]
+            sj = SJ[k]
+            length = sqrt((si*dy)**2 + (sj*dx)**2)
+            # sweep so that the cell (i+si, j+sj) is visited before (i, j)
+            for a0 in range(ny):
+                i = ny-1-a0 if si > 0 else a0
+                for b0 in range(nx):
+                    j = nx-1-b0 if sj > 0 else b0
+                    if not isnan(Z[i,j]):
+                        steps[i,j] = 0
+                        continue
+                    ii = i + si
+                    jj = j + sj
+                    if ii < 0 or ii >= ny or jj < 0 or jj >= nx or \
+                            steps[ii,jj] == -1:
+                        steps[i,j] = -1
+                        continue
+                    s = steps[ii,jj] + 1
+                    steps[i,j] = s
+                    d = s*length
+                    if d <= max_distance:
+                        w = pow(d, -power)
+                        num[i,j] += w*Z[i+s*si,j+s*sj]
+                        den[i,j] += w
+
+        for i in range(ny):
+            for j in range(nx):
+                if not isnan(Z[i,j]):
+                    out[i,j] = Z[i,j]
+                elif den[i,j] != 0:
+                    out[i,j] = num[i,j] / den[i,j]
+                else:
+                    out[i,j] = NAN
+    return
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+def relax(double[:,::1] Z not None, uint8[:,::1] free not None, double wx,
+          double wy, double omega, int iterations, double tol):
+    """ Relax the cells of *Z* where *free* is nonzero toward a solution of
+    Laplace's equation by red-black successive over-relaxation, with
+    weights *wx* and *wy* for neighbours along rows and columns. NaN cells
+    and the edges of *Z* are boundaries without flux.
+
+    Returns the number of iterations performed, stopping early when no cell
+    changes by more than *tol*.
+    """
+    cdef Py_ssize_t ny = Z.shape[0], nx = Z.shape[1]
+    cdef Py_ssize_t i, j
+    cdef int it, color
+    cdef double num, den, v, change, maxchange
+    it = 0
+    with nogil:
+        while it < iterations:
+            it += 1
+            maxchange = 0.0
+            for color in range(2):
+                for i in range(ny):
+                    for j in range((i+color) % 2, nx, 2):
+                        if free[i,j] == 0:
+                            continue
+                        num = 0.0
+                        den = 0.0
+                        if j > 0 and not isnan(Z[i,j-1]):
+                            num += wx*Z[i,j-1]
+                            den += wx
+                        if j < nx-1 and not isnan(Z[i,j+1]):
+                            num += wx*Z[i,j+1]
+                            den += wx
+                        if i > 0 and not isnan(Z[i-1,j]):
+                            num += wy*Z[i-1,j]
+                            den += wy
+                        if i < ny-1 and not isnan(Z[i+1,j]):
+                            num += wy*Z[i+1,j]
+                            den += wy
+                        if den == 0:
+                            continue
+                        v = Z[i,j]
+                        change = omega*(num/den - v)
+                        Z[i,j] = v + change
+                        if fabs(change) > maxchange:
+                            maxchange = fabs(change)
+            if maxchange <= tol:
+                break
+    return it
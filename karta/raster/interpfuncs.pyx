@@ -0,0 +1,276 @@
+""" Kernels for interpolating scattered points
+
+Points are triangulated by incremental insertion with Lawson edge flips
+(Lawson 1977; Guibas and Stolfi 1985), inserting points in an order that
+follows rows of buckets alternately left and right, so that the walk that
+locates each new point is short. The triangulation starts from a triangle
+much larger than the points, whose vertices and triangles are removed at
+the end.
+
+Triangles are then scanned over grid cells in fractional index space, where
+cell (i, j) is centered at row i and column j, interpolating linearly within
+each triangle. Kernels release the GIL.
+"""
+
+import numpy as np
+cimport numpy as np
+cimport cython
+from libc.math cimport ceil, floor, fmax, fmin
+
+ctypedef np.int32_t int32
+
+# size of the enclosing triangle relative to the extent of points
+cdef double SUPER_SCALE = 1e4
+
+cdef inline double _orient(double *x, double *y, int a, int b, int c) nogil:
+    return (x[b]-x[a])*(y[c]-y[a]) - (y[b]-y[a])*(x[c]-x[a])
+
+cdef inline double _incircle(double *x, double *y, int a, int b, int c,
+                             int d) nogil:
+    cdef double adx = x[a]-x[d], ady = y[a]-y[d]
+    cdef double bdx = x[b]-x[d], bdy = y[b]-y[d]
+    cdef double cdx = x[c]-x[d], cdy = y[c]-y[d]
+    return ((adx*adx + ady*ady) * (bdx*cdy - cdx*bdy) -
+            (bdx*bdx + bdy*bdy) * (adx*cdy - cdx*ady) +
+            (cdx*cdx + cdy*cdy) * (adx*bdy - bdx*ady))
+
+cdef inline void _relink(int32 *N, int t, int old, int new) nogil:
+    """ Point the neighbour reference of triangle t from old to new. """
+    cdef int k
+    if t == -1:
+        return
+    for k in range(3):
+        if N[3*t+k] == old:
+            N[3*t+k] = new
+            return
+
+cdef inline void _set(int32 *V, int32 *N, int t, int a, int b, int c,
+                      int na, int nb, int nc) nogil:
+    V[3*t] = a; V[3*t+1] = b; V[3*t+2] = c
+    N[3*t] = na; N[3*t+1] = nb; N[3*t+2] = nc
+
+cdef int _legalize(double *x, double *y, int32 *V, int32 *N, int32 *stack,
+                   int nstack) nogil:
+    """ Flip illegal edges opposite the inserted point, given as (triangle,
+    index of the point in the triangle) pairs on the stack. """
+    cdef int t, i, u, j, p, e1, e2, q, A, B, C, D, k
+    while nstack != 0:
+        nstack -= 1
+        t = stack[2*nstack]
+        i = stack[2*nstack+1]
+        u = N[3*t+i]
+        if u == -1:
+            continue
+        for j in range(3):
+            if N[3*u+j] == t:
+                break
+        p = V[3*t+i]
+        e1 = V[3*t+(i+1)%3]
+        e2 = V[3*t+(i+2)%3]
+        q = V[3*u+j]
+        if _incircle(x, y, p, e1, e2, q) <= 0:
+            continue
+        A = N[3*u+(j+1)%3]
+        B = N[3*u+(j+2)%3]
+        C = N[3*t+(i+2)%3]
+        D = N[3*t+(i+1)%3]
+        _set(V, N, t, p, e1, q, A, u, C)
+        _set(V, N, u, p, q, e2, B, D, t)
+        _relink(N, A, u, t)
+        _relink(N, D, t, u)
+        stack[2*nstack] = t
+        stack[2*nstack+1] = 0
+        stack[2*nstack+2] = u
+        stack[2*nstack+3] = 0
+        nstack += 2
+    return nstack
+
+cdef int _locate(double *x, double *y, int32 *V, int32 *N, int ntri, int t,
+                 int p) nogil:
+    """ Return a triangle containing point p, walking from triangle t. """
+    cdef int e, steps = 0
+    cdef bint moved = True
+    while moved:
+        moved = False
+        for e in range(3):
+            if _orient(x, y, V[3*t+(e+1)%3], V[3*t+(e+2)%3], p) < 0:
+                t = N[3*t+e]
+                moved = True
+                break
+        steps += 1
+        if steps > ntri:
+            # the walk is cycling, which can happen through nearly
+            # degenerate triangles; search every triangle instead
+            for t in range(ntri):
+                for e in range(3):
+                    if _orient(x, y, V[3*t+(e+1)%3], V[3*t+(e+2)%3], p) < 0:
+                        break
+                else:
+                    return t
+            return -1
+    return t
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+def delaunay(double[::1] px not None, double[::1] py not None):
+    """ Return the Delaunay triangulation of distinct points as an array of
+    counter-clockwise vertex index triples. """
+    cdef int n = px.shape[0]
+    cdef int i, k, t, u, e, j, p, a, b, c, d, ntri, nstack, nzero, ezero
+    cdef int t1, t2, u1, nA, nB, nC
+    cdef int nb
+    cdef double xmin, xmax, ymin, ymax, cx, cy, scale
+    cdef double o
+    if n < 3:
+        return np.zeros((0, 3), dtype=np.int32)
+
+    # normalize coordinates and append the vertices of an enclosing triangle
+    xmin, xmax = np.min(px), np.max(px)
+    ymin, ymax = np.min(py), np.max(py)
+    cx = 0.5*(xmin + xmax)
+    cy = 0.5*(ymin + ymax)
+    scale = fmax(xmax - xmin, ymax - ymin)
+    if scale == 0:
+        return np.zeros((0, 3), dtype=np.int32)
+    X = np.empty(n+3, dtype=np.float64)
+    Y = np.empty(n+3, dtype=np.float64)
+    X[:n] = (np.asarray(px) - cx) / scale
+    Y[:n] = (np.asarray(py) - cy) / scale
+    X[n:] = [-2*SUPER_SCALE, 2*SUPER_SCALE, 0.0]
+    Y[n:] = [-SUPER_SCALE, -SUPER_SCALE, 2*SUPER_SCALE]
+
+    # insertion order along rows of buckets, alternating direction
+    nb = max(1, int(np.sqrt(n/4.0)))
+    row = np.minimum((Y[:n] + 0.5)*nb, nb-1).astype(np.int64)
+    col = np.minimum((X[:n] + 0.5)*nb, nb-1).astype(np.int64)
+    col = np.where(row % 2 == 0, col, nb-1-col)
+    order_array = np.lexsort((X[:n], col, row)).astype(np.int32)
+
+    maxtri = 2*(n+3)
+    V_array = np.empty(3*maxtri, dtype=np.int32)
+    N_array = np.empty(3*maxtri, dtype=np.int32)
+    stack_array = np.empty(4*maxtri+8, dtype=np.int32)
+    cdef double[::1] Xv = X, Yv = Y
+    cdef int32[::1] order = order_array
+    cdef int32[::1] Vv = V_array, Nv = N_array, Sv = stack_array
+    cdef double *x = &Xv[0]
+    cdef double *y = &Yv[0]
+    cdef int32 *V = &Vv[0]
+    cdef int32 *N = &Nv[0]
+    cdef int32 *stack = &Sv[0]
+
+    with nogil:
+        _set(V, N, 0, n, n+1, n+2, -1, -1, -1)
+        ntri = 1
+        t = 0
+        for k in range(n):
+            p = order[k]
+            t = _locate(x, y, V, N, ntri, t, p)
+            if t == -1:
+                t = 0
+                continue
+            nzero = 0
+            ezero = -1
+            for e in range(3):
+                o = _orient(x, y, V[3*t+(e+1)%3], V[3*t+(e+2)%3], p)
+                if o == 0:
+                    nzero += 1
+                    ezero = e
+            if nzero > 1:
+                # coincides with a vertex
+                continue
+
+            nstack = 0
+            if nzero == 0:
+                # split the triangle in three
+                a = V[3*t]; b = V[3*t+1]; c = V[3*t+2]
+                nA = N[3*t]; nB = N[3*t+1]; nC = N[3*t+2]
+                t1 = ntri
+                t2 = ntri+1
+                ntri += 2
+                _set(V, N, t, a, b, p, t1, t2, nC)
+                _set(V, N, t1, b, c, p, t2, t, nA)
+                _set(V, N, t2, c, a, p, t, t1, nB)
+                _relink(N, nA, t, t1)
+                _relink(N, nB, t, t2)
+                stack[0] = t; stack[1] = 2
+                stack[2] = t1; stack[3] = 2
+                stack[4] = t2; stack[5] = 2
+                nstack = 3
+            else:
+                # split the triangles on either side of an edge in two
+                i = ezero
+                u = N[3*t+i]
+                if u == -1:
+                    continue
+                for j in range(3):
+                    if N[3*u+j] == t:
+                        break
+                a = V[3*t+i]; b = V[3*t+(i+1)%3]; c = V[3*t+(i+2)%3]
+                d = V[3*u+j]
+                nC = N[3*t+(i+1)%3]     # edge (c, a)
+                nA = N[3*t+(i+2)%3]     # edge (a, b)
+                nB = N[3*u+(j+1)%3]     # edge (b, d)
+                e = N[3*u+(j+2)%3]      # edge (d, c)
+                t1 = ntri
+                u1 = ntri+1
+                ntri += 2
+                _set(V, N, t, a, b, p, u1, t1, nA)
+                _set(V, N, t1, a, p, c, u, nC, t)
+                _set(V, N, u, d, c, p, t1, u1, e)
+                _set(V, N, u1, d, p, b, t, nB, u)
+                _relink(N, nC, t, t1)
+                _relink(N, nB, u, u1)
+                stack[0] = t; stack[1] = 2
+                stack[2] = t1; stack[3] = 1
+                stack[4] = u; stack[5] = 2
+                stack[6] = u1; stack[7] = 1
+                nstack = 4
+            _legalize(x, y, V, N, stack, nstack)
+
+    tri = V_array[:3*ntri].reshape(ntri, 3)
+    return np.ascontiguousarray(tri[np.all(tri < n, axis=1)])
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+def linear(double[::1] u not None, double[::1] v not None,
+           double[::1] z not None, int32[:,::1] tri not None,
+           int32[::1] sel not None, Py_ssize_t i0, Py_ssize_t j0,
+           double[:,::1] out not None):
+    """ Interpolate values *z* at vertices (u, v), given as fractional column
+    and row indices, linearly within the triangles *tri* indexed by *sel*,
+    into the cells of *out* whose centers they contain. Row 0 and column 0
+    of *out* are cell (i0, j0). """
+    cdef Py_ssize_t ny = out.shape[0], nx = out.shape[1]
+    cdef Py_ssize_t k, t, a, b, c, r, r0, r1, s, s0, s1
+    cdef double det, wa, wb, wc, cu, cv
+    cdef double eps = 1e-12
+    with nogil:
+        for k in range(sel.shape[0]):
+            t = sel[k]
+            a = tri[t,0]
+            b = tri[t,1]
+            c = tri[t,2]
+            det = (u[b]-u[a])*(v[c]-v[a]) - (v[b]-v[a])*(u[c]-u[a])
+            if det == 0:
+                continue
+            r0 = <Py_ssize_t> ceil(fmin(fmin(v[a], v[b]), v[c])) - i0
+            r1 = <Py_ssize_t> floor(fmax(fmax(v[a], v[b]), v[c])) - i0
+            s0 = <Py_ssize_t> ceil(fmin(fmin(u[a], u[b]), u[c])) - j0
+            s1 = <Py_ssize_t> floor(fmax(fmax(u[a], u[b]), u[c])) - j0
+            r0 = max(r0, 0)
+            r1 = min(r1, ny-1)
+            s0 = max(s0, 0)
+            s1 = min(s1, nx-1)
+            for r in range(r0, r1+1):
+                cv = r + i0
+                for s in range(s0, s1+1):
+                    cu = s + j0
+                    wa = ((u[b]-cu)*(v[c]-cv) - (v[b]-cv)*(u[c]-cu)) / det
+                    wb = ((u[c]-cu)*(v[a]-cv) - (v[c]-cv)*(u[a]-cu)) / det
+                    wc = 1.0 - wa - wb
+                    if wa >= -eps and wb >= -eps and wc >= -eps:
+                        out[r,s] = wa*z[a] + wb*z[b] + wc*z[c]
+    return
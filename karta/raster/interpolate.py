@@ -0,0 +1,143 @@
+"""
+Interpolation of scattered points to grids
+
+`interpolate_points` estimates a field measured at scattered points on every
+cell of a grid, one chunk at a time in a pool of threads.
+
+- "nearest" and "idw" find the nearest points of each cell center with a
+  `QuadTree` k-nearest neighbour search, and take the value of the nearest
+  point or the inverse distance weighted mean of the *k* nearest points
+- "linear" triangulates the points and interpolates linearly within
+  triangles. Cells outside the convex hull of the points are NoData.
+
+Points at the same position are merged, taking the mean of their values.
+"""
+
+import numpy as np
+from coordstring import CoordString
+from .grid import RegularGrid, BAND_CLASS_DEFAULT
+from .coordgen import affine_mesh
+from .misc import _chunks, _map_chunks
+from . import crfuncs
+from . import interpfuncs
+from ..vector.quadtree import QuadTree
+
+def _unique_points(x, y, z):
+    """ Merge points at equal positions, averaging their values. """
+    xy, inverse = np.unique(np.column_stack([x, y]), axis=0,
+                            return_inverse=True)
+    inverse = inverse.ravel()
+    counts = np.bincount(inverse)
+    z = np.bincount(inverse, weights=z) / counts
+    return (np.ascontiguousarray(xy[:,0]), np.ascontiguousarray(xy[:,1]), z)
+
+def _nearest_values(tree, z, x, y, k, power, max_distance):
+    """ Return the inverse distance weighted mean of the *k* points nearest
+    each position, or NaN if there are none within *max_distance*. """
+    idx, dist = tree.nearest(x, y, k)
+    if max_distance is not None:
+        idx[dist > max_distance] = -1
+    found = idx != -1
+    with np.errstate(divide="ignore"):
+        w = np.where(found, dist**-power, 0.0)
+    exact = found & (dist == 0)
+    values = z[np.where(found, idx, 0)]
+    total = w.sum(axis=1)
+    with np.errstate(invalid="ignore"):
+        out = np.where(total != 0, (w*values).sum(axis=1)/total, np.nan)
+    # cells at a point take its value
+    hit = exact.any(axis=1)
+    out[hit] = values[hit, exact[hit].argmax(axis=1)]
+    return out
+
+def interpolate_points(multipoint, field, like, method="idw", k=8, power=2.0,
+                       max_distance=None, bandclass=None, chunksize=(256, 256),
+                       nthreads=None):
+    """ Interpolate values at scattered points to a grid.
+
+    Parameters
+    ----------
+    multipoint : Multipoint
+    field : str or sequence of numbers
+        name of a data field of *multipoint* holding the values to
+        interpolate, or the values themselves
+    like : RegularGrid
+        grid providing the transform, size, and coordinate system of the
+        output
+    method : str, optional
+        "idw" (default) for the inverse distance weighted mean of the *k*
+        nearest points, "nearest" for the value of the nearest point, or
+        "linear" for linear interpolation between Delaunay triangles
+    k : int, optional
+        number of neighbours for "idw" (default 8)
+    power : float, optional
+        power of inverse distance weights (default 2)
+    max_distance : float, optional
+        for "idw" and "nearest", ignore points farther than this from cell
+        centers (default no limit)
+    bandclass : class, optional
+        band class of the output (default BAND_CLASS_DEFAULT)
+    chunksize : tuple of two ints, optional
+        size of chunks to compute at once (default (256, 256))
+    nthreads : int, optional
+        number of threads to use (default number of CPUs)
+
+    Returns
+    -------
+    RegularGrid
+        float64 grid with NoData as NaN
+    """
+    if method not in ("idw", "nearest", "linear"):
+        raise ValueError("method must be 'idw', 'nearest', or 'linear'")
+    if isinstance(field, str):
+        z = multipoint.data.getfield(field)
+    else:
+        z = field
+    z = np.asarray(z, dtype=np.float64)
+    x, y = multipoint.coords(crs=like.crs)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    if len(z) != len(x):
+        raise ValueError("one value is required per point")
+    valid = ~np.isnan(z)
+    if not valid.any():
+        raise ValueError("no points with valid values")
+    x, y, z = _unique_points(x[valid], y[valid], z[valid])
+    if bandclass is None:
+        bandclass = BAND_CLASS_DEFAULT
+    band = bandclass(like.size, np.float64, initval=np.nan)
+    T = like.transform
+
+    if method == "linear":
+        tri = interpfuncs.delaunay(x, y)
+        I, J = crfuncs.get_positions_vec(T, x, y)
+        I = np.ascontiguousarray(I, dtype=np.float64)
+        J = np.ascontiguousarray(J, dtype=np.float64)
+        vt, ut = I[tri], J[tri]
+        vmin, vmax = vt.min(axis=1), vt.max(axis=1)
+        umin, umax = ut.min(axis=1), ut.max(axis=1)
+
+        def compute(chunk):
+            i0, i1, j0, j1 = chunk
+            out = np.full((i1-i0, j1-j0), np.nan)
+            sel = np.flatnonzero((vmax >= i0) & (vmin <= i1-1) &
+                                 (umax >= j0) & (umin <= j1-1))
+            interpfuncs.linear(J, I, z, tri, sel.astype(np.int32), i0, j0, out)
+            return out
+    else:
+        tree = QuadTree(CoordString(np.column_stack([x, y])), leaf_capacity=16)
+        if method == "nearest":
+            k = 1
+
+        def compute(chunk):
+            i0, i1, j0, j1 = chunk
+            cx, cy = affine_mesh(T, np.arange(i0, i1), np.arange(j0, j1),
+                                 broadcast=True)
+            out = _nearest_values(tree, z, np.ravel(cx), np.ravel(cy), k,
+                                  power, max_distance)
+            return out.reshape(i1-i0, j1-j0)
+
+    for chunk, out in _map_chunks(_chunks(like.size, chunksize), lambda c: c,
+                                  compute, nthreads):
+        band.setblock(chunk[0], chunk[2], out)
+    return RegularGrid(T, bands=[band], crs=like.crs, nodata_value=np.nan)
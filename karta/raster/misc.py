@@ -1,23 +1,96 @@
 """
 2D raster functions
+
+Terrain functions process grids one chunk at a time, reading each chunk with a
+one-cell halo so that results do not depend on the chunk size. Chunks are
+computed in parallel by a pool of threads, and NoData cells become NaN in the
+output, as do cells whose neighbourhood contains NoData.
 """
 
+import multiprocessing
+from multiprocessing.pool import ThreadPool
 import numpy as np
 from .grid import RegularGrid
+from . import terrain
 
-def _slope(D, res=(1.0, 1.0)):
-    """ Return the scalar slope at each pixel using the neighbourhood method.
-    http://webhelp.esri.com/arcgisdesktop/9.2/index.cfm?TopicName=How%20Slope%20works
+def _check_orthogonal(grid, name):
+    if grid.skew != (0, 0):
+        raise NotImplementedError("{0} calculations not implemented on "
+                                  "skewed grids".format(name))
+
+def _check_dtype(dtype):
+    dtype = np.dtype(dtype)
+    if dtype not in (np.dtype(np.float32), np.dtype(np.float64)):
+        raise ValueError("dtype must be float32 or float64")
+    return dtype
+
+def _chunks(size, chunksize):
+    """ Return (i0, i1, j0, j1) bounds of chunks covering a grid. """
+    ny, nx = size
+    cny, cnx = chunksize
+    return [(i0, min(i0+cny, ny), j0, min(j0+cnx, nx))
+            for i0 in range(0, ny, cny) for j0 in range(0, nx, cnx)]
+
+def _read_halo(grid, band, chunk, dtype, reflect=False, halo=(1, 1)):
+    """ Read a chunk of a band as *dtype* with a halo of (rows, columns) cells,
+    replacing NoData with NaN. Halo cells beyond the edge of the grid are NaN,
+    or if *reflect* is True, the cells adjacent to the edge are linearly
+    extrapolated by odd reflection.
     """
-    dx, dy = res
-    Ddx = ((2 * D[1:-1,2:] + D[:-2,2:] + D[2:,2:]) -
-           (2 * D[1:-1,:-2] + D[:-2,:-2] + D[2:,:-2])) / (8.0 * dx)
-    Ddy = ((2 * D[2:,1:-1] + D[2:,2:] + D[2:,:-2]) -
-           (2 * D[:-2,1:-1] + D[:-2,:-2] + D[:-2,2:])) / (8.0 * dy)
-    return np.pad(np.sqrt(Ddx*Ddx + Ddy*Ddy), ((1, 1), (1, 1)), "reflect",
-                  reflect_type="odd")
-
-def slope(grid, band=0):
+    i0, i1, j0, j1 = chunk
+    ry, rx = halo
+    ny, nx = grid.size
+    a0, a1 = max(i0-ry, 0), min(i1+ry, ny)
+    b0, b1 = max(j0-rx, 0), min(j1+rx, nx)
+    raw = grid.bands[band].getblock(a0, b0, a1-a0, b1-b0)
+
+    D = np.full((i1-i0+2*ry, j1-j0+2*rx), np.nan, dtype=dtype)
+    inner = D[a0-i0+ry:a1-i0+ry, b0-j0+rx:b1-j0+rx]
+    inner[:,:] = raw
+    if not np.isnan(grid.nodata):
+        inner[raw == grid.nodata] = np.nan
+
+    if reflect:
+        if i0 == 0:
+            D[ry-1,:] = 2*D[ry,:] - D[ry+1,:]
+        if i1 == ny:
+            D[-ry,:] = 2*D[-ry-1,:] - D[-ry-2,:]
+        if j0 == 0:
+            D[:,rx-1] = 2*D[:,rx] - D[:,rx+1]
+        if j1 == nx:
+            D[:,-rx] = 2*D[:,-rx-1] - D[:,-rx-2]
+    return D
+
+def _map_chunks(chunks, read, compute, nthreads):
+    """ Generate (chunk, result) pairs, where result is
+    ``compute(read(chunk))``. Chunks are read in the calling thread and
+    computed by *nthreads* threads, in batches so that only a few chunks are
+    held in memory at once.
+    """
+    if nthreads is None:
+        nthreads = multiprocessing.cpu_count()
+    if nthreads <= 1 or len(chunks) == 1:
+        for chunk in chunks:
+            yield chunk, compute(read(chunk))
+        return
+
+    pool = ThreadPool(nthreads)
+    try:
+        nbatch = 2*nthreads
+        for k in range(0, len(chunks), nbatch):
+            batch = chunks[k:k+nbatch]
+            results = pool.map(compute, [read(chunk) for chunk in batch])
+            for chunk, result in zip(batch, results):
+                yield chunk, result
+    finally:
+        pool.close()
+        pool.join()
+
+def _output_grid(grid, bands):
+    return RegularGrid(grid.transform, bands=bands, crs=grid.crs,
+                       nodata_value=np.nan)
+
+def slope(grid, band=0, dtype=np.float32, chunksize=(256, 256), nthreads=None):
     """ Return the scalar slope at each pixel using the neighbourhood method.
 
     Parameters
@@ -25,6 +98,12 @@ def slope(grid, band=0):
     grid : RegularGrid
     band : int, optional
         band to compute slope for (default 0)
+    dtype : numpy float dtype, optional
+        precision of calculation and output (default float32)
+    chunksize : tuple of two ints, optional
+        size of chunks to process at once (default (256, 256))
+    nthreads : int, optional
+        number of threads to use (default number of CPUs)
 
     Returns
     -------
@@ -32,26 +111,28 @@ def slope(grid, band=0):
 
     Notes
     -----
+    Cells on the edge of the grid are computed by linearly extrapolating the
+    surface one cell beyond the edge.
+
     http://webhelp.esri.com/arcgisdesktop/9.2/index.cfm?TopicName=How%20Slope%20works
     """
-    if grid.skew != (0, 0):
-        raise NotImplementedError("slope calculations not implemented on skewed grids")
-    D = np.where(grid.data_mask, grid[:,:,band].astype(np.float32), np.nan)
-    return RegularGrid(grid.transform, _slope(D, grid.resolution),
-                       crs=grid.crs, nodata_value=np.nan)
+    _check_orthogonal(grid, "slope")
+    dtype = _check_dtype(dtype)
+    dx, dy = grid.resolution
 
-def _aspect(D, res=(1.0, 1.0)):
-    """ Return the slope aspect for each pixel.
-    http://webhelp.esri.com/arcgisdesktop/9.2/index.cfm?TopicName=How%20Aspect%20works
-    """
-    Ddx = ((2 * D[1:-1,2:] + D[:-2,2:] + D[2:,2:]) -
-           (2 * D[1:-1,:-2] + D[:-2,:-2] + D[2:,:-2])) / (8.0 * res[0])
-    Ddy = ((2 * D[2:,1:-1] + D[2:,2:] + D[2:,:-2]) -
-           (2 * D[:-2,1:-1] + D[:-2,:-2] + D[:-2,2:])) / (8.0 * res[1])
-    return np.pad(np.arctan2(Ddy, -Ddx), ((1, 1), (1, 1)), "constant",
-                  constant_values=(np.nan,))
-
-def aspect(grid, band=0):
+    def compute(D):
+        out = np.empty((D.shape[0]-2, D.shape[1]-2), dtype=dtype)
+        terrain.slope(D, dx, dy, out)
+        return out
+
+    read = lambda chunk: _read_halo(grid, band, chunk, dtype, reflect=True)
+    out = grid._bndcls(grid.size, dtype.type, initval=np.nan)
+    for chunk, result in _map_chunks(_chunks(grid.size, chunksize), read,
+                                     compute, nthreads):
+        out.setblock(chunk[0], chunk[2], result)
+    return _output_grid(grid, [out])
+
+def aspect(grid, band=0, dtype=np.float32, chunksize=(256, 256), nthreads=None):
     """ Compute grid aspect.
 
     Parameters
@@ -59,28 +140,38 @@ def aspect(grid, band=0):
     grid : RegularGrid
     band : int, optional
         band to compute aspect for (default 0)
+    dtype : numpy float dtype, optional
+        precision of calculation and output (default float32)
+    chunksize : tuple of two ints, optional
+        size of chunks to process at once (default (256, 256))
+    nthreads : int, optional
+        number of threads to use (default number of CPUs)
 
     Returns
     -------
     RegularGrid
-    """
-    if grid.skew != (0, 0):
-        raise NotImplementedError("aspect calculations not implemented on skewed grids")
-    D = np.where(grid.data_mask, grid[:,:,band].astype(np.float32), np.nan)
-    return RegularGrid(grid.transform, _aspect(D, grid.resolution),
-                       crs=grid.crs, nodata_value=np.nan)
 
-def _grad(D, res=(1.0, 1.0)):
-    """ Computes the gradient of potential D. Return a tuple (dx, dy).
+    Notes
+    -----
+    http://webhelp.esri.com/arcgisdesktop/9.2/index.cfm?TopicName=How%20Aspect%20works
     """
-    Ddx = ((2 * D[1:-1,2:] + D[:-2,2:] + D[2:,2:]) -
-           (2 * D[1:-1,:-2] + D[:-2,:-2] + D[2:,:-2])) / (8.0 * res[0])
-    Ddy = ((2 * D[2:,1:-1] + D[2:,2:] + D[2:,:-2]) -
-           (2 * D[:-2,1:-1] + D[:-2,:-2] + D[:-2,2:])) / (8.0 * res[1])
-    return (np.pad(Ddx, ((1, 1), (1, 1)), "constant", constant_values=(np.nan,)),
-            np.pad(Ddy, ((1, 1), (1, 1)), "constant", constant_values=(np.nan,)))
-
-def gradient(grid, band=0):
+    _check_orthogonal(grid, "aspect")
+    dtype = _check_dtype(dtype)
+    dx, dy = grid.resolution
+
+    def compute(D):
+        out = np.empty((D.shape[0]-2, D.shape[1]-2), dtype=dtype)
+        terrain.aspect(D, dx, dy, out)
+        return out
+
+    read = lambda chunk: _read_halo(grid, band, chunk, dtype)
+    out = grid._bndcls(grid.size, dtype.type, initval=np.nan)
+    for chunk, result in _map_chunks(_chunks(grid.size, chunksize), read,
+                                     compute, nthreads):
+        out.setblock(chunk[0], chunk[2], result)
+    return _output_grid(grid, [out])
+
+def gradient(grid, band=0, dtype=np.float32, chunksize=(256, 256), nthreads=None):
     """ Compute gradient field from a grid.
 
     Parameters
@@ -88,27 +179,38 @@ def gradient(grid, band=0):
     grid : RegularGrid
     band : int, optional
         (default 0)
+    dtype : numpy float dtype, optional
+        precision of calculation and output (default float32)
+    chunksize : tuple of two ints, optional
+        size of chunks to process at once (default (256, 256))
+    nthreads : int, optional
+        number of threads to use (default number of CPUs)
 
     Returns
     -------
     (RegularGrid, RegularGrid)
     """
-    if grid.skew != (0, 0):
-        raise NotImplementedError("gradient calculations not implemented on skewed grids")
-    D = np.where(grid.data_mask, grid[:,:,band].astype(np.float32), np.nan)
-    dDdx, dDdy = _grad(D, grid.resolution)
-    return (RegularGrid(grid.transform, dDdx, crs=grid.crs, nodata_value=np.nan),
-            RegularGrid(grid.transform, dDdy, crs=grid.crs, nodata_value=np.nan))
-
-def _div(U, V, res=(1.0, 1.0)):
-    """ Calculate the divergence of a vector field. """
-    dUdx = (U[:,2:] - U[:,:-2]) / (2.0*res[0])
-    dVdy = (V[2:,:] - V[:-2,:]) / (2.0*res[1])
-    divergence = np.pad(dUdx, ((0, 0), (1, 1)), "constant", constant_values=(np.nan,)) \
-               + np.pad(dVdy, ((1, 1), (0, 0)), "constant", constant_values=(np.nan,))
-    return divergence
-
-def divergence(grid, bands=(0, 1)):
+    _check_orthogonal(grid, "gradient")
+    dtype = _check_dtype(dtype)
+    dx, dy = grid.resolution
+
+    def compute(D):
+        gx = np.empty((D.shape[0]-2, D.shape[1]-2), dtype=dtype)
+        gy = np.empty_like(gx)
+        terrain.gradient(D, dx, dy, gx, gy)
+        return gx, gy
+
+    read = lambda chunk: _read_halo(grid, band, chunk, dtype)
+    outx = grid._bndcls(grid.size, dtype.type, initval=np.nan)
+    outy = grid._bndcls(grid.size, dtype.type, initval=np.nan)
+    for chunk, (gx, gy) in _map_chunks(_chunks(grid.size, chunksize), read,
+                                       compute, nthreads):
+        outx.setblock(chunk[0], chunk[2], gx)
+        outy.setblock(chunk[0], chunk[2], gy)
+    return _output_grid(grid, [outx]), _output_grid(grid, [outy])
+
+def divergence(grid, bands=(0, 1), dtype=None, chunksize=(256, 256),
+               nthreads=None):
     """ Compute divergence from a grid.
 
     Parameters
@@ -116,35 +218,41 @@ def divergence(grid, bands=(0, 1)):
     grid : RegularGrid
     band : tuple of ints, optional
         indicates orthogonal velocity bands (default (0, 1))
+    dtype : numpy float dtype, optional
+        precision of calculation and output (default float32 for float32
+        bands and float64 otherwise)
+    chunksize : tuple of two ints, optional
+        size of chunks to process at once (default (256, 256))
+    nthreads : int, optional
+        number of threads to use (default number of CPUs)
 
     Returns
     -------
     RegularGrid
     """
-    if grid.skew != (0, 0):
-        raise NotImplementedError("divergence calculations not implemented on skewed grids")
-    return RegularGrid(grid.transform,
-                       _div(grid[:,:,bands[0]],
-                            grid[:,:,bands[1]],
-                            grid.resolution),
-                       crs=grid.crs, nodata_value=np.nan)
-
-def _normed_potential_vectors(D, res=(1.0, 1.0)):
-    """ Computes a U,V vector field of potential D. Scalar components of
-    U,V are normalized to ``max(|U, V|)``.
-    """
-    dx, dy = res
-    Ddx = ((2 * D[1:-1,2:] + D[:-2,2:] + D[2:,2:]) -
-           (2 * D[1:-1,:-2] + D[:-2,:-2] + D[2:,:-2])) / (8.0*dx)
-    Ddy = ((2 * D[2:,1:-1] + D[2:,2:] + D[2:,:-2]) -
-           (2 * D[:-2,1:-1] + D[:-2,:-2] + D[:-2,2:])) / (8.0*dy)
-    M = np.sqrt(Ddx**2 + Ddy**2)
-    U = Ddx / M[np.isnan(M)==False].max()
-    V = Ddy / M[np.isnan(M)==False].max()
-    return (np.pad(U, ((1, 1), (1, 1)), "constant", constant_values=(np.nan,)),
-            np.pad(V, ((1, 1), (1, 1)), "constant", constant_values=(np.nan,)))
-
-def normed_potential_vectors(grid, band=0):
+    _check_orthogonal(grid, "divergence")
+    if dtype is None:
+        dtype = np.result_type(grid.bands[bands[0]].dtype,
+                               grid.bands[bands[1]].dtype, np.float32)
+    dtype = _check_dtype(dtype)
+    dx, dy = grid.resolution
+
+    def compute(UV):
+        U, V = UV
+        out = np.empty((U.shape[0]-2, U.shape[1]-2), dtype=dtype)
+        terrain.divergence(U, V, dx, dy, out)
+        return out
+
+    read = lambda chunk: (_read_halo(grid, bands[0], chunk, dtype),
+                          _read_halo(grid, bands[1], chunk, dtype))
+    out = grid._bndcls(grid.size, dtype.type, initval=np.nan)
+    for chunk, result in _map_chunks(_chunks(grid.size, chunksize), read,
+                                     compute, nthreads):
+        out.setblock(chunk[0], chunk[2], result)
+    return _output_grid(grid, [out])
+
+def normed_potential_vectors(grid, band=0, dtype=np.float32,
+                             chunksize=(256, 256), nthreads=None):
     """ Computes a U,V vector field of a potential grid. Scalar components of
     U,V are normalized to ``max(|U, V|)``.
 
@@ -152,19 +260,118 @@ def normed_potential_vectors(grid, band=0):
     ----------
     grid : RegularGrid
     band : int, optional (default 0)
+    dtype : numpy float dtype, optional
+        precision of calculation and output (default float32)
+    chunksize : tuple of two ints, optional
+        size of chunks to process at once (default (256, 256))
+    nthreads : int, optional
+        number of threads to use (default number of CPUs)
 
     Returns
     -------
     (RegularGrid, RegularGrid)
     """
-    if grid.skew != (0, 0):
-        raise NotImplementedError("potential vector calculations not implemented on skewed grids")
-    D = np.where(grid.data_mask, grid[:,:,band].astype(np.float32), np.nan)
-    u, v = _normed_potential_vectors(D, res=grid.resolution)
-    return (RegularGrid(grid.transform, u, crs=grid.crs, nodata_value=np.nan),
-            RegularGrid(grid.transform, v, crs=grid.crs, nodata_value=np.nan))
+    _check_orthogonal(grid, "potential vector")
+    dtype = _check_dtype(dtype)
+    dx, dy = grid.resolution
+    chunks = _chunks(grid.size, chunksize)
+    read = lambda chunk: _read_halo(grid, band, chunk, dtype)
+
+    maxima = [m for _, m in _map_chunks(chunks, read,
+                                        lambda D: terrain.max_gradient(D, dx, dy),
+                                        nthreads)
+              if not np.isnan(m)]
+    mmax = dtype.type(max(maxima) if len(maxima) != 0 else np.nan)
+
+    def compute(D):
+        gx = np.empty((D.shape[0]-2, D.shape[1]-2), dtype=dtype)
+        gy = np.empty_like(gx)
+        terrain.gradient(D, dx, dy, gx, gy)
+        return gx / mmax, gy / mmax
+
+    outu = grid._bndcls(grid.size, dtype.type, initval=np.nan)
+    outv = grid._bndcls(grid.size, dtype.type, initval=np.nan)
+    for chunk, (u, v) in _map_chunks(chunks, read, compute, nthreads):
+        outu.setblock(chunk[0], chunk[2], u)
+        outv.setblock(chunk[0], chunk[2], v)
+    return _output_grid(grid, [outu]), _output_grid(grid, [outv])
+
+def _lerp(a, b, t):
+    # linear interpolation as performed by numpy.percentile
+    d = b - a
+    return b - d*(1-t) if t >= 0.5 else a + d*t
 
-def hillshade(grid, azimuth=330.0, elevation=60.0, band=0):
+def _band_percentiles(band, chunks, qs, counts, vmin, vmax):
+    """ Return percentiles *qs* of the non-NaN values of a band, given a
+    histogram *counts* of those values with equal bins spanning [*vmin*,
+    *vmax*].
+    """
+    nbins = len(counts)
+    n = counts.sum()
+    cumulative = np.cumsum(counts)
+    values = {}
+
+    def value(r):
+        if r not in values:
+            k = np.searchsorted(cumulative, r, side="right")
+            inbin = lambda v: (_bin_index(v, vmin, vmax, nbins) == k) & ~np.isnan(v)
+            values[r] = _band_rank(band, chunks, r, inbin,
+                                   cumulative[k] - counts[k],
+                                   vmin + k*(vmax-vmin)/nbins,
+                                   vmin + (k+1)*(vmax-vmin)/nbins)
+        return values[r]
+
+    result = []
+    for q in qs:
+        pos = q/100.0*(n-1)
+        r = int(np.floor(pos))
+        result.append(_lerp(value(r), value(min(r+1, n-1)), pos-r))
+    return result
+
+def _band_rank(band, chunks, rank, inbin, below, lo, hi, nbins=4096,
+               limit=65536):
+    """ Return the value with 0-based *rank* among the values of a band.
+
+    The value must be among those selected by *inbin*, which lie between *lo*
+    and *hi* and are preceded by *below* smaller values. The selected values
+    are counted in *nbins* equal bins, and the bin containing *rank* is
+    narrowed to the range of its values until it holds at most *limit*
+    values, which are then sorted. Memory use is therefore bounded, even when
+    many values are equal.
+    """
+    while True:
+        counts = np.zeros(nbins, dtype=np.int64)
+        bmin = np.full(nbins, np.inf)
+        bmax = np.full(nbins, -np.inf)
+        for i0, i1, j0, j1 in chunks:
+            v = band.getblock(i0, j0, i1-i0, j1-j0).ravel().astype(np.float64)
+            v = v[inbin(v)]
+            b = _bin_index(v, lo, hi, nbins)
+            counts += np.bincount(b, minlength=nbins)
+            np.minimum.at(bmin, b, v)
+            np.maximum.at(bmax, b, v)
+
+        k = np.searchsorted(np.cumsum(counts), rank-below, side="right")
+        below += counts[:k].sum()
+        lo, hi = bmin[k], bmax[k]
+        if lo == hi:
+            return lo
+        inbin = lambda v, lo=lo, hi=hi: (v >= lo) & (v <= hi)
+        if counts[k] <= limit:
+            break
+
+    collected = []
+    for i0, i1, j0, j1 in chunks:
+        v = band.getblock(i0, j0, i1-i0, j1-j0).ravel().astype(np.float64)
+        collected.append(v[inbin(v)])
+    return np.sort(np.concatenate(collected))[rank-below]
+
+def _bin_index(v, vmin, vmax, nbins):
+    return np.clip(((v - vmin) / (vmax - vmin) * nbins).astype(np.int64),
+                   0, nbins-1)
+
+def hillshade(grid, azimuth=330.0, elevation=60.0, band=0, dtype=np.float64,
+              chunksize=(256, 256), nthreads=None):
     """ Return a hill-shaded version of *grid*.
 
     Parameters
@@ -176,6 +383,12 @@ def hillshade(grid, azimuth=330.0, elevation=60.0, band=0):
         height of light source (default 60.0)
     band : int, optional
         band to compute hillshade for (default 0)
+    dtype : numpy float dtype, optional
+        output precision (default float64)
+    chunksize : tuple of two ints, optional
+        size of chunks to process at once (default (256, 256))
+    nthreads : int, optional
+        number of threads to use (default number of CPUs)
 
     Returns
     -------
@@ -184,24 +397,42 @@ def hillshade(grid, azimuth=330.0, elevation=60.0, band=0):
     Notes
     -----
     Currently assumes orthogonal coordinates.
+
+    Output is clipped to the 2nd and 98th percentiles of the illumination,
+    which are found exactly from a histogram of the output so that the whole
+    grid never needs to be held in memory.
     """
-    dxgrid, dygrid = gradient(grid, band=band)
-    dx = dxgrid[:,:,0]
-    dy = dygrid[:,:,0]
-    res = grid.resolution
-    u = np.array((np.full_like(dx, res[0]), np.zeros_like(dx), dx))
-    v = np.array((np.zeros_like(dy), np.full_like(dy, res[1]), dy))
-    w = np.cross(u, v, axisa=0, axisb=0)
-    wunit = w / np.atleast_3d(np.sqrt(np.sum(w**2, axis=-1)))
-
-    s = np.array((np.cos(azimuth*np.pi/180.0),
-                  np.sin(azimuth*np.pi/180.0),
-                  np.sin(elevation*np.pi/180.0)))
-    smat = np.full((wunit.shape[0], wunit.shape[1], 3), s, dtype=np.float64)
-    dprod = (wunit*smat).sum(axis=-1)
-
-    q = np.percentile(dprod[~np.isnan(dprod)], [2, 98])
-    np.clip(dprod, q[0], q[1], out=dprod)
-
-    return RegularGrid(grid.transform, values=dprod, crs=grid.crs)
+    _check_orthogonal(grid, "hillshade")
+    dtype = _check_dtype(dtype)
+    dx, dy = grid.resolution
+    s = (np.cos(azimuth*np.pi/180.0),
+         np.sin(azimuth*np.pi/180.0),
+         np.sin(elevation*np.pi/180.0))
+
+    def compute(D):
+        out = np.empty((D.shape[0]-2, D.shape[1]-2), dtype=np.float64)
+        terrain.hillshade(D, dx, dy, s[0], s[1], s[2], out)
+        return out.astype(dtype, copy=False)
+
+    # illumination is bounded by the magnitude of s
+    vmax = np.sqrt(s[0]**2 + s[1]**2 + s[2]**2) * (1 + 1e-6)
+    nbins = 65536
+    counts = np.zeros(nbins, dtype=np.int64)
+
+    chunks = _chunks(grid.size, chunksize)
+    read = lambda chunk: _read_halo(grid, band, chunk, dtype)
+    out = grid._bndcls(grid.size, dtype.type, initval=np.nan)
+    for chunk, result in _map_chunks(chunks, read, compute, nthreads):
+        out.setblock(chunk[0], chunk[2], result)
+        v = result[~np.isnan(result)].astype(np.float64)
+        counts += np.bincount(_bin_index(v, -vmax, vmax, nbins),
+                              minlength=nbins)
 
+    if counts.sum() != 0:
+        qmin, qmax = _band_percentiles(out, chunks, (2, 98), counts,
+                                       -vmax, vmax)
+        for i0, i1, j0, j1 in chunks:
+            block = np.array(out.getblock(i0, j0, i1-i0, j1-j0))
+            np.clip(block, qmin, qmax, out=block)
+            out.setblock(i0, j0, block)
+    return _output_grid(grid, [out])
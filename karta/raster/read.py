@@ -1,24 +1,50 @@
 """ Functions for reading raster data sources as RegularGrid objects """
 import numpy as np
-from .grid import RegularGrid
+from .grid import RegularGrid, BAND_CLASS_DEFAULT
 from ..crs import ProjectedCRS, GeographicalCRS, Cartesian
 from . import _gdal
 from . import _aai
 from ..errors import GridError
 
-def read_aai(fnm):
+def read_aai(fnm, bandclass=None):
     """ Convenience function to open a ESRI ASCII grid and return a RegularGrid
     instance.
+
+    The file is parsed in blocks of rows that are written directly to the
+    grid band, so that the whole file is never held in memory as text.
+
+    Parameters
+    ----------
+    fnm : str
+        ASCII grid file path
+    bandclass : Band class, optional
+        class of band used by returned grid (default BAND_CLASS_DEFAULT)
     """
-    values, aschdr = _aai.aairead(fnm)
+    if bandclass is None:
+        bandclass = BAND_CLASS_DEFAULT
+
+    with open(fnm, "rb") as f:
+        aschdr, text = _aai.read_header(f)
+        ny, nx = aschdr['nrows'], aschdr['ncols']
+        band = bandclass((ny, nx), np.float64, initval=np.nan)
+
+        # rows are stored from the top of the grid, so blocks are sized to
+        # keep writes aligned with band chunks from the bottom
+        cny = getattr(band, "_chunksize", (256, 256))[0]
+        rowcounts = ([ny % cny] if ny % cny != 0 else []) + [cny]*(ny // cny)
+        i = ny
+        for block in _aai.iter_rowblocks(f, text, nx, rowcounts):
+            block[block==aschdr['nodata_value']] = np.nan
+            i -= len(block)
+            band.setblock(i, 0, block[::-1])
+
     t = {'xllcorner': aschdr['xllcorner'],
          'yllcorner': aschdr['yllcorner'],
          'dx'       : aschdr['cellsize'],
          'dy'       : aschdr['cellsize'],
          'sx'       : 0.0,
          'sy'       : 0.0}
-    values[values==aschdr['nodata_value']] = np.nan
-    return RegularGrid(t, values=values[::-1])
+    return RegularGrid(t, bands=[band])
 
 def proj4_isgeodetic(s):
     return ("lonlat" in s) or ("longlat" in s) or \
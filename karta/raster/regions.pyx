@@ -0,0 +1,346 @@
+""" Connected regions of equal grid values
+
+Regions are labeled one block of a grid at a time with a union-find
+structure, and labels that meet across block seams are merged afterwards in a
+global union-find structure. Region boundaries are recorded as runs of
+directed cell edges, oriented with the region on their left in (row, column)
+index space, and traced into closed rings.
+"""
+
+import numpy as np
+cimport numpy as np
+cimport cython
+from libc.stdlib cimport malloc, realloc, free
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef inline Py_ssize_t _find(Py_ssize_t *parent, Py_ssize_t a) nogil:
+    cdef Py_ssize_t root = a
+    cdef Py_ssize_t tmp
+    while parent[root] != root:
+        root = parent[root]
+    while parent[a] != root:
+        tmp = parent[a]
+        parent[a] = root
+        a = tmp
+    return root
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def label_block(double[:,:] z not None, np.uint8_t[:,:] valid not None):
+    """ Label 4-connected regions of equal valid values in a block.
+
+    Returns
+    -------
+    (labels, n)
+        int64 array of labels from 0 to n-1, with -1 where values are invalid
+    """
+    cdef Py_ssize_t nrows = z.shape[0]
+    cdef Py_ssize_t ncols = z.shape[1]
+    cdef Py_ssize_t i, j, k, a, b, n = 0
+    cdef np.ndarray[np.int64_t, ndim=2] labels = np.full((nrows, ncols), -1,
+                                                         dtype=np.int64)
+    cdef Py_ssize_t *parent = <Py_ssize_t*> malloc(max(nrows*ncols, 1) *
+                                                   sizeof(Py_ssize_t))
+    if parent == NULL:
+        raise MemoryError()
+
+    try:
+        with nogil:
+            for i in range(nrows):
+                for j in range(ncols):
+                    k = i*ncols + j
+                    parent[k] = k
+                    if not valid[i,j]:
+                        continue
+                    if j != 0 and valid[i,j-1] and z[i,j-1] == z[i,j]:
+                        parent[k] = _find(parent, k-1)
+                    if i != 0 and valid[i-1,j] and z[i-1,j] == z[i,j]:
+                        a = _find(parent, k)
+                        b = _find(parent, k-ncols)
+                        if a < b:
+                            parent[b] = a
+                        elif b < a:
+                            parent[a] = b
+
+            # roots precede the cells they label, so a single pass assigns
+            # consecutive labels
+            for i in range(nrows):
+                for j in range(ncols):
+                    if not valid[i,j]:
+                        continue
+                    k = i*ncols + j
+                    a = _find(parent, k)
+                    if a == k:
+                        labels[i,j] = n
+                        n += 1
+                    else:
+                        labels[i,j] = labels[a // ncols, a % ncols]
+    finally:
+        free(parent)
+    return labels, n
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def union_pairs(np.int64_t[:] parent not None, np.int64_t[:] a not None,
+                np.int64_t[:] b not None):
+    """ Merge the sets containing a[k] and b[k] in the union-find structure
+    *parent*, keeping the smaller label as the root. """
+    cdef Py_ssize_t k
+    cdef np.int64_t ra, rb
+    with nogil:
+        for k in range(a.shape[0]):
+            ra = a[k]
+            while parent[ra] != ra:
+                parent[ra] = parent[parent[ra]]
+                ra = parent[ra]
+            rb = b[k]
+            while parent[rb] != rb:
+                parent[rb] = parent[parent[rb]]
+                rb = parent[rb]
+            if ra < rb:
+                parent[rb] = ra
+            elif rb < ra:
+                parent[ra] = rb
+    return
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def resolve_parents(np.int64_t[:] parent not None):
+    """ Point every entry of union-find structure *parent* at its root. """
+    cdef Py_ssize_t k
+    with nogil:
+        # roots are the smallest members of their sets
+        for k in range(parent.shape[0]):
+            parent[k] = parent[parent[k]]
+    return
+
+cdef struct EdgeBuffer:
+    np.int64_t *data
+    Py_ssize_t n
+    Py_ssize_t capacity
+
+cdef int _push_edge(EdgeBuffer *buf, np.int64_t r0, np.int64_t c0,
+                    np.int64_t r1, np.int64_t c1, np.int64_t label) nogil:
+    cdef np.int64_t *tmp
+    if buf.n == buf.capacity:
+        tmp = <np.int64_t*> realloc(buf.data, 10*buf.capacity*sizeof(np.int64_t))
+        if tmp == NULL:
+            return -1
+        buf.data = tmp
+        buf.capacity *= 2
+    buf.data[5*buf.n] = r0
+    buf.data[5*buf.n+1] = c0
+    buf.data[5*buf.n+2] = r1
+    buf.data[5*buf.n+3] = c1
+    buf.data[5*buf.n+4] = label
+    buf.n += 1
+    return 0
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef inline bint _differ(double[:,:] z, np.uint8_t[:,:] valid,
+                         Py_ssize_t i0, Py_ssize_t j0, Py_ssize_t i1,
+                         Py_ssize_t j1, bint outside) nogil:
+    # True if a boundary separates cells (i0, j0) and (i1, j1)
+    if outside or not valid[i1,j1]:
+        return valid[i0,j0]
+    if not valid[i0,j0]:
+        return True
+    return z[i0,j0] != z[i1,j1]
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def boundary_edges(double[:,:] z not None, np.uint8_t[:,:] valid not None,
+                   np.int64_t[:,:] labels not None, long i0, long j0,
+                   bint last_row, bint last_col):
+    """ Return the region boundaries within a block as runs of directed edges.
+
+    Parameters
+    ----------
+    z, valid, labels : 2-d arrays
+        values, validity, and region labels of an (h+1 x w+1) block, where the
+        first row and column hold the neighbouring cells of the previous
+        blocks (invalid at the edge of the grid)
+    i0, j0 : int
+        grid indices of the first cell following the halo
+    last_row, last_col : bool
+        whether the block is the last in its column or row of blocks, in which
+        case boundaries along the far edges of the grid are included
+
+    Returns
+    -------
+    ndarray
+        (n x 5) int64 array of edges (row0, col0, row1, col1, label) between
+        grid vertices, with the region *label* on the left in (row, column)
+        space
+    """
+    cdef Py_ssize_t h = z.shape[0] - 1
+    cdef Py_ssize_t w = z.shape[1] - 1
+    cdef Py_ssize_t x, y, r, c, start, xend, yend
+    cdef np.int64_t la, lb
+    cdef bint outside
+    cdef int err = 0
+    cdef EdgeBuffer buf
+    buf.capacity = 1024
+    buf.n = 0
+    buf.data = <np.int64_t*> malloc(5*buf.capacity*sizeof(np.int64_t))
+    if buf.data == NULL:
+        raise MemoryError()
+
+    xend = w + 1 if last_col else w
+    yend = h + 1 if last_row else h
+
+    try:
+        with nogil:
+            # vertical lines, between columns x-1 and x
+            for x in range(1, xend+1):
+                outside = x == w + 1
+                r = 1
+                while r <= h and err == 0:
+                    if not _differ(z, valid, r, x-1, r, x, outside):
+                        r += 1
+                        continue
+                    la = labels[r,x-1]
+                    lb = -1 if outside or not valid[r,x] else labels[r,x]
+                    start = r
+                    r += 1
+                    while r <= h and _differ(z, valid, r, x-1, r, x, outside) and \
+                            labels[r,x-1] == la and \
+                            (-1 if outside or not valid[r,x] else labels[r,x]) == lb:
+                        r += 1
+                    if lb != -1:
+                        err = _push_edge(&buf, i0+start-1, j0+x-1, i0+r-1, j0+x-1, lb)
+                    if la != -1 and valid[start,x-1]:
+                        err = err or _push_edge(&buf, i0+r-1, j0+x-1, i0+start-1, j0+x-1, la)
+
+            # horizontal lines, between rows y-1 and y
+            for y in range(1, yend+1):
+                outside = y == h + 1
+                c = 1
+                while c <= w and err == 0:
+                    if not _differ(z, valid, y-1, c, y, c, outside):
+                        c += 1
+                        continue
+                    la = labels[y-1,c]
+                    lb = -1 if outside or not valid[y,c] else labels[y,c]
+                    start = c
+                    c += 1
+                    while c <= w and _differ(z, valid, y-1, c, y, c, outside) and \
+                            labels[y-1,c] == la and \
+                            (-1 if outside or not valid[y,c] else labels[y,c]) == lb:
+                        c += 1
+                    if la != -1 and valid[y-1,start]:
+                        err = _push_edge(&buf, i0+y-1, j0+start-1, i0+y-1, j0+c-1, la)
+                    if lb != -1:
+                        err = err or _push_edge(&buf, i0+y-1, j0+c-1, i0+y-1, j0+start-1, lb)
+
+        if err != 0:
+            raise MemoryError()
+        edges = np.empty((buf.n, 5), dtype=np.int64)
+        if buf.n != 0:
+            edges[:,:] = <np.int64_t[:buf.n,:5]> buf.data
+    finally:
+        free(buf.data)
+    return edges
+
+cdef inline int _sign(np.int64_t a) nogil:
+    return (a > 0) - (a < 0)
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef Py_ssize_t _lower_bound(np.int64_t[:] label, np.int64_t[:] key,
+                             np.int64_t l, np.int64_t k) nogil:
+    # first position at or after (l, k) in arrays sorted by (label, key)
+    cdef Py_ssize_t lo = 0
+    cdef Py_ssize_t hi = label.shape[0]
+    cdef Py_ssize_t mid
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if label[mid] < l or (label[mid] == l and key[mid] < k):
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def trace_rings(np.int64_t[:,:] edges not None, np.int64_t[:] startkey not None,
+                np.int64_t[:] endkey not None):
+    """ Join directed boundary edges into closed rings.
+
+    Parameters
+    ----------
+    edges : (n x 5) int64 array
+        edges as returned by `boundary_edges`, sorted by label and then by
+        *startkey*
+    startkey, endkey : int64 arrays
+        unique keys of the start and end vertex of each edge
+
+    Where a region touches itself diagonally at a vertex, rings turn away
+    from the region, so that an outer ring and a hole that meet at the vertex
+    are traced as separate rings rather than as one self-touching ring.
+
+    Returns
+    -------
+    (rows, cols, offsets, labels)
+        vertex rows and columns of each ring, without the closing vertex or
+        collinear vertices. Ring *k* is given by ``offsets[k]:offsets[k+1]``
+        and belongs to region ``labels[k]``.
+    """
+    cdef Py_ssize_t n = edges.shape[0]
+    cdef Py_ssize_t e, f, first, cur, p, q, nring, nvert, m
+    cdef int dr, dc, fdr, fdc, pdr, pdc
+    cdef np.int64_t[:] label = np.ascontiguousarray(edges[:,4])
+    cdef np.ndarray[np.uint8_t] used = np.zeros(n, dtype=np.uint8)
+    cdef np.ndarray[np.int64_t] rows = np.empty(n, dtype=np.int64)
+    cdef np.ndarray[np.int64_t] cols = np.empty(n, dtype=np.int64)
+    cdef np.ndarray[np.intp_t] offsets = np.empty(n+1, dtype=np.intp)
+    cdef np.ndarray[np.int64_t] labels = np.empty(n, dtype=np.int64)
+    cdef np.ndarray[np.intp_t] ring = np.empty(n, dtype=np.intp)
+
+    nring = 0
+    nvert = 0
+    with nogil:
+        for first in range(n):
+            if used[first]:
+                continue
+            m = 0
+            cur = first
+            while True:
+                used[cur] = 1
+                ring[m] = cur
+                m += 1
+                dr = _sign(edges[cur,2] - edges[cur,0])
+                dc = _sign(edges[cur,3] - edges[cur,1])
+                p = _lower_bound(label, startkey, label[cur], endkey[cur])
+                f = -1
+                for q in range(p, min(p+2, n)):
+                    if label[q] != label[cur] or startkey[q] != endkey[cur]:
+                        break
+                    fdr = _sign(edges[q,2] - edges[q,0])
+                    fdc = _sign(edges[q,3] - edges[q,1])
+                    if f == -1 or (fdr == dc and fdc == -dr):
+                        f = q
+                if f == -1 or used[f]:
+                    break
+                cur = f
+
+            # keep the vertices where the direction changes
+            offsets[nring] = nvert
+            labels[nring] = label[first]
+            nring += 1
+            pdr = _sign(edges[ring[m-1],2] - edges[ring[m-1],0])
+            pdc = _sign(edges[ring[m-1],3] - edges[ring[m-1],1])
+            for p in range(m):
+                e = ring[p]
+                dr = _sign(edges[e,2] - edges[e,0])
+                dc = _sign(edges[e,3] - edges[e,1])
+                if dr != pdr or dc != pdc:
+                    rows[nvert] = edges[e,0]
+                    cols[nvert] = edges[e,1]
+                    nvert += 1
+                pdr = dr
+                pdc = dc
+        offsets[nring] = nvert
+    return rows[:nvert], cols[:nvert], offsets[:nring+1], labels[:nring]
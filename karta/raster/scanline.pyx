@@ -0,0 +1,645 @@
+""" Scanline polygon rasterization
+
+Polygon edges are given in fractional grid index space, where the cell (i, j)
+spans i <= v < i+1 and j <= u < j+1. A cell is inside a polygon when its
+center (j+0.5, i+0.5) is inside according to the even-odd or nonzero winding
+rule. Rows are processed with an active edge table, and interiors are returned
+as runs of cells (spans) so that callers can build masks, labels, or
+reductions without allocating full-size intermediate arrays.
+"""
+
+import numpy as np
+cimport numpy as np
+cimport cython
+from libc.math cimport ceil, floor, fabs, isfinite
+from libc.stdlib cimport malloc, realloc, free, qsort
+
+cdef struct Crossing:
+    double u
+    int winding
+
+cdef int _cmp_crossing(const void *a, const void *b) nogil:
+    cdef double ua = (<Crossing*>a).u
+    cdef double ub = (<Crossing*>b).u
+    if ua < ub:
+        return -1
+    elif ua > ub:
+        return 1
+    return 0
+
+cdef struct SpanBuffer:
+    int *rows
+    int *starts
+    int *ends
+    Py_ssize_t n
+    Py_ssize_t capacity
+
+cdef int _push_span(SpanBuffer *buf, int row, int start, int end) nogil:
+    cdef Py_ssize_t cap
+    cdef int *tmp
+    if buf.n == buf.capacity:
+        cap = 2*buf.capacity
+        tmp = <int*> realloc(buf.rows, cap*sizeof(int))
+        if tmp == NULL:
+            return -1
+        buf.rows = tmp
+        tmp = <int*> realloc(buf.starts, cap*sizeof(int))
+        if tmp == NULL:
+            return -1
+        buf.starts = tmp
+        tmp = <int*> realloc(buf.ends, cap*sizeof(int))
+        if tmp == NULL:
+            return -1
+        buf.ends = tmp
+        buf.capacity = cap
+    buf.rows[buf.n] = row
+    buf.starts[buf.n] = start
+    buf.ends[buf.n] = end
+    buf.n += 1
+    return 0
+
+cdef inline int _first_cell(double u, int ncols) nogil:
+    # first column whose center is at or to the right of u
+    cdef double c = ceil(u - 0.5)
+    if c < 0:
+        return 0
+    elif c > ncols:
+        return ncols
+    return <int> c
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+def polygon_spans(double[:,:] edges not None, int nrows, int ncols,
+                  bint nonzero=False):
+    """ Return the runs of grid cells inside the polygon formed by *edges*.
+
+    Parameters
+    ----------
+    edges : (n x 4) array of doubles
+        edges (u0, v0, u1, v1) in fractional column (u) and row (v) indices.
+        Edges from all rings of one or more polygons may be combined.
+    nrows, ncols : int
+        size of the output region
+    nonzero : bool, optional
+        use the nonzero winding rule rather than the even-odd rule (default
+        False)
+
+    Returns
+    -------
+    (rows, starts, ends) : three int32 arrays
+        row index and half-open column range of each span, ordered by row
+    """
+    cdef Py_ssize_t n = edges.shape[0]
+    cdef Py_ssize_t k, m, nactive, ncross, nnew
+    cdef int row, rowmin, rowmax, istart, iend, w, start
+    cdef double u0, v0, u1, v1, vmin, vmax, du
+
+    if edges.shape[1] != 4:
+        raise ValueError("edges must have shape (n, 4)")
+
+    cdef int[:] first = np.empty(n, dtype=np.int32)
+    cdef int[:] last = np.empty(n, dtype=np.int32)
+    cdef double[:] ufirst = np.empty(n, dtype=np.float64)
+    cdef double[:] slope = np.empty(n, dtype=np.float64)
+    cdef int[:] direction = np.empty(n, dtype=np.int32)
+    cdef np.ndarray[np.int32_t] rows, starts, ends
+
+    # build the edge table, keeping only edges that cross a row center
+    m = 0
+    for k in range(n):
+        u0 = edges[k,0]
+        v0 = edges[k,1]
+        u1 = edges[k,2]
+        v1 = edges[k,3]
+        # skip horizontal edges and edges with non-finite coordinates
+        if v0 == v1 or not (isfinite(u0) and isfinite(v0) and
+                            isfinite(u1) and isfinite(v1)):
+            continue
+        if v0 < v1:
+            vmin = v0
+            vmax = v1
+            direction[m] = 1
+        else:
+            vmin = v1
+            vmax = v0
+            direction[m] = -1
+        # rows i where vmin <= i+0.5 < vmax
+        istart = <int> max(ceil(vmin - 0.5), 0.0)
+        iend = <int> min(ceil(vmax - 0.5), <double> nrows) - 1
+        if istart > iend:
+            continue
+        du = (u1 - u0) / (v1 - v0)
+        first[m] = istart
+        last[m] = iend
+        ufirst[m] = u0 + (istart + 0.5 - v0) * du
+        slope[m] = du
+        m += 1
+
+    if m == 0:
+        return (np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int32),
+                np.empty(0, dtype=np.int32))
+
+    cdef Py_ssize_t[:] order = np.argsort(np.asarray(first[:m]),
+                                          kind="mergesort").astype(np.intp)
+    rowmin = first[order[0]]
+    rowmax = np.asarray(last[:m]).max()
+
+    cdef Py_ssize_t *active = <Py_ssize_t*> malloc(m*sizeof(Py_ssize_t))
+    cdef Crossing *crossings = <Crossing*> malloc(m*sizeof(Crossing))
+    cdef SpanBuffer buf
+    buf.capacity = 1024
+    buf.n = 0
+    buf.rows = <int*> malloc(buf.capacity*sizeof(int))
+    buf.starts = <int*> malloc(buf.capacity*sizeof(int))
+    buf.ends = <int*> malloc(buf.capacity*sizeof(int))
+    cdef int err = 0
+
+    try:
+        if (active == NULL or crossings == NULL or buf.rows == NULL or
+                buf.starts == NULL or buf.ends == NULL):
+            raise MemoryError()
+
+        with nogil:
+            nactive = 0
+            nnew = 0
+            for row in range(rowmin, rowmax+1):
+
+                # retire finished edges and activate new ones
+                k = 0
+                for ncross in range(nactive):
+                    if last[active[ncross]] >= row:
+                        active[k] = active[ncross]
+                        k += 1
+                nactive = k
+                while nnew < m and first[order[nnew]] == row:
+                    active[nactive] = order[nnew]
+                    nactive += 1
+                    nnew += 1
+
+                if nactive == 0:
+                    continue
+
+                for k in range(nactive):
+                    crossings[k].u = ufirst[active[k]] + \
+                            (row - first[active[k]]) * slope[active[k]]
+                    crossings[k].winding = direction[active[k]]
+                qsort(crossings, nactive, sizeof(Crossing), _cmp_crossing)
+
+                if nonzero:
+                    w = 0
+                    start = 0
+                    for k in range(nactive):
+                        if w == 0:
+                            start = _first_cell(crossings[k].u, ncols)
+                        w += crossings[k].winding
+                        if w == 0:
+                            iend = _first_cell(crossings[k].u, ncols)
+                            if iend > start:
+                                err = _push_span(&buf, row, start, iend)
+                                if err != 0:
+                                    break
+                else:
+                    k = 0
+                    while k+1 < nactive:
+                        start = _first_cell(crossings[k].u, ncols)
+                        iend = _first_cell(crossings[k+1].u, ncols)
+                        if iend > start:
+                            err = _push_span(&buf, row, start, iend)
+                            if err != 0:
+                                break
+                        k += 2
+                if err != 0:
+                    break
+
+        if err != 0:
+            raise MemoryError()
+
+        rows = np.empty(buf.n, dtype=np.int32)
+        starts = np.empty(buf.n, dtype=np.int32)
+        ends = np.empty(buf.n, dtype=np.int32)
+        for k in range(buf.n):
+            rows[k] = buf.rows[k]
+            starts[k] = buf.starts[k]
+            ends[k] = buf.ends[k]
+    finally:
+        free(active)
+        free(crossings)
+        free(buf.rows)
+        free(buf.starts)
+        free(buf.ends)
+    return rows, starts, ends
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def spans_to_mask(int[:] rows not None, int[:] starts not None,
+                  int[:] ends not None, int nrows, int ncols):
+    """ Return a boolean (nrows x ncols) mask that is True within spans. """
+    cdef np.ndarray[np.uint8_t, ndim=2] mask = np.zeros((nrows, ncols), dtype=np.uint8)
+    cdef Py_ssize_t k, j
+    with nogil:
+        for k in range(rows.shape[0]):
+            for j in range(starts[k], ends[k]):
+                mask[rows[k], j] = 1
+    return mask.view(np.bool_)
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def spans_to_packed(int[:] rows not None, int[:] starts not None,
+                    int[:] ends not None, int nrows, int ncols):
+    """ Return a bit-packed mask of shape (nrows, ceil(ncols/8)) that is set
+    within spans. Bits are ordered as by `numpy.packbits`, so that
+    `numpy.unpackbits(mask, axis=1)[:,:ncols]` recovers the boolean mask. """
+    cdef Py_ssize_t nbytes = (ncols + 7) // 8
+    cdef np.ndarray[np.uint8_t, ndim=2] mask = np.zeros((nrows, nbytes), dtype=np.uint8)
+    cdef Py_ssize_t k, b, b0, b1
+    cdef int j0, j1
+    with nogil:
+        for k in range(rows.shape[0]):
+            j0 = starts[k]
+            j1 = ends[k]
+            if j1 <= j0:
+                continue
+            b0 = j0 >> 3
+            b1 = (j1 - 1) >> 3
+            if b0 == b1:
+                mask[rows[k], b0] |= (0xff >> (j0 & 7)) & (0xff << (7 - ((j1-1) & 7)))
+            else:
+                mask[rows[k], b0] |= 0xff >> (j0 & 7)
+                for b in range(b0+1, b1):
+                    mask[rows[k], b] = 0xff
+                mask[rows[k], b1] |= 0xff << (7 - ((j1-1) & 7))
+    return mask
+
+ctypedef fused fill_t:
+    np.uint8_t
+    np.int32_t
+    np.int64_t
+    np.float32_t
+    np.float64_t
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def fill_spans(int[:] rows not None, int[:] starts not None,
+               int[:] ends not None, fill_t[:,:] out not None, fill_t value):
+    """ Set cells of *out* within spans to *value*. """
+    cdef Py_ssize_t k, j
+    with nogil:
+        for k in range(rows.shape[0]):
+            for j in range(starts[k], ends[k]):
+                out[rows[k], j] = value
+    return
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef inline void _accumulate_piece(double[:,:] acc, int row, int ncols,
+                                   int col, double umid, double h) nogil:
+    # an edge piece within cell (row, col) with mean column position *umid*
+    # and signed height *h* covers the part of the cell to its right, and all
+    # cells to the right of it
+    cdef double frac
+    if col < 0:
+        acc[row, 0] += h
+    elif col < ncols:
+        frac = umid - col
+        acc[row, col] += h * (1.0 - frac)
+        if col + 1 < ncols:
+            acc[row, col+1] += h * frac
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+def polygon_coverage(double[:,:] edges not None, int nrows, int ncols):
+    """ Return the fraction of each grid cell covered by the polygon formed by
+    *edges*.
+
+    Each edge adds the signed area between itself and the right side of the
+    region to the cells it passes through, and coverage is recovered by a
+    cumulative sum along rows, so that the work per edge is proportional to
+    the number of boundary cells it crosses. The result is exact for
+    polygons whose outer rings and holes wind in opposite directions (see
+    ``_ring_edges(..., orient=True)``). Where polygons overlap, coverage is
+    limited to one.
+
+    Parameters
+    ----------
+    edges : (n x 4) array of doubles
+        edges (u0, v0, u1, v1) in fractional column (u) and row (v) indices,
+        where cell (i, j) spans i <= v < i+1 and j <= u < j+1
+    nrows, ncols : int
+        size of the output region
+
+    Returns
+    -------
+    ndarray
+        (nrows x ncols) array of coverage fractions between zero and one
+    """
+    cdef Py_ssize_t n = edges.shape[0]
+    cdef Py_ssize_t k
+    cdef int row, col, c0, c1, sign
+    cdef double u0, v0, u1, v1, vstart, vend, va, vb, ua, ub, umin, umax
+    cdef double dudv, dy, p, q, s
+
+    if edges.shape[1] != 4:
+        raise ValueError("edges must have shape (n, 4)")
+
+    cdef np.ndarray[np.float64_t, ndim=2] out = np.zeros((max(nrows, 0), max(ncols, 0)),
+                                                        dtype=np.float64)
+    if nrows <= 0 or ncols <= 0:
+        return out
+    cdef double[:,:] acc = out
+
+    with nogil:
+        for k in range(n):
+            u0 = edges[k,0]
+            v0 = edges[k,1]
+            u1 = edges[k,2]
+            v1 = edges[k,3]
+            if not (v0 != v1):      # horizontal edges enclose no area
+                continue
+            sign = 1
+            if v0 > v1:
+                u0, v0, u1, v1 = u1, v1, u0, v0
+                sign = -1
+            vstart = max(v0, 0.0)
+            vend = min(v1, <double> nrows)
+            if not (vstart < vend):
+                continue
+            dudv = (u1 - u0) / (v1 - v0)
+
+            for row in range(<int> vstart, <int> ceil(vend)):
+                va = max(vstart, <double> row)
+                vb = min(vend, <double> (row + 1))
+                if not (va < vb):
+                    continue
+                ua = u0 + (va - v0) * dudv
+                ub = u0 + (vb - v0) * dudv
+                dy = sign * (vb - va)
+                if ua < ub:
+                    umin = ua
+                    umax = ub
+                else:
+                    umin = ub
+                    umax = ua
+
+                if not (umin < umax):
+                    # vertical within this row
+                    col = <int> floor(umin)
+                    _accumulate_piece(acc, row, ncols, col, umin, dy)
+                    continue
+
+                # part left of the region covers whole row
+                if umin < 0:
+                    q = min(umax, 0.0)
+                    acc[row, 0] += dy * (q - umin) / (umax - umin)
+                c0 = <int> floor(max(umin, 0.0))
+                c1 = <int> min(floor(umax), <double> (ncols - 1))
+                for col in range(c0, c1+1):
+                    p = max(umin, <double> col)
+                    q = min(umax, <double> (col + 1))
+                    if q > p:
+                        _accumulate_piece(acc, row, ncols, col, 0.5*(p+q),
+                                          dy * (q - p) / (umax - umin))
+
+        for row in range(nrows):
+            s = 0.0
+            for col in range(ncols):
+                s += acc[row, col]
+                p = fabs(s)
+                if p < 1e-12:
+                    p = 0.0
+                elif p > 1.0 - 1e-12:
+                    p = 1.0
+                acc[row, col] = p
+    return out
+
+# Methods for combining burned values with values already burned into a cell
+cdef enum:
+    _MERGE_REPLACE = 0
+    _MERGE_ADD = 1
+    _MERGE_MAX = 2
+    _MERGE_MIN = 3
+
+MERGE_REPLACE = _MERGE_REPLACE
+MERGE_ADD = _MERGE_ADD
+MERGE_MAX = _MERGE_MAX
+MERGE_MIN = _MERGE_MIN
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef inline void _burn(double[:,:] out, np.uint8_t[:,:] touched, int i, int j,
+                       double value, int merge) nogil:
+    if touched[i,j] == 0:
+        out[i,j] = value
+        touched[i,j] = 1
+    elif merge == _MERGE_ADD:
+        out[i,j] += value
+    elif merge == _MERGE_MAX:
+        if value > out[i,j]:
+            out[i,j] = value
+    elif merge == _MERGE_MIN:
+        if value < out[i,j]:
+            out[i,j] = value
+    else:
+        out[i,j] = value
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def burn_points(double[:] u not None, double[:] v not None,
+                double[:] values not None, double[:,:] out not None,
+                np.uint8_t[:,:] touched not None, int merge):
+    """ Burn *values* into the cells of *out* containing points (u, v), given
+    in fractional column and row indices. Cells that receive a value are
+    marked in *touched*, and values burned into a touched cell are combined
+    according to *merge* (one of the MERGE_* constants). """
+    cdef Py_ssize_t k
+    cdef int i, j
+    cdef int nrows = out.shape[0]
+    cdef int ncols = out.shape[1]
+    with nogil:
+        for k in range(u.shape[0]):
+            if not (u[k] >= 0 and u[k] < ncols and v[k] >= 0 and v[k] < nrows):
+                continue
+            i = <int> v[k]
+            j = <int> u[k]
+            _burn(out, touched, i, j, values[k], merge)
+    return
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def burn_spans(int[:] rows not None, int[:] starts not None,
+               int[:] ends not None, double value, double[:,:] out not None,
+               np.uint8_t[:,:] touched not None, int merge):
+    """ Burn *value* into the cells of *out* within spans. """
+    cdef Py_ssize_t k, j
+    with nogil:
+        for k in range(rows.shape[0]):
+            for j in range(starts[k], ends[k]):
+                _burn(out, touched, rows[k], j, value, merge)
+    return
+
+cdef inline int _clamp(int a, int lo, int hi) nogil:
+    if a < lo:
+        return lo
+    elif a > hi:
+        return hi
+    return a
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+def burn_lines(double[:] u not None, double[:] v not None,
+               np.int64_t[:] starts not None, np.int64_t[:] ends not None,
+               double[:] values not None,
+               double[:,:] out not None, np.uint8_t[:,:] touched not None,
+               int merge):
+    """ Burn *values* into every cell of *out* crossed by polylines.
+
+    Polyline *k* has vertices ``u[starts[k]:ends[k]]``,
+    ``v[starts[k]:ends[k]]`` in fractional column and row indices.
+    Segments are clipped to the output region and traversed cell by cell with
+    a digital differential analyzer, so that the cells visited form a
+    4-connected path, except that segments passing exactly through a cell
+    corner step diagonally. A cell shared by consecutive segments of a
+    polyline is burned once.
+    """
+    cdef Py_ssize_t p, k
+    cdef int nrows = out.shape[0]
+    cdef int ncols = out.shape[1]
+    cdef int row, col, endrow, endcol, stepr, stepc, nr, nc, lastr, lastc, side
+    cdef double ua, va, du, dv, t0, t1, pp, qq, r, xa, ya, xb, yb
+    cdef double tmc, tmr
+    cdef int offc, offr
+    cdef double inf = float("inf")
+    cdef double value
+
+    if nrows == 0 or ncols == 0:
+        return
+
+    with nogil:
+        for p in range(starts.shape[0]):
+            value = values[p]
+            lastr = -1
+            lastc = -1
+            if ends[p] - starts[p] == 1:
+                k = starts[p]
+                if u[k] >= 0 and u[k] < ncols and v[k] >= 0 and v[k] < nrows:
+                    _burn(out, touched, <int> v[k], <int> u[k], value, merge)
+                continue
+
+            for k in range(starts[p], ends[p]-1):
+                ua = u[k]
+                va = v[k]
+                du = u[k+1] - ua
+                dv = v[k+1] - va
+
+                # Liang-Barsky clipping to 0 <= u <= ncols, 0 <= v <= nrows,
+                # excluding segments along the edges u = ncols and v = nrows
+                t0 = 0.0
+                t1 = 1.0
+                for side in range(4):
+                    if side == 0:
+                        pp = -du
+                        qq = ua
+                    elif side == 1:
+                        pp = du
+                        qq = ncols - ua
+                    elif side == 2:
+                        pp = -dv
+                        qq = va
+                    else:
+                        pp = dv
+                        qq = nrows - va
+                    if pp == 0:
+                        # segments along an edge belong to the cells after it
+                        if qq < 0 or (qq == 0 and side % 2 == 1):
+                            t0 = 2.0
+                    else:
+                        r = qq / pp
+                        if pp < 0:
+                            if r > t0:
+                                t0 = r
+                        elif r < t1:
+                            t1 = r
+                # skip segments that only touch the region, which are burned
+                # in the neighbouring region if at all, so that results do
+                # not depend on how the grid is divided into chunks
+                if not (t0 < t1):       # also rejects NaN
+                    continue
+
+                xa = ua + t0*du
+                ya = va + t0*dv
+                xb = ua + t1*du
+                yb = va + t1*dv
+
+                # cells containing the start and end of the clipped segment,
+                # assigning points on cell boundaries to the cell entered
+                # or left
+                if du > 0:
+                    stepc = 1
+                    col = <int> floor(xa)
+                    endcol = <int> ceil(xb) - 1
+                elif du < 0:
+                    stepc = -1
+                    col = <int> ceil(xa) - 1
+                    endcol = <int> floor(xb)
+                else:
+                    stepc = 1
+                    col = <int> floor(xa)
+                    endcol = col
+                if dv > 0:
+                    stepr = 1
+                    row = <int> floor(ya)
+                    endrow = <int> ceil(yb) - 1
+                elif dv < 0:
+                    stepr = -1
+                    row = <int> ceil(ya) - 1
+                    endrow = <int> floor(yb)
+                else:
+                    stepr = 1
+                    row = <int> floor(ya)
+                    endrow = row
+                col = _clamp(col, 0, ncols-1)
+                endcol = _clamp(endcol, 0, ncols-1)
+                row = _clamp(row, 0, nrows-1)
+                endrow = _clamp(endrow, 0, nrows-1)
+                if (endcol - col) * stepc < 0:
+                    endcol = col
+                if (endrow - row) * stepr < 0:
+                    endrow = row
+                nc = (endcol - col) * stepc
+                nr = (endrow - row) * stepr
+
+                # parameters of the next column and row boundaries along the
+                # segment, computed from its start rather than accumulated,
+                # so that crossings of cell corners are found exactly
+                offc = 1 if du > 0 else 0
+                offr = 1 if dv > 0 else 0
+                tmc = (col + offc - ua) / du if du != 0 else inf
+                tmr = (row + offr - va) / dv if dv != 0 else inf
+
+                while True:
+                    if row != lastr or col != lastc:
+                        _burn(out, touched, row, col, value, merge)
+                        lastr = row
+                        lastc = col
+                    if nc == 0 and nr == 0:
+                        break
+                    if nc != 0 and nr != 0 and tmc == tmr:
+                        # through a cell corner, step diagonally so that
+                        # the cells burned do not depend on chunking
+                        col += stepc
+                        nc -= 1
+                        tmc = (col + offc - ua) / du
+                        row += stepr
+                        nr -= 1
+                        tmr = (row + offr - va) / dv
+                    elif nr == 0 or (nc != 0 and tmc < tmr):
+                        col += stepc
+                        nc -= 1
+                        tmc = (col + offc - ua) / du
+                    else:
+                        row += stepr
+                        nr -= 1
+                        tmr = (row + offr - va) / dv
+    return
@@ -0,0 +1,183 @@
+"""
+Streaming quantile estimation
+"""
+
+import math
+import numpy as np
+
+class QuantileSketch(object):
+    """ Streaming quantile estimator with bounded error.
+
+    Values are counted in a histogram of at most *nbins* equal bins whose
+    width is a power of two. Bin edges are multiples of the width, so when
+    values arrive outside the current bins, the width is doubled by merging
+    pairs of bins until the histogram spans every value seen. The bin width is
+    therefore at most *error* times the range of the values, which bounds the
+    error of estimated quantiles. Sketches can be merged, so that values may
+    be summarized in parts.
+
+    Parameters
+    ----------
+    error : float, optional
+        maximum error of estimated quantiles, as a fraction of the range of
+        values (default 1e-3)
+
+    Example
+    -------
+    ::
+
+        sketch = QuantileSketch(error=1e-3)
+        for chunk in grid.aschunks():
+            sketch.update(chunk[:,:,0])
+        lower, upper = sketch.quantiles([0.02, 0.98])
+    """
+
+    def __init__(self, error=1e-3):
+        if not 0 < error < 1:
+            raise ValueError("error must be between 0 and 1")
+        self.error = error
+        self.nbins = int(math.ceil(2.0/error)) + 2
+        self.count = 0
+        self.min = np.nan
+        self.max = np.nan
+        self._exponent = None
+        self._offset = 0
+        self._counts = np.zeros(0, dtype=np.int64)
+        return
+
+    def _fit_exponent(self, vmin, vmax):
+        """ Return the smallest bin width exponent at least the current
+        exponent for which bins span [vmin, vmax]. """
+        # bin indices must fit comfortably in int64
+        scale = max(abs(vmin), abs(vmax))
+        e = math.frexp(scale)[1] - 60 if scale != 0 else -60
+        if vmax > vmin:
+            e = max(e, int(math.ceil(math.log((vmax-vmin)/(self.nbins-1), 2))))
+        if self._exponent is not None:
+            e = max(e, self._exponent)
+        while (math.floor(math.ldexp(vmax, -e)) -
+               math.floor(math.ldexp(vmin, -e)) + 1) > self.nbins:
+            e += 1
+        return e
+
+    def _rebin(self, exponent):
+        """ Merge bins to a larger width. """
+        shift = exponent - self._exponent
+        if shift != 0 and len(self._counts) != 0:
+            k = (np.arange(len(self._counts), dtype=np.int64) + self._offset) >> shift
+            offset = self._offset >> shift
+            self._counts = np.bincount(k - offset, weights=self._counts).astype(np.int64)
+            self._offset = offset
+        self._exponent = exponent
+        return
+
+    def _add_counts(self, offset, counts):
+        if len(self._counts) == 0:
+            self._offset, self._counts = offset, counts
+            return
+        start = min(self._offset, offset)
+        stop = max(self._offset + len(self._counts), offset + len(counts))
+        merged = np.zeros(stop - start, dtype=np.int64)
+        merged[self._offset-start:self._offset-start+len(self._counts)] += self._counts
+        merged[offset-start:offset-start+len(counts)] += counts
+        self._offset, self._counts = start, merged
+        return
+
+    def update(self, values):
+        """ Add an array of values to the sketch. NaN values are ignored.
+
+        Parameters
+        ----------
+        values : array-like
+        """
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return
+        vmin = values.min()
+        vmax = values.max()
+        if not np.isfinite(vmin) or not np.isfinite(vmax):
+            raise ValueError("values must be finite or NaN")
+        if self.count != 0:
+            vmin = min(vmin, self.min)
+            vmax = max(vmax, self.max)
+
+        exponent = self._fit_exponent(vmin, vmax)
+        if self._exponent is None:
+            self._exponent = exponent
+        else:
+            self._rebin(exponent)
+
+        k = np.floor(np.ldexp(values, -exponent)).astype(np.int64)
+        offset = int(k.min())
+        self._add_counts(offset, np.bincount(k - offset))
+        self.count += len(values)
+        self.min = vmin
+        self.max = vmax
+        return
+
+    def merge(self, other):
+        """ Add the values summarized by another sketch to this sketch. The
+        error of this sketch is retained.
+
+        Parameters
+        ----------
+        other : QuantileSketch
+        """
+        if other.count == 0:
+            return
+        vmin = other.min if self.count == 0 else min(self.min, other.min)
+        vmax = other.max if self.count == 0 else max(self.max, other.max)
+        exponent = max(self._fit_exponent(vmin, vmax), other._exponent)
+        if self._exponent is None:
+            self._exponent = exponent
+        else:
+            self._rebin(exponent)
+
+        shift = exponent - other._exponent
+        k = (np.arange(len(other._counts), dtype=np.int64) + other._offset) >> shift
+        offset = other._offset >> shift
+        self._add_counts(offset, np.bincount(k - offset, weights=other._counts)
+                                   .astype(np.int64))
+        self.count += other.count
+        self.min = vmin
+        self.max = vmax
+        return
+
+    def quantiles(self, qs):
+        """ Estimate quantiles of the values added to the sketch.
+
+        Parameters
+        ----------
+        qs : float or array-like
+            quantiles to estimate, between 0 and 1
+
+        Returns
+        -------
+        float or ndarray
+            estimated quantiles, which are NaN if the sketch is empty
+        """
+        qs_ = np.asarray(qs, dtype=np.float64)
+        if np.any((qs_ < 0) | (qs_ > 1)):
+            raise ValueError("quantiles must be between 0 and 1")
+        if self.count == 0:
+            return np.full_like(qs_, np.nan)[()]
+
+        # values in each bin are treated as evenly spread through the bin, and
+        # quantiles interpolate between the estimated values of neighbouring
+        # ranks, as in numpy.percentile. The extreme values are known exactly.
+        cumulative = np.cumsum(self._counts)
+        width = math.ldexp(1.0, self._exponent)
+
+        def value(rank):
+            b = np.searchsorted(cumulative, rank, side="right")
+            below = cumulative[b] - self._counts[b]
+            v = (self._offset + b + (rank - below + 0.5) / self._counts[b]) * width
+            return np.where(rank == 0, self.min,
+                            np.where(rank == self.count-1, self.max, v))
+
+        pos = qs_ * (self.count - 1)
+        lower = np.floor(pos)
+        vlower = value(lower)
+        result = vlower + (value(np.minimum(lower+1, self.count-1)) - vlower) * (pos - lower)
+        return np.clip(result, self.min, self.max)[()]
@@ -0,0 +1,226 @@
+"""
+Stacks of co-registered grids
+
+A `RasterStack` is a sequence of grids with the same transform and size,
+such as a time series. Reductions over the stack are computed chunk by
+chunk in a pool of threads, reading each chunk from every grid in turn, so
+that only a few chunks of all time steps are held in memory at once.
+"""
+
+import numpy as np
+from .grid import RegularGrid
+from .misc import _chunks, _read_halo, _map_chunks
+from .read import read_geotiff
+from ..errors import GridError
+
+def _count(block):
+    return (~np.isnan(block)).sum(axis=0)
+
+def _mean(block):
+    n = _count(block)
+    total = np.where(np.isnan(block), 0.0, block).sum(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(n != 0, total/n, np.nan)
+
+def _percentile(block, q):
+    """ Percentiles of valid values, interpolated linearly as by
+    `numpy.percentile`. """
+    n = _count(block)
+    if n.size != 0 and n.min() == n.max() != 0:
+        # the same number of values in every cell needs only a partial sort
+        pos = q/100.0*(n.flat[0]-1)
+        lo = int(np.floor(pos))
+        hi = min(lo+1, n.flat[0]-1)
+        s = np.partition(block, (lo, hi), axis=0)
+        return s[lo] + (pos-lo)*(s[hi]-s[lo])
+    s = np.sort(block, axis=0)
+    pos = q/100.0*np.maximum(n-1, 0)
+    lo = np.floor(pos).astype(np.intp)
+    hi = np.minimum(lo+1, np.maximum(n-1, 0))
+    vlo = np.take_along_axis(s, lo[np.newaxis], axis=0)[0]
+    vhi = np.take_along_axis(s, hi[np.newaxis], axis=0)[0]
+    out = vlo + (pos-lo)*(vhi-vlo)
+    out[n == 0] = np.nan
+    return out
+
+def _argmax(block):
+    out = np.where(np.isnan(block), -np.inf, block).argmax(axis=0)
+    out = out.astype(np.int32)
+    out[_count(block) == 0] = -1
+    return out
+
+def _trend(block, t):
+    """ Least squares slope of valid values against times *t*. """
+    valid = ~np.isnan(block)
+    n = valid.sum(axis=0)
+    T = np.where(valid, t[:,np.newaxis,np.newaxis], 0.0)
+    Z = np.where(valid, block, 0.0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        tm = T.sum(axis=0)/n
+        zm = Z.sum(axis=0)/n
+        dt = np.where(valid, T-tm, 0.0)
+        slope = (dt*(Z-zm)).sum(axis=0) / (dt*dt).sum(axis=0)
+    slope[n < 2] = np.nan
+    slope[~np.isfinite(slope)] = np.nan
+    return slope
+
+class RasterStack(object):
+    """ Sequence of co-registered grids, such as a time series.
+
+    Parameters
+    ----------
+    grids : list of RegularGrid
+        grids with equal transforms, sizes, and coordinate systems
+    times : list of numbers, optional
+        time of each grid, used by `trend` (default 0, 1, 2, ...)
+    band : int, optional
+        band of each grid in the stack (default 0)
+
+    Raises
+    ------
+    GridError
+        if grids are not co-registered
+    """
+
+    def __init__(self, grids, times=None, band=0):
+        grids = list(grids)
+        if len(grids) == 0:
+            raise ValueError("at least one grid must be provided")
+        for grid in grids[1:]:
+            if grid.size != grids[0].size or \
+                    grid.transform != grids[0].transform or \
+                    grid.crs != grids[0].crs:
+                raise GridError("grids in a stack must have the same size, "
+                                "transform, and coordinate system")
+        if times is None:
+            times = np.arange(len(grids), dtype=np.float64)
+        else:
+            times = np.asarray(times, dtype=np.float64)
+            if times.shape != (len(grids),):
+                raise ValueError("one time is required per grid")
+        self.grids = grids
+        self.times = times
+        self.band = band
+        return
+
+    @classmethod
+    def from_grid(cls, grid, times=None):
+        """ Return a stack of the bands of a grid. """
+        grids = [RegularGrid(grid.transform, bands=[band], crs=grid.crs,
+                             nodata_value=grid.nodata) for band in grid.bands]
+        return cls(grids, times=times)
+
+    @classmethod
+    def from_geotiffs(cls, fnms, times=None, in_memory=False, **kw):
+        """ Return a stack of the first bands of GeoTiff files. By default,
+        files are read a chunk at a time as needed.
+
+        Parameters
+        ----------
+        fnms : list of str
+            GeoTiff file paths
+        times : list of numbers, optional
+            time of each file
+        in_memory : bool, optional
+            if True, read entire datasets into memory (default False)
+        """
+        grids = [read_geotiff(fnm, in_memory=in_memory, ibands=1, **kw)
+                 for fnm in fnms]
+        return cls(grids, times=times)
+
+    def __len__(self):
+        return len(self.grids)
+
+    def __getitem__(self, index):
+        return self.grids[index]
+
+    @property
+    def size(self):
+        return self.grids[0].size
+
+    @property
+    def transform(self):
+        return self.grids[0].transform
+
+    @property
+    def crs(self):
+        return self.grids[0].crs
+
+    def read_chunk(self, i0, i1, j0, j1):
+        """ Return rows i0 to i1 and columns j0 to j1 of every grid as a
+        float64 array of shape (len(stack), i1-i0, j1-j0), with NoData as
+        NaN. """
+        block = np.empty((len(self.grids), i1-i0, j1-j0), dtype=np.float64)
+        for k, grid in enumerate(self.grids):
+            block[k] = _read_halo(grid, self.band, (i0, i1, j0, j1),
+                                  np.float64, halo=(0, 0))
+        return block
+
+    def reduce(self, func, dtype=np.float64, nodata_value=np.nan,
+               chunksize=None, nthreads=None):
+        """ Reduce the stack cell by cell, one chunk at a time.
+
+        Parameters
+        ----------
+        func : callable
+            function taking an array of shape (len(stack), ny, nx) with
+            NoData as NaN, and returning an array of shape (ny, nx)
+        dtype : numpy dtype, optional
+            type of the output (default float64)
+        nodata_value : number, optional
+            NoData value of the output (default NaN)
+        chunksize : tuple of two ints, optional
+            size of chunks to process at once (default the chunk size of the
+            first grid, or (256, 256))
+        nthreads : int, optional
+            number of threads to use (default number of CPUs)
+
+        Returns
+        -------
+        RegularGrid
+        """
+        first = self.grids[0]
+        if chunksize is None:
+            chunksize = getattr(first.bands[self.band], "_chunksize", (256, 256))
+        out = first._bndcls(self.size, dtype, initval=nodata_value)
+        read = lambda c: self.read_chunk(*c)
+        for chunk, result in _map_chunks(_chunks(self.size, chunksize), read,
+                                         func, nthreads):
+            out.setblock(chunk[0], chunk[2], result.astype(dtype))
+        return RegularGrid(self.transform, bands=[out], crs=self.crs,
+                           nodata_value=nodata_value)
+
+    def count(self, chunksize=None, nthreads=None):
+        """ Return an int32 grid of the number of valid values of each cell.
+        """
+        return self.reduce(_count, dtype=np.int32, nodata_value=-1,
+                           chunksize=chunksize, nthreads=nthreads)
+
+    def mean(self, chunksize=None, nthreads=None):
+        """ Return the mean of the valid values of each cell, or NaN. """
+        return self.reduce(_mean, chunksize=chunksize, nthreads=nthreads)
+
+    def percentile(self, q, chunksize=None, nthreads=None):
+        """ Return the *q*-th percentile (0 <= q <= 100) of the valid values
+        of each cell, interpolated linearly between values, or NaN. """
+        if not 0 <= q <= 100:
+            raise ValueError("percentile must be between 0 and 100")
+        return self.reduce(lambda b: _percentile(b, q), chunksize=chunksize,
+                           nthreads=nthreads)
+
+    def median(self, chunksize=None, nthreads=None):
+        """ Return the median of the valid values of each cell, or NaN. """
+        return self.percentile(50, chunksize=chunksize, nthreads=nthreads)
+
+    def argmax(self, chunksize=None, nthreads=None):
+        """ Return an int32 grid of the index of the grid with the largest
+        valid value of each cell, or -1 if no value is valid. """
+        return self.reduce(_argmax, dtype=np.int32, nodata_value=-1,
+                           chunksize=chunksize, nthreads=nthreads)
+
+    def trend(self, chunksize=None, nthreads=None):
+        """ Return the least squares slope of the valid values of each cell
+        against the times of the stack, or NaN if there are fewer than two
+        valid values at different times. """
+        return self.reduce(lambda b: _trend(b, self.times),
+                           chunksize=chunksize, nthreads=nthreads)
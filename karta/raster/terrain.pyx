@@ -0,0 +1,148 @@
+""" Stencil kernels for terrain analysis
+
+Kernels operate on a block of values with a one-cell halo, so that a grid can
+be processed one chunk at a time. Input blocks have shape (h+2, w+2) and
+outputs have shape (h, w). Nodata is represented by NaN, which propagates to
+every output cell whose neighbourhood contains it. Kernels release the GIL so
+that chunks may be processed by several threads.
+
+Derivatives use the 3x3 Sobel operator, with x increasing along rows and y
+increasing down columns.
+"""
+
+import numpy as np
+cimport numpy as np
+cimport cython
+from libc.math cimport sqrt, atan2, NAN
+
+ctypedef fused floating:
+    np.float32_t
+    np.float64_t
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+cdef inline void _sobel(floating[:,:] D, Py_ssize_t i, Py_ssize_t j,
+                        floating xdiv, floating ydiv,
+                        floating *gx, floating *gy) nogil:
+    # derivatives at block cell (i, j), which is (i+1, j+1) in D. The
+    # operator does not use the center value, so NaN is propagated explicitly.
+    if D[i+1,j+1] != D[i+1,j+1]:
+        gx[0] = NAN
+        gy[0] = NAN
+        return
+    gx[0] = ((2 * D[i+1,j+2] + D[i,j+2] + D[i+2,j+2]) -
+             (2 * D[i+1,j] + D[i,j] + D[i+2,j])) / xdiv
+    gy[0] = ((2 * D[i+2,j+1] + D[i+2,j+2] + D[i+2,j]) -
+             (2 * D[i,j+1] + D[i,j] + D[i,j+2])) / ydiv
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def gradient(floating[:,:] D not None, double dx, double dy,
+             floating[:,:] gx not None, floating[:,:] gy not None):
+    """ Compute the x and y derivatives of *D*, storing them in *gx*, *gy*. """
+    cdef Py_ssize_t i, j
+    cdef floating xdiv = 8.0*dx
+    cdef floating ydiv = 8.0*dy
+    with nogil:
+        for i in range(gx.shape[0]):
+            for j in range(gx.shape[1]):
+                _sobel(D, i, j, xdiv, ydiv, &gx[i,j], &gy[i,j])
+    return
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def slope(floating[:,:] D not None, double dx, double dy,
+          floating[:,:] out not None):
+    """ Compute the slope magnitude of *D*, storing it in *out*. """
+    cdef Py_ssize_t i, j
+    cdef floating xdiv = 8.0*dx
+    cdef floating ydiv = 8.0*dy
+    cdef floating gx, gy
+    with nogil:
+        for i in range(out.shape[0]):
+            for j in range(out.shape[1]):
+                _sobel(D, i, j, xdiv, ydiv, &gx, &gy)
+                out[i,j] = sqrt(gx*gx + gy*gy)
+    return
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def aspect(floating[:,:] D not None, double dx, double dy,
+           floating[:,:] out not None):
+    """ Compute the slope aspect of *D* in radians, storing it in *out*. """
+    cdef Py_ssize_t i, j
+    cdef floating xdiv = 8.0*dx
+    cdef floating ydiv = 8.0*dy
+    cdef floating gx, gy
+    with nogil:
+        for i in range(out.shape[0]):
+            for j in range(out.shape[1]):
+                _sobel(D, i, j, xdiv, ydiv, &gx, &gy)
+                out[i,j] = atan2(gy, -gx)
+    return
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def max_gradient(floating[:,:] D not None, double dx, double dy):
+    """ Return the largest gradient magnitude of *D*, ignoring NaN, or NaN if
+    there are no valid values. """
+    cdef Py_ssize_t i, j
+    cdef floating xdiv = 8.0*dx
+    cdef floating ydiv = 8.0*dy
+    cdef floating gx, gy, m
+    cdef double mmax = NAN
+    with nogil:
+        for i in range(D.shape[0]-2):
+            for j in range(D.shape[1]-2):
+                _sobel(D, i, j, xdiv, ydiv, &gx, &gy)
+                m = sqrt(gx*gx + gy*gy)
+                if m == m and not (m <= mmax):
+                    mmax = m
+    return mmax
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+def hillshade(floating[:,:] D not None, double dx, double dy,
+              double sx, double sy, double sz, double[:,:] out not None):
+    """ Compute the illumination of the surface *D* by a light source in the
+    direction (sx, sy, sz), as the dot product with the unit surface normal,
+    storing it in *out*. """
+    cdef Py_ssize_t i, j
+    cdef floating xdiv = 8.0*dx
+    cdef floating ydiv = 8.0*dy
+    cdef floating rx = dx
+    cdef floating ry = dy
+    cdef floating gx, gy, w0, w1, w2, norm
+    with nogil:
+        for i in range(out.shape[0]):
+            for j in range(out.shape[1]):
+                _sobel(D, i, j, xdiv, ydiv, &gx, &gy)
+                # normal is the cross product of (rx, 0, gx) and (0, ry, gy)
+                w0 = -(gx*ry)
+                w1 = -(rx*gy)
+                w2 = rx*ry
+                norm = sqrt(w0*w0 + w1*w1 + w2*w2)
+                out[i,j] = (<double> (w0/norm) * sx + <double> (w1/norm) * sy) + \
+                           <double> (w2/norm) * sz
+    return
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def divergence(floating[:,:] U not None, floating[:,:] V not None,
+               double dx, double dy, floating[:,:] out not None):
+    """ Compute the divergence of the vector field (*U*, *V*) by central
+    differences, storing it in *out*. """
+    cdef Py_ssize_t i, j
+    cdef floating xdiv = 2.0*dx
+    cdef floating ydiv = 2.0*dy
+    with nogil:
+        for i in range(out.shape[0]):
+            for j in range(out.shape[1]):
+                if U[i+1,j+1] != U[i+1,j+1] or V[i+1,j+1] != V[i+1,j+1]:
+                    out[i,j] = NAN
+                else:
+                    out[i,j] = (U[i+1,j+2] - U[i+1,j]) / xdiv + \
+                               (V[i+2,j+1] - V[i,j+1]) / ydiv
+    return
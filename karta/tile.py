@@ -1,6 +1,30 @@
+"""
+Web map tiles
+
+`Tile` locates OpenStreetMap-style XYZ tiles. `render_tiles` cuts a grid into
+tiles in Web Mercator, warping each tile from the grid and writing it to a
+directory cache of PNG images or raw arrays in a pool of processes.
+"""
+
 import math
+import multiprocessing
+import numbers
+import os
+import struct
+import zlib
+import numpy as np
 from .vector.geometry import Point
-from .crs import LonLatWGS84
+from .crs import LonLatWGS84, WebMercator
+from .raster import crfuncs
+from .raster.coordgen import ApproximateTransformer, coordinate_transformer
+from .raster.misc import _read_halo
+from .errors import GridError
+
+# half the width of the Web Mercator plane, in meters
+_HALF_WORLD = math.pi*6378137.0
+
+# largest number of source cells read at once when warping a tile
+_MAX_READ_CELLS = 1 << 22
 
 class Tile(object):
 
@@ -49,6 +73,19 @@ class Tile(object):
                Tile(z, x, y+1).nw_corner()]
         return pts[0].x, pts[2].y, pts[1].x, pts[0].y
 
+    def mercator_bbox(self):
+        """ Return the bounding box of a Tile in Web Mercator coordinates
+
+        Returns
+        -------
+        tuple
+            (xmin, ymin, xmax, ymax)
+        """
+        size = 2*_HALF_WORLD / 2**self.z
+        xmin = -_HALF_WORLD + self.x*size
+        ymax = _HALF_WORLD - self.y*size
+        return xmin, ymax-size, xmin+size, ymax
+
 def tile_from_point(point, zoom):
     """ Return the (z, x, y) locator for an OpenStreetMap tile containing a
     point.
@@ -76,3 +113,320 @@ def tile_from_point(point, zoom):
     x = int(x0 // dlon)
     y = int(y0 // dlat)
     return Tile(z, x, y)
+
+def _mercator_bbox(grid):
+    """ Return the bounding box of a grid in Web Mercator coordinates,
+    clipped to the extent of Web Mercator. """
+    ny, nx = grid.size
+    T = grid.transform
+    to_mercator = coordinate_transformer(grid.crs, WebMercator)
+
+    # transform a densified outline of the grid
+    t = np.linspace(0.0, 1.0, 33)
+    i = np.concatenate([t*ny, np.full_like(t, ny), t[::-1]*ny, np.zeros_like(t)])
+    j = np.concatenate([np.zeros_like(t), t*nx, np.full_like(t, nx), t[::-1]*nx])
+    x, y = to_mercator(T[0] + j*T[2] + i*T[4], T[1] + i*T[3] + j*T[5])
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    valid = ~np.isnan(x) & ~np.isnan(y)
+    if not valid.any():
+        raise GridError("grid outline could not be transformed")
+    x = np.clip(x[valid], -_HALF_WORLD, _HALF_WORLD)
+    y = np.clip(y[valid], -_HALF_WORLD, _HALF_WORLD)
+    return x.min(), y.min(), x.max(), y.max()
+
+def tiles_covering(grid, zoom):
+    """ Return the tiles at a zoom level that overlap a grid.
+
+    Parameters
+    ----------
+    grid : RegularGrid
+    zoom : int
+        non-negative zoom level
+
+    Returns
+    -------
+    list of Tile
+        tiles ordered by row and then column
+    """
+    z = int(zoom)
+    xmin, ymin, xmax, ymax = _mercator_bbox(grid)
+    n = 2**z
+    size = 2*_HALF_WORLD / n
+    x0 = min(max(int(math.floor((xmin+_HALF_WORLD)/size)), 0), n-1)
+    x1 = min(max(int(math.ceil((xmax+_HALF_WORLD)/size)), x0+1), n)
+    y0 = min(max(int(math.floor((_HALF_WORLD-ymax)/size)), 0), n-1)
+    y1 = min(max(int(math.ceil((_HALF_WORLD-ymin)/size)), y0+1), n)
+    return [Tile(z, tx, ty) for ty in range(y0, y1) for tx in range(x0, x1)]
+
+def _sample(grid, band, I, J, method, out):
+    """ Store in *out* the values of a band at fractional row and column
+    positions, or NaN outside the grid and at NoData. Positions covering a
+    large part of the grid are sampled in strips, so that memory use is
+    bounded. """
+    ny, nx = grid.size
+    if method == "nearest":
+        I = np.round(I)
+        J = np.round(J)
+    with np.errstate(invalid="ignore"):
+        valid = (I >= 0) & (I <= ny-1) & (J >= 0) & (J <= nx-1)
+    if not valid.any():
+        return
+    Iv = I[valid]
+    Jv = J[valid]
+    a0 = int(math.floor(Iv.min()))
+    a1 = min(int(math.floor(Iv.max()))+2, ny)
+    b0 = int(math.floor(Jv.min()))
+    b1 = min(int(math.floor(Jv.max()))+2, nx)
+    if (a1-a0)*(b1-b0) > _MAX_READ_CELLS and I.shape[0] > 1:
+        h = I.shape[0] // 2
+        _sample(grid, band, I[:h], J[:h], method, out[:h])
+        _sample(grid, band, I[h:], J[h:], method, out[h:])
+        return
+    Z = _read_halo(grid, band, (a0, a1, b0, b1), np.float64, halo=(0, 0))
+    if method == "nearest":
+        out[valid] = Z[(Iv-a0).astype(np.intp), (Jv-b0).astype(np.intp)]
+    else:
+        out[valid] = crfuncs.sample_bilinear_double(Iv-a0, Jv-b0, Z, np.nan)
+    return
+
+def warp_tile(grid, tile, band=0, method="nearest", tilesize=256):
+    """ Return the values of a grid band on the pixels of a tile.
+
+    Tile pixel centers are mapped to grid positions through an approximate
+    coordinate transformation, as in `RegularGrid.reproject`, accurate to an
+    eighth of a tile pixel or of a grid cell, whichever is larger.
+
+    Parameters
+    ----------
+    grid : RegularGrid
+    tile : Tile
+    band : int, optional
+        band to sample (default 0)
+    method : str, optional
+        'nearest' (default) or 'linear'
+    tilesize : int, optional
+        number of pixels along each side of the tile (default 256)
+
+    Returns
+    -------
+    ndarray
+        float64 array of shape (tilesize, tilesize), with the northern row
+        first and NaN where the grid has no data
+    """
+    if method not in ("nearest", "linear"):
+        raise NotImplementedError('method "{0}" unavailable'.format(method))
+    return _warp(grid, tile, band, method, tilesize, _mercator_bbox(grid))
+
+def _warp(grid, tile, band, method, tilesize, bbox):
+    """ Sample a grid on the pixels of a tile, given the bounding box of the
+    grid in Web Mercator. Only pixels within the bounding box are mapped to
+    the grid. """
+    out = np.full((tilesize, tilesize), np.nan)
+    xmin, _, xmax, ymax = tile.mercator_bbox()
+    res = (xmax - xmin) / tilesize
+    i0 = max(int(math.floor((ymax - bbox[3]) / res)) - 1, 0)
+    i1 = min(int(math.ceil((ymax - bbox[1]) / res)) + 1, tilesize)
+    j0 = max(int(math.floor((bbox[0] - xmin) / res)) - 1, 0)
+    j1 = min(int(math.ceil((bbox[2] - xmin) / res)) + 1, tilesize)
+    if i0 >= i1 or j0 >= j1:
+        return out
+
+    T = grid.transform
+    to_source = coordinate_transformer(WebMercator, grid.crs)
+
+    def source_positions(i, j):
+        xs, ys = to_source(xmin + (j+0.5)*res, ymax - (i+0.5)*res)
+        return crfuncs.get_positions_vec(T,
+                                         np.asarray(xs, dtype=np.float64),
+                                         np.asarray(ys, dtype=np.float64))
+
+    # tolerate an approximation error of an eighth of a tile pixel, which may
+    # span many grid cells at low zoom levels
+    I, J = source_positions(np.array([i0, i0, i1-1], dtype=np.float64),
+                            np.array([j0, j1-1, j0], dtype=np.float64))
+    steps = np.array([max(i1-i0-1, 1), max(j1-j0-1, 1)])
+    spacing = np.hypot(I[1:]-I[0], J[1:]-J[0])[::-1] / steps
+    spacing = spacing[np.isfinite(spacing)]
+    error = 0.125*max(1.0, spacing.max() if len(spacing) != 0 else 1.0)
+    approx = ApproximateTransformer(source_positions, error=error)
+    I, J = approx(i0, i1, j0, j1)
+    _sample(grid, band, I, J, method, out[i0:i1,j0:j1])
+    return out
+
+def _apply_colormap(values, colormap):
+    """ Return an RGBA uint8 array of shape values.shape + (4,). NaN values
+    are transparent for colormaps given as stops. """
+    nodata = np.isnan(values)
+    if callable(colormap):
+        rgba = np.asarray(colormap(values))
+    else:
+        stops = sorted(colormap, key=lambda stop: stop[0])
+        levels = [float(stop[0]) for stop in stops]
+        colors = np.array([tuple(stop[1]) + (255,)*(4-len(stop[1]))
+                           for stop in stops], dtype=np.float64)
+        v = np.where(nodata, levels[0], values)
+        rgba = np.empty(values.shape + (4,), dtype=np.uint8)
+        for k in range(4):
+            rgba[...,k] = np.round(np.interp(v, levels, colors[:,k]))
+        rgba[nodata] = 0
+    if rgba.shape[-1] == 3:
+        alpha = np.where(nodata, 0, 255)[...,np.newaxis]
+        rgba = np.concatenate([rgba, alpha], axis=-1)
+    return rgba.astype(np.uint8)
+
+def _write_png(f, rgba):
+    """ Write an RGBA uint8 array to a file as an 8-bit PNG image. """
+    h, w = rgba.shape[:2]
+    raw = np.zeros((h, 1+4*w), dtype=np.uint8)
+    raw[:,1:] = rgba.reshape(h, 4*w)
+
+    def chunk(tag, data):
+        crc = zlib.crc32(tag + data) & 0xffffffff
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", crc)
+
+    f.write(b"\x89PNG\r\n\x1a\n")
+    f.write(chunk(b"IHDR", struct.pack(">IIBBBBB", w, h, 8, 6, 0, 0, 0)))
+    f.write(chunk(b"IDAT", zlib.compress(raw.tobytes(), 6)))
+    f.write(chunk(b"IEND", b""))
+    return
+
+def tile_path(directory, tile, fmt="png"):
+    """ Return the path of a tile in a tile cache directory, laid out as
+    *directory*/z/x/y.fmt """
+    return os.path.join(directory, str(tile.z), str(tile.x),
+                        "{0}.{1}".format(tile.y, fmt))
+
+def _empty_path(directory, tile):
+    """ Return the path of the marker recording that a tile has no data """
+    return os.path.join(directory, str(tile.z), str(tile.x),
+                        "{0}.empty".format(tile.y))
+
+def _remove(path):
+    if os.path.exists(path):
+        os.remove(path)
+    return
+
+def _render_tile(grid, tile, colormap, directory, fmt, band, method, tilesize,
+                 bbox):
+    """ Render and write a tile, returning its path, or None if the tile
+    contains no data, in which case an empty marker file is written. """
+    values = _warp(grid, tile, band, method, tilesize, bbox)
+    path = tile_path(directory, tile, fmt)
+    marker = _empty_path(directory, tile)
+    dirname = os.path.dirname(path)
+    try:
+        os.makedirs(dirname)
+    except OSError:
+        if not os.path.isdir(dirname):
+            raise
+
+    if np.isnan(values).all():
+        open(marker, "wb").close()
+        _remove(path)
+        return None
+
+    # write to a temporary file and rename, so that partially written tiles
+    # are never found in the cache
+    tmp = "{0}.{1}.tmp".format(path, os.getpid())
+    with open(tmp, "wb") as f:
+        if fmt == "png":
+            _write_png(f, _apply_colormap(values, colormap))
+        elif colormap is None:
+            np.save(f, values)
+        else:
+            np.save(f, _apply_colormap(values, colormap))
+    _remove(path)
+    os.rename(tmp, path)
+    _remove(marker)
+    return path
+
+# arguments of _render_tile shared by the tasks of a worker process
+_worker_args = None
+
+def _init_worker(*args):
+    global _worker_args
+    _worker_args = args
+    return
+
+def _render_task(zxy):
+    grid = _worker_args[0]
+    return _render_tile(grid, Tile(*zxy), *_worker_args[1:])
+
+def render_tiles(grid, zooms, colormap=None, directory="tiles", fmt="png",
+                 band=0, method="nearest", tilesize=256, overwrite=False,
+                 nprocesses=None):
+    """ Render a grid as Web Mercator XYZ tiles in a directory cache.
+
+    Each tile covering the grid is warped from the grid, colored, and written
+    to *directory*/z/x/y.png (or .npy). Tiles without data are recorded by an
+    empty file *directory*/z/x/y.empty instead. Tiles already in the cache,
+    including empty tiles, are not rendered again, so that an interrupted run
+    can be resumed. Tiles are rendered by a pool of processes.
+
+    Parameters
+    ----------
+    grid : RegularGrid
+    zooms : int or list of ints
+        zoom levels to render
+    colormap : callable or list of (value, color) pairs, optional
+        a function taking a float64 array of values, with NaN as NoData, and
+        returning an array of uint8 RGB or RGBA colors with an additional
+        last dimension, or color stops as (value, (r, g, b[, a])) pairs, which
+        are interpolated linearly and leave NoData transparent. Required for
+        PNG tiles.
+    directory : str, optional
+        root directory of the tile cache (default "tiles")
+    fmt : str, optional
+        "png" (default) for RGBA images, or "npy" for numpy arrays of colors,
+        or of float64 values with NaN as NoData if *colormap* is None
+    band : int, optional
+        band to render (default 0)
+    method : str, optional
+        'nearest' (default) or 'linear'
+    tilesize : int, optional
+        number of pixels along each side of tiles (default 256)
+    overwrite : bool, optional
+        if True, render tiles that are already in the cache (default False)
+    nprocesses : int, optional
+        number of processes to use (default number of CPUs)
+
+    Returns
+    -------
+    list of str
+        paths of the tiles written, excluding tiles without data
+    """
+    if fmt not in ("png", "npy"):
+        raise ValueError("fmt must be 'png' or 'npy'")
+    if fmt == "png" and colormap is None:
+        raise ValueError("a colormap is required to render PNG tiles")
+    if method not in ("nearest", "linear"):
+        raise NotImplementedError('method "{0}" unavailable'.format(method))
+    if isinstance(zooms, numbers.Integral):
+        zooms = [zooms]
+
+    bbox = _mercator_bbox(grid)
+    todo = []
+    for zoom in zooms:
+        for tile in tiles_covering(grid, zoom):
+            if overwrite or not (
+                    os.path.exists(tile_path(directory, tile, fmt)) or
+                    os.path.exists(_empty_path(directory, tile))):
+                todo.append((tile.z, tile.x, tile.y))
+
+    args = (grid, colormap, directory, fmt, band, method, tilesize, bbox)
+    if nprocesses is None:
+        nprocesses = multiprocessing.cpu_count()
+    if nprocesses <= 1 or len(todo) <= 1:
+        paths = [_render_tile(grid, Tile(*zxy), *args[1:]) for zxy in todo]
+    else:
+        # tiles are handed out in runs of neighbours, limiting the overhead
+        # of passing tasks between processes
+        pool = multiprocessing.Pool(nprocesses, _init_worker, args)
+        try:
+            paths = pool.map(_render_task, todo,
+                             max(1, len(todo) // (4*nprocesses)))
+        finally:
+            pool.close()
+            pool.join()
+    return [path for path in paths if path is not None]
@@ -892,28 +892,14 @@ class Line(MultiVertexBase, ConnectedMultiVertexMixin, Rotatable, GeoJSONOutMixi
         ----------
         dx : float
             spacing of points
+
+        Notes
+        -----
+        - If CRS is Geographical, points are placed along geodesics between
+          vertices, with spacing measured by the CRS instance.
         """
-        remainder = 0
-        pt0 = self[0]
-        vertices = [pt0.vertex()]
-
-        for seg in self.segments:
-            pos = 0
-            az = seg[0].azimuth(seg[1])
-
-            while pos < seg.length:
-                distance_to_endpt = pt0.distance(seg[1])
-                if distance_to_endpt >= dx:
-                    pt1 = pt0.walk(dx - remainder, az)
-                    pos += dx - remainder
-                    vertices.append(pt1.vertex())
-                    remainder = 0
-                    pt0 = pt1
-                else:
-                    remainder = distance_to_endpt
-                    pos = seg.length
-                    pt0 = seg[1]
-        return Multipoint(vertices, crs=self.crs)
+        x, y = _path_positions(self.vertices(drop_z=True), self.crs, dx)
+        return Multipoint(np.column_stack([x, y]), crs=self.crs)
 
     def to_npoints(self, n):
         """ Return *n* equally spaced Point instances along line.
@@ -1659,6 +1645,28 @@ class Multiline(Multipart, MultiVertexMultipartMixin, GeoJSONOutMixin,
             ret.append(line_vertices.T)
         return ret
 
+    def to_points(self, dx):
+        """ Return equally spaced points along each line, as a Multipoint
+        with a "part" data field giving the index of the line each point was
+        placed on.
+
+        Parameters
+        ----------
+        dx : float
+            spacing of points
+        """
+        xs, ys, parts = [], [], []
+        for i, v in enumerate(self.vertices()):
+            x, y = _path_positions(v[:,:2], self.crs, dx)
+            xs.append(x)
+            ys.append(y)
+            parts.append(np.full(len(x), i, dtype=np.int64))
+        if len(xs) == 0:
+            return Multipoint([], data={"part": []}, crs=self.crs)
+        return Multipoint(np.column_stack([np.concatenate(xs), np.concatenate(ys)]),
+                          data={"part": np.concatenate(parts).tolist()},
+                          crs=self.crs)
+
 class Multipolygon(Multipart, MultiVertexMultipartMixin, GeoJSONOutMixin,
                    ShapefileOutMixin):
     """ Collection of polygons with associated attributes.
@@ -1820,6 +1828,38 @@ def sign(a):
     else:
         return a/abs(a)
 
+def _path_positions(vertices, crs, dx):
+    """ Return x and y arrays of positions spaced *dx* apart along the path
+    through an (n x 2) array of *vertices*, starting at the first vertex.
+    Geographical paths follow geodesics and are computed with a single call to
+    the forward geodetic problem. """
+    vertices = np.asarray(vertices, dtype=np.float64)
+    if len(vertices) < 2:
+        return vertices[:,0].copy(), vertices[:,1].copy()
+    x0, y0 = vertices[:-1,0], vertices[:-1,1]
+    x1, y1 = vertices[1:,0], vertices[1:,1]
+
+    if isinstance(crs, GeographicalCRS):
+        az, _, seglength = crs.inverse(x0, y0, x1, y1)
+        az = np.atleast_1d(az)
+        seglength = np.atleast_1d(seglength)
+    else:
+        seglength = np.hypot(x1-x0, y1-y0)
+    cumlength = np.concatenate([[0.0], np.cumsum(seglength)])
+
+    s = dx*np.arange(int(cumlength[-1] // dx) + 1)
+    k = np.clip(np.searchsorted(cumlength, s, side="right")-1, 0, len(seglength)-1)
+    offset = s - cumlength[k]
+
+    if isinstance(crs, GeographicalCRS):
+        x, y, _ = crs.forward(x0[k], y0[k], az[k], offset)
+        return np.atleast_1d(x), np.atleast_1d(y)
+    else:
+        nonzero = seglength[k] != 0
+        frac = np.zeros_like(offset)
+        frac[nonzero] = offset[nonzero] / seglength[k][nonzero]
+        return x0[k] + frac*(x1-x0)[k], y0[k] + frac*(y1-y0)[k]
+
 def merge_properties(prop_sets):
     """ Perform an inner join on a list of dictionaries """
     inner_keys = set.intersection(*[set(p.keys()) for p in prop_sets])
@@ -318,6 +318,89 @@ Pool *qt_search_within(NodePtrUnion node_union, Bbox *bbox) {
     return results;
 }
 
+// squared distance from a point to the nearest point of a bounding box
+double bbox_dist2(Bbox *bbox, double x, double y) {
+    double dx = fmax(fmax(bbox->xmin - x, x - bbox->xmax), 0.0);
+    double dy = fmax(fmax(bbox->ymin - y, y - bbox->ymax), 0.0);
+    return dx*dx + dy*dy;
+}
+
+// insert a candidate into ids/dist2 sorted by increasing distance, keeping at
+// most k entries, and return the new number of entries
+int knn_insert(int *ids, double *dist2, int count, int k, int id, double d2) {
+    int i;
+    if (count == k) {
+        if (d2 >= dist2[k-1]) {
+            return count;
+        }
+        count--;
+    }
+    i = count;
+    while ((i > 0) && (dist2[i-1] > d2)) {
+        ids[i] = ids[i-1];
+        dist2[i] = dist2[i-1];
+        i--;
+    }
+    ids[i] = id;
+    dist2[i] = d2;
+    return count+1;
+}
+
+int qt_knn_visit(NodePtrUnion node_union, double x, double y, int k,
+                 int *ids, double *dist2, int count) {
+    NodePtrUnion children[4];
+    double cdist2[4];
+    NodePtrUnion tmpnode;
+    double tmpdist;
+    LeafNode *leaf;
+    NonleafNode *nonleaf;
+    double dx, dy;
+    int i, j;
+
+    if (node_union.leafnode->type == LEAF) {
+        leaf = node_union.leafnode;
+        for (i=0; i!=leaf->count; i++) {
+            dx = leaf->positions[i].x - x;
+            dy = leaf->positions[i].y - y;
+            count = knn_insert(ids, dist2, count, k, leaf->positions[i].id,
+                               dx*dx + dy*dy);
+        }
+        return count;
+    }
+
+    // visit children in order of distance, skipping those farther than the
+    // kth nearest candidate
+    nonleaf = node_union.nonleafnode;
+    children[0] = nonleaf->ulnode;
+    children[1] = nonleaf->urnode;
+    children[2] = nonleaf->llnode;
+    children[3] = nonleaf->lrnode;
+    for (i=0; i!=4; i++) {
+        cdist2[i] = bbox_dist2(children[i].leafnode->bbox, x, y);
+        for (j=i; (j > 0) && (cdist2[j-1] > cdist2[j]); j--) {
+            tmpdist = cdist2[j]; cdist2[j] = cdist2[j-1]; cdist2[j-1] = tmpdist;
+            tmpnode = children[j]; children[j] = children[j-1]; children[j-1] = tmpnode;
+        }
+    }
+    for (i=0; i!=4; i++) {
+        if ((count == k) && (cdist2[i] >= dist2[k-1])) {
+            break;
+        }
+        count = qt_knn_visit(children[i], x, y, k, ids, dist2, count);
+    }
+    return count;
+}
+
+// find the k positions nearest (x, y), storing their ids and squared
+// distances in increasing order of distance, and return the number found
+int qt_nearest(NodePtrUnion node_union, double x, double y, int k,
+               int *ids, double *dist2) {
+    if (k <= 0) {
+        return 0;
+    }
+    return qt_knn_visit(node_union, x, y, k, ids, dist2, 0);
+}
+
 void qt_free_position(Position *pos) {
     free(pos);
 }
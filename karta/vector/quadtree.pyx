@@ -1,6 +1,7 @@
 """ Cython wrapper quadtree """
 
-from libc.math cimport isnan
+import numpy as np
+from libc.math cimport isnan, sqrt
 
 cdef extern from "quadtree.h":
 
@@ -52,6 +53,7 @@ cdef extern from "quadtree.h":
     NonleafNode *qt_insert(NodePtrUnion, Position, int*)
     void qt_free_node(NodePtrUnion)
     Pool *qt_search_within(NodePtrUnion, Bbox*)
+    int qt_nearest(NodePtrUnion, double, double, int, int*, double*) nogil
     char *pool_pop(Pool*, int)
 
 cdef class QuadTree:
@@ -130,3 +132,42 @@ cdef class QuadTree:
         qt_free_bbox(bbox)
         return out
 
+    def nearest(self, x, y, int k=1):
+        """ Find the *k* points nearest each of a sequence of positions.
+        Duplicated points are represented by the first point at a position.
+
+        Parameters
+        ----------
+        x, y : arrays of floats
+            positions to search from
+        k : int, optional
+            number of neighbours to find (default 1)
+
+        Returns
+        -------
+        (indices, distances) : arrays with shape (len(x), k)
+            indices of the nearest points and their distances, in order of
+            increasing distance. If there are fewer than *k* points, missing
+            neighbours have index -1 and an infinite distance.
+        """
+        cdef double[::1] xv = np.ascontiguousarray(x, dtype=np.float64).ravel()
+        cdef double[::1] yv = np.ascontiguousarray(y, dtype=np.float64).ravel()
+        cdef Py_ssize_t n = xv.shape[0], i, j
+        cdef int found
+        if yv.shape[0] != n:
+            raise ValueError("x and y must have equal size")
+        if k < 1:
+            raise ValueError("k must be positive")
+        indices = np.full((n, k), -1, dtype=np.int32)
+        distances = np.full((n, k), np.inf, dtype=np.float64)
+        cdef int[:,::1] iv = indices
+        cdef double[:,::1] dv = distances
+        if self.count == 0:
+            return indices, distances
+        with nogil:
+            for i in range(n):
+                found = qt_nearest(self.root, xv[i], yv[i], k, &iv[i,0],
+                                   &dv[i,0])
+                for j in range(found):
+                    dv[i,j] = sqrt(dv[i,j])
+        return indices, distances
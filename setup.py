@@ -54,6 +54,26 @@ class build_ext(_build_ext):
 extensions = [
         Extension("karta.raster.crfuncs", ["karta/raster/crfuncs.pyx"]),
 
+        Extension("karta.raster.scanline", ["karta/raster/scanline.pyx"]),
+
+        Extension("karta.raster.contour", ["karta/raster/contour.pyx"]),
+
+        Extension("karta.raster.regions", ["karta/raster/regions.pyx"]),
+
+        Extension("karta.raster.terrain", ["karta/raster/terrain.pyx"]),
+
+        Extension("karta.raster.aaifuncs", ["karta/raster/aaifuncs.pyx"]),
+
+        Extension("karta.raster.hydrofuncs", ["karta/raster/hydrofuncs.pyx"]),
+
+        Extension("karta.raster.edt", ["karta/raster/edt.pyx"]),
+
+        Extension("karta.raster.costfuncs", ["karta/raster/costfuncs.pyx"]),
+
+        Extension("karta.raster.inpaintfuncs", ["karta/raster/inpaintfuncs.pyx"]),
+
+        Extension("karta.raster.interpfuncs", ["karta/raster/interpfuncs.pyx"]),
+
         Extension("karta.vector.vectorgeo", ["karta/vector/vectorgeo.pyx"],
                   extra_compile_args=["-std=c99"]),
 
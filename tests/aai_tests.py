@@ -2,6 +2,7 @@ import unittest
 import os
 import karta
 import numpy as np
+import numpy.testing as npt
 from test_helper import TESTDATA, TMPDATA
 
 class AAITests(unittest.TestCase):
@@ -50,6 +51,64 @@ CELLSIZE 30.0
 NODATA_VALUE -9999
 """)
 
+    def test_write_read_roundtrip(self):
+        np.random.seed(40)
+        values = np.random.normal(size=(600, 40))
+        values[5,7] = np.nan
+        grid = karta.RegularGrid((10.0, 20.0, 5.0, 5.0, 0.0, 0.0), values=values)
+        fnm = os.path.join(TMPDATA, "roundtrip.asc")
+        grid.to_aai(fnm)
+        with open(fnm) as f:
+            lines = f.readlines()
+        # the first data row is the top of the grid
+        self.assertEqual(lines[6].split()[0], repr(values[-1,0]))
+        self.assertEqual(lines[6+599-5].split()[7], "-9999")
+
+        result = karta.read_aai(fnm)
+        self.assertEqual(result.transform, grid.transform)
+        npt.assert_array_equal(result[:,:,0], values)
+
+    def test_write_integer_and_precision(self):
+        values = np.arange(12, dtype=np.int32).reshape(3, 4) - 5
+        grid = karta.RegularGrid((0.0, 0.0, 1.0, 1.0, 0.0, 0.0), values=values,
+                                 nodata_value=-5)
+        fnm = os.path.join(TMPDATA, "integer.asc")
+        grid.to_aai(fnm, nodata_value=-99)
+        with open(fnm) as f:
+            lines = f.readlines()
+        self.assertEqual(lines[6:], ["3 4 5 6\n", "-1 0 1 2\n",
+                                     "-99 -4 -3 -2\n"])
+
+        grid = karta.RegularGrid((0.0, 0.0, 1.0, 1.0, 0.0, 0.0),
+                                 values=np.array([[1.0/3, 2.0/3]]))
+        grid.to_aai(fnm, precision=4)
+        with open(fnm) as f:
+            lines = f.readlines()
+        self.assertEqual(lines[6:], ["0.3333 0.6667\n"])
+
+    def test_read_values_across_lines(self):
+        fnm = os.path.join(TMPDATA, "wrapped.asc")
+        with open(fnm, "w") as f:
+            f.write("ncols 3\nnrows 2\nxllcenter 0.5\nyllcenter 0.5\n"
+                    "cellsize 1\n1.5 -2e3\n  7 8\r\n\t-9999 1E-2\n")
+        grid = karta.read_aai(fnm)
+        self.assertEqual(grid.transform, (0.0, 0.0, 1.0, 1.0, 0.0, 0.0))
+        npt.assert_array_equal(grid[:,:,0], [[8, np.nan, 0.01], [1.5, -2000, 7]])
+
+    def test_read_malformed(self):
+        fnm = os.path.join(TMPDATA, "malformed.asc")
+        with open(fnm, "w") as f:
+            f.write("ncols 2\nnrows 2\nxllcorner 0\nyllcorner 0\n"
+                    "cellsize 1\n1 2\n3 x\n")
+        with self.assertRaises(ValueError):
+            karta.read_aai(fnm)
+
+        with open(fnm, "w") as f:
+            f.write("ncols 2\nnrows 2\nxllcorner 0\nyllcorner 0\n"
+                    "cellsize 1\n1 2\n3\n")
+        with self.assertRaises(ValueError):
+            karta.read_aai(fnm)
+
 def peaks(n=49):
     """ 2d peaks function of MATLAB logo fame. """
     X, Y = np.meshgrid(np.linspace(-3, 3, n), np.linspace(-3, 3, n))
@@ -2,7 +2,7 @@ import unittest
 import numpy as np
 import numpy.testing as npt
 
-from karta.raster import SimpleBand, CompressedBand
+from karta.raster import SimpleBand, CompressedBand, InterleavedBand, RegularGrid
 from karta.raster.band import BandIndexer
 
 class GenericBandTests(object):
@@ -68,6 +68,106 @@ class CompressedBandTests(unittest.TestCase, GenericBandTests):
         self.type = CompressedBand
         self.initkwargs = dict(chunksize=(256, 256))
 
+    def test_depth(self):
+        values = np.arange(30*20*3, dtype=np.int32).reshape(30, 20, 3)
+        band = CompressedBand((30, 20), np.int32, chunksize=(8, 8), initval=-1,
+                              depth=3)
+        band.setblock(2, 3, values[2:25,3:17])
+        self.assertEqual(band.getblock(0, 0, 30, 20).shape, (30, 20, 3))
+        npt.assert_array_equal(band.getblock(2, 3, 23, 14), values[2:25,3:17])
+        self.assertTrue(np.all(band.getblock(25, 0, 5, 20) == -1))
+
+class InterleavedLayerTests(unittest.TestCase, GenericBandTests):
+
+    def setUp(self):
+        self.type = lambda size, dtype, **kw: InterleavedBand(size, dtype, 3, **kw).bands[1]
+        self.initkwargs = dict(chunksize=(256, 256))
+
+
+class PlainInterleavedLayerTests(unittest.TestCase, GenericBandTests):
+
+    def setUp(self):
+        self.type = lambda size, dtype, **kw: InterleavedBand(size, dtype, 3, **kw).bands[1]
+        self.initkwargs = dict(compress=False)
+
+
+class InterleavedBandTests(unittest.TestCase):
+
+    def setUp(self):
+        x, y = np.meshgrid(np.arange(300), np.arange(200))
+        self.values = np.dstack([x+y, x*y, x-y, x**2]).astype(np.float64)
+
+    def test_getblock(self):
+        for compress in (True, False):
+            band = InterleavedBand((200, 300), np.float64, 4, compress=compress,
+                                   chunksize=(64, 64))
+            band.setblock(0, 0, self.values)
+            npt.assert_array_equal(band.getblock(10, 50, 100, 200),
+                                   self.values[10:110,50:250])
+            npt.assert_array_equal(band.bands[2].getblock(10, 50, 100, 200),
+                                   self.values[10:110,50:250,2])
+
+    def test_layer_setblock(self):
+        for compress in (True, False):
+            band = InterleavedBand((200, 300), np.float64, 4, initval=0.0,
+                                   compress=compress, chunksize=(64, 64))
+            band.bands[1].setblock(30, 40, np.ones((50, 70)))
+            expected = np.zeros((200, 300, 4))
+            expected[30:80,40:110,1] = 1.0
+            npt.assert_array_equal(band.getblock(0, 0, 200, 300), expected)
+
+    def test_indexer_get(self):
+        for compress in (True, False):
+            band = InterleavedBand((200, 300), np.float64, 4, compress=compress)
+            band.setblock(0, 0, self.values)
+            indexer = BandIndexer(band.bands)
+            npt.assert_array_equal(indexer[:,:], self.values)
+            npt.assert_array_equal(indexer[20:180:3,::-2], self.values[20:180:3,::-2])
+            npt.assert_array_equal(indexer[5:10,6:9,1:3], self.values[5:10,6:9,1:3])
+            npt.assert_array_equal(indexer[5,6], self.values[5,6])
+            npt.assert_array_equal(indexer[5:10,6:9,2], self.values[5:10,6:9,2])
+            # reordered bands
+            indexer = BandIndexer(band.bands[::-1])
+            npt.assert_array_equal(indexer[:,:], self.values[:,:,::-1])
+
+            # values read are copies
+            out = indexer[:,:]
+            out[:] = 0
+            npt.assert_array_equal(band.getblock(0, 0, 200, 300), self.values)
+
+    def test_indexer_set(self):
+        for compress in (True, False):
+            band = InterleavedBand((200, 300), np.float64, 4, initval=0.0,
+                                   compress=compress)
+            indexer = BandIndexer(band.bands)
+            indexer[:,:] = self.values
+            npt.assert_array_equal(band.getblock(0, 0, 200, 300), self.values)
+            indexer[10:20,10:20,1] = -1.0
+            self.assertEqual(band.getblock(0, 0, 200, 300)[:,:,1].min(), -1.0)
+
+    def test_indexer_iter(self):
+        band = InterleavedBand((200, 300), np.float64, 4)
+        band.setblock(0, 0, self.values)
+        rows = list(BandIndexer(band.bands))
+        self.assertEqual(len(rows), 200)
+        npt.assert_array_equal(rows[7], self.values[7].T)
+
+    def test_grid(self):
+        grid = RegularGrid((0, 0, 1, 1, 0, 0), values=self.values,
+                           bandclass=InterleavedBand)
+        self.assertEqual(len(grid.bands), 4)
+        self.assertTrue(grid.bands[0].interleaved is grid.bands[3].interleaved)
+        self.assertEqual(grid._bndcls, CompressedBand)
+        npt.assert_array_equal(grid[:,:], self.values)
+
+        grid2 = RegularGrid((0, 0, 1, 1, 0, 0), bands=grid.bands[1:3])
+        npt.assert_array_equal(grid2[:,:], self.values[:,:,1:3])
+
+        cp = grid.copy()
+        cp[:,:] = 0.0
+        npt.assert_array_equal(grid[:,:], self.values)
+
+
 class BandIndexerTests(unittest.TestCase):
 
     def test_get_set_typeerror(self):
@@ -0,0 +1,127 @@
+import unittest
+import numpy as np
+import numpy.testing as npt
+from karta import RegularGrid
+from karta.raster import classify
+
+class ReclassifyTests(unittest.TestCase):
+
+    def setUp(self):
+        np.random.seed(43)
+        self.classes = np.random.randint(0, 12, (150, 170)).astype(np.uint8)
+        self.grid = RegularGrid((0, 0, 1, 1, 0, 0), values=self.classes,
+                                nodata_value=0)
+
+    def test_reclassify_mapping(self):
+        mapping = {1: 10, 2: 10, 3: 20, 11: 30}
+        out = self.grid.reclassify(mapping, dtype=np.uint8, nodata_value=255,
+                                   chunksize=(64, 64), nthreads=3)
+        expected = np.full(self.classes.shape, 255, dtype=np.uint8)
+        for k, v in mapping.items():
+            expected[self.classes == k] = v
+        self.assertEqual(out.nodata, 255)
+        self.assertEqual(out[:,:,0].dtype, np.uint8)
+        npt.assert_array_equal(out[:,:,0], expected)
+
+    def test_reclassify_default(self):
+        out = self.grid.reclassify({1: 10}, default=5)
+        expected = np.where(self.classes == 1, 10, 5)
+        expected[self.classes == 0] = out.nodata
+        npt.assert_array_equal(out[:,:,0], expected)
+
+    def test_reclassify_default_dtype(self):
+        out = self.grid.reclassify({1: 10, 2: 20})
+        self.assertEqual(out[:,:,0].dtype, np.uint8)
+        self.assertEqual(out.nodata, 255)
+        out = self.grid.reclassify({1: 10, 2: 255})
+        self.assertEqual(out[:,:,0].dtype, np.uint16)
+        out = self.grid.reclassify({1: -3, 2: 100})
+        self.assertEqual(out[:,:,0].dtype, np.int8)
+        out = self.grid.reclassify({1: 1, 2: 70000}, default=-1)
+        self.assertEqual(out[:,:,0].dtype, np.int32)
+        out = self.grid.reclassify({1: 1, 2: 2}, nodata_value=np.nan)
+        self.assertEqual(out[:,:,0].dtype, np.float32)
+        out = self.grid.reclassify({1: 0.1})
+        self.assertEqual(out[:,:,0].dtype, np.float64)
+
+    def test_reclassify_signed(self):
+        values = np.random.randint(-300, 300, (60, 70)).astype(np.int16)
+        grid = RegularGrid((0, 0, 1, 1, 0, 0), values=values, nodata_value=-300)
+        out = grid.reclassify([(-1000, 0, 1.0), (0, 100, 2.0)],
+                              chunksize=(32, 32))
+        expected = np.where(values < 0, 1.0, np.where(values < 100, 2.0, np.nan))
+        expected[values == -300] = np.nan
+        npt.assert_array_equal(out[:,:,0], expected)
+
+    def test_reclassify_float_ranges(self):
+        values = np.random.random((80, 90))
+        values[5:10,5:10] = np.nan
+        grid = RegularGrid((0, 0, 1, 1, 0, 0), values=values)
+        out = grid.reclassify([(0.5, 0.75, 2), (0.0, 0.25, 1)], dtype=np.int32,
+                              default=0, nodata_value=-1, chunksize=(32, 32))
+        expected = np.where(values < 0.25, 1, np.where(values < 0.5, 0,
+                            np.where(values < 0.75, 2, 0)))
+        expected[np.isnan(values)] = -1
+        npt.assert_array_equal(out[:,:,0], expected)
+
+    def test_reclassify_overlapping(self):
+        with self.assertRaises(ValueError):
+            self.grid.reclassify([(0, 5, 1), (4, 10, 2)])
+
+    def test_value_counts(self):
+        values, counts = self.grid.value_counts(chunksize=(64, 64), nthreads=2)
+        expected_values, expected_counts = np.unique(
+                self.classes[self.classes != 0], return_counts=True)
+        npt.assert_array_equal(values, expected_values)
+        npt.assert_array_equal(counts, expected_counts)
+
+    def test_value_counts_signed(self):
+        values = np.random.randint(-5, 5, (60, 70)).astype(np.int8)
+        grid = RegularGrid((0, 0, 1, 1, 0, 0), values=values, nodata_value=4)
+        v, n = grid.value_counts()
+        ev, en = np.unique(values[values != 4], return_counts=True)
+        npt.assert_array_equal(v, ev)
+        npt.assert_array_equal(n, en)
+
+    def test_value_counts_float(self):
+        values = np.random.randint(0, 20, (80, 90)) / 4.0
+        values[values == 1.0] = np.nan
+        grid = RegularGrid((0, 0, 1, 1, 0, 0), values=values)
+        v, n = grid.value_counts(chunksize=(32, 32))
+        ev, en = np.unique(values[~np.isnan(values)], return_counts=True)
+        npt.assert_array_equal(v, ev)
+        npt.assert_array_equal(n, en)
+
+    def test_value_counts_continuous(self):
+        values = np.random.random((100, 120))
+        values[:3] = 0.5
+        values[40:45,10:20] = np.nan
+        grid = RegularGrid((0, 0, 1, 1, 0, 0), values=values)
+        v, n = grid.value_counts(chunksize=(16, 16), nthreads=2)
+        ev, en = np.unique(values[~np.isnan(values)], return_counts=True)
+        npt.assert_array_equal(v, ev)
+        npt.assert_array_equal(n, en)
+
+        # merge into the running totals while reading
+        merge_size = classify._MERGE_SIZE
+        classify._MERGE_SIZE = 100
+        try:
+            v, n = grid.value_counts(chunksize=(16, 16), nthreads=1)
+        finally:
+            classify._MERGE_SIZE = merge_size
+        npt.assert_array_equal(v, ev)
+        npt.assert_array_equal(n, en)
+
+        empty = RegularGrid((0, 0, 1, 1, 0, 0), values=np.full((10, 10), np.nan))
+        v, n = empty.value_counts()
+        self.assertEqual(len(v), 0)
+        self.assertEqual(len(n), 0)
+
+    def test_value_counts_bins(self):
+        values = np.random.random((80, 90))
+        grid = RegularGrid((0, 0, 1, 1, 0, 0), values=values)
+        bins, n = grid.value_counts(bins=[0, 0.1, 0.5, 1.0], chunksize=(32, 32))
+        npt.assert_array_equal(n, np.histogram(values, bins=[0, 0.1, 0.5, 1.0])[0])
+
+if __name__ == "__main__":
+    unittest.main()
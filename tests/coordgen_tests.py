@@ -1,6 +1,7 @@
 import unittest
 import numpy as np
-from karta.raster.coordgen import CoordinateGenerator
+from karta.raster.coordgen import (CoordinateGenerator, ApproximateTransformer,
+                                   affine_mesh)
 from karta.crs import CartesianCRS, LonLatWGS84, WebMercator
 
 class CoordinateGeneratorTests(unittest.TestCase):
@@ -33,5 +34,74 @@ class CoordinateGeneratorTests(unittest.TestCase):
         self.assertEqual(x.shape, (9 ,4))
         return
 
+    def test_slice_unskewed(self):
+        cg = CoordinateGenerator([0, 0, 2, 3, 0, 0], (400, 300), CartesianCRS, CartesianCRS)
+        x, y = cg[:,:]
+        self.assertEqual(x.shape, (400, 300))
+        self.assertTrue(np.allclose(x[7,:], np.arange(1.0, 600, 2.0)))
+        self.assertTrue(np.allclose(y[:,7], np.arange(1.5, 1200, 3.0)))
+        x[0,0] = -1.0
+        self.assertEqual(cg[:,:][0][0,0], 1.0)
+        return
+
+    def test_affine_mesh_broadcast(self):
+        x, y = affine_mesh([0, 0, 2, 3, 0, 0], np.arange(40), np.arange(30),
+                           broadcast=True)
+        self.assertEqual(x.shape, (40, 30))
+        self.assertEqual(x.strides[0], 0)
+        self.assertEqual(y.strides[1], 0)
+        xw, yw = affine_mesh([0, 0, 2, 3, 0, 0], np.arange(40), np.arange(30))
+        self.assertTrue(xw.flags.writeable and yw.flags.writeable)
+        self.assertTrue(np.array_equal(x, xw))
+        self.assertTrue(np.array_equal(y, yw))
+        return
+
+    def test_slice_skewed(self):
+        T = [1, 2, 2, 3, 0.5, 0.25]
+        cg = CoordinateGenerator(T, (16, 12), CartesianCRS, CartesianCRS)
+        x, y = cg[:,:]
+        J, I = np.meshgrid(np.arange(12)+0.5, np.arange(16)+0.5)
+        self.assertTrue(np.allclose(x, T[0] + J*T[2] + I*T[4]))
+        self.assertTrue(np.allclose(y, T[1] + I*T[3] + J*T[5]))
+        return
+
+    def test_axes(self):
+        cg = CoordinateGenerator([0, 0, 1, 2, 0, 0], (16, 8), CartesianCRS, CartesianCRS)
+        x, y = cg.axes()
+        self.assertTrue(np.allclose(x, np.arange(0.5, 8, 1.0)))
+        self.assertTrue(np.allclose(y, np.arange(1.0, 32, 2.0)))
+
+        cg = CoordinateGenerator([0, 0, 1, 1, 0, 0], (16, 16), LonLatWGS84, WebMercator)
+        with self.assertRaises(ValueError):
+            cg.axes()
+        return
+
+class ApproximateTransformerTests(unittest.TestCase):
+
+    def test_affine_exact(self):
+        calls = []
+        def func(i, j):
+            calls.append(len(i))
+            return 2.0*i + 0.5*j + 1.0, -i + 3.0*j
+        U, V = ApproximateTransformer(func)(10, 74, 5, 133)
+        J, I = np.meshgrid(np.arange(5, 133), np.arange(10, 74))
+        self.assertTrue(np.allclose(U, 2.0*I + 0.5*J + 1.0))
+        self.assertTrue(np.allclose(V, -I + 3.0*J))
+        self.assertEqual(calls, [9])
+        return
+
+    def test_nonlinear_within_error(self):
+        def func(i, j):
+            return 100*np.sin(i/50.0) + j, 0.002*j**2
+        J, I = np.meshgrid(np.arange(300), np.arange(200))
+        Uex, Vex = func(I.astype(np.float64), J.astype(np.float64))
+        U, V = ApproximateTransformer(func, error=0.1)(0, 200, 0, 300)
+        self.assertTrue(np.max(np.abs(U-Uex)) < 0.1)
+        self.assertTrue(np.max(np.abs(V-Vex)) < 0.1)
+        U, V = ApproximateTransformer(func, error=0)(0, 200, 0, 300)
+        self.assertTrue(np.array_equal(U, Uex))
+        self.assertTrue(np.array_equal(V, Vex))
+        return
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,110 @@
+import unittest
+import numpy as np
+import numpy.testing as npt
+from karta import RegularGrid, Point, Multipoint
+from karta.raster import costpath
+
+def move_cost(C, i, j, k, dx, dy):
+    """ Cost of move k from cell (i, j), or None if it leaves the grid """
+    di, dj = costpath.MOVES[k]
+    ny, nx = C.shape
+    if not (0 <= i+di < ny and 0 <= j+dj < nx):
+        return None
+    length = np.hypot(di*dy, dj*dx)
+    if k < 8:
+        return 0.5*length*(C[i,j] + C[i+di,j+dj])
+    elif abs(di) == 2:
+        cells = [C[i,j], C[i+di//2,j], C[i+di//2,j+dj], C[i+di,j+dj]]
+    else:
+        cells = [C[i,j], C[i,j+dj//2], C[i+di,j+dj//2], C[i+di,j+dj]]
+    return 0.25*length*sum(cells)
+
+def brute_force_cost(C, sources, connectivity, dx, dy):
+    """ Accumulate cost by Bellman-Ford relaxation """
+    D = np.full(C.shape, np.inf)
+    for i, j in sources:
+        D[i,j] = 0.0
+    ny, nx = C.shape
+    changed = True
+    while changed:
+        changed = False
+        for i in range(ny):
+            for j in range(nx):
+                if np.isinf(D[i,j]):
+                    continue
+                for k in range(connectivity):
+                    step = move_cost(C, i, j, k, dx, dy)
+                    if step is None or np.isnan(step):
+                        continue
+                    di, dj = costpath.MOVES[k]
+                    if D[i,j] + step < D[i+di,j+dj] - 1e-12:
+                        D[i+di,j+dj] = D[i,j] + step
+                        changed = True
+    D[np.isinf(D)] = np.nan
+    return D
+
+class CostDistanceTests(unittest.TestCase):
+
+    def setUp(self):
+        np.random.seed(46)
+        self.C = np.random.uniform(1, 10, (13, 17))
+        self.C[3:10,8] = np.nan
+        self.grid = RegularGrid([100.0, 50.0, 2.0, -3.0, 0.0, 0.0],
+                                values=self.C)
+
+    def test_cost_distance_8(self):
+        src = Multipoint([(103.0, 48.5), (131.0, 20.0)])
+        dist, back = costpath.cost_distance(self.grid, src)
+        D = brute_force_cost(self.C, [(0, 1), (10, 15)], 8, 2.0, 3.0)
+        npt.assert_allclose(dist[:,:,0], D)
+        self.assertTrue(np.all(back[:,:,0][np.isnan(self.C)] == 255))
+        self.assertEqual(back[0,1,0], 0)
+
+    def test_cost_distance_16(self):
+        src = Point((103.0, 48.5))
+        dist, _ = costpath.cost_distance(self.grid, src, connectivity=16)
+        D = brute_force_cost(self.C, [(0, 1)], 16, 2.0, 3.0)
+        npt.assert_allclose(dist[:,:,0], D)
+
+    def test_least_cost_path(self):
+        src = [Point((103.0, 48.5)), Point((131.0, 20.0))]
+        dist, back = costpath.cost_distance(self.grid, src, connectivity=16)
+        line = costpath.least_cost_path(back, Point((133.0, 45.5)))
+        i, j = self.grid.indices(*line.coords())
+        self.assertIn((i[0], j[0]), [(0, 1), (10, 15)])
+        self.assertEqual((i[-1], j[-1]), (1, 16))
+
+        # the path cost is the accumulated cost at the destination
+        total = 0.0
+        for n in range(len(i)-1):
+            k = costpath.MOVES.index((i[n+1]-i[n], j[n+1]-j[n]))
+            total += move_cost(self.C, i[n], j[n], k, 2.0, 3.0)
+        self.assertAlmostEqual(total, dist[1,16,0])
+
+    def test_unreachable(self):
+        C = np.ones((5, 5))
+        C[:,2] = np.nan
+        grid = RegularGrid([0, 0, 1, 1, 0, 0], values=C)
+        dist, back = costpath.cost_distance(grid, Point((0.5, 0.5)),
+                                            connectivity=16)
+        self.assertTrue(np.all(np.isnan(dist[:,3:,0])))
+        with self.assertRaises(ValueError):
+            costpath.least_cost_path(back, Point((4.5, 4.5)))
+
+    def test_source_path(self):
+        dist, back = costpath.cost_distance(self.grid, Point((103.0, 48.5)))
+        line = costpath.least_cost_path(back, Point((103.0, 48.5)))
+        self.assertEqual(line[0].vertex()[:2], (103.0, 48.5))
+
+    def test_bad_arguments(self):
+        with self.assertRaises(ValueError):
+            costpath.cost_distance(self.grid, Point((103.0, 48.5)),
+                                   connectivity=4)
+        with self.assertRaises(IndexError):
+            costpath.cost_distance(self.grid, Point((0.0, 0.0)))
+        grid = RegularGrid([0, 0, 1, 1, 0, 0], values=-np.ones((3, 3)))
+        with self.assertRaises(ValueError):
+            costpath.cost_distance(grid, Point((0.5, 0.5)))
+
+if __name__ == "__main__":
+    unittest.main()
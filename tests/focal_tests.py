@@ -0,0 +1,69 @@
+import unittest
+import numpy as np
+from karta import RegularGrid
+from karta.raster import focal
+
+def brute_force(Z, ky, kx, func):
+    out = np.full(Z.shape, np.nan)
+    for i in range(Z.shape[0]):
+        for j in range(Z.shape[1]):
+            w = Z[max(i-ky//2, 0):i+ky//2+1, max(j-kx//2, 0):j+kx//2+1]
+            w = w[~np.isnan(w)]
+            if len(w) != 0:
+                out[i,j] = func(w)
+    return out
+
+class FocalTests(unittest.TestCase):
+
+    def setUp(self):
+        np.random.seed(39)
+        Z = np.random.normal(100.0, 5.0, (37, 45))
+        Z[np.random.random(Z.shape) < 0.2] = np.nan
+        Z[:4,:4] = np.nan
+        self.Z = Z
+        self.grid = RegularGrid((0, 0, 1, 1, 0, 0),
+                                values=np.where(np.isnan(Z), -9999, Z),
+                                nodata_value=-9999)
+
+    def check(self, func, reference, size):
+        ky, kx = (size, size) if np.ndim(size) == 0 else size
+        expected = brute_force(self.Z, ky, kx, reference)
+        for chunksize in (None, (8, 11)):
+            result = func(self.grid, size, chunksize=chunksize, nthreads=2)[:,:,0]
+            self.assertTrue(np.array_equal(np.isnan(result), np.isnan(expected)))
+            valid = ~np.isnan(expected)
+            self.assertTrue(np.allclose(result[valid], expected[valid],
+                                        rtol=0, atol=1e-9))
+
+    def test_sum(self):
+        self.check(focal.focal_sum, np.sum, 5)
+
+    def test_mean(self):
+        self.check(focal.focal_mean, np.mean, (3, 7))
+
+    def test_std(self):
+        self.check(focal.focal_std, np.std, 7)
+
+    def test_min(self):
+        self.check(focal.focal_min, np.min, (9, 5))
+
+    def test_max(self):
+        self.check(focal.focal_max, np.max, 1)
+        self.check(focal.focal_max, np.max, 11)
+
+    def test_empty_window(self):
+        Z = np.full((20, 20), -9999.0)
+        Z[15,15] = 2.0
+        grid = RegularGrid((0, 0, 1, 1, 0, 0), values=Z, nodata_value=-9999)
+        result = focal.focal_mean(grid, 3)[:,:,0]
+        self.assertEqual(np.sum(~np.isnan(result)), 9)
+        self.assertTrue(np.all(result[14:17,14:17] == 2.0))
+
+    def test_window_size(self):
+        with self.assertRaises(ValueError):
+            focal.focal_mean(self.grid, 4)
+        with self.assertRaises(ValueError):
+            focal.focal_mean(self.grid, (3, 0))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -514,21 +514,31 @@ class TestGeometryAnalysis(unittest.TestCase):
     def test_to_points_lonlat(self):
         line = Line([(0.0, 38.0), (-10.5, 33.0), (-6.0, 35.0)], crs=LonLatWGS84)
         points = line.to_points(100000.0)
+        # points follow geodesics between vertices
         ans = [(  0.        , 38.        ), ( -1.00809817, 37.58554833),
-               ( -2.01066416, 37.17113146), ( -3.00781084, 36.7567488 ),
-               ( -3.99964867, 36.34239982), ( -4.98628577, 35.92808398),
-               ( -5.96782797, 35.51380078), ( -6.94437893, 35.09954973),
-               ( -7.91604017, 34.68533037), ( -8.88291117, 34.27114226),
-               ( -9.84508939, 33.85698498), (-10.80267038, 33.44285814),
-               (-10.09466286, 33.19083929), ( -9.15505703, 33.62895663),
-               ( -8.21064326, 34.0669835 ), ( -7.26131724, 34.5049191 ),
-               ( -6.30697252, 34.94276264)]
+               ( -2.0049662 , 37.16255305), ( -2.99067839, 36.73123521),
+               ( -3.96532303, 36.29181339), ( -4.92900135, 35.84450348),
+               ( -5.88182653, 35.38951854), ( -6.82392276, 34.92706857),
+               ( -7.75542426, 34.45736039), ( -8.67647443, 33.98059755),
+               ( -9.58722495, 33.49698018), (-10.487835  , 33.00670493),
+               ( -9.57525459, 33.43225226), ( -8.62844513, 33.86331858),
+               ( -7.67215419, 34.28700932), ( -6.70630274, 34.70313336)]
         self.assertEqual(len(points), len(ans))
         for pt, vert in zip(points, ans):
             self.assertAlmostEqual(pt.x, vert[0])
             self.assertAlmostEqual(pt.y, vert[1])
         return
 
+    def test_to_points_multiline(self):
+        lines = Multiline([[(0.0, 0.0), (4.0, 3.0)], [(1.0, 1.0), (1.0, 3.5)]])
+        points = lines.to_points(1.0)
+        self.assertEqual(len(points), 9)
+        self.assertEqual(points.d["part"], [0, 0, 0, 0, 0, 0, 1, 1, 1])
+        x, y = points.coords()
+        self.assertTrue(np.allclose(x, [0, 0.8, 1.6, 2.4, 3.2, 4.0, 1, 1, 1]))
+        self.assertTrue(np.allclose(y, [0, 0.6, 1.2, 1.8, 2.4, 3.0, 1, 2, 3]))
+        return
+
     def test_to_npoints_cartesian(self):
         line = Line([(0.0, 0.0), (1.0, 2.0), (3.0, -2.0), (4.0, -1.0),
                      (4.0, 3.0), (3.0, 2.0)])
@@ -8,6 +8,7 @@ from test_helper import TESTDATA
 
 import karta
 from karta import RegularGrid
+from karta.raster import CompressedBand
 
 class RegularGridTests(unittest.TestCase):
 
@@ -88,6 +89,70 @@ class RegularGridTests(unittest.TestCase):
             count += 1
         self.assertEqual(count, 256)
 
+    def test_aschunks_nocopy(self):
+        grid = RegularGrid((0, 0, 1, 1, 0, 0), values=peaks(500))
+        count = 0
+        for chunk in grid.aschunks(size=(64, 64), copy=False):
+            i0 = int(chunk.transform[1])
+            j0 = int(chunk.transform[0])
+            self.assertEqual(chunk.size, (min(64, 500-i0), min(64, 500-j0)))
+            npt.assert_array_equal(chunk[:,:,0],
+                                   grid[i0:i0+64,j0:j0+64,0])
+            count += 1
+        self.assertEqual(count, 64)
+
+    def test_window(self):
+        grid = RegularGrid((10, 20, 2, 3, 0.5, 0.25), values=peaks(64),
+                           bandclass=CompressedBand)
+        win = grid.window(5, 25, 10, 40)
+        self.assertEqual(win.size, (20, 30))
+        self.assertEqual(win._bndcls, CompressedBand)
+        self.assertEqual(win.transform, (10+10*2+5*0.5, 20+5*3+10*0.25,
+                                         2, 3, 0.5, 0.25))
+        npt.assert_array_equal(win[:,:,0], grid[5:25,10:40,0])
+        X, Y = win.center_coords()
+        Xp, Yp = grid.center_coords()
+        self.assertEqual((X[0,0], Y[0,0]), (Xp[5,10], Yp[5,10]))
+
+        # windows of windows refer to the parent band
+        win2 = win.window(2, 4, 3, 6)
+        self.assertTrue(win2.bands[0].band is grid.bands[0])
+        npt.assert_array_equal(win2[:,:,0], grid[7:9,13:16,0])
+
+        # changes to the parent are visible through the window
+        grid[6,11] = 99.0
+        self.assertEqual(win[1,1,0], 99.0)
+
+        with self.assertRaises(IndexError):
+            grid.window(5, 65, 0, 10)
+
+    def test_window_readonly(self):
+        grid = RegularGrid((0, 0, 1, 1, 0, 0), values=peaks(64))
+        win = grid.window(5, 25, 10, 40)
+        with self.assertRaises(ValueError):
+            win[0,0] = 1.0
+
+    def test_window_writable(self):
+        grid = RegularGrid((0, 0, 1, 1, 0, 0), values=np.zeros((64, 64)))
+        win = grid.window(5, 25, 10, 40, writable=True)
+        win[:,:] = 1.0
+        self.assertEqual(grid[:,:,0].sum(), 600.0)
+        self.assertEqual(grid[5:25,10:40,0].sum(), 600.0)
+
+        # writable windows of read-only windows are read-only
+        win2 = grid.window(0, 10, 0, 10).window(0, 5, 0, 5, writable=True)
+        with self.assertRaises(ValueError):
+            win2[0,0] = 1.0
+
+    def test_window_copy(self):
+        grid = RegularGrid((0, 0, 1, 1, 0, 0), values=peaks(64))
+        win = grid.window(5, 25, 10, 40)
+        cp = win.copy()
+        self.assertEqual(cp.bands[0].size, (20, 30))
+        cp[:,:] = 0.0
+        self.assertEqual(cp[:,:,0].sum(), 0.0)
+        npt.assert_array_equal(win[:,:,0], peaks(64)[5:25,10:40])
+
     def test_index_multiband(self):
         p = peaks(512)
         grid = RegularGrid((0, 0, 1, 1, 0, 0),
@@ -217,6 +282,69 @@ class RegularGridTests(unittest.TestCase):
         self.assertEqual(grid2[0,0,1], 2.0)
         self.assertEqual(grid2[0,0,2], 3.0)
 
+    def test_reproject_same_crs(self):
+        grid = RegularGrid((0, 0, 1, 1, 0, 0),
+                           values=np.arange(100, dtype=np.int16).reshape(10, 10))
+        grid2 = grid.reproject(grid.crs, resolution=1, method="linear",
+                               chunksize=(4, 4))
+        self.assertEqual(grid2.transform, (0, 0, 1, 1, 0, 0))
+        self.assertEqual(grid2.bands[0].dtype, np.int16)
+        self.assertTrue(np.array_equal(grid2[:,:], grid[:,:]))
+
+        grid3 = grid.reproject(grid.crs, resolution=0.5, chunksize=(7, 7))
+        self.assertEqual(grid3.size, (20, 20))
+        self.assertTrue(np.array_equal(grid3[::2,::2], grid[:,:]))
+        self.assertTrue(np.array_equal(grid3[1::2,1::2], grid[:,:]))
+
+    def test_reproject_lonlat_webmercator(self):
+        # linear function of longitude and latitude
+        lonlat = karta.crs.LonLatWGS84
+        grid = RegularGrid((-10, 40, 0.05, 0.05, 0, 0),
+                           values=np.fromfunction(
+                               lambda i, j: 2*(-10+(j+0.5)*0.05) - (40+(i+0.5)*0.05),
+                               (100, 160)),
+                           crs=lonlat)
+        merc = karta.crs.WebMercator
+        grid2 = grid.reproject(merc, method="linear")
+        x0, y0 = lonlat.transform(merc, -10.0, 40.0)
+        x1, y1 = lonlat.transform(merc, -2.0, 45.0)
+        xmin, ymin, xmax, ymax = grid2.bbox()
+        self.assertAlmostEqual(xmin, x0, places=4)
+        self.assertAlmostEqual(ymin, y0, places=4)
+        self.assertTrue(0 <= xmax-x1 < grid2.transform[2])
+        self.assertTrue(0 <= ymax-y1 < grid2.transform[3])
+
+        X, Y = grid2.center_coords()
+        lon, lat = merc.transform(lonlat, np.ascontiguousarray(X),
+                                  np.ascontiguousarray(Y))
+        # exact transformation
+        grid3 = grid.reproject(merc, method="linear", error=0)
+        z = grid3[:,:,0]
+        mask = ~np.isnan(z)
+        self.assertTrue(mask.sum() > 0.95*z.size)
+        self.assertTrue(np.max(np.abs(z-(2*lon-lat))[mask]) < 1e-6)
+
+        # approximate transformation, tolerating 1/8 pixel position error
+        z2 = grid2[:,:,0]
+        self.assertTrue(np.nanmax(np.abs(z2-z)) < 0.125*0.05*3)
+
+    def test_reproject_linear_nodata(self):
+        values = np.ones((6, 6))
+        values[2,3] = -9999
+        grid = RegularGrid((0, 0, 1, 1, 0, 0), values=values, nodata_value=-9999)
+        grid2 = grid.reproject(grid.crs, resolution=0.5, method="linear")
+        z = grid2[:,:,0]
+        valid = z != -9999
+        self.assertTrue(np.all(z[valid] == 1.0))
+        # cells interpolated from the NoData cell are NoData
+        self.assertTrue(np.all(z[3:7,5:9] == -9999))
+        self.assertEqual(valid[1:-1,1:-1].sum(), 100-16)
+
+    def test_reproject_bad_method(self):
+        grid = RegularGrid((0, 0, 1, 1, 0, 0), values=np.zeros((4, 4)))
+        with self.assertRaises(NotImplementedError):
+            grid.reproject(grid.crs, method="cubic")
+
     def test_sample_nearest(self):
         grid = RegularGrid([0.0, 0.0, 1.0, 1.0, 0.0, 0.0],
                            values=np.array([[0, 1], [1, 0.5]]))
@@ -335,6 +463,15 @@ class RegularGridTests(unittest.TestCase):
         self.assertTrue(np.sum(grid.vertex_coords()[0] - ans[0]) < 1e-10)
         self.assertTrue(np.sum(grid.vertex_coords()[1] - ans[1]) < 1e-10)
 
+    def test_vertex_coords_shape(self):
+        grid = RegularGrid((5.0, 10.0, 2.0, 3.0, 0.0, 0.0), values=np.zeros([4, 6]))
+        X, Y = grid.vertex_coords()
+        self.assertEqual(X.shape, (5, 7))
+        self.assertEqual(X[-1,-1], 17.0)
+        self.assertEqual(Y[-1,-1], 22.0)
+        X[0,0] = 0.0
+        self.assertEqual(grid.vertex_coords()[0][0,0], 5.0)
+
     def test_vertex_coords_skewed(self):
         grid = RegularGrid((0.0, 0.0, 30.0, 30.0, 20.0, 10.0), values=np.zeros([5, 5]))
         ans = np.meshgrid(np.arange(15.0, 1486.0, 30.0),
@@ -406,6 +543,14 @@ class RegularGridTests(unittest.TestCase):
         self.assertEqual(Y[0,0], 525)
         self.assertEqual(Y[-1,0], 945)
 
+    def test_clip_nocopy(self):
+        clipped = self.rast.clip(500, 950, 500, 950, copy=False)
+        self.assertEqual(clipped.size, (15, 15))
+        self.assertEqual(clipped.transform, (510, 510, 30, 30, 0, 0))
+        npt.assert_array_equal(clipped[:,:,0],
+                               self.rast.clip(500, 950, 500, 950)[:,:,0])
+        self.assertTrue(clipped.bands[0].band is self.rast.bands[0])
+
     def test_clip_to_extent(self):
         proto = RegularGrid((500, 500, 30, 30, 0, 0), np.zeros((15,15)))
         clipped = self.rast.clip(*proto.extent("edge"))
@@ -465,7 +610,7 @@ class RegularGridTests(unittest.TestCase):
                            values=np.arange(1e6).reshape(1000, 1000),
                            crs=karta.crs.Cartesian)
         masked_grid = grid.mask_by_poly(poly)
-        self.assertEqual(int(np.nansum(masked_grid[:,:])), 97048730546)
+        self.assertEqual(int(np.nansum(masked_grid[:,:])), 96937778947)
 
     def test_mask_poly_inplace(self):
         t = -np.linspace(0, 2*np.pi, 200)
@@ -476,7 +621,7 @@ class RegularGridTests(unittest.TestCase):
                            values=np.arange(1e6).reshape(1000, 1000),
                            crs=karta.crs.Cartesian)
         grid.mask_by_poly(poly, inplace=True)
-        self.assertEqual(int(np.nansum(grid[:,:])), 97048730546)
+        self.assertEqual(int(np.nansum(grid[:,:])), 96937778947)
 
     def test_mask_poly_partial(self):
         t = -np.linspace(0, 2*np.pi, 200)
@@ -487,7 +632,7 @@ class RegularGridTests(unittest.TestCase):
                            values=np.arange(1e6).reshape(1000, 1000),
                            crs=karta.crs.Cartesian)
         masked_grid = grid.mask_by_poly(poly)
-        self.assertEqual(masked_grid.data_mask.sum(), 181424)
+        self.assertEqual(masked_grid.data_mask.sum(), 181327)
 
     def test_mask_poly_partial2(self):
         # this case has the first transect begin off-grid, which has caused
@@ -495,7 +640,7 @@ class RegularGridTests(unittest.TestCase):
         g = RegularGrid([0, 0, 1, 1, 0, 0], values=np.ones((7, 7)))
         p = karta.Polygon([(-2, 3), (8, -5), (8, -1), (-2, 7)])
         gc = g.mask_by_poly(p)
-        self.assertEqual(gc.data_mask.sum(), 20)
+        self.assertEqual(gc.data_mask.sum(), 17)
 
     def test_mask_poly_multiple(self):
         # mask by multiple polygons
@@ -510,7 +655,7 @@ class RegularGridTests(unittest.TestCase):
                            values=np.arange(1e6).reshape(1000, 1000),
                            crs=karta.crs.Cartesian)
         masked_grid = grid.mask_by_poly([poly, poly2])
-        self.assertEqual(int(np.nansum(masked_grid[:,:])), 47081206720)
+        self.assertEqual(int(np.nansum(masked_grid[:,:])), 47025269255)
 
     def test_mask_poly_multiband(self):
         t = -np.linspace(0, 2*np.pi, 200)
@@ -523,7 +668,7 @@ class RegularGridTests(unittest.TestCase):
                                (1000, 1000, 3)),
                            crs=karta.crs.Cartesian)
         masked_grid = grid.mask_by_poly(poly)
-        self.assertEqual(int(np.nansum(masked_grid[:,:])), 97048730546*3)
+        self.assertEqual(int(np.nansum(masked_grid[:,:])), 96937778947*3)
 
     def test_mask_poly_inverted(self):
         # grids where transform dy is negative (common for geotiffs)
@@ -535,7 +680,7 @@ class RegularGridTests(unittest.TestCase):
                            values=np.arange(1e6).reshape(1000, 1000),
                            crs=karta.crs.Cartesian)
         masked_grid = grid.mask_by_poly(poly)
-        self.assertEqual(int(np.nansum(masked_grid[:,:])), 97048730546)
+        self.assertEqual(int(np.nansum(masked_grid[:,:])), 105023944947)
 
     def test_mask_multipoly(self):
         t = -np.linspace(0, 2*np.pi, 200)
@@ -552,7 +697,252 @@ class RegularGridTests(unittest.TestCase):
                            crs=karta.crs.Cartesian)
         masked_grid = grid.mask_by_poly(poly)
 
-        self.assertEqual(int(np.nansum(masked_grid[:,:])), 73399874364)
+        self.assertEqual(int(np.nansum(masked_grid[:,:])), 73228222014)
+
+    def test_mask_poly_holes(self):
+        g = RegularGrid([0, 0, 1, 1, 0, 0], values=np.ones((10, 10)))
+        hole = karta.Polygon([(3, 3), (3, 7), (7, 7), (7, 3)])
+        p = karta.Polygon([(1, 1), (9, 1), (9, 9), (1, 9)], subs=[hole])
+        gc = g.mask_by_poly(p)
+        self.assertEqual(gc.data_mask.sum(), 64-16)
+        self.assertFalse(gc.data_mask[5,5])
+        self.assertTrue(gc.data_mask[2,2])
+
+    def test_mask_poly_crop(self):
+        t = -np.linspace(0, 2*np.pi, 200)
+        xp = ((2+np.cos(7*t)) * np.cos(t+0.3) + 4) * 12
+        yp = ((2+np.cos(7*t)) * np.sin(t+0.2) + 4) * 12
+        poly = karta.Polygon(zip(xp, yp), crs=karta.crs.Cartesian)
+        grid = RegularGrid([0.0, 0.0, 0.1, 0.1, 0.0, 0.0],
+                           values=np.arange(1e6).reshape(1000, 1000),
+                           crs=karta.crs.Cartesian)
+        masked_grid = grid.mask_by_poly(poly)
+        cropped_grid = grid.mask_by_poly(poly, crop=True)
+        self.assertEqual(int(np.nansum(cropped_grid[:,:])), 96937778947)
+
+        rows, cols = np.nonzero(masked_grid.data_mask)
+        self.assertEqual(cropped_grid.size, (rows.max()-rows.min()+1,
+                                             cols.max()-cols.min()+1))
+        x0, _, y0, _ = masked_grid.extent(reference="edge")
+        self.assertAlmostEqual(cropped_grid.transform[0], x0 + 0.1*cols.min())
+        self.assertAlmostEqual(cropped_grid.transform[1], y0 + 0.1*rows.min())
+        self.assertTrue(np.array_equal(
+            cropped_grid.data_mask,
+            masked_grid.data_mask[rows.min():rows.max()+1,
+                                  cols.min():cols.max()+1]))
+
+        with self.assertRaises(ValueError):
+            grid.mask_by_poly(poly, inplace=True, crop=True)
+
+    def test_mask_poly_chunks(self):
+        # one chunk inside, one outside, and boundary chunks, with a source
+        # band that must not be modified
+        values = np.arange(64*64, dtype=np.int32).reshape(64, 64)
+        grid = RegularGrid([0, 0, 1, 1, 0, 0], values=values,
+                           bandclass=karta.raster.SimpleBand, nodata_value=-1)
+        poly = karta.Polygon([(0, 0), (40, 0), (40, 20), (0, 20)])
+        masked_grid = grid.mask_by_poly(poly)
+        self.assertTrue(np.array_equal(grid[:,:,0], values))
+        expected = np.where(np.arange(64)[:,None] < 20, values, -1)
+        expected[:,40:] = -1
+        self.assertTrue(np.array_equal(masked_grid[:,:,0], expected))
+        self.assertTrue(isinstance(masked_grid.bands[0], karta.raster.SimpleBand))
+
+        cropped_grid = grid.mask_by_poly(poly, crop=True)
+        self.assertTrue(isinstance(cropped_grid.bands[0], karta.raster.SimpleBand))
+        self.assertTrue(np.array_equal(cropped_grid[:,:,0], values[:20,:40]))
+
+        grid = RegularGrid([0, 0, 1, 1, 0, 0], values=values, nodata_value=-1)
+        grid.bands[0] = karta.raster.CompressedBand((64, 64), np.int32,
+                                                    chunksize=(16, 16))
+        grid.bands[0].setblock(0, 0, values)
+        grid.mask_by_poly(poly, inplace=True)
+        self.assertTrue(np.array_equal(grid[:,:,0], expected))
+
+    def test_polygon_mask_rules(self):
+        p1 = karta.Polygon([(0, 0), (6, 0), (6, 6), (0, 6)])
+        p2 = karta.Polygon([(4, 4), (10, 4), (10, 10), (4, 10)][::-1])
+        T = [0, 0, 1, 1, 0, 0]
+        m = karta.raster.grid.polygon_mask([p1, p2], (10, 10), T)
+        self.assertEqual(m.sum(), 36+36-2*4)
+        self.assertFalse(m[5,5])
+        m = karta.raster.grid.polygon_mask([p1, p2], (10, 10), T, rule="nonzero")
+        self.assertEqual(m.sum(), 36+36-4)
+        self.assertTrue(m[5,5])
+
+    def test_polygon_spans_nonfinite_edges(self):
+        square = np.array([[1, 1, 5, 1], [5, 1, 5, 5], [5, 5, 1, 5],
+                           [1, 5, 1, 1]], dtype=np.float64)
+        bad = np.array([[2, np.nan, 3, 4], [np.inf, 1, 3, 4],
+                        [2, 1, 3, -np.inf]], dtype=np.float64)
+        expected = karta.raster.scanline.polygon_spans(square, 8, 8)
+        spans = karta.raster.scanline.polygon_spans(
+                np.vstack([square, bad]), 8, 8)
+        for a, b in zip(spans, expected):
+            self.assertTrue(np.array_equal(a, b))
+
+    def test_polygon_mask_window_packed(self):
+        t = -np.linspace(0, 2*np.pi, 200)
+        xp = ((2+np.cos(7*t)) * np.cos(t+0.3) + 4) * 12
+        yp = ((2+np.cos(7*t)) * np.sin(t+0.2) + 4) * 12
+        poly = karta.Polygon(zip(xp, yp))
+        T = [0.0, 0.0, 0.1, 0.1, 0.0, 0.0]
+        full = karta.raster.grid.polygon_mask(poly, (1000, 1000), T)
+        win = karta.raster.grid.polygon_mask(poly, (1000, 1000), T,
+                                             window=(200, 450, 333, 700))
+        self.assertEqual(win.shape, (250, 367))
+        self.assertTrue(np.array_equal(win, full[200:450,333:700]))
+        packed = karta.raster.grid.polygon_mask(poly, (1000, 1000), T,
+                                                window=(200, 450, 333, 700),
+                                                packed=True)
+        self.assertEqual(packed.shape, (250, 46))
+        self.assertTrue(np.array_equal(np.unpackbits(packed, axis=1)[:,:367], win))
+
+    def test_zonal_stats(self):
+        np.random.seed(49)
+        values = np.random.rand(100, 120)
+        values[50:55,50:55] = np.nan
+        grid = RegularGrid([0, 0, 1, 1, 0, 0], values=values)
+        hole = [(22, 22), (22, 28), (28, 28), (28, 22)]
+        zones = karta.Multipolygon([
+            [[(10, 10), (40, 10), (40, 40), (10, 40)], hole],
+            [[(45.3, 5), (110, 5), (110, 95), (45.3, 95)]],
+            [[(200, 200), (210, 200), (210, 210)]]])
+        table = grid.zonal_stats(zones,
+                                 stats=["count", "sum", "mean", "std",
+                                        "min", "max", "histogram"],
+                                 bins=np.linspace(0, 1, 5), chunksize=(32, 48))
+        self.assertTrue(table is zones.data)
+
+        mask0 = np.zeros((100, 120), dtype=bool)
+        mask0[10:40,10:40] = True
+        mask0[22:28,22:28] = False
+        mask1 = np.zeros((100, 120), dtype=bool)
+        mask1[5:95,45:110] = True
+        mask1[50:55,50:55] = False
+        for k, mask in enumerate([mask0, mask1]):
+            v = values[mask]
+            self.assertEqual(zones.d["count"][k], len(v))
+            self.assertAlmostEqual(zones.d["sum"][k], v.sum())
+            self.assertAlmostEqual(zones.d["mean"][k], v.mean())
+            self.assertAlmostEqual(zones.d["std"][k], v.std())
+            self.assertEqual(zones.d["min"][k], v.min())
+            self.assertEqual(zones.d["max"][k], v.max())
+            self.assertEqual(zones.d["histogram"][k],
+                             list(np.histogram(v, np.linspace(0, 1, 5))[0]))
+        self.assertEqual(zones.d["count"][2], 0)
+        self.assertTrue(np.isnan(zones.d["mean"][2]))
+
+    def test_zonal_stats_bad_stat(self):
+        grid = RegularGrid([0, 0, 1, 1, 0, 0], values=np.zeros((10, 10)))
+        zones = karta.Multipolygon([[[(1, 1), (4, 1), (4, 4)]]])
+        with self.assertRaises(ValueError):
+            grid.zonal_stats(zones, stats=["median"])
+        with self.assertRaises(ValueError):
+            grid.zonal_stats(zones, stats=["histogram"])
+
+    def test_polygon_coverage(self):
+        T = [0.0, 0.0, 0.5, 0.5, 0.0, 0.0]
+        poly = karta.Polygon([(0.25, 0.25), (4.75, 0.5), (2.0, 4.6)],
+                             subs=[karta.Polygon([(1.5, 1.0), (2.5, 1.0),
+                                                  (2.5, 2.0), (1.5, 2.0)])])
+        cov = karta.raster.grid.polygon_coverage(poly, (12, 12), T)
+        self.assertTrue(np.all((cov >= 0) & (cov <= 1)))
+        self.assertAlmostEqual(cov.sum()*0.25, poly.area)
+        self.assertTrue(np.all(cov[2:4,3:5] == 0))
+
+        win = karta.raster.grid.polygon_coverage(poly, (12, 12), T,
+                                                 window=(3, 8, 2, 11))
+        self.assertTrue(np.allclose(win, cov[3:8,2:11]))
+
+        # polygon smaller than a cell
+        tiny = karta.Polygon([(1.1, 1.1), (1.3, 1.1), (1.3, 1.2)])
+        cov = karta.raster.grid.polygon_coverage(tiny, (4, 4), [0, 0, 1, 1, 0, 0])
+        self.assertAlmostEqual(cov[1,1], 0.01)
+        self.assertAlmostEqual(cov.sum(), 0.01)
+
+    def test_zonal_stats_coverage(self):
+        np.random.seed(50)
+        values = np.random.rand(20, 20)
+        grid = RegularGrid([0, 0, 1, 1, 0, 0], values=values)
+        zones = karta.Multipolygon([
+            [[(3.2, 3.1), (3.4, 3.1), (3.4, 3.3)]],
+            [[(2.5, 2.5), (7.5, 2.5), (7.5, 4.5), (2.5, 4.5)]],
+            [[(1.2, 6.3), (15.7, 9.1), (4.4, 17.9)]]])
+        grid.zonal_stats(zones, stats=["count", "mean", "std", "min"],
+                         coverage=True, chunksize=(7, 6))
+
+        self.assertAlmostEqual(zones.d["count"][0], 0.02)
+        self.assertAlmostEqual(zones.d["mean"][0], values[3,3])
+        self.assertAlmostEqual(zones.d["count"][1], 10.0)
+        for k in range(3):
+            w = karta.raster.grid.polygon_coverage(zones[k], (20, 20),
+                                                   grid.transform)
+            mean = np.sum(w*values) / np.sum(w)
+            self.assertAlmostEqual(zones.d["count"][k], w.sum())
+            self.assertAlmostEqual(zones.d["mean"][k], mean)
+            self.assertAlmostEqual(zones.d["std"][k],
+                    np.sqrt(np.sum(w*(values-mean)**2) / np.sum(w)))
+            self.assertEqual(zones.d["min"][k], values[w != 0].min())
+
+    def test_contour(self):
+        y, x = np.mgrid[0:50,0:60]
+        z = np.hypot(x - 30.0, y - 25.0)
+        grid = RegularGrid([0, 0, 1, 1, 0, 0], values=z)
+        contours = grid.contour([5.0, 10.0, 50.0], chunksize=(16, 16))
+        self.assertEqual(len(contours), 2)
+        self.assertEqual(contours.d["level"], [5.0, 10.0])
+        for level, v in zip([5.0, 10.0], contours.vertices()):
+            r = np.hypot(v[:,0] - 30.5, v[:,1] - 25.5)
+            self.assertTrue(np.all(r <= level + 1e-12))
+            self.assertTrue(np.all(r > level - 0.01))
+            self.assertTrue(np.all(v[0] == v[-1]))
+
+        # results do not depend on chunking
+        other = grid.contour([5.0, 10.0], chunksize=(50, 60))
+        for v1, v2 in zip(contours.vertices(), other.vertices()):
+            self.assertEqual(set(map(tuple, v1)), set(map(tuple, v2)))
+
+    def test_contour_nodata(self):
+        y, x = np.mgrid[0:40,0:40]
+        z = x + 0.5*y
+        z[10:15,:] = -1
+        grid = RegularGrid([0, 0, 1, 1, 0, 0], values=z, nodata_value=-1)
+        contours = grid.contour(20.0, chunksize=(8, 8))
+        self.assertEqual(len(contours), 2)
+        for v in contours.vertices():
+            self.assertTrue(np.allclose(v[:,0] - 0.5 + 0.5*(v[:,1] - 0.5), 20.0))
+            self.assertFalse(np.any((v[:,1] > 9.5) & (v[:,1] < 15.5)))
+
+    def test_polygonize(self):
+        values = np.zeros((6, 7), dtype=np.int32)
+        values[1:5,1:6] = 1
+        values[2:4,3] = 2
+        values[0,0] = -1
+        grid = RegularGrid([0, 0, 1, 1, 0, 0], values=values, nodata_value=-1)
+        polys = grid.polygonize(chunksize=(3, 3))
+        self.assertEqual(len(polys), 3)
+        self.assertEqual(polys.d["value"], [0, 1, 2])
+        self.assertEqual([len(p.subs) for p in polys], [1, 1, 0])
+        self.assertEqual(polys[0].area, 42 - 20 - 1)
+        self.assertEqual(polys[1].area, 20 - 2)
+        self.assertEqual(polys[2].area, 2)
+        self.assertEqual(sorted(map(tuple, polys[2].vertices())),
+                         [(3, 2), (3, 4), (4, 2), (4, 4)])
+
+    def test_polygonize_chunks(self):
+        np.random.seed(52)
+        values = np.random.randint(0, 3, (40, 45)).astype(np.float64)
+        grid = RegularGrid([10, 5, 2, 1.5, 0, 0], values=values)
+        polys = grid.polygonize(chunksize=(7, 9))
+        other = grid.polygonize(chunksize=(40, 45))
+        self.assertEqual(len(polys), len(other))
+        for v in (0, 1, 2):
+            area = sum(p.area for p, pv in zip(polys, polys.d["value"])
+                       if pv == v)
+            self.assertAlmostEqual(area, 3.0*np.sum(values == v))
+        self.assertEqual(sorted(p.area for p in polys),
+                         sorted(p.area for p in other))
 
     def test_positions(self):
         grid = RegularGrid([0.0, 0.0, 1.0, 1.0, 0.0, 0.0],
@@ -626,6 +1016,17 @@ class RegularGridTests(unittest.TestCase):
         self.assertEqual(len(pts), 49)
         self.assertTrue(np.allclose(z, expected))
 
+    def test_profile_multiline(self):
+        paths = karta.Multiline([[(15.0, 15.0), (1484.0, 1484.0)],
+                                 [(15.0, 1455.0), (1484.0, -14.0)]],
+                                crs=karta.crs.Cartesian)
+        pts, z = self.rast.profile(paths, resolution=42.426406871192853,
+                                   method="nearest")
+        self.assertEqual(len(pts), 98)
+        self.assertEqual(pts.d["part"], [0]*49 + [1]*49)
+        self.assertTrue(np.allclose(z[0,:49], self.rast[:,:,0].diagonal()))
+        self.assertTrue(np.allclose(z[0,49:], self.rast[:,:,0][::-1].diagonal()))
+
     def test_gridpoints_float64(self):
         # should use fast C version
         np.random.seed(49)
@@ -640,7 +1041,6 @@ class RegularGridTests(unittest.TestCase):
         self.assertTrue(np.sum(np.abs(Xg**2+Yg**3-grid[:,:,0]))/Xg.size < 0.45)
 
     def test_gridpoints_float32(self):
-        # should use Python fallback
         np.random.seed(49)
         x = np.random.rand(20000).astype(np.float32)*10.0-5.0
         y = np.random.rand(20000).astype(np.float32)*10.0-5.0
@@ -663,6 +1063,102 @@ class RegularGridTests(unittest.TestCase):
         self.assertEqual(np.sum(np.isnan(grid[:,:])), 4)
         self.assertEqual(np.sum(grid[:,:] == -1.0), 0)
 
+    def test_proximity(self):
+        np.random.seed(45)
+        v = np.where(np.random.rand(37, 53) < 0.02, 1, 0).astype(np.int32)
+        grid = RegularGrid([10.0, 200.0, 2.0, -3.0, 0.0, 0.0], values=v,
+                           nodata_value=-1)
+        dist, index = grid.proximity(target_values=[1], return_index=True)
+
+        I, J = np.indices(v.shape)
+        ti, tj = np.nonzero(v)
+        d = np.sqrt((2.0*(J[:,:,np.newaxis]-tj))**2 +
+                    (3.0*(I[:,:,np.newaxis]-ti))**2)
+        npt.assert_allclose(dist[:,:,0], d.min(axis=2))
+
+        # the index points to a target cell at the reported distance
+        k = index[:,:,0]
+        self.assertTrue(np.all(v.ravel()[k] == 1))
+        npt.assert_allclose(np.sqrt((2.0*(J-k%53))**2 + (3.0*(I-k//53))**2),
+                            dist[:,:,0])
+        self.assertFalse(np.any(np.isnan(dist[:,:,0])))
+
+    def test_proximity_nodata_targets(self):
+        v = np.full((5, 6), np.nan)
+        v[2,3] = 7.0
+        grid = RegularGrid([0, 0, 1, 1, 0, 0], values=v)
+        dist = grid.proximity()
+        I, J = np.indices(v.shape)
+        npt.assert_allclose(dist[:,:,0], np.sqrt((I-2)**2 + (J-3)**2))
+
+    def test_proximity_no_targets(self):
+        grid = RegularGrid([0, 0, 1, 1, 0, 0], values=np.zeros((4, 5)))
+        dist, index = grid.proximity(target_values=[1], return_index=True)
+        self.assertTrue(np.all(np.isnan(dist[:,:,0])))
+        self.assertTrue(np.all(index[:,:,0] == -1))
+
+class PointAggregatorTests(unittest.TestCase):
+
+    def setUp(self):
+        np.random.seed(49)
+        self.x = np.random.rand(5000)*4.0
+        self.y = np.random.rand(5000)*3.0
+        self.z = np.random.rand(5000)*100.0 + 1000.0
+        self.T = (0.0, 0.0, 1.0, 1.0, 0.0, 0.0)
+
+    def cell_values(self, i, j):
+        m = (np.floor(self.y) == i) & (np.floor(self.x) == j)
+        return self.z[m]
+
+    def test_statistics(self):
+        agg = karta.raster.PointAggregator(self.T, (3, 4),
+                stats=["count", "mean", "std", "min", "max", "last"])
+        self.assertEqual(agg.add(self.x, self.y, self.z), 5000)
+        grid = agg.finalize()
+        self.assertEqual(grid.nbands, 6)
+        for i in range(3):
+            for j in range(4):
+                z = self.cell_values(i, j)
+                self.assertEqual(grid[i,j,0], len(z))
+                self.assertAlmostEqual(grid[i,j,1], z.mean())
+                self.assertAlmostEqual(grid[i,j,2], z.std())
+                self.assertEqual(grid[i,j,3], z.min())
+                self.assertEqual(grid[i,j,4], z.max())
+                self.assertEqual(grid[i,j,5], z[-1])
+
+    def test_batches(self):
+        agg = karta.raster.PointAggregator(self.T, (3, 4), stats=["mean", "std"])
+        for k in range(0, 5000, 700):
+            agg.add(self.x[k:k+700], self.y[k:k+700], self.z[k:k+700])
+        agg2 = karta.raster.PointAggregator(self.T, (3, 4), stats=["mean", "std"])
+        agg2.add(self.x, self.y, self.z)
+        self.assertTrue(np.allclose(agg.finalize()[:,:], agg2.finalize()[:,:]))
+
+    def test_outside_and_empty(self):
+        agg = karta.raster.PointAggregator(self.T, (4, 4), stats="mean")
+        n = agg.add([0.5, -0.5, 5.5, 1.5, 2.5], [0.5, 0.5, 0.5, 4.5, 2.5],
+                    [1.0, 2.0, 3.0, 4.0, np.nan])
+        self.assertEqual(n, 2)
+        grid = agg.finalize("mean")
+        self.assertEqual(grid[0,0], 1.0)
+        self.assertTrue(np.isnan(grid[2,2]))
+        self.assertTrue(np.isnan(grid[3,3]))
+        self.assertEqual(agg.finalize("count")[0,0], 1)
+
+    def test_integer_counts(self):
+        agg = karta.raster.PointAggregator(self.T, (1, 1), stats=["count", "max"])
+        z = np.arange(40000, dtype=np.int64) % 30000
+        agg.add(np.full(40000, 0.5), np.full(40000, 0.5), z.astype(np.int16))
+        self.assertEqual(agg.finalize("count")[0,0], 40000)
+        self.assertEqual(agg.finalize("max")[0,0], 29999)
+
+    def test_unknown_statistic(self):
+        with self.assertRaises(ValueError):
+            karta.raster.PointAggregator(self.T, (3, 4), stats=["median"])
+        agg = karta.raster.PointAggregator(self.T, (3, 4), stats=["mean"])
+        with self.assertRaises(ValueError):
+            agg.finalize("max")
+
 #class TestInterpolation(unittest.TestCase):
 #
 #    def test_idw(self):
@@ -705,6 +1201,94 @@ def peaks(n=49):
             - 10.0 * (X/5.0 - X**3 - Y**5) * np.exp(-X**2 - Y**2) \
             - 1.0/3.0 * np.exp(-(X+1)**2 - Y**2)
 
+class RasterizeTests(unittest.TestCase):
+
+    def setUp(self):
+        self.like = RegularGrid([10.0, 20.0, 0.5, 0.5, 0.0, 0.0],
+                                values=np.zeros((40, 50)))
+
+    def test_rasterize_lines(self):
+        np.random.seed(51)
+        xy = np.c_[np.random.rand(12)*30 + 5, np.random.rand(12)*24 + 16]
+        line = karta.Line(xy)
+        out = karta.raster.rasterize(line, self.like, chunksize=(16, 16))
+        self.assertTrue(np.isnan(out.nodata))
+        burned = ~np.isnan(out[:,:,0])
+
+        # cells crossed by the line, found by dense sampling
+        expected = np.zeros((40, 50), dtype=bool)
+        for (x0, y0), (x1, y1) in zip(xy[:-1], xy[1:]):
+            t = np.linspace(0, 1, 20000)
+            j = np.floor((x0 + t*(x1-x0) - 10.0) / 0.5).astype(int)
+            i = np.floor((y0 + t*(y1-y0) - 20.0) / 0.5).astype(int)
+            ok = (i >= 0) & (i < 40) & (j >= 0) & (j < 50)
+            expected[i[ok], j[ok]] = True
+        self.assertTrue(np.all(burned[expected]))
+        self.assertTrue(burned.sum() - expected.sum() < 0.01*expected.sum())
+
+        # 'add' counts each cell once per line, including cells at vertices
+        x = np.linspace(11, 34, 40)
+        line = karta.Line(np.c_[x, 30 + 8*np.sin(x/4)])
+        out = karta.raster.rasterize([line, line], self.like, merge="add",
+                                     chunksize=(16, 16))
+        burned = ~np.isnan(out[:,:,0])
+        self.assertTrue(np.all(out[:,:,0][burned] == 2))
+
+    def test_rasterize_lines_chunk_invariant(self):
+        like = RegularGrid([0.0, 0.0, 1.0, 1.0, 0.0, 0.0],
+                           values=np.zeros((32, 32)))
+        out = karta.raster.rasterize(karta.Line([(16, 5.5), (20, 5.5)]), like,
+                                     chunksize=(16, 16))
+        self.assertEqual(np.flatnonzero(~np.isnan(out[5,:,0])).tolist(),
+                         [16, 17, 18, 19])
+
+        # lines starting, ending, and running on chunk boundaries
+        lines = [karta.Line([(16, 5.5), (20, 5.5)]),
+                 karta.Line([(3.5, 8), (16, 8)]),
+                 karta.Line([(8, 2.5), (8, 16), (24, 16), (24, 30)]),
+                 karta.Line([(16, 16), (28.5, 3.5)]),
+                 karta.Line([(2, 2), (16, 16), (30, 20)]),
+                 karta.Line([(20.5, 32), (20.5, 24)])]
+        for line in lines:
+            expected = karta.raster.rasterize(line, like, chunksize=(256, 256))
+            for chunksize in [(16, 16), (8, 8), (5, 7)]:
+                out = karta.raster.rasterize(line, like, chunksize=chunksize)
+                npt.assert_array_equal(out[:,:,0], expected[:,:,0])
+
+    def test_rasterize_points_field(self):
+        mp = karta.Multipoint([(10.1, 20.1), (10.4, 20.3), (34.9, 39.9),
+                               (100.0, 20.0)], data={"z": [1.0, 5.0, 3.0, 9.0]})
+        out = karta.raster.rasterize(mp, self.like, values="z", merge="add",
+                                     chunksize=(16, 16))
+        self.assertEqual(out[0,0,0], 6.0)
+        self.assertEqual(out[39,49,0], 3.0)
+        self.assertEqual(np.sum(~np.isnan(out[:,:,0])), 2)
+
+        out = karta.raster.rasterize(mp, self.like, values="z", merge="max")
+        self.assertEqual(out[0,0,0], 5.0)
+        out = karta.raster.rasterize(mp, self.like, values="z", merge="min",
+                                     dtype=np.int32)
+        self.assertEqual(out[0,0,0], 1)
+        self.assertEqual(out[5,5,0], out.nodata)
+
+    def test_rasterize_polygons(self):
+        p1 = karta.Polygon([(12, 22), (30, 24), (20, 38)],
+                           properties={"id": 1})
+        p2 = karta.Polygon([(18, 21), (33, 21), (33, 30), (18, 30)],
+                           properties={"id": 2})
+        out = karta.raster.rasterize([p1, p2], self.like, values="id",
+                                     chunksize=(16, 16))
+        m1 = karta.raster.grid.polygon_mask(p1, (40, 50), self.like.transform)
+        m2 = karta.raster.grid.polygon_mask(p2, (40, 50), self.like.transform)
+        self.assertTrue(np.all(out[:,:,0][m2] == 2))
+        self.assertTrue(np.all(out[:,:,0][m1 & ~m2] == 1))
+        self.assertTrue(np.all(np.isnan(out[:,:,0][~(m1 | m2)])))
+
+    def test_rasterize_bad_merge(self):
+        with self.assertRaises(ValueError):
+            karta.raster.rasterize(karta.Point((11, 21)), self.like,
+                                   merge="mean")
+
 if __name__ == "__main__":
     unittest.main()
 
@@ -0,0 +1,158 @@
+import unittest
+import numpy as np
+import numpy.testing as npt
+from karta import RegularGrid
+from karta.raster import hydro
+
+def brute_force_fill(Z):
+    """ Fill by repeated relaxation from outlets """
+    ny, nx = Z.shape
+    P = np.pad(Z, 1, mode="constant", constant_values=np.nan)
+    W = np.where(np.isnan(Z), np.nan, np.inf)
+    outlet = np.zeros(Z.shape, dtype=bool)
+    for i in range(3):
+        for j in range(3):
+            outlet |= np.isnan(P[i:i+ny,j:j+nx])
+    outlet &= ~np.isnan(Z)
+    W[outlet] = Z[outlet]
+    while True:
+        Wp = np.pad(W, 1, mode="constant", constant_values=np.inf)
+        Wp[np.isnan(Wp)] = np.inf
+        lowest = np.full(Z.shape, np.inf)
+        for i in range(3):
+            for j in range(3):
+                lowest = np.minimum(lowest, Wp[i:i+ny,j:j+nx])
+        Wnew = np.where(np.isnan(Z), np.nan,
+                        np.where(outlet, Z, np.maximum(Z, lowest)))
+        if np.array_equal(Wnew, W, equal_nan=True):
+            return W
+        W = Wnew
+
+def brute_force_accumulation(F, di, dj):
+    ny, nx = F.shape
+    acc = np.zeros(F.shape)
+    for i in range(ny):
+        for j in range(nx):
+            if F[i,j] == 255:
+                continue
+            ci, cj = i, j
+            while True:
+                acc[ci,cj] += 1
+                code = F[ci,cj]
+                ni, nj = ci + di[code], cj + dj[code]
+                if (ni, nj) == (ci, cj) or not (0 <= ni < ny and 0 <= nj < nx) \
+                        or F[ni,nj] == 255:
+                    break
+                ci, cj = ni, nj
+    acc[F == 255] = np.nan
+    return acc
+
+class HydroTests(unittest.TestCase):
+
+    def setUp(self):
+        np.random.seed(44)
+        ny, nx = 41, 53
+        y, x = np.mgrid[:ny,:nx]
+        Z = 0.05*(x-20)**2 + 0.03*(y-25)**2 + np.random.normal(0, 3.0, (ny, nx))
+        Z[10:14,30:33] = np.nan
+        Z[20,0:3] = np.nan
+        self.Z = Z
+        self.grid = RegularGrid((0, 0, 10, 10, 0, 0),
+                                values=np.where(np.isnan(Z), -9999, Z),
+                                nodata_value=-9999)
+
+    def test_fill(self):
+        filled = hydro.fill_depressions(self.grid)
+        npt.assert_array_equal(filled[:,:,0], brute_force_fill(self.Z))
+
+    def test_fill_tiled(self):
+        expected = brute_force_fill(self.Z)
+        for tilesize in [(7, 9), (16, 16), (41, 2)]:
+            filled = hydro.fill_depressions(self.grid, tilesize=tilesize,
+                                            nthreads=2)
+            npt.assert_array_equal(filled[:,:,0], expected)
+
+    def test_fill_epsilon(self):
+        filled = hydro.fill_depressions(self.grid, epsilon=True)
+        expected = brute_force_fill(self.Z)
+        F = filled[:,:,0]
+        self.assertTrue(np.all((F >= expected) | np.isnan(F)))
+        npt.assert_allclose(F, expected, atol=1e-9)
+
+        # every cell except outlets drains to a lower neighbour
+        fdir = hydro.flow_direction(filled)[:,:,0]
+        outlet = hydro._outlets(np.pad(F, 1, mode="constant",
+                                       constant_values=np.nan))
+        self.assertTrue(np.all(fdir[~outlet & ~np.isnan(F)] != 0))
+
+    def test_fill_epsilon_tiled(self):
+        # a sloping surface with many small depressions, some of which cross
+        # tile edges
+        n = 150
+        y, x = np.mgrid[:n,:n] / float(n)
+        rng = np.random.RandomState(44)
+        Z = (100*(x + y) + 20*np.sin(12*x)*np.cos(9*y) +
+             rng.normal(0, 0.5, x.shape)).astype(np.float32).astype(np.float64)
+        grid = RegularGrid((0, 0, 30, 30, 0, 0), values=Z)
+        expected = brute_force_fill(Z)
+        raised = expected > Z
+        self.assertTrue(raised.sum() > 100)
+
+        untiled = hydro.fill_depressions(grid, epsilon=True)
+        acc = hydro.flow_accumulation(hydro.flow_direction(untiled))[:,:,0]
+        outlet = hydro._outlets(np.pad(Z, 1, mode="constant",
+                                       constant_values=np.nan))
+        for tilesize in [(32, 32), (17, 40)]:
+            filled = hydro.fill_depressions(grid, epsilon=True,
+                                            tilesize=tilesize, nthreads=2)
+            F = filled[:,:,0]
+            self.assertTrue(np.all(F >= expected))
+            npt.assert_allclose(F, expected, atol=1e-8)
+
+            # every cell except outlets drains to a lower neighbour, and flow
+            # leaves filled depressions where it does without tiles
+            fdir = hydro.flow_direction(filled)
+            self.assertTrue(np.all(fdir[:,:,0][~outlet] != 0))
+            tacc = hydro.flow_accumulation(fdir)[:,:,0]
+            npt.assert_array_equal(tacc[~raised], acc[~raised])
+            self.assertEqual(tacc.max(), acc.max())
+
+    def test_flow_direction_plane(self):
+        y, x = np.mgrid[:10,:12]
+        grid = RegularGrid((0, 0, 1, 1, 0, 0), values=100.0 - x - 0.1*y)
+        # rows run south to north
+        fdir = hydro.flow_direction(grid, chunksize=(4, 5))[:,:,0]
+        self.assertEqual(fdir.dtype, np.uint8)
+        self.assertTrue(np.all(fdir[:,:-1] == 1))
+        self.assertTrue(np.all(fdir[:-1,-1] == 64))
+
+        # rows run north to south when dy is negative
+        grid = RegularGrid((0, 10, 1, -1, 0, 0), values=100.0 - y)
+        fdir = hydro.flow_direction(grid)[:,:,0]
+        self.assertTrue(np.all(fdir[:-1] == 4))
+
+    def test_flow_direction_nodata(self):
+        fdir = hydro.flow_direction(self.grid)
+        self.assertEqual(fdir.nodata, 255)
+        npt.assert_array_equal(fdir[:,:,0] == 255, np.isnan(self.Z))
+
+    def test_flow_accumulation(self):
+        filled = hydro.fill_depressions(self.grid, epsilon=True)
+        fdir = hydro.flow_direction(filled)
+        di, dj = hydro._offsets(fdir)
+        expected = brute_force_accumulation(fdir[:,:,0], di, dj)
+        acc = hydro.flow_accumulation(fdir)
+        npt.assert_array_equal(acc[:,:,0], expected)
+        for tilesize in [(7, 9), (16, 16), (41, 2)]:
+            acc = hydro.flow_accumulation(fdir, tilesize=tilesize, nthreads=2)
+            npt.assert_array_equal(acc[:,:,0], expected)
+
+    def test_flow_accumulation_weights(self):
+        fdir = hydro.flow_direction(hydro.fill_depressions(self.grid, epsilon=True))
+        weights = RegularGrid(fdir.transform, values=np.full(fdir.size, 0.5))
+        acc = hydro.flow_accumulation(fdir)
+        wacc = hydro.flow_accumulation(fdir, weights=weights, tilesize=(10, 10))
+        npt.assert_array_equal(wacc[:,:,0], 0.5*acc[:,:,0])
+
+if __name__ == "__main__":
+    unittest.main()
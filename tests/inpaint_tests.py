@@ -0,0 +1,65 @@
+import unittest
+import numpy as np
+import numpy.testing as npt
+from karta import RegularGrid
+
+class FillNodataTests(unittest.TestCase):
+
+    def setUp(self):
+        I, J = np.indices((120, 150))
+        self.Z = 0.3*I + 0.7*J + 5.0
+        H = self.Z.copy()
+        H[30:90,40:110] = np.nan
+        H[100:105,10:14] = np.nan
+        self.grid = RegularGrid([0, 0, 2.0, -3.0, 0, 0], values=H)
+
+    def test_laplace_linear(self):
+        # linear surfaces are harmonic, so enclosed holes are filled exactly
+        filled = self.grid.fill_nodata(method="laplace", max_distance=500,
+                                       chunksize=(32, 32))
+        npt.assert_allclose(filled[:,:,0], self.Z, atol=1e-2)
+        self.assertEqual(np.isnan(self.grid[:,:,0]).sum(), 60*70+5*4)
+
+    def test_idw(self):
+        filled = self.grid.fill_nodata(method="idw", max_distance=500,
+                                       chunksize=(32, 32))
+        F = filled[:,:,0]
+        self.assertFalse(np.any(np.isnan(F)))
+        valid = ~np.isnan(self.grid[:,:,0])
+        npt.assert_equal(F[valid], self.Z[valid])
+        self.assertTrue(np.all(F[~valid] >= self.Z[valid].min()))
+        self.assertTrue(np.all(F[~valid] <= self.Z[valid].max()))
+
+    def test_idw_weights(self):
+        v = np.array([[0.0, np.nan, np.nan, 30.0]])
+        grid = RegularGrid([0, 0, 1, 1, 0, 0], values=v)
+        filled = grid.fill_nodata(method="idw", max_distance=10)
+        npt.assert_allclose(filled[0,:,0], [0.0, 6.0, 24.0, 30.0])
+
+    def test_max_distance(self):
+        for method in ("idw", "laplace"):
+            filled = self.grid.fill_nodata(method=method, max_distance=10,
+                                           chunksize=(32, 32))
+            F = filled[:,:,0]
+            # cells more than 10 units from valid cells remain NoData
+            self.assertTrue(np.isnan(F[60,75]))
+            self.assertFalse(np.isnan(F[31,75]))
+            self.assertFalse(np.isnan(F[60,43]))
+            self.assertFalse(np.any(np.isnan(F[100:105,10:14])))
+
+    def test_integer_band(self):
+        v = np.full((5, 5), 10, dtype=np.int16)
+        v[1:4,1:4] = 20
+        v[2,2] = -1
+        grid = RegularGrid([0, 0, 1, 1, 0, 0], values=v, nodata_value=-1)
+        filled = grid.fill_nodata(method="laplace")
+        self.assertEqual(filled[:,:,0].dtype, np.int16)
+        self.assertEqual(filled[2,2,0], 20)
+        self.assertEqual(filled.nodata, -1)
+
+    def test_bad_method(self):
+        with self.assertRaises(ValueError):
+            self.grid.fill_nodata(method="kriging")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+import unittest
+import numpy as np
+import numpy.testing as npt
+from karta import RegularGrid, Multipoint
+from karta.raster import interpolate_points
+
+class InterpolatePointsTests(unittest.TestCase):
+
+    def setUp(self):
+        np.random.seed(49)
+        self.x = np.random.uniform(10, 90, 300)
+        self.y = np.random.uniform(20, 70, 300)
+        self.z = 2*self.x - 3*self.y + 1
+        self.mp = Multipoint(np.column_stack([self.x, self.y]),
+                             data={"z": self.z})
+        self.like = RegularGrid([0, 80, 2.0, -2.0, 0, 0],
+                                values=np.zeros((35, 50)))
+        self.cx, self.cy = self.like.center_coords()
+
+    def test_linear_plane(self):
+        grid = interpolate_points(self.mp, "z", like=self.like,
+                                  method="linear", chunksize=(16, 16))
+        v = grid[:,:,0]
+        inside = ~np.isnan(v)
+        npt.assert_allclose(v[inside], (2*self.cx - 3*self.cy + 1)[inside],
+                            atol=1e-9)
+        # cells far outside the convex hull are NoData
+        self.assertTrue(np.isnan(v[0,0]))
+        self.assertTrue(np.isnan(v[-1,-1]))
+        self.assertFalse(np.isnan(v[15,25]))
+
+    def test_nearest(self):
+        grid = interpolate_points(self.mp, "z", like=self.like,
+                                  method="nearest", chunksize=(16, 16))
+        cx, cy = np.ravel(self.cx), np.ravel(self.cy)
+        d = np.hypot(cx[:,np.newaxis]-self.x, cy[:,np.newaxis]-self.y)
+        expected = self.z[d.argmin(axis=1)].reshape(self.like.size)
+        npt.assert_allclose(grid[:,:,0], expected)
+
+    def test_idw(self):
+        grid = interpolate_points(self.mp, self.z, like=self.like, k=4,
+                                  power=1.5, chunksize=(16, 16), nthreads=2)
+        cx, cy = np.ravel(self.cx), np.ravel(self.cy)
+        d = np.hypot(cx[:,np.newaxis]-self.x, cy[:,np.newaxis]-self.y)
+        nearest = np.argsort(d, axis=1)[:,:4]
+        dn = np.take_along_axis(d, nearest, axis=1)
+        w = dn**-1.5
+        expected = (w*self.z[nearest]).sum(axis=1) / w.sum(axis=1)
+        npt.assert_allclose(grid[:,:,0], expected.reshape(self.like.size))
+
+    def test_idw_at_points(self):
+        mp = Multipoint([(1.0, 1.0), (3.0, 1.0), (3.0, 1.0), (5.0, 5.0)],
+                        data={"z": [1.0, 2.0, 4.0, 8.0]})
+        like = RegularGrid([0, 0, 2.0, 2.0, 0, 0], values=np.zeros((3, 3)))
+        grid = interpolate_points(mp, "z", like=like, max_distance=1.5)
+        v = grid[:,:,0]
+        self.assertEqual(v[0,0], 1.0)
+        # duplicate points are averaged
+        self.assertEqual(v[0,1], 3.0)
+        self.assertEqual(v[2,2], 8.0)
+        self.assertTrue(np.isnan(v[1,0]))
+
+    def test_bad_arguments(self):
+        with self.assertRaises(ValueError):
+            interpolate_points(self.mp, "z", like=self.like, method="cubic")
+        with self.assertRaises(ValueError):
+            interpolate_points(self.mp, [1.0, 2.0], like=self.like)
+
+if __name__ == "__main__":
+    unittest.main()
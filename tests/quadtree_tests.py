@@ -68,6 +68,26 @@ class TestQuadTree(unittest.TestCase):
         self.assertEqual(len(indices_within), 11)
         return
 
+    def test_quadtree_nearest(self):
+        np.random.seed(49)
+        vertices = np.random.rand(2000, 2)
+        quadtree = QuadTree(CoordString(vertices), leaf_capacity=10)
+        x, y = np.random.rand(2, 100) * 1.2 - 0.1
+        indices, distances = quadtree.nearest(x, y, k=5)
+        self.assertEqual(indices.shape, (100, 5))
+        for i in range(100):
+            d = np.hypot(vertices[:,0]-x[i], vertices[:,1]-y[i])
+            np.testing.assert_allclose(distances[i], np.sort(d)[:5])
+            np.testing.assert_allclose(d[indices[i]], distances[i])
+        return
+
+    def test_quadtree_nearest_few_points(self):
+        quadtree = QuadTree(CoordString([(0.0, 0.0), (1.0, 1.0), (1.0, 1.0)]))
+        indices, distances = quadtree.nearest([0.9], [0.9], k=3)
+        self.assertEqual(list(indices[0]), [1, 0, -1])
+        self.assertTrue(np.isinf(distances[0,2]))
+        return
+
 class TestGeometryWithQuadTree(unittest.TestCase):
 
     def test_within_radius(self):
@@ -136,6 +136,68 @@ class RasterMiscTests(unittest.TestCase):
             np.nansum(np.abs((g[:,:]/g.max() + div[:,:]/div.max()))) < 1.32
         )
 
+    def test_chunked_threaded(self):
+        x = np.linspace(0, 3*np.pi, 90)
+        y = np.linspace(0, 2*np.pi, 70).reshape(-1, 1)
+        g = RegularGrid((0, 0, 0.5, 0.3, 0, 0), values=np.sin(x)*np.cos(y))
+        for func in (misc.slope, misc.aspect, misc.hillshade):
+            ref = func(g, chunksize=(1000, 1000), nthreads=1)
+            res = func(g, chunksize=(16, 24), nthreads=3)
+            npt.assert_array_equal(ref[:,:], res[:,:])
+
+        refx, refy = misc.gradient(g, chunksize=(1000, 1000), nthreads=1)
+        resx, resy = misc.gradient(g, chunksize=(7, 11), nthreads=2)
+        npt.assert_array_equal(refx[:,:], resx[:,:])
+        npt.assert_array_equal(refy[:,:], resy[:,:])
+
+    def test_dtype(self):
+        x = np.linspace(0, 3*np.pi, 60)
+        y = np.linspace(0, 2*np.pi, 40).reshape(-1, 1)
+        g = RegularGrid((0, 0, 0.5, 0.3, 0, 0), values=np.sin(x)*np.cos(y))
+        s32 = misc.slope(g)
+        s64 = misc.slope(g, dtype=np.float64)
+        self.assertEqual(s32[:,:].dtype, np.float32)
+        self.assertEqual(s64[:,:].dtype, np.float64)
+        npt.assert_allclose(s32[:,:], s64[:,:], rtol=1e-5)
+        self.assertEqual(misc.hillshade(g, dtype=np.float32)[:,:].dtype,
+                         np.float32)
+        with self.assertRaises(ValueError):
+            misc.slope(g, dtype=np.int32)
+
+    def test_band_percentiles(self):
+        values = np.zeros((60, 50))
+        values[:10] = np.random.RandomState(7).rand(10, 50)
+        values[20:30,:5] = np.nan
+        g = RegularGrid((0, 0, 1, 1, 0, 0), values=values)
+        band = g.bands[0]
+        chunks = misc._chunks(g.size, (16, 16))
+        v = values[~np.isnan(values)]
+        counts = np.bincount(misc._bin_index(v, 0.0, 1.0, 256), minlength=256)
+        npt.assert_allclose(misc._band_percentiles(band, chunks, (2, 50, 90, 98),
+                                                   counts, 0.0, 1.0),
+                            np.percentile(v, (2, 50, 90, 98)))
+
+        # narrow repeatedly when few values may be held at once
+        inbin = lambda x: ~np.isnan(x)
+        for rank in (0, 17, 2500, len(v)-1):
+            self.assertEqual(misc._band_rank(band, chunks, rank, inbin, 0,
+                                             0.0, 1.0, nbins=4, limit=3),
+                             np.sort(v)[rank])
+
+    def test_nodata(self):
+        x = np.arange(32, dtype=np.float64)
+        y = np.arange(24).reshape(-1, 1)
+        values = x*np.ones_like(y)
+        values[10, 12] = -9999
+        g = RegularGrid((0, 0, 10, 10, 0, 0), values=values, nodata_value=-9999)
+        slope = misc.slope(g, chunksize=(8, 8))[:,:,0]
+        self.assertTrue(np.all(np.isnan(slope[9:12,11:14])))
+        self.assertEqual(np.isnan(slope).sum(), 9)
+        self.assertTrue(np.all(slope[~np.isnan(slope)] == np.float32(0.1)))
+
+        aspect = misc.aspect(g, chunksize=(8, 8))[:,:,0]
+        self.assertEqual(np.isnan(aspect).sum(), 9 + 2*32 + 2*22)
+
 if __name__ == "__main__":
     unittest.main()
 
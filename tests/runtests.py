@@ -18,6 +18,14 @@ from grid_tests import *
 from band_tests import *
 from coordgen_tests import *
 from raster_misc_tests import *
+from focal_tests import *
+from sketch_tests import *
+from classify_tests import *
+from hydro_tests import *
+from costpath_tests import *
+from inpaint_tests import *
+from stack_tests import *
+from interpolate_tests import *
 
 # Vector operations
 from vector_predicate_tests import *
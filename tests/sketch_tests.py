@@ -0,0 +1,76 @@
+import unittest
+import numpy as np
+from karta import RegularGrid
+from karta.raster import QuantileSketch, CompressedBand
+
+class QuantileSketchTests(unittest.TestCase):
+
+    def setUp(self):
+        np.random.seed(49)
+
+    def assertWithinError(self, sketch, values, qs):
+        exact = np.percentile(values, 100*np.asarray(qs))
+        span = values.max() - values.min()
+        self.assertTrue(np.all(np.abs(sketch.quantiles(qs) - exact)
+                               <= sketch.error*span))
+
+    def test_quantiles(self):
+        values = np.random.normal(1000.0, 25.0, 100000)
+        sketch = QuantileSketch(error=1e-3)
+        sketch.update(values)
+        qs = np.linspace(0, 1, 51)
+        self.assertWithinError(sketch, values, qs)
+        self.assertEqual(sketch.quantiles(0.0), values.min())
+        self.assertEqual(sketch.quantiles(1.0), values.max())
+
+    def test_streaming_rebin(self):
+        # later chunks extend the range, forcing bins to be merged
+        values = np.random.exponential(1.0, 50000)
+        values[-10000:] *= 100.0
+        sketch = QuantileSketch(error=1e-2)
+        for chunk in np.array_split(values, 13):
+            sketch.update(chunk)
+        self.assertEqual(sketch.count, len(values))
+        self.assertLessEqual(len(sketch._counts), sketch.nbins)
+        self.assertWithinError(sketch, values, np.linspace(0, 1, 51))
+
+    def test_merge(self):
+        values = np.random.uniform(-5, 5, 30000)
+        values[:10000] *= 1e-3
+        merged = QuantileSketch(error=1e-3)
+        for chunk in np.array_split(values, 3):
+            part = QuantileSketch(error=1e-3)
+            part.update(chunk)
+            merged.merge(part)
+        self.assertEqual(merged.count, len(values))
+        self.assertWithinError(merged, values, np.linspace(0, 1, 51))
+
+    def test_constant_and_empty(self):
+        sketch = QuantileSketch()
+        self.assertTrue(np.isnan(sketch.quantiles(0.5)))
+        sketch.update([np.nan, 3.5, 3.5, np.nan])
+        self.assertEqual(sketch.count, 2)
+        self.assertTrue(np.all(sketch.quantiles([0, 0.5, 1]) == 3.5))
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            QuantileSketch(error=0)
+        sketch = QuantileSketch()
+        with self.assertRaises(ValueError):
+            sketch.update([1.0, np.inf])
+        with self.assertRaises(ValueError):
+            sketch.quantiles(1.5)
+
+    def test_grid_quantiles(self):
+        values = np.random.normal(size=(300, 400))
+        values[:50,:50] = -9999
+        g = RegularGrid((0, 0, 1, 1, 0, 0), values=values, nodata_value=-9999,
+                        bandclass=CompressedBand)
+        valid = values[values != -9999]
+        q = g.quantiles([0.02, 0.5, 0.98], error=1e-3)
+        exact = np.percentile(valid, [2, 50, 98])
+        span = valid.max() - valid.min()
+        self.assertTrue(np.all(np.abs(q - exact) <= 1e-3*span))
+
+if __name__ == "__main__":
+    unittest.main()
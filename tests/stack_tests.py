@@ -0,0 +1,91 @@
+import unittest
+import numpy as np
+import numpy.testing as npt
+import karta
+from karta import RegularGrid
+from karta.raster import RasterStack
+from karta.errors import GridError
+
+class RasterStackTests(unittest.TestCase):
+
+    def setUp(self):
+        np.random.seed(48)
+        self.values = np.random.rand(9, 23, 31)
+        self.values[self.values < 0.15] = np.nan
+        self.values[:,0,0] = np.nan
+        self.values[0,1,1] = 0.5
+        self.values[1:,1,1] = np.nan
+        self.times = np.cumsum(np.random.rand(9))
+        grids = []
+        for v in self.values:
+            v = np.where(np.isnan(v), -1, v)
+            grids.append(RegularGrid([0, 0, 2, 2, 0, 0], values=v,
+                                     nodata_value=-1))
+        self.stack = RasterStack(grids, times=self.times)
+
+    def test_read_chunk(self):
+        block = self.stack.read_chunk(3, 10, 5, 20)
+        npt.assert_equal(block, self.values[:,3:10,5:20])
+
+    def test_count(self):
+        count = self.stack.count(chunksize=(8, 8))
+        npt.assert_equal(count[:,:,0], (~np.isnan(self.values)).sum(axis=0))
+
+    def test_mean(self):
+        mean = self.stack.mean(chunksize=(8, 8))
+        expected = np.nanmean(self.values, axis=0)
+        npt.assert_allclose(mean[:,:,0], expected)
+
+    def test_median_percentile(self):
+        npt.assert_allclose(self.stack.median(chunksize=(8, 8))[:,:,0],
+                            np.nanmedian(self.values, axis=0))
+        for q in (0, 10, 75, 100):
+            npt.assert_allclose(self.stack.percentile(q, chunksize=(8, 8))[:,:,0],
+                                np.nanpercentile(self.values, q, axis=0))
+
+    def test_percentile_complete(self):
+        v = np.random.rand(6, 10, 12)
+        stack = RasterStack([RegularGrid([0, 0, 1, 1, 0, 0], values=a)
+                             for a in v])
+        for q in (0, 30, 50, 100):
+            npt.assert_allclose(stack.percentile(q)[:,:,0],
+                                np.percentile(v, q, axis=0))
+
+    def test_argmax(self):
+        argmax = self.stack.argmax(chunksize=(8, 8))[:,:,0]
+        self.assertEqual(argmax[0,0], -1)
+        expected = np.nanargmax(self.values[:,1:,:], axis=0)
+        npt.assert_equal(argmax[1:,:], expected)
+
+    def test_trend(self):
+        trend = self.stack.trend(chunksize=(8, 8))[:,:,0]
+        self.assertTrue(np.isnan(trend[0,0]))
+        self.assertTrue(np.isnan(trend[1,1]))
+        for i, j in [(5, 7), (20, 30), (12, 0)]:
+            valid = ~np.isnan(self.values[:,i,j])
+            slope = np.polyfit(self.times[valid], self.values[valid,i,j], 1)[0]
+            self.assertAlmostEqual(trend[i,j], slope)
+
+    def test_reduce(self):
+        result = self.stack.reduce(lambda b: np.nanmax(b, axis=0) > 0.9,
+                                   dtype=np.uint8, nodata_value=255)
+        self.assertEqual(result[:,:,0].dtype, np.uint8)
+        self.assertEqual(result.crs, self.stack.crs)
+
+    def test_from_grid(self):
+        grid = RegularGrid([0, 0, 2, 2, 0, 0], values=np.dstack(self.values),
+                           nodata_value=np.nan)
+        stack = RasterStack.from_grid(grid)
+        self.assertEqual(len(stack), 9)
+        npt.assert_allclose(stack.mean()[:,:,0], np.nanmean(self.values, axis=0))
+
+    def test_mismatched_grids(self):
+        grids = [RegularGrid([0, 0, 2, 2, 0, 0], values=np.zeros((4, 4))),
+                 RegularGrid([1, 0, 2, 2, 0, 0], values=np.zeros((4, 4)))]
+        with self.assertRaises(GridError):
+            RasterStack(grids)
+        with self.assertRaises(ValueError):
+            RasterStack(grids[:1], times=[1, 2])
+
+if __name__ == "__main__":
+    unittest.main()
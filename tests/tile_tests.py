@@ -1,7 +1,16 @@
+import os
+import shutil
+import struct
+import tempfile
 import unittest
-from karta.tile import Tile, tile_from_point
+import zlib
+import numpy as np
+import numpy.testing as npt
+from karta.tile import (Tile, tile_from_point, tiles_covering, tile_path,
+                        warp_tile, render_tiles)
 from karta.vector.geometry import Point
-from karta.crs import LonLatWGS84
+from karta.raster.grid import RegularGrid
+from karta.crs import LonLatWGS84, WebMercator
 
 class TileTests(unittest.TestCase):
 
@@ -33,5 +42,188 @@ class TileTests(unittest.TestCase):
         self.assertAlmostEqual(bbox[3], 85.05112877, places=7)
         return
 
+    def test_tile_mercator_bbox(self):
+        bbox = Tile(1, 0, 0).mercator_bbox()
+        npt.assert_allclose(bbox, (-20037508.342789244, 0.0,
+                                   0.0, 20037508.342789244), atol=1e-6)
+        return
+
+def read_png(fnm):
+    """ Decode an 8-bit RGBA PNG written without filters. """
+    with open(fnm, "rb") as f:
+        data = f.read()
+    pos = 8
+    idat = b""
+    while pos < len(data):
+        n, = struct.unpack(">I", data[pos:pos+4])
+        tag = data[pos+4:pos+8]
+        if tag == b"IHDR":
+            w, h = struct.unpack(">II", data[pos+8:pos+16])
+        elif tag == b"IDAT":
+            idat += data[pos+8:pos+8+n]
+        pos += n + 12
+    raw = np.frombuffer(zlib.decompress(idat), dtype=np.uint8)
+    return raw.reshape(h, 1+4*w)[:,1:].reshape(h, w, 4)
+
+class RenderTileTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        # a grid with the cells of the pixels of tile (4, 8, 7)
+        xmin, ymin, xmax, ymax = Tile(4, 8, 7).mercator_bbox()
+        d = (xmax-xmin)/256
+        self.values = np.arange(256*256, dtype=np.float64).reshape(256, 256)
+        self.values[:10,:10] = -1
+        self.grid = RegularGrid((xmin, ymin, d, d, 0, 0), values=self.values,
+                                crs=WebMercator, nodata_value=-1)
+        return
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        return
+
+    def test_tiles_covering(self):
+        grid = RegularGrid((0, 0, 0.1, 0.1, 0, 0), values=np.zeros((100, 100)),
+                           crs=LonLatWGS84)
+        self.assertEqual(tiles_covering(grid, 4), [Tile(4, 8, 7)])
+        self.assertEqual(tiles_covering(grid, 6),
+                         [Tile(6, 32, 30), Tile(6, 33, 30),
+                          Tile(6, 32, 31), Tile(6, 33, 31)])
+        self.assertEqual(tiles_covering(self.grid, 4), [Tile(4, 8, 7)])
+        self.assertEqual(len(tiles_covering(self.grid, 6)), 16)
+        return
+
+    def test_warp_tile(self):
+        values = warp_tile(self.grid, Tile(4, 8, 7))
+        expected = self.values[::-1].copy()
+        expected[expected == -1] = np.nan
+        npt.assert_array_equal(values, expected)
+
+        values = warp_tile(self.grid, Tile(4, 9, 7))
+        self.assertTrue(np.isnan(values).all())
+        return
+
+    def test_render_npy(self):
+        paths = render_tiles(self.grid, [3, 4], directory=self.directory,
+                             fmt="npy", nprocesses=1)
+        self.assertEqual(sorted(paths),
+                         [tile_path(self.directory, Tile(3, 4, 3), "npy"),
+                          tile_path(self.directory, Tile(4, 8, 7), "npy")])
+        values = np.load(tile_path(self.directory, Tile(4, 8, 7), "npy"))
+        npt.assert_array_equal(values[-1,10:], self.values[0,10:])
+        self.assertTrue(np.isnan(values[-10:,:10]).all())
+
+        values = np.load(tile_path(self.directory, Tile(3, 4, 3), "npy"))
+        self.assertTrue(np.isnan(values[:128]).all())
+        self.assertTrue(np.isnan(values[:,128:]).all())
+        self.assertFalse(np.isnan(values[133:,5:128]).any())
+        return
+
+    def test_render_png(self):
+        colormap = [(0, (0, 0, 255)), (65535, (255, 0, 0))]
+        paths = render_tiles(self.grid, 4, colormap, directory=self.directory,
+                             nprocesses=1)
+        self.assertEqual(paths, [tile_path(self.directory, Tile(4, 8, 7))])
+        rgba = read_png(paths[0])
+        self.assertEqual(rgba.shape, (256, 256, 4))
+        v = self.values[::-1]
+        npt.assert_array_equal(rgba[...,0], np.where(v == -1, 0,
+                               np.round(v/65535.0*255)))
+        npt.assert_array_equal(rgba[...,3], np.where(v == -1, 0, 255))
+        return
+
+    def test_render_callable_colormap(self):
+        colormap = lambda v: np.where(np.isnan(v), 0, 200)[...,np.newaxis] * \
+                             np.ones(3, dtype=np.uint8)
+        paths = render_tiles(self.grid, 4, colormap, directory=self.directory,
+                             nprocesses=1)
+        rgba = read_png(paths[0])
+        self.assertEqual(rgba[0,0].tolist(), [200, 200, 200, 255])
+        self.assertEqual(rgba[-1,0].tolist(), [0, 0, 0, 0])
+        return
+
+    def test_render_skips_existing(self):
+        colormap = [(0, (0, 0, 0)), (65535, (255, 255, 255))]
+        paths = render_tiles(self.grid, [4, 5], colormap,
+                             directory=self.directory, nprocesses=1)
+        self.assertEqual(len(paths), 5)
+        with open(paths[0], "wb") as f:
+            f.write(b"sentinel")
+        self.assertEqual(render_tiles(self.grid, [4, 5], colormap,
+                                      directory=self.directory, nprocesses=1),
+                         [])
+        with open(paths[0], "rb") as f:
+            self.assertEqual(f.read(), b"sentinel")
+
+        again = render_tiles(self.grid, [4, 5], colormap,
+                             directory=self.directory, overwrite=True,
+                             nprocesses=1)
+        self.assertEqual(sorted(again), sorted(paths))
+        self.assertEqual(read_png(paths[0]).shape, (256, 256, 4))
+        return
+
+    def test_render_records_empty_tiles(self):
+        lonlat = RegularGrid((10.0, 5.0, 0.5, 0.5, 0, 0),
+                             values=np.ones((20, 20)), crs=LonLatWGS84)
+        tiles = tiles_covering(lonlat, 6)
+        paths = render_tiles(lonlat, 6, directory=self.directory, fmt="npy",
+                             nprocesses=1)
+        self.assertEqual(len(paths), len(tiles))
+
+        # NoData in the eastern half of the grid leaves tiles without data
+        grid = RegularGrid((10.0, 5.0, 0.5, 0.5, 0, 0),
+                           values=np.where(np.arange(20) < 10, 1.0, np.nan)
+                                  * np.ones((20, 1)),
+                           crs=LonLatWGS84)
+        directory = os.path.join(self.directory, "partial")
+        paths = render_tiles(grid, 6, directory=directory, fmt="npy",
+                             nprocesses=1)
+        self.assertTrue(0 < len(paths) < len(tiles))
+        empty = [t for t in tiles if tile_path(directory, t, "npy") not in paths]
+        for t in empty:
+            marker = os.path.join(directory, "6", str(t.x),
+                                  "{0}.empty".format(t.y))
+            self.assertTrue(os.path.exists(marker))
+            self.assertEqual(os.path.getsize(marker), 0)
+            self.assertFalse(os.path.exists(tile_path(directory, t, "npy")))
+
+        # empty tiles are not rendered again
+        self.assertEqual(render_tiles(grid, 6, directory=directory, fmt="npy",
+                                      nprocesses=1), [])
+
+        # overwriting a tile that now has data removes its marker
+        again = render_tiles(lonlat, 6, directory=directory, fmt="npy",
+                             overwrite=True, nprocesses=1)
+        self.assertEqual(len(again), len(tiles))
+        for t in empty:
+            marker = os.path.join(directory, "6", str(t.x),
+                                  "{0}.empty".format(t.y))
+            self.assertFalse(os.path.exists(marker))
+        return
+
+    def test_render_processes(self):
+        serial = os.path.join(self.directory, "serial")
+        pooled = os.path.join(self.directory, "pooled")
+        a = render_tiles(self.grid, [4, 5, 6], directory=serial, fmt="npy",
+                         nprocesses=1)
+        b = render_tiles(self.grid, [4, 5, 6], directory=pooled, fmt="npy",
+                         nprocesses=2)
+        self.assertEqual(len(a), 21)
+        self.assertEqual(len(b), 21)
+        for path in a:
+            npt.assert_array_equal(np.load(path),
+                    np.load(path.replace(serial, pooled)))
+        return
+
+    def test_render_bad_arguments(self):
+        with self.assertRaises(ValueError):
+            render_tiles(self.grid, 4, directory=self.directory)
+        with self.assertRaises(ValueError):
+            render_tiles(self.grid, 4, directory=self.directory, fmt="jpg")
+        with self.assertRaises(NotImplementedError):
+            render_tiles(self.grid, 4, directory=self.directory, fmt="npy",
+                         method="cubic")
+        return
+
 if __name__ == "__main__":
     unittest.main()